@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Shared fixtures of the configuration test scripts
+Builds WireguardConfiguration objects without a backing interface on SQLite
+databases in temporary directories, which are removed when the tests exit
+"""
+
+import sys
+import os
+import atexit
+import shutil
+import tempfile
+from unittest.mock import MagicMock
+
+import sqlalchemy
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+
+def make_engine():
+    """Engine of a new SQLite database, disposed and deleted at exit"""
+    directory = tempfile.mkdtemp()
+    engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(directory, 'wgdashboard.db')}")
+    # atexit runs the last registered first, so the engine is disposed before its directory goes
+    atexit.register(shutil.rmtree, directory, True)
+    atexit.register(engine.dispose)
+    return engine
+
+
+def make_configuration(engine, name='wg0', partitioning=False, node_observations=None):
+    """WireguardConfiguration named name with its tables created on engine and no peers"""
+    from modules.WireguardConfiguration import WireguardConfiguration
+
+    c = WireguardConfiguration.__new__(WireguardConfiguration)
+    c.Name = name
+    c.engine = engine
+    c.metadata = sqlalchemy.MetaData()
+    c.DashboardConfig = MagicMock()
+    c.DashboardConfig.GetConfig.side_effect = lambda section, key: \
+        (True, partitioning) if key == 'time_partitioning' else (True, 'sqlite')
+    if node_observations is not None:
+        c._WireguardConfiguration__nodeObservations = node_observations
+    c.createDatabase()
+    c.Peers = []
+    return c
@@ -1,3 +1,4 @@
+import atexit
 import logging
 import random, shutil, sqlite3, configparser, hashlib, ipaddress, json, os, secrets, subprocess
 import time, re, uuid, bcrypt, psutil, pyotp, threading
@@ -8,7 +9,7 @@ from datetime import datetime, timedelta
 
 import sqlalchemy
 from jinja2 import Template
-from flask import Flask, request, render_template, session, send_file
+from flask import Flask, request, render_template, session, send_file, Response, stream_with_context
 from flask_cors import CORS
 from icmplib import ping, traceroute
 from flask.json.provider import DefaultJSONProvider
@@ -43,13 +44,18 @@ from modules.NewConfigurationTemplates import NewConfigurationTemplates
 from modules.NodesManager import NodesManager
 from modules.IPAllocationManager import IPAllocationManager
 from modules.NodeSelector import NodeSelector
+from modules.NodeMetricsManager import NodeMetricsManager
 from modules.DriftDetector import DriftDetector
 from modules.ConfigNodesManager import ConfigNodesManager
 from modules.NodeInterfacesManager import NodeInterfacesManager
 from modules.EndpointGroupsManager import EndpointGroupsManager
 from modules.CloudflareDNSManager import CloudflareDNSManager
 from modules.PeerMigrationManager import PeerMigrationManager
+from modules.DNSFailoverManager import DNSFailoverManager
+from modules.PeerConfigArchive import PeerConfigArchiveFormats, StreamPeerConfigs
 from modules.AuditLogManager import AuditLogManager
+from modules.LogQueue import LogQueue
+from modules.LogPagination import InvalidCursorException, PageSize, ReadPages, MAX_PAGE_SIZE
 
 class CustomJsonEncoder(DefaultJSONProvider):
     def __init__(self, app):
@@ -89,6 +95,7 @@ def peerInformationBackgroundThread():
     app.logger.info("Background Thread #1 Started")
     app.logger.info("Background Thread #1 PID:" + str(threading.get_native_id()))
     delay = 6
+    lastExpire = None
     time.sleep(10)
     while True:
         with app.app_context():
@@ -98,16 +105,25 @@ def peerInformationBackgroundThread():
                     if name in WireguardConfigurations.keys() and WireguardConfigurations.get(name) is not None:
                         c = WireguardConfigurations.get(name)
                         if c.getStatus():
-                            c.getPeersLatestHandshake()
-                            c.getPeersTransfer()
+                            handshakes = c.getPeersLatestHandshake()
+                            changed = c.getPeersTransfer()
                             c.getPeersEndpoint()
                             c.getPeers()
+                            if handshakes != "stopped":
+                                c.logPeersSessions(handshakes)
+                            if changed:
+                                AllPeerJobs.evaluatePeers(c.Name, changed)
                             if delay == 6:
                                 if c.configurationInfo.PeerTrafficTracking:
                                     c.logPeersTraffic()
+                                c.rollupPeersTraffic()
                                 if c.configurationInfo.PeerHistoricalEndpointTracking:
                                     c.logPeersHistoryEndpoint()
                             c.getRestrictedPeersList()
+                if lastExpire is None or time.monotonic() - lastExpire >= 3600:
+                    for c in list(WireguardConfigurations.values()):
+                        c.expirePeersTracking()
+                    lastExpire = time.monotonic()
             except Exception as e:
                 app.logger.error(f"[WGDashboard] Background Thread #1 Error", e)
 
@@ -122,12 +138,18 @@ def peerJobScheduleBackgroundThread():
         app.logger.info(f"Background Thread #2 Started")
         app.logger.info(f"Background Thread #2 PID:" + str(threading.get_native_id()))
         time.sleep(10)
+        AllPeerJobs.runJob()
+        lastClean = time.monotonic()
         while True:
             try:
-                AllPeerJobs.runJob()
-                time.sleep(180)
+                nextDue = AllPeerJobs.runDueJobs()
+                if time.monotonic() - lastClean >= 180:
+                    AllPeerJobs.cleanJob()
+                    lastClean = time.monotonic()
+                AllPeerJobs.waitForJobs(180 if nextDue is None else min(nextDue, 180))
             except Exception as e:
                 app.logger.error("Background Thread #2 Error", e)
+                time.sleep(10)
 
 def nodeHealthPollingBackgroundThread():
     """Background thread for polling node health and peer stats"""
@@ -136,6 +158,10 @@ def nodeHealthPollingBackgroundThread():
         app.logger.info(f"Background Thread #3 (Node Health) Started")
         app.logger.info(f"Background Thread #3 PID:" + str(threading.get_native_id()))
         time.sleep(15)  # Initial delay
+        # Last successful poll per node, used to backfill traffic after an outage
+        lastOnline: dict[str, int] = {}
+        unreachable: set[str] = set()
+        lastDownsample = 0
         while True:
             try:
                 enabled_nodes = NodesManager.getEnabledNodes()
@@ -148,38 +174,99 @@ def nodeHealthPollingBackgroundThread():
                             continue
                         
                         # Poll health endpoint
+                        started = time.monotonic()
                         health_success, health_data = client.get_health()
+                        latency_ms = (time.monotonic() - started) * 1000
                         
                         health_info = {}
                         if health_success:
                             health_info['status'] = 'online'
                             health_info['health'] = health_data if isinstance(health_data, dict) else {}
+                            status_success, status_data = client.get_status()
+                            if status_success and isinstance(status_data, dict):
+                                health_info['status_data'] = status_data
+                            if node.id in unreachable and node.id in lastOnline:
+                                _backfillNodeTraffic(node, client, lastOnline[node.id])
+                            unreachable.discard(node.id)
+                            lastOnline[node.id] = int(time.time())
                         else:
                             health_info['status'] = 'offline'
                             health_info['error'] = health_data
+                            unreachable.add(node.id)
                         
-                        # Poll WireGuard dump if node is online
-                        if health_success and node.wg_interface:
-                            dump_success, dump_data = client.get_wg_dump(node.wg_interface)
-                            if dump_success:
-                                health_info['wg_dump'] = dump_data if isinstance(dump_data, dict) else {}
+                        # Debounced health transitions drive DNS failover
+                        DNSFailoverManager.observe(node.id, health_success)
                         
-                        # Update node health in database
-                        NodesManager.updateNodeHealth(node.id, health_info)
+                        # Poll WireGuard dumps if node is online and apply them to node-hosted peers
+                        if health_success:
+                            dumped_peers = []
+                            for iface in _nodeInterfaceNames(node):
+                                dump_success, dump_data = client.get_wg_dump(iface)
+                                if dump_success and isinstance(dump_data, dict):
+                                    dumped_peers.extend(dump_data.get('peers', []))
+                                    _ingestNodeDump(node, iface, dump_data.get('peers', []))
+                            health_info['wg_dump'] = {'peers': dumped_peers}
+                        
+                        # Typed metrics feed the in-memory state map; health_json only keeps the status
+                        NodeMetricsManager.record(node.id, health_info, latency_ms if health_success else None)
+                        NodesManager.updateNodeHealth(node.id, {
+                            k: v for k, v in health_info.items() if k in ('status', 'error', 'health')
+                        })
                         
                     except Exception as e:
                         app.logger.error(f"Error polling node {node.id}: {e}")
+                        unreachable.add(node.id)
+                        DNSFailoverManager.observe(node.id, False)
                         # Mark node as offline on error
+                        NodeMetricsManager.record(node.id, {'status': 'error'})
                         NodesManager.updateNodeHealth(node.id, {
                             'status': 'error',
                             'error': str(e)
                         })
                 
+                # Re-score nodes from the fresh state
+                NodeSelector.refreshIndex()
+                
+                if time.time() - lastDownsample >= 3600:
+                    NodeMetricsManager.downsample()
+                    lastDownsample = time.time()
+                
                 time.sleep(60)  # Poll every 60 seconds
             except Exception as e:
                 app.logger.error(f"Node Health Polling Thread Error: {e}")
                 time.sleep(60)
 
+def _nodeInterfaceNames(node) -> list[str]:
+    """Enabled interface names of a node, falling back to the legacy wg_interface field"""
+    interfaces = [i.interface_name for i in NodeInterfacesManager.getEnabledInterfacesByNodeId(node.id)]
+    if not interfaces and node.wg_interface:
+        interfaces = [node.wg_interface]
+    return interfaces
+
+def _ingestNodeDump(node, iface: str, peers: list):
+    """Apply a node interface dump to the peers of every configuration hosted there"""
+    for name in list(WireguardConfigurations.keys()):
+        c = WireguardConfigurations.get(name)
+        if c is not None:
+            changed = c.ingestNodeDump(node.id, iface, peers)
+            if changed:
+                app.logger.debug(f"Updated {len(changed)} peers of {name} from node {node.id} ({iface})")
+                AllPeerJobs.evaluatePeers(name, changed)
+
+def _backfillNodeTraffic(node, client, since: int):
+    """Backfill <config>_transfer from the agent's history after the node was unreachable"""
+    for iface in _nodeInterfaceNames(node):
+        for success, samples in client.iter_wg_history(iface, since):
+            if not success:
+                app.logger.warning(f"Failed to get history from node {node.id} ({iface}): {samples}")
+                break
+            for name in list(WireguardConfigurations.keys()):
+                c = WireguardConfigurations.get(name)
+                if c is not None and c.configurationInfo.PeerTrafficTracking:
+                    count = c.backfillPeersTraffic(node.id, samples)
+                    if count:
+                        app.logger.info(f"Backfilled {count} transfer rows for {name} from node {node.id} ({iface})")
+
 def gunicornConfig():
     _, app_ip = DashboardConfig.GetConfig("Server", "app_ip")
     _, app_port = DashboardConfig.GetConfig("Server", "app_port")
@@ -258,24 +345,33 @@ with app.app_context():
     SystemStatus = SystemStatus()
     DashboardConfig = DashboardConfig()
     EmailSender = EmailSender(DashboardConfig)
+    DashboardLogQueue: LogQueue = LogQueue(DashboardConfig)
+    atexit.register(DashboardLogQueue.shutdown)
     AllPeerShareLinks: PeerShareLinks = PeerShareLinks(DashboardConfig, WireguardConfigurations)
-    AllPeerJobs: PeerJobs = PeerJobs(DashboardConfig, WireguardConfigurations, AllPeerShareLinks)
-    DashboardLogger: DashboardLogger = DashboardLogger()
+    AllPeerJobs: PeerJobs = PeerJobs(DashboardConfig, WireguardConfigurations, AllPeerShareLinks, DashboardLogQueue)
+    DashboardLogger: DashboardLogger = DashboardLogger(DashboardLogQueue)
     DashboardPlugins: DashboardPlugins = DashboardPlugins(app, WireguardConfigurations)
     DashboardWebHooks: DashboardWebHooks = DashboardWebHooks(DashboardConfig)
     NewConfigurationTemplates: NewConfigurationTemplates = NewConfigurationTemplates()
     NodesManager: NodesManager = NodesManager(DashboardConfig)
     IPAllocManager: IPAllocationManager = IPAllocationManager(DashboardConfig)
-    NodeSelector: NodeSelector = NodeSelector(NodesManager)
-    DriftDetector: DriftDetector = DriftDetector(DashboardConfig)
+    NodeMetricsManager: NodeMetricsManager = NodeMetricsManager(DashboardConfig)
+    NodeSelector: NodeSelector = NodeSelector(NodesManager, NodeMetricsManager)
+    DriftDetector: DriftDetector = DriftDetector(DashboardConfig, WireguardConfigurations)
     ConfigNodesManager: ConfigNodesManager = ConfigNodesManager(DashboardConfig)
     NodeInterfacesManager: NodeInterfacesManager = NodeInterfacesManager(DashboardConfig)
     EndpointGroupsManager: EndpointGroupsManager = EndpointGroupsManager(DashboardConfig)
     CloudflareDNSManager: CloudflareDNSManager = CloudflareDNSManager()
-    PeerMigrationManager: PeerMigrationManager = PeerMigrationManager(DashboardConfig, NodesManager, ConfigNodesManager)
     AuditLogManager: AuditLogManager = AuditLogManager(DashboardConfig)
+    DNSFailoverManager: DNSFailoverManager = DNSFailoverManager(
+        ConfigNodesManager, lambda config_name: _update_dns_for_config(config_name)
+    )
+    PeerMigrationManager: PeerMigrationManager = PeerMigrationManager(
+        DashboardConfig, NodesManager, ConfigNodesManager, AuditLogManager, WireguardConfigurations,
+        NodeInterfacesManager=NodeInterfacesManager, NodeSelector=NodeSelector
+    )
     InitWireguardConfigurationsList(startup=True)
-    DashboardClients: DashboardClients = DashboardClients(WireguardConfigurations)
+    DashboardClients: DashboardClients = DashboardClients(WireguardConfigurations, DashboardLogQueue)
     app.register_blueprint(createClientBlueprint(WireguardConfigurations, DashboardConfig, DashboardClients))
 
 _, APP_PREFIX = DashboardConfig.GetConfig("Server", "app_prefix")
@@ -740,6 +836,10 @@ def API_updateDashboardConfigurationItem():
             WireguardConfigurations.clear()
             WireguardConfigurations.clear()
             InitWireguardConfigurationsList()
+    if data['section'] == "Peers":
+        # Peer defaults such as remote_endpoint end up in every rendered client config
+        for c in WireguardConfigurations.values():
+            c.invalidatePeerConfigCache()
     return ResponseObject(True, data=DashboardConfig.GetConfig(data["section"], data["key"])[1])
 
 @app.get(f'{APP_PREFIX}/api/getDashboardAPIKeys')
@@ -971,15 +1071,128 @@ def API_allowAccessPeers(configName: str) -> ResponseObject:
         return ResponseObject(status, msg)
     return ResponseObject(False, "Configuration does not exist")
 
+def _addBulkPeersOnNodes(config, node_selection: str, first_node, amount: int, preshared_key_bulkAdd: bool,
+                         dns_addresses: str, endpoint_allowed_ip: str, mtu: int, keep_alive: int):
+    """
+    Place each bulk peer on its own selected node, interface and IP, then push the
+    peers of each node interface with one reconcile request. Placements that were
+    not created on their node are deallocated and released.
+    """
+    placements = []
+    placed = set()
+    try:
+        node = first_node
+        for i in range(amount):
+            if node is None:
+                success, node, message = NodeSelector.selectNode(node_selection)
+                if not success:
+                    return ResponseObject(False, f"Cannot place peer {i + 1} of {amount}: {message}")
+            privateKey = GenerateWireguardPrivateKey()[1]
+            placement = {
+                "node": node,
+                "interface": None,
+                "private_key": privateKey,
+                "public_key": GenerateWireguardPublicKey(privateKey)[1],
+                "preshared_key": GenerateWireguardPrivateKey()[1] if preshared_key_bulkAdd else "",
+                "allowed_ip": None
+            }
+            placements.append(placement)
+            node = None
+
+            ip_pool_cidr = None
+            node_interfaces = NodeInterfacesManager.getEnabledInterfacesByNodeId(placement["node"].id)
+            if node_interfaces:
+                placement["interface"] = NodeSelector.selectInterface(placement["node"], node_interfaces)
+                if not placement["interface"]:
+                    return ResponseObject(False, f"No interface on node {placement['node'].name} has available IPs")
+                ip_pool_cidr = placement["interface"].ip_pool_cidr
+            elif not placement["node"].wg_interface:
+                return ResponseObject(False, f"Node {placement['node'].name} has no interface configured")
+            success, ip_or_error = IPAllocManager.allocateIP(placement["node"].id, placement["public_key"],
+                                                             ip_pool_cidr=ip_pool_cidr)
+            if not success:
+                return ResponseObject(False, f"Failed to allocate IP: {ip_or_error}")
+            placement["allowed_ip"] = ip_or_error
+
+        groups = {}
+        for placement in placements:
+            interface_name = placement["interface"].interface_name if placement["interface"] \
+                else placement["node"].wg_interface
+            groups.setdefault((placement["node"].id, interface_name), []).append(placement)
+
+        failed = []
+        records = []
+        createdAt = datetime.now().strftime('%Y%m%d_%H%M%S')
+        for (node_id, interface_name), group in groups.items():
+            client = NodesManager.getNodeAgentClient(node_id)
+            if not client:
+                failed.append(f"{group[0]['node'].name}: failed to get agent client")
+                continue
+            success, response = client.reconcile_peers(interface_name, [{
+                "public_key": p["public_key"],
+                "preshared_key": p["preshared_key"] if p["preshared_key"] else None,
+                "allowed_ips": [p["allowed_ip"]],
+                "persistent_keepalive": keep_alive if keep_alive > 0 else 0
+            } for p in group])
+            if not success:
+                failed.append(f"{group[0]['node'].name}/{interface_name}: {response}")
+                continue
+            for p in group:
+                records.append({
+                    "id": p["public_key"],
+                    "private_key": p["private_key"],
+                    "DNS": dns_addresses,
+                    "endpoint_allowed_ip": endpoint_allowed_ip,
+                    "name": f"BulkPeer_{len(records) + 1}_{createdAt}",
+                    "total_receive": 0,
+                    "total_sent": 0,
+                    "total_data": 0,
+                    "endpoint": "N/A",
+                    "status": "stopped",
+                    "latest_handshake": "N/A",
+                    "allowed_ip": p["allowed_ip"],
+                    "cumu_receive": 0,
+                    "cumu_sent": 0,
+                    "cumu_data": 0,
+                    "mtu": mtu,
+                    "keepalive": keep_alive,
+                    "remote_endpoint": (p["interface"].endpoint if p["interface"] else None) or p["node"].endpoint,
+                    "preshared_key": p["preshared_key"],
+                    "node_id": node_id,
+                    "iface": interface_name
+                })
+
+        if records:
+            with config.engine.begin() as conn:
+                conn.execute(config.peersTable.insert(), records)
+            placed.update(r["id"] for r in records)
+            config.getPeers()
+        addedPeers = [p for p in config.Peers if p.id in placed]
+        if failed:
+            return ResponseObject(False, f"Failed to add {amount - len(records)} of {amount} peers to nodes: "
+                                         f"{'; '.join(failed)}", data=addedPeers)
+        return ResponseObject(status=True, message=f"{len(records)} peers created on nodes", data=addedPeers)
+    finally:
+        for placement in placements:
+            if placement["public_key"] not in placed:
+                if placement["allowed_ip"]:
+                    IPAllocManager.deallocateIP(placement["node"].id, placement["public_key"])
+                NodeSelector.releaseNode(placement["node"].id,
+                                         placement["interface"].interface_name if placement["interface"] else None)
+
 @app.post(f'{APP_PREFIX}/api/addPeers/<configName>')
 def API_addPeers(configName):
     if configName in WireguardConfigurations.keys():
         data: dict = request.get_json()
+        # Node placement state, released in the finally unless the peer was created on the node
+        selected_node = None
+        selected_node_id = None
+        reserved_interface = None
+        ip_allocated = False
+        placed = False
         try:
             # Multi-node support: node selection
             node_selection: str = data.get('node_selection', None)  # "auto", specific node_id, or None for local
-            selected_node = None
-            selected_node_id = None
             
             # If node selection is provided, select a node
             if node_selection:
@@ -1043,6 +1256,12 @@ def API_addPeers(configName):
                     preshared_key_bulkAdd = False
                 if type(bulkAddAmount) is not int or bulkAddAmount < 1:
                     return ResponseObject(False, "Please specify amount of peers you want to add")
+                if selected_node:
+                    # Every bulk peer gets its own node, interface and IP; the helper owns the reservations
+                    placed = True
+                    return _addBulkPeersOnNodes(config, node_selection, selected_node, bulkAddAmount,
+                                                preshared_key_bulkAdd, dns_addresses, endpoint_allowed_ip,
+                                                mtu, keep_alive)
                 if not ipStatus:
                     return ResponseObject(False, "No more available IP can assign")
                 if len(availableIps.keys()) == 0:
@@ -1098,18 +1317,43 @@ def API_addPeers(configName):
                 
                 # IP allocation logic - different for node vs local
                 if selected_node:
-                    # Allocate IP from node's pool using IPAM
+                    # Select the interface first so the IP comes from its pool
+                    # Priority:
+                    # 1. Interface with the most remaining IP pool capacity, then fewest peers
+                    # 2. Fallback to legacy wg_interface field and the node's pool
+                    ip_pool_cidr = None
+                    node_interfaces = NodeInterfacesManager.getEnabledInterfacesByNodeId(selected_node_id)
+                    
+                    if node_interfaces:
+                        reserved_interface = NodeSelector.selectInterface(selected_node, node_interfaces)
+                        if not reserved_interface:
+                            return ResponseObject(False, "No interface on the node has available IPs")
+                        interface_name = reserved_interface.interface_name
+                        interface_endpoint = reserved_interface.endpoint or selected_node.endpoint
+                        ip_pool_cidr = reserved_interface.ip_pool_cidr
+                    else:
+                        interface_name = selected_node.wg_interface
+                        interface_endpoint = selected_node.endpoint
+                    
+                    if not interface_name:
+                        return ResponseObject(False, "Node has no interface configured")
+                    
+                    # Allocate IP from the interface's pool (or the node's) using IPAM
                     if len(allowed_ips) == 0:
-                        success, ip_or_error = IPAllocManager.allocateIP(selected_node_id, public_key)
+                        success, ip_or_error = IPAllocManager.allocateIP(selected_node_id, public_key,
+                                                                         ip_pool_cidr=ip_pool_cidr)
                         if not success:
                             return ResponseObject(False, f"Failed to allocate IP: {ip_or_error}")
                         allowed_ips = [ip_or_error]
+                        ip_allocated = True
                     else:
                         # User provided IP - validate it's in node's pool
                         # For now, still allocate to track it
-                        success, _ = IPAllocManager.allocateIP(selected_node_id, public_key)
+                        success, _ = IPAllocManager.allocateIP(selected_node_id, public_key,
+                                                               ip_pool_cidr=ip_pool_cidr)
                         if not success:
                             app.logger.warning(f"Failed to track user-provided IP in IPAM")
+                        ip_allocated = success
                 else:
                     # Legacy local mode - use existing logic
                     if len(allowed_ips) == 0:
@@ -1138,40 +1382,8 @@ def API_addPeers(configName):
                 if selected_node:
                     # Create peer via node agent
                     try:
-                        # Select appropriate interface for this node
-                        # Priority:
-                        # 1. Interface specified by user (if added to API in future)
-                        # 2. Interface with available IPs in its pool
-                        # 3. First enabled interface
-                        # 4. Fallback to legacy wg_interface field
-                        
-                        selected_interface = None
-                        interface_name = None
-                        interface_endpoint = None
-                        
-                        # Get enabled interfaces for this node
-                        node_interfaces = NodeInterfacesManager.getEnabledInterfacesByNodeId(selected_node_id)
-                        
-                        if node_interfaces:
-                            # For now, select the first enabled interface
-                            # TODO: Implement smarter selection based on IP pool availability
-                            selected_interface = node_interfaces[0]
-                            interface_name = selected_interface.interface_name
-                            interface_endpoint = selected_interface.endpoint or selected_node.endpoint
-                        else:
-                            # Fallback to legacy wg_interface field
-                            interface_name = selected_node.wg_interface
-                            interface_endpoint = selected_node.endpoint
-                        
-                        if not interface_name:
-                            # Rollback IP allocation
-                            IPAllocManager.deallocateIP(selected_node_id, public_key)
-                            return ResponseObject(False, "Node has no interface configured")
-                        
                         client = NodesManager.getNodeAgentClient(selected_node_id)
                         if not client:
-                            # Rollback IP allocation
-                            IPAllocManager.deallocateIP(selected_node_id, public_key)
                             return ResponseObject(False, "Failed to get agent client for node")
                         
                         # Prepare peer data for agent
@@ -1186,8 +1398,6 @@ def API_addPeers(configName):
                         success, response = client.add_peer(interface_name, peer_data)
                         
                         if not success:
-                            # Rollback IP allocation
-                            IPAllocManager.deallocateIP(selected_node_id, public_key)
                             return ResponseObject(False, f"Failed to add peer to node: {response}")
                         
                         # Store peer in database with node_id and iface
@@ -1219,6 +1429,7 @@ def API_addPeers(configName):
                             conn.execute(
                                 config.peersTable.insert().values(peer_record)
                             )
+                        placed = True
                         
                         # Refresh peers list
                         config.getPeers()
@@ -1230,8 +1441,6 @@ def API_addPeers(configName):
                             return ResponseObject(status=True, message="Peer created on node", data=[])
                             
                     except Exception as e:
-                        # Rollback IP allocation
-                        IPAllocManager.deallocateIP(selected_node_id, public_key)
                         app.logger.error(f"Error creating peer on node: {e}")
                         return ResponseObject(False, f"Error creating peer on node: {str(e)}")
                 
@@ -1255,6 +1464,13 @@ def API_addPeers(configName):
             app.logger.error("Add peers failed", e)
             return ResponseObject(False,
                                   f"Add peers failed. Reason: {message}")
+        finally:
+            if selected_node_id and not placed:
+                # Roll back the IP allocation and the reservation of a placement that failed
+                if ip_allocated:
+                    IPAllocManager.deallocateIP(selected_node_id, public_key)
+                NodeSelector.releaseNode(selected_node_id,
+                                         reserved_interface.interface_name if reserved_interface else None)
 
     return ResponseObject(False, "Configuration does not exist")
 
@@ -1284,6 +1500,20 @@ def API_downloadAllPeers(configName):
         peerData.append(file)
     return ResponseObject(data=peerData)
 
+@app.get(f"{APP_PREFIX}/api/downloadAllPeersArchive/<configName>")
+def API_downloadAllPeersArchive(configName):
+    if configName not in WireguardConfigurations.keys():
+        return ResponseObject(False, "Configuration does not exist")
+    archiveFormat = request.args.get("format", "zip")
+    if archiveFormat not in PeerConfigArchiveFormats:
+        return ResponseObject(False, "Archive format must be zip or tar.gz")
+    peers = list(WireguardConfigurations[configName].Peers)
+    return Response(
+        stream_with_context(StreamPeerConfigs(peers, archiveFormat)),
+        mimetype=PeerConfigArchiveFormats[archiveFormat],
+        headers={"Content-Disposition": f'attachment; filename="{configName}.{archiveFormat}"'}
+    )
+
 @app.get(f"{APP_PREFIX}/api/getAvailableIPs/<configName>")
 def API_getAvailableIPs(configName):
     if configName not in WireguardConfigurations.keys():
@@ -1329,7 +1559,7 @@ def API_GetPeerHistoricalEndpoints():
             return ResponseObject(data=result, message="Failed to request IP address geolocation. " + str(e))
         
         return ResponseObject(data={
-            "endpoints": p.getEndpoints(),
+            "endpoints": result,
             "geolocation": d
         })
     return ResponseObject(False, "Peer does not exist")
@@ -1354,8 +1584,12 @@ def API_GetPeerSessions():
         return ResponseObject(False, "Dates are invalid")
     if not configurationName or not id:
         return ResponseObject(False, "Please provide configurationName and id")
+    # Session records with start, end and traffic; without it the minute samples the calendar grouped
+    records = request.args.get('records', 'false').lower() == 'true'
     fp, p = WireguardConfigurations.get(configurationName).searchPeer(id)
     if fp:
+        if records:
+            return ResponseObject(data=p.getSessionRecords(startDate, endDate))
         return ResponseObject(data=p.getSessions(startDate, endDate))
     return ResponseObject(False, "Peer does not exist")
 
@@ -1367,10 +1601,25 @@ def API_GetPeerTraffics():
         interval = request.args.get('interval', 30)
         startDate = request.args.get('startDate', None)
         endDate = request.args.get('endDate', None)
+        resolution = request.args.get('resolution', None)
+        bucket = request.args.get('bucket', None)
+        maxPoints = request.args.get('max_points', None)
         if type(interval) is str:
             if not interval.isdigit():
                 return ResponseObject(False, "Interval must be integers in minutes")
             interval = int(interval)
+        if resolution is not None:
+            if not resolution.isdigit():
+                return ResponseObject(False, "Resolution must be integers in seconds")
+            resolution = int(resolution)
+        if bucket is not None:
+            if not bucket.isdigit() or int(bucket) == 0:
+                return ResponseObject(False, "Bucket must be positive integers in seconds")
+            bucket = int(bucket)
+        if maxPoints is not None:
+            if not maxPoints.isdigit() or int(maxPoints) == 0:
+                return ResponseObject(False, "Max points must be positive integers")
+            maxPoints = int(maxPoints)
         if startDate is None:
             endDate = None
         else:
@@ -1385,9 +1634,45 @@ def API_GetPeerTraffics():
         return ResponseObject(False, "Please provide configurationName and id")
     fp, p = WireguardConfigurations.get(configurationName).searchPeer(id)
     if fp:
-        return ResponseObject(data=p.getTraffics(interval, startDate, endDate))
+        return ResponseObject(data=p.getTraffics(interval, startDate, endDate, resolution, bucket, maxPoints))
     return ResponseObject(False, "Peer does not exist")
 
+@app.post(f'{APP_PREFIX}/api/getPeersTraffics/<configName>')
+def API_GetPeersTraffics(configName: str) -> ResponseObject:
+    if configName not in WireguardConfigurations.keys():
+        return ResponseObject(False, "Configuration does not exist", status_code=404)
+    data = request.get_json(silent=True) or {}
+    peers = data.get('peers', 'all')
+    if peers != 'all' and (type(peers) is not list or not all(type(x) is str for x in peers)):
+        return ResponseObject(False, 'Peers must be a list of peer IDs or "all"', status_code=400)
+    try:
+        interval = int(data.get('interval', 30))
+        bucket = data.get('bucket', None)
+        maxPoints = data.get('max_points', None)
+        bucket = int(bucket) if bucket is not None else None
+        maxPoints = int(maxPoints) if maxPoints is not None else None
+        if interval <= 0 or (bucket is not None and bucket <= 0) or (maxPoints is not None and maxPoints <= 0):
+            raise ValueError
+    except (TypeError, ValueError):
+        return ResponseObject(False, "Interval, bucket and max points must be positive integers", status_code=400)
+    try:
+        startDate = data.get('startDate', None)
+        endDate = data.get('endDate', None)
+        if startDate is None:
+            endDate = datetime.now()
+            startDate = endDate - timedelta(minutes=interval)
+        else:
+            startDate = datetime.strptime(startDate, "%Y-%m-%d")
+            endDate = datetime.strptime(endDate, "%Y-%m-%d") if endDate else startDate
+            if startDate > endDate:
+                return ResponseObject(False, "startDate must be smaller than endDate", status_code=400)
+            endDate = endDate.replace(hour=23, minute=59, second=59, microsecond=999999)
+    except (TypeError, ValueError):
+        return ResponseObject(False, "Dates are invalid", status_code=400)
+    return ResponseObject(data=WireguardConfigurations.get(configName).getPeersTraffics(
+        None if peers == 'all' else peers, startDate, endDate, bucket, maxPoints
+    ))
+
 @app.get(f'{APP_PREFIX}/api/getPeerTrackingTableCounts')
 def API_GetPeerTrackingTableCounts():
     configurationName = request.args.get("configurationName")
@@ -1483,11 +1768,22 @@ def API_deletePeerScheduleJob():
 def API_getPeerScheduleJobLogs(configName):
     if configName not in WireguardConfigurations.keys():
         return ResponseObject(False, "Configuration does not exist")
-    data = request.args.get("requestAll")
-    requestAll = False
-    if data is not None and data == "true":
-        requestAll = True
-    return ResponseObject(data=AllPeerJobs.getPeerJobLogs(configName))
+    status = request.args.get("status")
+    if status is not None and status not in ["true", "false"]:
+        return ResponseObject(False, "Status must be true or false")
+    status = None if status is None else status == "true"
+    # Without paged=true the response stays the list of every log older clients expect
+    if request.args.get("paged", "false").lower() != "true":
+        return ResponseObject(data=ReadPages(lambda cursor: AllPeerJobs.getPeerJobLogs(
+            configName, cursor, MAX_PAGE_SIZE, status, request.args.get("JobID"))))
+    try:
+        logs, nextCursor = AllPeerJobs.getPeerJobLogs(
+            configName, request.args.get("cursor"), PageSize(request.args.get("limit")),
+            status, request.args.get("JobID")
+        )
+    except InvalidCursorException as e:
+        return ResponseObject(False, str(e), status_code=400)
+    return ResponseObject(data={"Logs": logs, "NextCursor": nextCursor})
 
 '''
 File Download
@@ -1971,7 +2267,29 @@ def API_WebHooks_GetWebHookSessions():
     if not webHook:
         return ResponseObject(False, "Webhook does not exist")
     
-    return ResponseObject(data=DashboardWebHooks.GetWebHookSessions(webHook))
+    status = request.args.get('Status')
+    if status is not None and not RegexMatch("^-?[0-9]$", status):
+        return ResponseObject(False, "Status is invalid")
+    status = None if status is None else int(status)
+    # Without paged=true the response stays the list of every session older clients expect
+    if request.args.get('paged', 'false').lower() != 'true':
+        return ResponseObject(data=ReadPages(lambda cursor: DashboardWebHooks.GetWebHookSessions(
+            webHook, cursor, MAX_PAGE_SIZE, status)))
+    try:
+        sessions, nextCursor = DashboardWebHooks.GetWebHookSessions(
+            webHook, request.args.get('cursor'), PageSize(request.args.get('limit')), status
+        )
+    except InvalidCursorException as e:
+        return ResponseObject(False, str(e), status_code=400)
+    return ResponseObject(data={"Sessions": sessions, "NextCursor": nextCursor})
+
+@app.get(f'{APP_PREFIX}/api/webHooks/getQueueStats')
+def API_WebHooks_GetQueueStats():
+    return ResponseObject(data=DashboardWebHooks.GetQueueStats())
+
+@app.get(f'{APP_PREFIX}/api/getLogQueueStats')
+def API_GetLogQueueStats():
+    return ResponseObject(data=DashboardLogQueue.getStats())
     
 
 '''
@@ -2003,6 +2321,9 @@ def API_GetClusterOverview():
                 healthy_nodes = [cn for cn in config_nodes if cn.is_healthy]
                 is_healthy = len(healthy_nodes) > 0
                 
+                # Latest node state from the in-memory map
+                node_states = [s for s in (NodeMetricsManager.getLatest(cn.node_id) for cn in config_nodes) if s]
+                
                 # Get peer count for this config
                 peer_count = len(config.getPeers())
                 
@@ -2012,7 +2333,11 @@ def API_GetClusterOverview():
                     'peer_count': peer_count,
                     'endpoint': endpoint,
                     'is_healthy': is_healthy,
-                    'healthy_node_count': len(healthy_nodes)
+                    'healthy_node_count': len(healthy_nodes),
+                    'online_node_count': len([s for s in node_states if s.status == 'online']),
+                    'node_peer_count': sum(s.peer_count or 0 for s in node_states),
+                    'node_active_peers': sum(s.active_peers or 0 for s in node_states),
+                    'nodes': [s.toJson() for s in node_states]
                 })
         
         return ResponseObject(data=cluster_data)
@@ -2115,6 +2440,7 @@ def API_CreateNode():
             return ResponseObject(False, result)
         
         node = result
+        NodeSelector.invalidateIndex()
         
         # Create interfaces if provided
         # Priority 1: interfaces array (new approach)
@@ -2172,6 +2498,7 @@ def API_UpdateNode(node_id):
         success, result = NodesManager.updateNode(node_id, data)
         
         if success:
+            NodeSelector.invalidateIndex()
             return ResponseObject(True, "Node updated successfully", data=result.toJson())
         return ResponseObject(False, result)
     except Exception as e:
@@ -2187,6 +2514,7 @@ def API_ToggleNode(node_id):
         success, result = NodesManager.toggleNodeEnabled(node_id, enabled)
         
         if success:
+            NodeSelector.invalidateIndex()
             status = "enabled" if enabled else "disabled"
             return ResponseObject(True, f"Node {status} successfully", data=result.toJson())
         return ResponseObject(False, result)
@@ -2209,11 +2537,32 @@ def API_DeleteNode(node_id):
     """Delete node"""
     try:
         success, message = NodesManager.deleteNode(node_id)
+        if success:
+            NodeMetricsManager.forgetNode(node_id)
+            DNSFailoverManager.forgetNode(node_id)
+            NodeSelector.invalidateIndex()
         return ResponseObject(success, message)
     except Exception as e:
         app.logger.error(f"Error deleting node: {e}")
         return ResponseObject(False, "Failed to delete node")
 
+@app.get(f'{APP_PREFIX}/api/nodes/<node_id>/metrics')
+def API_GetNodeMetrics(node_id):
+    """Get the latest state and metric history of a node"""
+    try:
+        hours = int(request.args.get('hours', 24))
+        latest = NodeMetricsManager.getLatest(node_id)
+        history = NodeMetricsManager.getHistory(node_id, datetime.now() - timedelta(hours=hours))
+        return ResponseObject(data={
+            'latest': latest.toJson() if latest else None,
+            'history': [m.toJson() for m in history]
+        })
+    except ValueError:
+        return ResponseObject(False, "hours must be an integer")
+    except Exception as e:
+        app.logger.error(f"Error getting node metrics: {e}")
+        return ResponseObject(False, "Failed to get node metrics")
+
 
 # Node Interface Management API Endpoints
 
@@ -2341,14 +2690,11 @@ def API_GetNodeDrift(node_id):
         if not client:
             return ResponseObject(False, "Failed to create agent client")
         
-        # Get WireGuard dump from agent
-        success, wg_data = client.get_wg_dump(node.wg_interface)
-        
-        if not success:
-            return ResponseObject(False, f"Failed to get WireGuard dump: {wg_data}")
+        # Compare peer set digests first, diff full dumps only on mismatch
+        drift_report = DriftDetector.detectNodeDrift(node, client, _nodeInterfaceNames(node))
         
-        # Detect drift
-        drift_report = DriftDetector.detectDrift(node_id, wg_data)
+        if 'error' in drift_report:
+            return ResponseObject(False, drift_report['error'])
         
         return ResponseObject(True, "Drift detection completed", data=drift_report)
         
@@ -2361,7 +2707,7 @@ def API_GetNodeDrift(node_id):
 def API_GetAllNodesDrift():
     """Get drift report for all enabled nodes"""
     try:
-        drift_reports = DriftDetector.detectDriftForAllNodes(NodesManager)
+        drift_reports = DriftDetector.detectDriftForAllNodes(NodesManager, NodeInterfacesManager)
         
         # Calculate summary
         total_drift_count = sum(1 for report in drift_reports.values() if report.get('has_drift', False))
@@ -2381,6 +2727,99 @@ def API_GetAllNodesDrift():
         return ResponseObject(False, "Failed to detect drift for all nodes")
 
 
+def _reconcileNodeDriftPerPeer(node, client, drift_report: dict, reconcile_missing: bool,
+                               reconcile_mismatched: bool, remove_unknown: bool) -> dict:
+    """Apply each difference of a drift report with its own agent call"""
+    reconcile_results = {
+        "added": [],
+        "updated": [],
+        "removed": [],
+        "errors": []
+    }
+    
+    # Reconcile missing peers (add them to node)
+    if reconcile_missing:
+        for missing_peer in drift_report.get('missing_peers', []):
+            try:
+                # Get full peer data from DB
+                peer_public_key = missing_peer['public_key']
+                peer_data = {
+                    'public_key': peer_public_key,
+                    'allowed_ips': missing_peer.get('allowed_ips', []),
+                    'persistent_keepalive': 0  # Default, would need to fetch from DB
+                }
+                
+                success, result = client.add_peer(node.wg_interface, peer_data)
+                if success:
+                    reconcile_results['added'].append(peer_public_key)
+                else:
+                    reconcile_results['errors'].append({
+                        'peer': peer_public_key,
+                        'action': 'add',
+                        'error': result
+                    })
+            except Exception as e:
+                reconcile_results['errors'].append({
+                    'peer': missing_peer['public_key'],
+                    'action': 'add',
+                    'error': str(e)
+                })
+    
+    # Reconcile mismatched peers (update them on node)
+    if reconcile_mismatched:
+        for mismatched_peer in drift_report.get('mismatched_peers', []):
+            try:
+                peer_public_key = mismatched_peer['public_key']
+                
+                # Build update data from mismatches
+                update_data = {}
+                for mismatch in mismatched_peer.get('mismatches', []):
+                    if mismatch['field'] == 'allowed_ips':
+                        update_data['allowed_ips'] = mismatch['expected']
+                    elif mismatch['field'] == 'persistent_keepalive':
+                        update_data['persistent_keepalive'] = mismatch['expected']
+                
+                if update_data:
+                    success, result = client.update_peer(node.wg_interface, peer_public_key, update_data)
+                    if success:
+                        reconcile_results['updated'].append(peer_public_key)
+                    else:
+                        reconcile_results['errors'].append({
+                            'peer': peer_public_key,
+                            'action': 'update',
+                            'error': result
+                        })
+            except Exception as e:
+                reconcile_results['errors'].append({
+                    'peer': mismatched_peer['public_key'],
+                    'action': 'update',
+                    'error': str(e)
+                })
+    
+    # Remove unknown peers (remove them from node)
+    if remove_unknown:
+        for unknown_peer in drift_report.get('unknown_peers', []):
+            try:
+                peer_public_key = unknown_peer['public_key']
+                success, result = client.delete_peer(node.wg_interface, peer_public_key)
+                if success:
+                    reconcile_results['removed'].append(peer_public_key)
+                else:
+                    reconcile_results['errors'].append({
+                        'peer': peer_public_key,
+                        'action': 'remove',
+                        'error': result
+                    })
+            except Exception as e:
+                reconcile_results['errors'].append({
+                    'peer': unknown_peer['public_key'],
+                    'action': 'remove',
+                    'error': str(e)
+                })
+    
+    return reconcile_results
+
+
 @app.post(f'{APP_PREFIX}/api/drift/nodes/<node_id>/reconcile')
 def API_ReconcileNodeDrift(node_id):
     """Reconcile drift for a specific node by applying panel configuration"""
@@ -2395,108 +2834,34 @@ def API_ReconcileNodeDrift(node_id):
         reconcile_missing = data.get('reconcile_missing', True)
         reconcile_mismatched = data.get('reconcile_mismatched', True)
         remove_unknown = data.get('remove_unknown', False)
+        # 'batch' sends the full desired peer set per interface in one request,
+        # 'per_peer' applies each difference with its own agent call
+        mode = data.get('mode', 'batch')
         
         # Get agent client
         client = NodesManager.getNodeAgentClient(node_id)
         if not client:
             return ResponseObject(False, "Failed to create agent client")
         
-        # First, detect current drift
-        success, wg_data = client.get_wg_dump(node.wg_interface)
-        if not success:
-            return ResponseObject(False, f"Failed to get WireGuard dump: {wg_data}")
-        
-        drift_report = DriftDetector.detectDrift(node_id, wg_data)
-        
-        if not drift_report.get('has_drift', False):
-            return ResponseObject(True, "No drift detected, nothing to reconcile")
-        
-        reconcile_results = {
-            "added": [],
-            "updated": [],
-            "removed": [],
-            "errors": []
-        }
-        
-        # Reconcile missing peers (add them to node)
-        if reconcile_missing:
-            for missing_peer in drift_report.get('missing_peers', []):
-                try:
-                    # Get full peer data from DB
-                    peer_public_key = missing_peer['public_key']
-                    peer_data = {
-                        'public_key': peer_public_key,
-                        'allowed_ips': missing_peer.get('allowed_ips', []),
-                        'persistent_keepalive': 0  # Default, would need to fetch from DB
-                    }
-                    
-                    success, result = client.add_peer(node.wg_interface, peer_data)
-                    if success:
-                        reconcile_results['added'].append(peer_public_key)
-                    else:
-                        reconcile_results['errors'].append({
-                            'peer': peer_public_key,
-                            'action': 'add',
-                            'error': result
-                        })
-                except Exception as e:
-                    reconcile_results['errors'].append({
-                        'peer': missing_peer['public_key'],
-                        'action': 'add',
-                        'error': str(e)
-                    })
-        
-        # Reconcile mismatched peers (update them on node)
-        if reconcile_mismatched:
-            for mismatched_peer in drift_report.get('mismatched_peers', []):
-                try:
-                    peer_public_key = mismatched_peer['public_key']
-                    
-                    # Build update data from mismatches
-                    update_data = {}
-                    for mismatch in mismatched_peer.get('mismatches', []):
-                        if mismatch['field'] == 'allowed_ips':
-                            update_data['allowed_ips'] = mismatch['expected']
-                        elif mismatch['field'] == 'persistent_keepalive':
-                            update_data['persistent_keepalive'] = mismatch['expected']
-                    
-                    if update_data:
-                        success, result = client.update_peer(node.wg_interface, peer_public_key, update_data)
-                        if success:
-                            reconcile_results['updated'].append(peer_public_key)
-                        else:
-                            reconcile_results['errors'].append({
-                                'peer': peer_public_key,
-                                'action': 'update',
-                                'error': result
-                            })
-                except Exception as e:
-                    reconcile_results['errors'].append({
-                        'peer': mismatched_peer['public_key'],
-                        'action': 'update',
-                        'error': str(e)
-                    })
-        
-        # Remove unknown peers (remove them from node)
-        if remove_unknown:
-            for unknown_peer in drift_report.get('unknown_peers', []):
-                try:
-                    peer_public_key = unknown_peer['public_key']
-                    success, result = client.delete_peer(node.wg_interface, peer_public_key)
-                    if success:
-                        reconcile_results['removed'].append(peer_public_key)
-                    else:
-                        reconcile_results['errors'].append({
-                            'peer': peer_public_key,
-                            'action': 'remove',
-                            'error': result
-                        })
-                except Exception as e:
-                    reconcile_results['errors'].append({
-                        'peer': unknown_peer['public_key'],
-                        'action': 'remove',
-                        'error': str(e)
-                    })
+        if mode == 'batch':
+            reconcile_results = DriftDetector.reconcileNode(
+                node, client, _nodeInterfaceNames(node),
+                reconcile_missing, reconcile_mismatched, remove_unknown
+            )
+        else:
+            # First, detect current drift
+            success, wg_data = client.get_wg_dump(node.wg_interface)
+            if not success:
+                return ResponseObject(False, f"Failed to get WireGuard dump: {wg_data}")
+            
+            drift_report = DriftDetector.detectDrift(node_id, wg_data, node.wg_interface)
+            
+            if not drift_report.get('has_drift', False):
+                return ResponseObject(True, "No drift detected, nothing to reconcile")
+            
+            reconcile_results = _reconcileNodeDriftPerPeer(
+                node, client, drift_report, reconcile_missing, reconcile_mismatched, remove_unknown
+            )
         
         # Build response message
         message_parts = []
@@ -2666,7 +3031,7 @@ def API_RemoveNodeFromConfig(config_name, node_id):
         
         # Migrate peers from this node
         migrated, migrate_msg, peer_count = PeerMigrationManager.migrate_peers_from_node(
-            config_name, node_id
+            config_name, node_id, user=session.get("username")
         )
         
         if not migrated and peer_count > 0:
@@ -2831,7 +3196,7 @@ def API_SyncDNS(config_name):
             return ResponseObject(False, "No valid node IPs found")
         
         # Sync DNS
-        CloudflareDNSManager.setAPIToken(cloudflare_token)
+        CloudflareDNSManager.set_api_token(cloudflare_token)
         success, message = CloudflareDNSManager.sync_node_ips_to_dns(
             endpoint_group.cloudflare_zone_id,
             endpoint_group.cloudflare_record_name,
@@ -2865,18 +3230,54 @@ def API_GetAuditLogs():
         entity_type = request.args.get('entity_type')
         entity_id = request.args.get('entity_id')
         action = request.args.get('action')
-        limit = int(request.args.get('limit', 100))
-        offset = int(request.args.get('offset', 0))
+        user = request.args.get('user')
+        
+        # Without paged=true the response stays the limit/offset list older clients expect
+        if request.args.get('paged', 'false').lower() != 'true':
+            limit = max(int(request.args.get('limit', 100)), 0)
+            offset = max(int(request.args.get('offset', 0)), 0)
+            logs = ReadPages(lambda cursor: AuditLogManager.get_logs(
+                entity_type, entity_id, action, MAX_PAGE_SIZE, cursor, user), offset + limit)
+            return ResponseObject(True, "Audit logs retrieved successfully",
+                                  [log.toJson() for log in logs[offset:]])
         
-        logs = AuditLogManager.get_logs(entity_type, entity_id, action, limit, offset)
+        limit = PageSize(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        
+        logs, nextCursor = AuditLogManager.get_logs(entity_type, entity_id, action, limit, cursor, user)
         
         return ResponseObject(True, "Audit logs retrieved successfully", 
-                            [log.toJson() for log in logs])
+                            {"Logs": [log.toJson() for log in logs], "NextCursor": nextCursor})
+    except InvalidCursorException as e:
+        return ResponseObject(False, str(e), status_code=400)
     except Exception as e:
         app.logger.error(f"Error getting audit logs: {e}")
         return ResponseObject(False, "Failed to get audit logs", status_code=500)
 
 
+@app.get(f'{APP_PREFIX}/api/migrations/<migration_id>')
+def API_GetPeerMigration(migration_id):
+    """Get the progress of a peer migration"""
+    progress = PeerMigrationManager.get_migration_progress(migration_id)
+    if progress is None:
+        return ResponseObject(False, "Migration not found", status_code=404)
+    progress.pop("migrated_peers")
+    return ResponseObject(True, "Migration progress retrieved successfully", progress)
+
+
+@app.post(f'{APP_PREFIX}/api/migrations/<migration_id>/resume')
+def API_ResumePeerMigration(migration_id):
+    """Resume an interrupted or partially failed peer migration"""
+    try:
+        success, message, peer_count = PeerMigrationManager.resume_migration(
+            migration_id, session.get("username")
+        )
+        return ResponseObject(success, message, {"peers_migrated": peer_count})
+    except Exception as e:
+        app.logger.error(f"Error resuming migration {migration_id}: {e}")
+        return ResponseObject(False, "Failed to resume migration", status_code=500)
+
+
 def _update_dns_for_config(config_name: str):
     """Helper function to update DNS records for a config's endpoint group"""
     try:
@@ -8,6 +8,9 @@ def post_worker_init(worker):
     dashboard.startThreads()
     dashboard.DashboardPlugins.startThreads()
 
+def worker_exit(server, worker):
+    dashboard.DashboardLogQueue.shutdown()
+
 worker_class = 'gthread'
 workers = 1
 threads = 2
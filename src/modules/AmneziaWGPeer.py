@@ -86,6 +86,7 @@ class AmneziaWGPeer(Peer):
                         self.configuration.peersTable.c.id == self.id
                     )
                 )
+            self.configuration.invalidatePeerConfigCache(self.id)
             self.configuration.getPeers()
             return True, None
         except subprocess.CalledProcessError as exc:
@@ -3,9 +3,13 @@ AmneziaWG Configuration
 """
 import random, sqlalchemy, os, subprocess, re, uuid
 from flask import current_app
+from .ConfigurationSchema import ConfigurationSchema
 from .PeerJobs import PeerJobs
 from .AmneziaWGPeer import AmneziaWGPeer
+from .PeerSessions import PeerSessions
 from .PeerShareLinks import PeerShareLinks
+from .PeerTrafficRollups import PeerTrafficRollups
+from .TimePartitions import TimePartitionedTable, PartitionedTableOptions
 from .Utilities import RegexMatch
 from .WireguardConfiguration import WireguardConfiguration
 from .DashboardWebHooks import DashboardWebHooks
@@ -67,6 +71,7 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
     def createDatabase(self, dbName = None):
         if dbName is None:
             dbName = self.Name
+        partitioning = self.DashboardConfig.GetConfig("Database", "time_partitioning")[1] is True
 
 
         self.peersTable = sqlalchemy.Table(
@@ -128,8 +133,16 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             sqlalchemy.Column('cumu_data', sqlalchemy.Float),
             sqlalchemy.Column('time', (sqlalchemy.DATETIME if self.DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else sqlalchemy.TIMESTAMP),
                               server_default=sqlalchemy.func.now()),
-            extend_existing=True
+            extend_existing=True,
+            **PartitionedTableOptions(self.engine, f'{dbName}_transfer', partitioning)
+        )
+        self.peersTransferPartitions = TimePartitionedTable(
+            self.engine, self.metadata, self.peersTransferTable, partitioning
         )
+        self.peersTrafficRollups = PeerTrafficRollups(
+            self.engine, self.metadata, dbName, self.peersTransferPartitions, self.DashboardConfig
+        )
+        self.peerSessions = PeerSessions(self.engine, self.metadata, dbName, self.DashboardConfig)
         self.peersDeletedTable = sqlalchemy.Table(
             f'{dbName}_deleted', self.metadata,
             sqlalchemy.Column('id', sqlalchemy.String(255), nullable=False),
@@ -167,10 +180,21 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             sqlalchemy.Column('endpoint', sqlalchemy.String(255), nullable=False),
             sqlalchemy.Column('time',
                               (sqlalchemy.DATETIME if self.DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else sqlalchemy.TIMESTAMP)),
-            extend_existing=True
+            sqlalchemy.Column('first_seen',
+                              (sqlalchemy.DATETIME if self.DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else sqlalchemy.TIMESTAMP)),
+            sqlalchemy.Column('last_seen',
+                              (sqlalchemy.DATETIME if self.DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else sqlalchemy.TIMESTAMP)),
+            sqlalchemy.Column('seen_count', sqlalchemy.Integer),
+            extend_existing=True,
+            **PartitionedTableOptions(self.engine, f'{dbName}_history_endpoint', partitioning)
+        )
+        self.peersHistoryEndpointPartitions = TimePartitionedTable(
+            self.engine, self.metadata, self.peersHistoryEndpointTable, partitioning, "last_seen"
         )
 
         self.metadata.create_all(self.engine)
+        self.configurationSchema = ConfigurationSchema(self, dbName)
+        self.configurationSchema.migrate()
 
     def getPeers(self):
         self.Peers.clear()        
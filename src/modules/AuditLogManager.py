@@ -15,8 +15,10 @@ except ImportError:
 
 try:
     from .AuditLog import AuditLog
+    from .LogPagination import KeysetPage, InvalidCursorException
 except ImportError:
     from AuditLog import AuditLog
+    from LogPagination import KeysetPage, InvalidCursorException
 
 
 def _log_info(msg):
@@ -41,7 +43,13 @@ def _log_error(msg, exc=None):
 
 
 class AuditLogManager:
-    """Manager for audit log operations"""
+    """
+    Manager for audit log operations
+    
+    Entries are written synchronously rather than through the log queue: peer
+    migrations journal their progress here and resume from it, so an entry must
+    never be dropped and must be readable as soon as log returns.
+    """
     
     def __init__(self, DashboardConfig):
         self.DashboardConfig = DashboardConfig
@@ -63,17 +71,17 @@ class AuditLogManager:
         Returns:
             Tuple of (success, message)
         """
+        row = {
+            "timestamp": datetime.now(),
+            "action": action,
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "details": details,
+            "user": user
+        }
         try:
             with self.engine.begin() as conn:
-                conn.execute(
-                    self.auditLogTable.insert().values(
-                        action=action,
-                        entity_type=entity_type,
-                        entity_id=entity_id,
-                        details=details,
-                        user=user
-                    )
-                )
+                conn.execute(self.auditLogTable.insert().values(row))
             
             _log_info(f"Audit log: {action} on {entity_type} {entity_id}")
             return True, "Audit log created"
@@ -83,19 +91,21 @@ class AuditLogManager:
             return False, str(e)
     
     def get_logs(self, entity_type: str = None, entity_id: str = None, 
-                action: str = None, limit: int = 100, offset: int = 0) -> List[AuditLog]:
+                action: str = None, limit: int = 100, cursor: str = None,
+                user: str = None) -> Tuple[List[AuditLog], Optional[str]]:
         """
-        Query audit logs with filters
+        Query one page of audit logs with filters, newest first
         
         Args:
             entity_type: Filter by entity type
             entity_id: Filter by entity ID
             action: Filter by action
-            limit: Maximum number of results
-            offset: Pagination offset
+            limit: Page size, capped at MAX_PAGE_SIZE
+            cursor: Cursor of the page to read, returned with the previous page
+            user: Filter by user
             
         Returns:
-            List of AuditLog objects
+            Tuple of (AuditLog objects, cursor of the next page or None)
         """
         try:
             with self.engine.connect() as conn:
@@ -109,20 +119,19 @@ class AuditLogManager:
                     filters.append(self.auditLogTable.c.entity_id == entity_id)
                 if action:
                     filters.append(self.auditLogTable.c.action == action)
+                if user:
+                    filters.append(self.auditLogTable.c.user == user)
                 
                 if filters:
                     query = query.where(db.and_(*filters))
                 
-                # Order by timestamp descending
-                query = query.order_by(self.auditLogTable.c.timestamp.desc())
-                
-                # Apply pagination
-                query = query.limit(limit).offset(offset)
-                
-                result = conn.execute(query).mappings().fetchall()
+                result, nextCursor = KeysetPage(conn, query, self.auditLogTable.c.timestamp,
+                                                self.auditLogTable.c.id, cursor, limit)
                 
-                return [AuditLog(dict(row)) for row in result]
+                return [AuditLog(dict(row)) for row in result], nextCursor
         
+        except InvalidCursorException:
+            raise
         except Exception as e:
             _log_error(f"Error querying audit logs: {e}")
-            return []
+            return [], None
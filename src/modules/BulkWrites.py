@@ -0,0 +1,112 @@
+"""
+Bulk Writes
+Backend specific fast paths for the rows written by every poll cycle
+"""
+from typing import Callable
+
+import sqlalchemy as db
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+BATCH_SIZE = 1000
+
+
+def _staging(conn: db.Connection, table: db.Table) -> str:
+    """
+    Session local table shaped like table, emptied before use. It is created once
+    per connection and its rows are discarded at commit.
+    """
+    name = f'{table.name}_staging'
+    conn.exec_driver_sql(
+        f'CREATE TEMPORARY TABLE IF NOT EXISTS "{name}" (LIKE "{table.name}") ON COMMIT DELETE ROWS'
+    )
+    conn.exec_driver_sql(f'TRUNCATE "{name}"')
+    return name
+
+
+def _copy(conn: db.Connection, name: str, columns: list[str], rows: list[dict]):
+    """Stream rows into a table with COPY FROM STDIN"""
+    quoted = ", ".join(f'"{c}"' for c in columns)
+    with conn.connection.cursor() as cursor:
+        with cursor.copy(f'COPY "{name}" ({quoted}) FROM STDIN') as copy:
+            for row in rows:
+                copy.write_row([row.get(c) for c in columns])
+
+
+def BulkInsert(conn: db.Connection, table: db.Table, rows: list[dict]) -> int:
+    """
+    Insert rows in the caller's transaction with the fastest statement of the
+    backend: COPY into a staging table merged with one INSERT ... SELECT on
+    PostgreSQL, multi-row INSERT on MySQL and executemany on SQLite.
+
+    Returns:
+        Number of rows inserted
+    """
+    if not rows:
+        return 0
+    columns = [c.name for c in table.columns if c.name in rows[0]]
+    dialect = conn.dialect.name
+    if dialect == 'postgresql':
+        staging = _staging(conn, table)
+        _copy(conn, staging, columns, rows)
+        quoted = ", ".join(f'"{c}"' for c in columns)
+        conn.exec_driver_sql(f'INSERT INTO "{table.name}" ({quoted}) SELECT {quoted} FROM "{staging}"')
+    elif dialect == 'mysql':
+        for i in range(0, len(rows), BATCH_SIZE):
+            conn.execute(table.insert().values(rows[i:i + BATCH_SIZE]))
+    else:
+        conn.execute(table.insert(), rows)
+    return len(rows)
+
+
+def BulkUpdate(conn: db.Connection, table: db.Table, key: str, rows: list[dict]) -> int:
+    """
+    Update the rows matching each row's key column with its other values. On
+    PostgreSQL the rows are copied into a staging table and merged with one
+    UPDATE ... FROM, elsewhere the update is sent with executemany. Rows must all
+    have the same columns.
+
+    Returns:
+        Number of rows sent
+    """
+    if not rows:
+        return 0
+    columns = [c.name for c in table.columns if c.name in rows[0] and c.name != key]
+    if conn.dialect.name == 'postgresql':
+        staging = _staging(conn, table)
+        _copy(conn, staging, [key, *columns], rows)
+        assignments = ", ".join(f'"{c}" = s."{c}"' for c in columns)
+        conn.exec_driver_sql(
+            f'UPDATE "{table.name}" AS t SET {assignments} FROM "{staging}" AS s WHERE t."{key}" = s."{key}"'
+        )
+    else:
+        conn.execute(
+            table.update().where(table.c[key] == db.bindparam(f'b_{key}')).values(
+                {c: db.bindparam(f'b_{c}') for c in columns}
+            ),
+            [{f'b_{c}': row[c] for c in (key, *columns)} for row in rows]
+        )
+    return len(rows)
+
+
+def BulkUpsert(conn: db.Connection, table: db.Table, rows: list[dict], keys: list[str],
+               update: Callable[[db.Table, db.ColumnCollection], dict], batchSize: int = BATCH_SIZE) -> int:
+    """
+    Insert rows in one statement per batch, updating the row that already holds
+    the same keys instead. keys must be covered by a unique index of table.
+    update receives the target table and the columns of the row proposed for
+    insertion, and returns the values to set on conflict.
+
+    Returns:
+        Number of rows sent
+    """
+    dialect = conn.dialect.name
+    for i in range(0, len(rows), batchSize):
+        batch = rows[i:i + batchSize]
+        if dialect == 'mysql':
+            statement = mysql.insert(table).values(batch)
+            statement = statement.on_duplicate_key_update(**update(table, statement.inserted))
+        else:
+            statement = (postgresql if dialect == 'postgresql' else sqlite).insert(table).values(batch)
+            statement = statement.on_conflict_do_update(index_elements=keys, set_=update(table, statement.excluded))
+        conn.execute(statement)
+    return len(rows)
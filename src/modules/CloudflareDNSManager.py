@@ -6,6 +6,8 @@ import json
 import time
 import threading
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Tuple, Dict, Any
 from datetime import datetime
 from collections import deque
@@ -45,20 +47,42 @@ class CloudflareDNSManager:
     Features:
     - Create/update/delete A and AAAA records
     - Enforce proxied=false (DNS-only)
-    - Retry queue for failed operations
-    - Debouncing/batching of updates
+    - Cached record view per managed name, revalidated with ETag or on a slow interval
+    - Minimal local diff, mutations sent concurrently over a pooled session
+    - Retry queue with per-item exponential backoff
     """
     
-    def __init__(self, api_token: str = None):
+    # Seconds a cached record view is trusted before it is revalidated
+    RECORD_CACHE_TTL = 300
+    # Retry delays grow from RETRY_BASE_DELAY, doubling per attempt up to RETRY_MAX_DELAY
+    RETRY_BASE_DELAY = 5
+    RETRY_MAX_DELAY = 300
+    MAX_RETRIES = 5
+    
+    def __init__(self, api_token: str = None, base_url: str = "https://api.cloudflare.com/client/v4",
+                 max_workers: int = 8):
         """
         Initialize Cloudflare DNS Manager
         
         Args:
             api_token: Cloudflare API token with DNS edit permissions
+            base_url: API base URL
+            max_workers: Maximum number of record mutations sent concurrently
         """
         self.api_token = api_token
-        self.base_url = "https://api.cloudflare.com/client/v4"
+        self.base_url = base_url
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        # (zone_id, name) -> {"records": {(type, content): record_id}, "etag", "fetched_at"}
+        self._record_cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._cache_lock = threading.Lock()
+        
         self.retry_queue = deque()
+        self._retry_condition = threading.Condition()
         self.pending_operations = {}  # For debouncing
         self.debounce_delay = 5  # seconds
         self._retry_thread = None
@@ -66,8 +90,16 @@ class CloudflareDNSManager:
     
     def set_api_token(self, api_token: str):
         """Update the API token"""
+        if api_token != self.api_token:
+            self.invalidate_cache()
         self.api_token = api_token
     
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_token}",
+            "Content-Type": "application/json"
+        }
+    
     def _make_request(self, method: str, endpoint: str, data: dict = None) -> Tuple[bool, Any]:
         """
         Make a request to Cloudflare API
@@ -82,24 +114,14 @@ class CloudflareDNSManager:
         """
         if not self.api_token:
             return False, "Cloudflare API token not configured"
+        if method not in ("GET", "POST", "PUT", "DELETE"):
+            return False, f"Unsupported method: {method}"
         
         url = f"{self.base_url}/{endpoint}"
-        headers = {
-            "Authorization": f"Bearer {self.api_token}",
-            "Content-Type": "application/json"
-        }
         
         try:
-            if method == "GET":
-                response = requests.get(url, headers=headers, timeout=10)
-            elif method == "POST":
-                response = requests.post(url, headers=headers, json=data, timeout=10)
-            elif method == "PUT":
-                response = requests.put(url, headers=headers, json=data, timeout=10)
-            elif method == "DELETE":
-                response = requests.delete(url, headers=headers, timeout=10)
-            else:
-                return False, f"Unsupported method: {method}"
+            response = self.session.request(method, url, headers=self._headers(),
+                                            json=data if method in ("POST", "PUT") else None, timeout=10)
             
             response_data = response.json()
             
@@ -175,6 +197,8 @@ class CloudflareDNSManager:
         
         if success:
             _log_info(f"Created DNS record: {record_type} {name} -> {content}")
+            if isinstance(result, dict) and result.get("id"):
+                self._cache_record(zone_id, name, record_type, content, result["id"])
         else:
             _log_error(f"Failed to create DNS record: {result}")
         
@@ -214,6 +238,8 @@ class CloudflareDNSManager:
         
         if success:
             _log_info(f"Updated DNS record: {record_type} {name} -> {content}")
+            self._uncache_record(zone_id, record_id)
+            self._cache_record(zone_id, name, record_type, content, record_id)
         else:
             _log_error(f"Failed to update DNS record: {result}")
         
@@ -235,17 +261,99 @@ class CloudflareDNSManager:
         
         if success:
             _log_info(f"Deleted DNS record: {record_id}")
+            self._uncache_record(zone_id, record_id)
         else:
             _log_error(f"Failed to delete DNS record: {result}")
         
         return success, result
     
+    def get_cached_records(self, zone_id: str, name: str, max_age: Optional[float] = None) -> Tuple[bool, Any]:
+        """
+        Get the A/AAAA records of a name from the cache, revalidating a stale view
+        
+        A stale view is revalidated with If-None-Match; a 304 keeps the cached records.
+        
+        Args:
+            zone_id: Cloudflare zone ID
+            name: Record name
+            max_age: Seconds a cached view is trusted (defaults to RECORD_CACHE_TTL)
+            
+        Returns:
+            Tuple of (success, {(type, content): record_id} or error message)
+        """
+        max_age = self.RECORD_CACHE_TTL if max_age is None else max_age
+        key = (zone_id, name)
+        with self._cache_lock:
+            cached = self._record_cache.get(key)
+            if cached is not None and time.monotonic() - cached["fetched_at"] < max_age:
+                return True, dict(cached["records"])
+            etag = cached["etag"] if cached is not None else None
+        
+        if not self.api_token:
+            return False, "Cloudflare API token not configured"
+        
+        headers = self._headers()
+        if etag:
+            headers["If-None-Match"] = etag
+        try:
+            response = self.session.get(f"{self.base_url}/zones/{zone_id}/dns_records", headers=headers,
+                                        params={"name": name, "per_page": 1000}, timeout=10)
+            if response.status_code == 304 and cached is not None:
+                with self._cache_lock:
+                    cached["fetched_at"] = time.monotonic()
+                    return True, dict(cached["records"])
+            response_data = response.json()
+            if response.status_code != 200 or not response_data.get("success"):
+                errors = response_data.get("errors", [])
+                return False, errors[0].get("message") if errors else f"HTTP {response.status_code}"
+        except requests.exceptions.RequestException as e:
+            return False, str(e)
+        except Exception as e:
+            return False, str(e)
+        
+        records = {
+            (record["type"], record["content"]): record["id"]
+            for record in response_data.get("result") or []
+            if record.get("type") in ("A", "AAAA")
+        }
+        with self._cache_lock:
+            self._record_cache[key] = {
+                "records": records,
+                "etag": response.headers.get("ETag"),
+                "fetched_at": time.monotonic()
+            }
+        return True, dict(records)
+    
+    def invalidate_cache(self, zone_id: str = None, name: str = None):
+        """Drop cached record views, all of them or those of one zone/name"""
+        with self._cache_lock:
+            if zone_id is None:
+                self._record_cache.clear()
+            else:
+                for key in [k for k in self._record_cache if k[0] == zone_id and (name is None or k[1] == name)]:
+                    del self._record_cache[key]
+    
+    def _cache_record(self, zone_id: str, name: str, record_type: str, content: str, record_id: str):
+        with self._cache_lock:
+            cached = self._record_cache.get((zone_id, name))
+            if cached is not None:
+                cached["records"][(record_type, content)] = record_id
+    
+    def _uncache_record(self, zone_id: str, record_id: str):
+        with self._cache_lock:
+            for (cached_zone, _), cached in self._record_cache.items():
+                if cached_zone != zone_id:
+                    continue
+                for record_key in [k for k, v in cached["records"].items() if v == record_id]:
+                    del cached["records"][record_key]
+    
     def sync_node_ips_to_dns(self, zone_id: str, record_name: str, node_ips: List[str], 
                             ttl: int = 60) -> Tuple[bool, str]:
         """
         Sync node IPs to DNS records (A and AAAA)
-        Creates/updates records to match the provided list of IPs
-        Removes records that are not in the list
+        Creates records for new IPs and removes records that are not in the list.
+        The diff is computed against the cached record view, so an unchanged
+        set costs no API calls; required mutations are sent concurrently.
         All records are created with proxied=False (DNS-only)
         
         Args:
@@ -261,59 +369,40 @@ class CloudflareDNSManager:
             # Enforce DNS-only (no proxy)
             proxied = False
             
-            # Separate IPv4 and IPv6
-            ipv4_addresses = [ip for ip in node_ips if ':' not in ip]
-            ipv6_addresses = [ip for ip in node_ips if ':' in ip]
-            
-            # Get existing A records
-            success_a, existing_a = self.list_dns_records(zone_id, record_name, "A")
-            if not success_a:
-                existing_a = []
+            success, existing = self.get_cached_records(zone_id, record_name)
+            if not success:
+                return False, f"Failed to list DNS records: {existing}"
             
-            # Get existing AAAA records
-            success_aaaa, existing_aaaa = self.list_dns_records(zone_id, record_name, "AAAA")
-            if not success_aaaa:
-                existing_aaaa = []
+            # Separate IPv4 and IPv6
+            desired = {("AAAA" if ':' in ip else "A", ip) for ip in node_ips}
+            to_create = sorted(desired - set(existing))
+            to_delete = sorted(existing[key] for key in set(existing) - desired)
             
-            # Process A records
-            existing_a_ips = {record['content']: record['id'] for record in existing_a} if isinstance(existing_a, list) else {}
+            # A newer desired set supersedes queued retries for this name
+            self._drop_retries(zone_id, record_name)
             
-            for ip in ipv4_addresses:
-                if ip in existing_a_ips:
-                    # Record exists, update if needed
-                    record_id = existing_a_ips[ip]
-                    existing_a_ips.pop(ip)  # Remove from list to track deletions
-                else:
-                    # Create new record
-                    success, result = self.create_dns_record(zone_id, "A", record_name, ip, ttl, False)
-                    if not success:
-                        self._queue_retry("create", zone_id, "A", record_name, ip, ttl)
+            if not to_create and not to_delete:
+                return True, "DNS records already in sync"
             
-            # Delete A records that are no longer needed
-            for ip, record_id in existing_a_ips.items():
-                success, result = self.delete_dns_record(zone_id, record_id)
+            def create(record):
+                record_type, ip = record
+                success, _ = self.create_dns_record(zone_id, record_type, record_name, ip, ttl, proxied)
                 if not success:
-                    self._queue_retry("delete", zone_id, None, None, None, None, record_id)
-            
-            # Process AAAA records
-            existing_aaaa_ips = {record['content']: record['id'] for record in existing_aaaa} if isinstance(existing_aaaa, list) else {}
-            
-            for ip in ipv6_addresses:
-                if ip in existing_aaaa_ips:
-                    # Record exists
-                    existing_aaaa_ips.pop(ip)  # Remove from list to track deletions
-                else:
-                    # Create new record
-                    success, result = self.create_dns_record(zone_id, "AAAA", record_name, ip, ttl, False)
-                    if not success:
-                        self._queue_retry("create", zone_id, "AAAA", record_name, ip, ttl)
+                    self._queue_retry("create", zone_id, record_type, record_name, ip, ttl)
+                return success
             
-            # Delete AAAA records that are no longer needed
-            for ip, record_id in existing_aaaa_ips.items():
-                success, result = self.delete_dns_record(zone_id, record_id)
+            def delete(record_id):
+                success, _ = self.delete_dns_record(zone_id, record_id)
                 if not success:
-                    self._queue_retry("delete", zone_id, None, None, None, None, record_id)
+                    self._queue_retry("delete", zone_id, None, record_name, None, None, record_id)
+                return success
+            
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(to_create) + len(to_delete))) as executor:
+                results = list(executor.map(create, to_create)) + list(executor.map(delete, to_delete))
             
+            failed = results.count(False)
+            if failed:
+                return True, f"DNS records synced, {failed} operations queued for retry"
             return True, "DNS records synced successfully"
         
         except Exception as e:
@@ -323,7 +412,7 @@ class CloudflareDNSManager:
     def _queue_retry(self, operation: str, zone_id: str, record_type: str = None, 
                     name: str = None, content: str = None, ttl: int = None, 
                     record_id: str = None):
-        """Queue a failed operation for retry"""
+        """Queue a failed operation for retry after its backoff delay"""
         retry_item = {
             "operation": operation,
             "zone_id": zone_id,
@@ -333,15 +422,25 @@ class CloudflareDNSManager:
             "ttl": ttl,
             "record_id": record_id,
             "timestamp": time.time(),
-            "retry_count": 0
+            "retry_count": 0,
+            "next_attempt": time.monotonic() + self.RETRY_BASE_DELAY
         }
-        self.retry_queue.append(retry_item)
+        with self._retry_condition:
+            self.retry_queue.append(retry_item)
+            self._retry_condition.notify()
         _log_info(f"Queued {operation} operation for retry")
         
         # Start retry thread if not running
         if not self._retry_thread or not self._retry_thread.is_alive():
             self._start_retry_thread()
     
+    def _drop_retries(self, zone_id: str, name: str):
+        with self._retry_condition:
+            kept = [item for item in self.retry_queue if (item["zone_id"], item["name"]) != (zone_id, name)]
+            if len(kept) != len(self.retry_queue):
+                self.retry_queue.clear()
+                self.retry_queue.extend(kept)
+    
     def _start_retry_thread(self):
         """Start the retry thread"""
         self._stop_retry_thread = False
@@ -349,11 +448,19 @@ class CloudflareDNSManager:
         self._retry_thread.start()
     
     def _retry_worker(self):
-        """Worker thread that processes retry queue"""
+        """Worker thread that retries each queued item when its own backoff timer expires"""
         while not self._stop_retry_thread:
-            if self.retry_queue:
-                item = self.retry_queue.popleft()
-                
+            with self._retry_condition:
+                now = time.monotonic()
+                due = [item for item in self.retry_queue if item["next_attempt"] <= now]
+                if not due:
+                    next_attempt = min((item["next_attempt"] for item in self.retry_queue), default=None)
+                    self._retry_condition.wait(timeout=None if next_attempt is None else next_attempt - now)
+                    continue
+                for item in due:
+                    self.retry_queue.remove(item)
+            
+            for item in due:
                 # Attempt retry
                 success = False
                 if item["operation"] == "create":
@@ -366,16 +473,19 @@ class CloudflareDNSManager:
                 
                 if not success:
                     item["retry_count"] += 1
-                    if item["retry_count"] < 5:  # Max 5 retries
-                        self.retry_queue.append(item)
-                        _log_info(f"Retry {item['retry_count']}/5 for {item['operation']}")
+                    if item["retry_count"] < self.MAX_RETRIES:
+                        delay = min(self.RETRY_BASE_DELAY * 2 ** item["retry_count"], self.RETRY_MAX_DELAY)
+                        item["next_attempt"] = time.monotonic() + delay
+                        with self._retry_condition:
+                            self.retry_queue.append(item)
+                        _log_info(f"Retry {item['retry_count']}/{self.MAX_RETRIES} for {item['operation']} in {delay}s")
                     else:
                         _log_error(f"Max retries reached for {item['operation']}, giving up")
-            
-            time.sleep(30)  # Wait 30 seconds between retries
     
     def stop_retry_thread(self):
         """Stop the retry thread"""
-        self._stop_retry_thread = True
+        with self._retry_condition:
+            self._stop_retry_thread = True
+            self._retry_condition.notify()
         if self._retry_thread:
             self._retry_thread.join(timeout=5)
@@ -0,0 +1,187 @@
+"""
+Configuration Schema
+Indexes and versioned upgrades of the per-configuration tables
+"""
+from datetime import datetime
+
+import sqlalchemy as db
+
+
+def _index(table: db.Table, suffix: str, *columns: str, unique: bool = False) -> db.Index:
+    """Index named ix_<table>_<suffix>, or ux_<table>_<suffix> if unique, declared on the table once"""
+    name = f'{"ux" if unique else "ix"}_{table.name}_{suffix}'
+    index = next((i for i in table.indexes if i.name == name), None)
+    if index is None:
+        index = db.Index(name, *[table.c[c] for c in columns], unique=unique)
+    return index
+
+
+class ConfigurationSchema:
+    """
+    Brings a configuration's tables created by an older version up to date. Every
+    migration is idempotent and the version reached is stored per configuration in
+    ConfigurationsSchemaVersion after each step, so an interrupted upgrade resumes
+    where it stopped and an up to date configuration costs one lookup.
+
+    Indexes are declared on the table objects whatever the stored version, so the
+    monthly partitions created later get them too.
+    """
+    def __init__(self, configuration, dbName: str):
+        self.configuration = configuration
+        self.dbName = dbName
+        self.engine: db.Engine = configuration.engine
+        self.versionTable = db.Table(
+            'ConfigurationsSchemaVersion', configuration.metadata,
+            db.Column('ID', db.String(255), primary_key=True),
+            db.Column('Version', db.Integer, nullable=False),
+            db.Column('UpdatedAt', (db.DATETIME if self.engine.dialect.name == 'sqlite' else db.TIMESTAMP)),
+            extend_existing=True
+        )
+        self.versionTable.create(self.engine, checkfirst=True)
+        self.__declareIndexes()
+        self.migrations = [
+            (1, "Add columns missing from older peer tables", self.__addMissingColumns),
+            (2, "Index peers by node and interface", self.__createPeerIndexes),
+            (3, "Index transfer and endpoint history by peer and time", self.__createHistoryIndexes),
+            (4, "Keep one endpoint history row per peer and endpoint", self.__deduplicateEndpoints),
+        ]
+
+    @property
+    def latestVersion(self) -> int:
+        return self.migrations[-1][0]
+
+    def __declareIndexes(self):
+        c = self.configuration
+        if 'node_id' in c.peersTable.c:
+            _index(c.peersTable, 'node_id_iface', 'node_id', 'iface')
+        _index(c.peersTransferTable, 'id_time', 'id', 'time')
+        _index(c.peersTransferTable, 'time', 'time')
+        _index(c.peersHistoryEndpointTable, 'id_endpoint', 'id', 'endpoint', unique=True)
+        _index(c.peersHistoryEndpointTable, 'time', 'time')
+
+    def getVersion(self) -> int:
+        with self.engine.connect() as conn:
+            version = conn.execute(
+                db.select(self.versionTable.c.Version).where(self.versionTable.c.ID == self.dbName)
+            ).scalar()
+        return version or 0
+
+    def __setVersion(self, version: int):
+        with self.engine.begin() as conn:
+            updated = conn.execute(
+                self.versionTable.update().where(self.versionTable.c.ID == self.dbName).values(
+                    Version=version, UpdatedAt=datetime.now()
+                )
+            ).rowcount
+            if not updated:
+                conn.execute(self.versionTable.insert().values(
+                    ID=self.dbName, Version=version, UpdatedAt=datetime.now()
+                ))
+
+    def deleteVersion(self, dbName: str):
+        with self.engine.begin() as conn:
+            conn.execute(self.versionTable.delete().where(self.versionTable.c.ID == dbName))
+
+    def migrate(self) -> list[int]:
+        """
+        Run the migrations newer than the stored version
+
+        Returns:
+            Versions that were applied
+        """
+        current = self.getVersion()
+        applied = []
+        for version, _, migration in self.migrations:
+            if version > current:
+                migration()
+                self.__setVersion(version)
+                applied.append(version)
+        return applied
+
+    def __addMissingColumns(self):
+        """Columns added to the peer tables since they were created, all nullable"""
+        c = self.configuration
+        self.__addColumns([c.peersTable, c.peersRestrictedTable, c.peersDeletedTable])
+
+    def __addColumns(self, tables: list[db.Table]):
+        with self.engine.begin() as conn:
+            inspector = db.inspect(conn)
+            for table in tables:
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing and column.nullable:
+                        conn.execute(db.text(
+                            f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" '
+                            f'{column.type.compile(dialect=conn.dialect)}'
+                        ))
+
+    def __createPeerIndexes(self):
+        self.__createIndexes([self.configuration.peersTable])
+
+    def __createHistoryIndexes(self):
+        c = self.configuration
+        self.__createIndexes(c.peersTransferPartitions.tables(), c.peersTransferPartitions.native, unique=False)
+        self.__createIndexes(c.peersHistoryEndpointPartitions.tables(), c.peersHistoryEndpointPartitions.native,
+                             unique=False)
+
+    def __deduplicateEndpoints(self):
+        """
+        Older versions added an endpoint history row whenever a peer's endpoint was
+        not in the history yet. The rows get first_seen, last_seen and seen_count,
+        any duplicate of a peer and endpoint is merged into one row, and the index on
+        (id, endpoint) is replaced with a unique one that the poller upserts against.
+        Natively partitioned tables get the unique index on every partition instead.
+        """
+        partitions = self.configuration.peersHistoryEndpointPartitions
+        tables = partitions.tables()
+        storage = [p for _, p in sorted(partitions.partitions().items())] if partitions.native else tables
+        self.__addColumns(tables)
+        with self.engine.begin() as conn:
+            for table in tables:
+                conn.execute(table.update().where(table.c.seen_count.is_(None)).values(
+                    first_seen=table.c.time, last_seen=table.c.time, seen_count=1
+                ))
+            for table in storage:
+                duplicates = conn.execute(
+                    db.select(
+                        table.c.id, table.c.endpoint, db.func.min(table.c.time).label("time"),
+                        db.func.min(table.c.first_seen).label("first_seen"),
+                        db.func.max(table.c.last_seen).label("last_seen"),
+                        db.func.sum(table.c.seen_count).label("seen_count")
+                    ).group_by(table.c.id, table.c.endpoint).having(db.func.count() > 1)
+                ).mappings().fetchall()
+                for row in duplicates:
+                    conn.execute(table.delete().where(
+                        db.and_(table.c.id == row["id"], table.c.endpoint == row["endpoint"])
+                    ))
+                    conn.execute(table.insert().values(**row))
+            inspector = db.inspect(conn)
+            for table in tables:
+                name = f'ix_{table.name}_id_endpoint'
+                if name in {i['name'] for i in inspector.get_indexes(table.name)}:
+                    quote = conn.dialect.identifier_preparer.quote
+                    conn.execute(db.text(
+                        f'DROP INDEX {quote(name)} ON {quote(table.name)}' if conn.dialect.name == 'mysql'
+                        else f'DROP INDEX {quote(name)}'
+                    ))
+        self.__createIndexes(storage, partitions.native, unique=True)
+
+    def __createIndexes(self, tables: list[db.Table], partitioned: bool = False, unique: bool = None):
+        """
+        Build the declared indexes that do not exist yet. On PostgreSQL they are built
+        concurrently, except on natively partitioned tables where that is not
+        supported, and MySQL builds InnoDB indexes in place, so the poller keeps
+        writing during the backfill. SQLite holds the write lock while an index is
+        built. unique limits the build to the unique or to the other indexes.
+        """
+        concurrently = self.engine.dialect.name == 'postgresql' and not partitioned
+        for table in tables:
+            for index in table.indexes:
+                if unique is not None and index.unique != unique:
+                    continue
+                if concurrently:
+                    index.dialect_options['postgresql']['concurrently'] = True
+                    with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                        index.create(conn, checkfirst=True)
+                else:
+                    index.create(self.engine, checkfirst=True)
@@ -0,0 +1,153 @@
+"""
+DNS Failover Manager
+Turns node health checks into config node health transitions with hysteresis
+and coalesces the resulting DNS updates
+"""
+import threading
+from typing import Callable, Dict, Optional, Set
+
+try:
+    from flask import current_app
+    _has_flask = True
+except ImportError:
+    _has_flask = False
+
+
+def _log_info(msg):
+    """Helper to log info messages"""
+    if _has_flask:
+        try:
+            current_app.logger.info(msg)
+        except (RuntimeError, NameError):
+            pass
+
+
+def _log_error(msg, exc=None):
+    """Helper to log error messages"""
+    if _has_flask:
+        try:
+            if exc:
+                current_app.logger.error(msg, exc)
+            else:
+                current_app.logger.error(msg)
+        except (RuntimeError, NameError):
+            pass
+
+
+class DNSFailoverManager:
+    """
+    Health state machine for DNS failover
+
+    A node is marked unhealthy after UNHEALTHY_THRESHOLD consecutive failed checks
+    and healthy again after HEALTHY_THRESHOLD consecutive good checks, so a flapping
+    node does not toggle its records on every poll. Transitions are collected for
+    COALESCE_WINDOW seconds and then applied together: every affected config node
+    assignment is updated and each affected configuration gets a single DNS update.
+    """
+
+    UNHEALTHY_THRESHOLD = 3
+    HEALTHY_THRESHOLD = 2
+    COALESCE_WINDOW = 5
+
+    def __init__(self, ConfigNodesManager, updateDNS: Callable[[str], None],
+                 unhealthy_threshold: int = None, healthy_threshold: int = None,
+                 coalesce_window: float = None):
+        """
+        Args:
+            ConfigNodesManager: Config nodes manager holding the per-config health flags
+            updateDNS: Called with a configuration name to republish its records
+            unhealthy_threshold: Consecutive failed checks before a node is removed
+            healthy_threshold: Consecutive good checks before a node is re-added
+            coalesce_window: Seconds transitions are collected before they are applied
+        """
+        self.ConfigNodesManager = ConfigNodesManager
+        self.updateDNS = updateDNS
+        self.unhealthy_threshold = unhealthy_threshold or self.UNHEALTHY_THRESHOLD
+        self.healthy_threshold = healthy_threshold or self.HEALTHY_THRESHOLD
+        self.coalesce_window = self.COALESCE_WINDOW if coalesce_window is None else coalesce_window
+        self.__lock = threading.Lock()
+        self.__healthy: Dict[str, bool] = {}
+        self.__streak: Dict[str, int] = {}
+        self.__pending: Dict[str, bool] = {}
+        self.__timer: Optional[threading.Timer] = None
+
+    def observe(self, node_id: str, healthy: bool) -> Optional[bool]:
+        """
+        Feed one health check result of a node
+
+        Returns:
+            The node's new state when this check caused a transition, otherwise None
+        """
+        initial = True
+        if node_id not in self.__healthy:
+            # Start from the stored assignment state so a restart does not re-announce nodes
+            assignments = self.ConfigNodesManager.getConfigsForNode(node_id)
+            initial = all(cn.is_healthy for cn in assignments)
+
+        with self.__lock:
+            state = self.__healthy.setdefault(node_id, initial)
+            if healthy == state:
+                self.__streak[node_id] = 0
+                return None
+
+            streak = self.__streak.get(node_id, 0) + 1
+            threshold = self.healthy_threshold if healthy else self.unhealthy_threshold
+            if streak < threshold:
+                self.__streak[node_id] = streak
+                return None
+
+            self.__healthy[node_id] = healthy
+            self.__streak[node_id] = 0
+            if node_id in self.__pending and self.__pending[node_id] != healthy:
+                # Reverted before the window closed, nothing to apply
+                del self.__pending[node_id]
+            else:
+                self.__pending[node_id] = healthy
+            if self.__pending and self.__timer is None:
+                self.__timer = threading.Timer(self.coalesce_window, self.flush)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+        _log_info(f"Node {node_id} is now {'healthy' if healthy else 'unhealthy'} after {streak} checks")
+        return healthy
+
+    def isHealthy(self, node_id: str) -> Optional[bool]:
+        """Debounced state of a node, or None if it has not been observed"""
+        with self.__lock:
+            return self.__healthy.get(node_id)
+
+    def forgetNode(self, node_id: str):
+        """Drop the state of a deleted node"""
+        with self.__lock:
+            self.__healthy.pop(node_id, None)
+            self.__streak.pop(node_id, None)
+            self.__pending.pop(node_id, None)
+
+    def flush(self) -> Set[str]:
+        """
+        Apply the collected transitions now
+
+        Returns:
+            Names of the configurations whose DNS was updated
+        """
+        with self.__lock:
+            pending, self.__pending = self.__pending, {}
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+
+        configs = set()
+        for node_id, healthy in pending.items():
+            for assignment in self.ConfigNodesManager.getConfigsForNode(node_id):
+                if assignment.is_healthy != healthy:
+                    self.ConfigNodesManager.updateNodeHealth(assignment.config_name, node_id, healthy)
+                    configs.add(assignment.config_name)
+
+        for config_name in sorted(configs):
+            try:
+                self.updateDNS(config_name)
+            except Exception as e:
+                _log_error(f"Error updating DNS for {config_name} after failover: {e}")
+        if configs:
+            _log_info(f"Applied {len(pending)} node health transitions to {len(configs)} configurations")
+        return configs
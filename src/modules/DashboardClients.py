@@ -14,12 +14,13 @@ from .DashboardClientsTOTP import DashboardClientsTOTP
 from .DashboardOIDC import DashboardOIDC
 from .Utilities import ValidatePasswordStrength
 from .DashboardLogger import DashboardLogger
+from .LogQueue import LogQueue
 from flask import session
 
 
 class DashboardClients:
-    def __init__(self, wireguardConfigurations):
-        self.logger = DashboardLogger()
+    def __init__(self, wireguardConfigurations, logQueue: LogQueue = None):
+        self.logger = DashboardLogger(logQueue)
         self.engine = db.create_engine(ConnectionString("wgdashboard"))
         self.metadata = db.MetaData()
         self.OIDC = DashboardOIDC("Client")
@@ -77,7 +78,7 @@ class DashboardClients:
         self.ClientsRaw = []
         self.__getClients()
         self.DashboardClientsTOTP = DashboardClientsTOTP()
-        self.DashboardClientsPeerAssignment = DashboardClientsPeerAssignment(wireguardConfigurations)
+        self.DashboardClientsPeerAssignment = DashboardClientsPeerAssignment(wireguardConfigurations, logQueue)
         
     def __getClients(self):
         with self.engine.connect() as conn:
@@ -3,6 +3,7 @@ import uuid
 
 from .ConnectionString import ConnectionString
 from .DashboardLogger import DashboardLogger
+from .LogQueue import LogQueue
 import sqlalchemy as db
 from .WireguardConfiguration import WireguardConfiguration
 
@@ -29,8 +30,8 @@ class Assignment:
         }
         
 class DashboardClientsPeerAssignment:
-    def __init__(self, wireguardConfigurations: dict[str, WireguardConfiguration]):
-        self.logger = DashboardLogger()
+    def __init__(self, wireguardConfigurations: dict[str, WireguardConfiguration], logQueue: LogQueue = None):
+        self.logger = DashboardLogger(logQueue)
         self.engine = db.create_engine(ConnectionString("wgdashboard"))
         self.metadata = db.MetaData()
         self.wireguardConfigurations = wireguardConfigurations
@@ -49,6 +50,9 @@ class DashboardClientsPeerAssignment:
         )
         self.metadata.create_all(self.engine)
         self.assignments: list[Assignment] = []
+        self.__byID: dict[str, Assignment] = {}
+        self.__byClient: dict[str, list[Assignment]] = {}
+        self.__byPeer: dict[tuple[str, str], list[Assignment]] = {}
         self.__getAssignments()
         
     def __getAssignments(self):
@@ -61,40 +65,54 @@ class DashboardClientsPeerAssignment:
             ).mappings().fetchall()
             for a in get:
                 assignments.append(Assignment(**a))
-            self.assignments = assignments
+        self.__byID = {}
+        self.__byClient = {}
+        self.__byPeer = {}
+        for a in assignments:
+            self.__index(a)
+        self.assignments = assignments
             
+    def __index(self, a: Assignment):
+        self.__byID[a.AssignmentID] = a
+        self.__byClient.setdefault(a.ClientID, []).append(a)
+        self.__byPeer.setdefault((a.ConfigurationName, a.PeerID), []).append(a)
+
+    def __unindex(self, a: Assignment):
+        self.__byID.pop(a.AssignmentID, None)
+        for index, key in ((self.__byClient, a.ClientID), (self.__byPeer, (a.ConfigurationName, a.PeerID))):
+            remaining = [e for e in index.get(key, []) if e.AssignmentID != a.AssignmentID]
+            if remaining:
+                index[key] = remaining
+            else:
+                index.pop(key, None)
+        self.assignments = [e for e in self.assignments if e.AssignmentID != a.AssignmentID]
             
     def AssignClient(self, ClientID, ConfigurationName, PeerID):
-        existing = list(
-            filter(lambda e: 
-                   e.ClientID == ClientID and 
-                   e.ConfigurationName == ConfigurationName and
-                   e.PeerID == PeerID, self.assignments)
-        )
+        existing = [e for e in self.__byPeer.get((ConfigurationName, PeerID), []) if e.ClientID == ClientID]
         if len(existing) == 0:
             if ConfigurationName in self.wireguardConfigurations.keys():
                 config = self.wireguardConfigurations.get(ConfigurationName)
-                peer = list(filter(lambda x : x.id == PeerID, config.Peers))
-                if len(peer) == 1:
+                found, _ = config.searchPeer(PeerID)
+                if found:
                     with self.engine.begin() as conn:
                         data = {
                             "AssignmentID": str(uuid.uuid4()),
                             "ClientID": ClientID,
                             "ConfigurationName": ConfigurationName,
-                            "PeerID": PeerID
+                            "PeerID": PeerID,
+                            "AssignedDate": datetime.datetime.now()
                         }
                         conn.execute(
                             self.dashboardClientsPeerAssignmentTable.insert().values(data)
                         )
-                    self.__getAssignments()
+                    assignment = Assignment(**data)
+                    self.__index(assignment)
+                    self.assignments.append(assignment)
                     return True, data
         return False, None
     
     def UnassignClients(self, AssignmentID):
-        existing = list(
-            filter(lambda e:
-                   e.AssignmentID == AssignmentID, self.assignments)
-        )
+        existing = self.__byID.get(AssignmentID)
         if not existing:
             return False
         with self.engine.begin() as conn:
@@ -105,8 +123,8 @@ class DashboardClientsPeerAssignment:
                     self.dashboardClientsPeerAssignmentTable.c.AssignmentID == AssignmentID
                 )
             )
-            self.__getAssignments()
-            return True
+        self.__unindex(existing)
+        return True
         
     def UnassignPeers(self, ClientID):
         with self.engine.begin() as conn:
@@ -120,29 +138,27 @@ class DashboardClientsPeerAssignment:
                     )
                 )
             )
-            self.__getAssignments()
-            return True
+        for a in list(self.__byClient.get(ClientID, [])):
+            self.__unindex(a)
+        return True
     
     def GetAssignedClients(self, ConfigurationName, PeerID) -> list[Assignment]:
-        self.__getAssignments()
-        return list(filter(
-            lambda c : c.ConfigurationName == ConfigurationName and 
-                       c.PeerID == PeerID, self.assignments))
+        return list(self.__byPeer.get((ConfigurationName, PeerID), []))
     
     def GetAssignedPeers(self, ClientID):
-        self.__getAssignments()
-        
         peers = []
-        assigned = filter(lambda e:
-                          e.ClientID == ClientID, self.assignments)
-        
-        for a in assigned:
-            peer = filter(lambda e : e.id == a.PeerID, 
-                          self.wireguardConfigurations[a.ConfigurationName].Peers)
-            for p in peer:
+        peersByConfiguration: dict[str, dict] = {}
+        for a in self.__byClient.get(ClientID, []):
+            configuration = self.wireguardConfigurations.get(a.ConfigurationName)
+            if configuration is None:
+                continue
+            if a.ConfigurationName not in peersByConfiguration:
+                peersByConfiguration[a.ConfigurationName] = {p.id: p for p in configuration.Peers}
+            p = peersByConfiguration[a.ConfigurationName].get(a.PeerID)
+            if p is not None:
                 peers.append({
                     'assignment_id': a.AssignmentID,
-                    'protocol': self.wireguardConfigurations[a.ConfigurationName].Protocol,
+                    'protocol': configuration.Protocol,
                     'id': p.id,
                     'private_key': p.private_key,
                     'name': p.name,
@@ -156,4 +172,4 @@ class DashboardClientsPeerAssignment:
                     'configuration_name': a.ConfigurationName,
                     'peer_configuration_data': p.downloadPeer()
                 })
-        return peers
\ No newline at end of file
+        return peers
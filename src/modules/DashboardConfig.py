@@ -12,6 +12,7 @@ from .Utilities import (
     GetRemoteEndpoint, ValidateDNSAddress
 )
 from .DashboardAPIKey import DashboardAPIKey
+from .LogPagination import CreateIndexes
 
 
 
@@ -60,12 +61,31 @@ class DashboardConfig:
             "Other": {
                 "welcome_session": "true"
             },
+            "WebHooks": {
+                "delivery_workers": "4",
+                "batch_window": "0"
+            },
+            "Logging": {
+                "queue_size": "10000",
+                "overflow": "drop_oldest",
+                "batch_size": "500",
+                "flush_interval": "1",
+                "block_timeout": "5"
+            },
+            "TrafficRollups": {
+                "raw_retention_days": "2",
+                "minute_retention_days": "14",
+                "hour_retention_days": "180",
+                "day_retention_days": "0",
+                "history_endpoint_retention_days": "0"
+            },
             "Database":{
                 "type": "sqlite",
                 "host": "",
                 "port": "",
                 "username": "",
-                "password": ""
+                "password": "",
+                "time_partitioning": "false"
             },
             "Email":{
                 "server": "",
@@ -108,6 +128,7 @@ class DashboardConfig:
         self.__createEndpointGroupsTable()
         self.__createAuditLogTable()
         self.__createNodeInterfacesTable()
+        self.__createNodeMetricsTable()
         self.DashboardAPIKeys = self.__getAPIKeys()
         self.APIAccessed = False
         self.SetConfig("Server", "version", DashboardConfig.DashboardVersion)
@@ -267,9 +288,15 @@ class DashboardConfig:
                                       db.Column('entity_type', db.String(50), nullable=False),
                                       db.Column('entity_id', db.String(255), nullable=True),
                                       db.Column('details', db.Text, nullable=True),
-                                      db.Column('user', db.String(255), nullable=True)
+                                      db.Column('user', db.String(255), nullable=True),
+                                      # Keyset pagination indexes, one per filter of the log viewer
+                                      db.Index('ix_AuditLog_timestamp_id', 'timestamp', 'id'),
+                                      db.Index('ix_AuditLog_action_timestamp_id', 'action', 'timestamp', 'id'),
+                                      db.Index('ix_AuditLog_user_timestamp_id', 'user', 'timestamp', 'id'),
+                                      db.Index('ix_AuditLog_entity_timestamp_id', 'entity_type', 'entity_id', 'timestamp', 'id')
                                       )
         self.dbMetadata.create_all(self.engine)
+        CreateIndexes(self.engine, self.auditLogTable)
     
     def __createNodeInterfacesTable(self):
         """Create node interfaces table for managing multiple interfaces per node"""
@@ -298,6 +325,26 @@ class DashboardConfig:
                                            db.UniqueConstraint('node_id', 'interface_name', name='uq_node_interface')
                                            )
         self.dbMetadata.create_all(self.engine)
+
+    def __createNodeMetricsTable(self):
+        """Create typed node metrics time series (raw samples are downsampled over time)"""
+        self.nodeMetricsTable = db.Table('NodeMetrics', self.dbMetadata,
+                                         db.Column('id', db.Integer, primary_key=True, autoincrement=True),
+                                         db.Column('node_id', db.String(255), nullable=False),
+                                         db.Column('time',
+                                                   (db.DATETIME if self.GetConfig('Database', 'type')[1] == 'sqlite' else db.TIMESTAMP),
+                                                   nullable=False),
+                                         db.Column('resolution', db.Integer, nullable=False, server_default='60'),
+                                         db.Column('status', db.String(20), nullable=False),
+                                         db.Column('cpu_percent', db.Float, nullable=True),
+                                         db.Column('memory_percent', db.Float, nullable=True),
+                                         db.Column('peer_count', db.Integer, nullable=True),
+                                         db.Column('active_peers', db.Integer, nullable=True),
+                                         db.Column('interface_count', db.Integer, nullable=True),
+                                         db.Column('latency_ms', db.Float, nullable=True),
+                                         db.Index('ix_NodeMetrics_node_id_time', 'node_id', 'time')
+                                         )
+        self.dbMetadata.create_all(self.engine)
     
     def __getAPIKeys(self) -> list[DashboardAPIKey]:
         try:
@@ -2,13 +2,17 @@
 Dashboard Logger Class
 """
 import uuid
+from datetime import datetime
+
 import sqlalchemy as db
 from flask import current_app
 from .ConnectionString import ConnectionString
+from .LogQueue import LogQueue
 
 
 class DashboardLogger:
-    def __init__(self):
+    def __init__(self, logQueue: LogQueue = None):
+        self.logQueue = logQueue
         self.engine = db.create_engine(ConnectionString("wgdashboard_log"))
         self.metadata = db.MetaData()
         self.dashboardLoggerTable = db.Table('DashboardLog', self.metadata,
@@ -27,17 +31,19 @@ class DashboardLogger:
         self.log(Message="WGDashboard started")
 
     def log(self, URL: str = "", IP: str = "", Status: str = "true", Message: str = "") -> bool:
+        row = {
+            "LogID": str(uuid.uuid4()),
+            "LogDate": datetime.now(),
+            "URL": URL,
+            "IP": IP,
+            "Status": Status,
+            "Message": Message
+        }
+        if self.logQueue is not None:
+            return self.logQueue.put(self.engine, self.dashboardLoggerTable, row)
         try:
             with self.engine.begin() as conn:
-                conn.execute(
-                    self.dashboardLoggerTable.insert().values(
-                        LogID=str(uuid.uuid4()),
-                        URL=URL,
-                        IP=IP,
-                        Status=Status,
-                        Message=Message
-                    )
-                )
+                conn.execute(self.dashboardLoggerTable.insert().values(row))
             return True
         except Exception as e:
             current_app.logger.error(f"Access Log Error", e)
@@ -1,14 +1,19 @@
+import heapq
 import json
 import threading
 import time
 import urllib.parse
 import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import requests
+from requests.adapters import HTTPAdapter
 from pydantic import BaseModel, field_serializer
 import sqlalchemy as db
 from .ConnectionString import ConnectionString
+from .LogPagination import CreateIndexes, KeysetPage
 from flask import current_app
 
 WebHookActions = ['peer_created', 'peer_deleted', 'peer_updated']
@@ -39,9 +44,25 @@ class WebHookSessionLogs(BaseModel):
         self.Logs.append(WebHookSessionLog(LogTime=datetime.now(), Status=status, Message=message))
 
 class DashboardWebHooks:
-    def __init__(self, DashboardConfig):
+    """
+    Events are written to the DashboardWebHookOutbox table and delivered by a fixed
+    pool of workers with pooled HTTP sessions. A dispatcher thread keeps the outbox
+    on a heap keyed by the next attempt time, so failed deliveries are retried on
+    their backoff timer instead of a sleeping thread, and undelivered events survive
+    a restart. With a batch window, events for the same webhook that are due
+    together are folded into one delivery.
+    """
+    DELIVERY_WORKERS = 4
+    MAX_ATTEMPTS = 5
+    RETRY_BASE_DELAY = 10
+    RETRY_MAX_DELAY = 300
+    REQUEST_TIMEOUT = 10
+    LATENCY_SAMPLES = 500
+
+    def __init__(self, DashboardConfig, workers: int = None, batchWindow: float = None):
         self.engine = db.create_engine(ConnectionString("wgdashboard"))
         self.metadata = db.MetaData()
+        dateType = (db.DATETIME if DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else db.TIMESTAMP)
         self.webHooksTable = db.Table(
             'DashboardWebHooks', self.metadata,
             db.Column('WebHookID', db.String(255), nullable=False, primary_key=True),
@@ -52,7 +73,7 @@ class DashboardWebHooks:
             db.Column('SubscribedActions', db.JSON),
             db.Column('IsActive', db.Boolean, nullable=False),
             db.Column('CreationDate',
-                      (db.DATETIME if DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else db.TIMESTAMP),
+                      dateType,
                       server_default=db.func.now(),
                       nullable=False),
             db.Column('Notes', db.Text),
@@ -63,32 +84,78 @@ class DashboardWebHooks:
             db.Column('WebHookSessionID', db.String(255), nullable=False, primary_key=True),
             db.Column('WebHookID', db.String(255), nullable=False),
             db.Column('StartDate', 
-                      (db.DATETIME if DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else db.TIMESTAMP),
+                      dateType,
                       server_default=db.func.now(),
                       nullable=False
             ),
             db.Column('EndDate',
-                      (db.DATETIME if DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else db.TIMESTAMP),
+                      dateType,
             ),
             db.Column('Data', db.JSON),
             db.Column('Status', db.INTEGER),
-            db.Column('Logs', db.JSON)
+            db.Column('Logs', db.JSON),
+            db.Index('ix_DashboardWebHookSessions_WebHookID_StartDate_ID', 'WebHookID', 'StartDate', 'WebHookSessionID')
+        )
+        self.webHookOutboxTable = db.Table(
+            'DashboardWebHookOutbox', self.metadata,
+            db.Column('OutboxID', db.String(255), nullable=False, primary_key=True),
+            db.Column('WebHookID', db.String(255), nullable=False, index=True),
+            db.Column('WebHookSessionID', db.String(255)),
+            db.Column('Data', db.JSON),
+            db.Column('CreationDate', dateType, nullable=False),
+            db.Column('NextAttempt', dateType, nullable=False),
+            db.Column('Attempts', db.INTEGER, nullable=False, default=0)
         )
         
         self.metadata.create_all(self.engine)
+        CreateIndexes(self.engine, self.webHookSessionsTable)
         self.WebHooks: list[WebHook] = []
         
         with self.engine.begin() as conn:
+           # Sessions still in the outbox are resumed below, the rest were cut off
            conn.execute(
                self.webHookSessionsTable.update().values({
                    "EndDate": datetime.now(),
                    "Status": 2
                }).where(
-                   self.webHookSessionsTable.c.Status == -1
+                   db.and_(
+                       self.webHookSessionsTable.c.Status == -1,
+                       self.webHookSessionsTable.c.WebHookSessionID.not_in(
+                           db.select(self.webHookOutboxTable.c.WebHookSessionID).where(
+                               self.webHookOutboxTable.c.WebHookSessionID.is_not(None)
+                           )
+                       )
+                   )
                )
            )
         
         self.__getWebHooks()
+
+        self.workers = int(workers or self.__configNumber(DashboardConfig, "delivery_workers", self.DELIVERY_WORKERS))
+        self.batchWindow = float(batchWindow if batchWindow is not None
+                                 else self.__configNumber(DashboardConfig, "batch_window", 0))
+        self.__condition = threading.Condition()
+        self.__due: list[tuple[float, str, str]] = []
+        self.__openBatches: dict[str, float] = {}
+        self.__slots = threading.BoundedSemaphore(self.workers)
+        self.__executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="WebHookWorker")
+        self.__httpSessions = threading.local()
+        self.__latencies: deque[float] = deque(maxlen=self.LATENCY_SAMPLES)
+        self.__inFlight = 0
+        self.__delivered = 0
+        self.__failed = 0
+        self.__running = True
+        self.__loadOutbox()
+        self.__dispatcher = threading.Thread(target=self.__dispatch, daemon=True, name="WebHookDispatcher")
+        self.__dispatcher.start()
+
+    @staticmethod
+    def __configNumber(DashboardConfig, key: str, default: float) -> float:
+        exist, value = DashboardConfig.GetConfig("WebHooks", key)
+        try:
+            return float(value) if exist else default
+        except (TypeError, ValueError):
+            return default
         
     def __getWebHooks(self):
         with self.engine.connect() as conn:
@@ -97,33 +164,34 @@ class DashboardWebHooks:
                     self.webHooksTable.c.CreationDate
                 )
             ).mappings().fetchall()
-            self.WebHooks.clear()
             self.WebHooks = [WebHook(**webhook) for webhook in webhooks]
             
     def GetWebHooks(self):
         self.__getWebHooks()
         return list(map(lambda x : x.model_dump(), self.WebHooks))
     
-    def GetWebHookSessions(self, webHook: WebHook):
+    def GetWebHookSessions(self, webHook: WebHook, cursor: str = None, limit: int = None,
+                           status: int = None) -> tuple[list[db.RowMapping], str | None]:
+        """
+        One page of the delivery sessions of a webhook, newest first
+
+        Returns:
+            Sessions of the page and the cursor of the next page, None on the last page
+        """
+        query = self.webHookSessionsTable.select().where(
+            self.webHookSessionsTable.c.WebHookID == webHook.WebHookID
+        )
+        if status is not None:
+            query = query.where(self.webHookSessionsTable.c.Status == status)
         with self.engine.connect() as conn:
-            sessions = conn.execute(
-                self.webHookSessionsTable.select().where(
-                    self.webHookSessionsTable.c.WebHookID == webHook.WebHookID
-                ).order_by(
-                    db.desc(self.webHookSessionsTable.c.StartDate)
-                )
-            ).mappings().fetchall()
-        return sessions
+            return KeysetPage(conn, query, self.webHookSessionsTable.c.StartDate,
+                              self.webHookSessionsTable.c.WebHookSessionID, cursor, limit)
     
     def CreateWebHook(self) -> WebHook:
         return WebHook(WebHookID=str(uuid.uuid4()))
     
     def SearchWebHook(self, webHook: WebHook) -> WebHook | None:
-        try:
-            first = next(filter(lambda x : x.WebHookID == webHook.WebHookID, self.WebHooks))
-        except StopIteration:
-            return None
-        return first
+        return self.SearchWebHookByID(webHook.WebHookID)
     
     def SearchWebHookByID(self, webHookID: str) -> WebHook | None:
         try:
@@ -181,40 +249,223 @@ class DashboardWebHooks:
         return True, None
     
     def RunWebHook(self, action: str, data):
+        """Queue an event for every active webhook subscribed to the action"""
         try:
             if action not in WebHookActions:
                 return False
-            self.__getWebHooks()
-            subscribedWebHooks = filter(lambda webhook: action in webhook.SubscribedActions and webhook.IsActive, 
-                                        self.WebHooks)
+            subscribedWebHooks = [webhook for webhook in self.WebHooks
+                                  if action in webhook.SubscribedActions and webhook.IsActive]
+            if not subscribedWebHooks:
+                return True
             data['action'] = action
-            for i in subscribedWebHooks:
-                try:
-                    ws = WebHookSession(i, data)
-                    t = threading.Thread(target=ws.Execute, daemon=True)
-                    t.start()
-                    current_app.logger.info(f"Requesting {i.PayloadURL}")
-                except Exception as e:
-                    current_app.logger.error(f"Requesting {i.PayloadURL} error", e)
+            now = datetime.now()
+            rows = []
+            with self.__condition:
+                for webhook in subscribedWebHooks:
+                    # Join the open batch of this webhook, or open one that closes after the window
+                    due = self.__openBatches.get(webhook.WebHookID, 0)
+                    if due <= now.timestamp():
+                        due = now.timestamp() + self.batchWindow
+                        if self.batchWindow > 0:
+                            self.__openBatches[webhook.WebHookID] = due
+                    rows.append({
+                        "OutboxID": str(uuid.uuid4()),
+                        "WebHookID": webhook.WebHookID,
+                        "WebHookSessionID": None,
+                        "Data": data,
+                        "CreationDate": now,
+                        "NextAttempt": datetime.fromtimestamp(due),
+                        "Attempts": 0
+                    })
+            with self.engine.begin() as conn:
+                conn.execute(self.webHookOutboxTable.insert(), rows)
+            with self.__condition:
+                for row in rows:
+                    heapq.heappush(self.__due, (row["NextAttempt"].timestamp(), row["WebHookID"], row["OutboxID"]))
+                self.__condition.notify()
+            return True
         except Exception as e:
-            current_app.logger.error("Error when running WebHook")
+            current_app.logger.error("Error when running WebHook", e)
+            return False
+
+    def GetQueueStats(self) -> dict:
+        """Outbox depth, delivery counters and latency from event to successful delivery"""
+        with self.__condition:
+            latencies = sorted(self.__latencies)
+            stats = {
+                "QueueDepth": len(self.__due),
+                "InFlight": self.__inFlight,
+                "Delivered": self.__delivered,
+                "Failed": self.__failed,
+                "Workers": self.workers,
+                "BatchWindow": self.batchWindow
+            }
+        stats["Latency"] = {
+            "Samples": len(latencies),
+            "Average": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "P95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+            "Max": round(latencies[-1], 3) if latencies else None
+        }
+        return stats
+
+    def Shutdown(self, wait: bool = True):
+        """Stop dispatching; undelivered events stay in the outbox for the next start"""
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify_all()
+        self.__dispatcher.join(timeout=5)
+        self.__executor.shutdown(wait=wait)
+
+    def __loadOutbox(self):
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                db.select(self.webHookOutboxTable.c.OutboxID, self.webHookOutboxTable.c.WebHookID,
+                          self.webHookOutboxTable.c.NextAttempt)
+            ).fetchall()
+        self.__due = [(row.NextAttempt.timestamp(), row.WebHookID, row.OutboxID) for row in rows]
+        heapq.heapify(self.__due)
+
+    def __dispatch(self):
+        while True:
+            with self.__condition:
+                while self.__running and (not self.__due or self.__due[0][0] > time.time()):
+                    self.__condition.wait(None if not self.__due else self.__due[0][0] - time.time())
+                if not self.__running:
+                    return
+                # Everything due for one webhook goes out together
+                now = time.time()
+                webHookID = self.__due[0][1]
+                outboxIDs = []
+                remaining = []
+                while self.__due and self.__due[0][0] <= now:
+                    item = heapq.heappop(self.__due)
+                    (outboxIDs if item[1] == webHookID else remaining).append(item)
+                for item in remaining:
+                    heapq.heappush(self.__due, item)
+            self.__slots.acquire()
+            with self.__condition:
+                self.__inFlight += 1
+            self.__executor.submit(self.__deliver, webHookID, [item[2] for item in outboxIDs])
+
+    def __httpSession(self) -> requests.Session:
+        session = getattr(self.__httpSessions, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+            session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+            self.__httpSessions.session = session
+        return session
+
+    def __deliver(self, webHookID: str, outboxIDs: list[str]):
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    self.webHookOutboxTable.select().where(
+                        self.webHookOutboxTable.c.OutboxID.in_(outboxIDs)
+                    ).order_by(self.webHookOutboxTable.c.CreationDate)
+                ).mappings().fetchall()
+            webHook = self.SearchWebHookByID(webHookID)
+            if webHook is None or not webHook.IsActive:
+                self.__removeOutbox(outboxIDs)
+                return
+            # Retries keep their session; with a batch window new events are folded into one
+            groups: dict[str, tuple[str | None, list]] = {}
+            for row in rows:
+                sessionID = row["WebHookSessionID"]
+                key = sessionID or ("batch" if self.batchWindow > 0 else row["OutboxID"])
+                groups.setdefault(key, (sessionID, []))[1].append(row)
+            for sessionID, group in groups.values():
+                self.__deliverGroup(webHook, sessionID, group)
+        except Exception:
+            # Leave the events in the outbox and look at them again later
+            retryAt = time.time() + self.RETRY_BASE_DELAY
+            with self.__condition:
+                for outboxID in outboxIDs:
+                    heapq.heappush(self.__due, (retryAt, webHookID, outboxID))
+                self.__condition.notify()
+        finally:
+            with self.__condition:
+                self.__inFlight -= 1
+            self.__slots.release()
+
+    def __deliverGroup(self, webHook: WebHook, sessionID: str | None, rows: list):
+        outboxIDs = [row["OutboxID"] for row in rows]
+        attempts = rows[0]["Attempts"] + 1
+        if sessionID is None:
+            events = [row["Data"] for row in rows]
+            data = events[0] if len(events) == 1 else {"action": "batch", "events": events}
+            ws = WebHookSession(self, webHook, data)
+        else:
+            ws = WebHookSession.Resume(self, webHook, sessionID)
+
+        if ws.Execute(self.__httpSession(), attempts, self.MAX_ATTEMPTS):
+            self.__removeOutbox(outboxIDs)
+            latency = time.time() - min(row["CreationDate"] for row in rows).timestamp()
+            with self.__condition:
+                self.__delivered += 1
+                self.__latencies.append(latency)
+            return
+
+        if attempts >= self.MAX_ATTEMPTS:
+            ws.webHookSessionLogs.addLog(1, "Webhook request failed & terminated.")
+            ws.UpdateStatus(1)
+            self.__removeOutbox(outboxIDs)
+            with self.__condition:
+                self.__failed += 1
+            return
+
+        nextAttempt = datetime.now() + timedelta(
+            seconds=min(self.RETRY_BASE_DELAY * (2 ** (attempts - 1)), self.RETRY_MAX_DELAY))
+        with self.engine.begin() as conn:
+            conn.execute(
+                self.webHookOutboxTable.update().values({
+                    "WebHookSessionID": ws.sessionID,
+                    "Attempts": attempts,
+                    "NextAttempt": nextAttempt
+                }).where(self.webHookOutboxTable.c.OutboxID.in_(outboxIDs))
+            )
+        with self.__condition:
+            for outboxID in outboxIDs:
+                heapq.heappush(self.__due, (nextAttempt.timestamp(), webHook.WebHookID, outboxID))
+            self.__condition.notify()
+
+    def __removeOutbox(self, outboxIDs: list[str]):
+        with self.engine.begin() as conn:
+            conn.execute(
+                self.webHookOutboxTable.delete().where(self.webHookOutboxTable.c.OutboxID.in_(outboxIDs))
+            )
 
 class WebHookSession:
-    def __init__(self, webHook: WebHook, data: dict[str, str]):
-        self.engine = db.create_engine(ConnectionString("wgdashboard"))
-        self.metadata = db.MetaData()
-        self.webHookSessionsTable = db.Table('DashboardWebHookSessions', self.metadata, autoload_with=self.engine)
+    def __init__(self, webHooks: DashboardWebHooks, webHook: WebHook, data: dict[str, str], sessionID: str = None):
+        self.engine = webHooks.engine
+        self.webHookSessionsTable = webHooks.webHookSessionsTable
         self.webHook = webHook
-        self.sessionID = str(uuid.uuid4())
+        self.sessionID = sessionID or str(uuid.uuid4())
         self.webHookSessionLogs: WebHookSessionLogs = WebHookSessionLogs()
         self.time = datetime.now()
-        data['time'] = self.time.strftime("%Y-%m-%d %H:%M:%S")
-        data['webhook_id'] = webHook.WebHookID
-        data['webhook_session'] = self.sessionID
         self.data = data
-        self.Prepare()
+        if sessionID is None:
+            data = dict(data)
+            data['time'] = self.time.strftime("%Y-%m-%d %H:%M:%S")
+            data['webhook_id'] = webHook.WebHookID
+            data['webhook_session'] = self.sessionID
+            self.data = data
+            self.Prepare()
+
+    @classmethod
+    def Resume(cls, webHooks: DashboardWebHooks, webHook: WebHook, sessionID: str) -> 'WebHookSession':
+        with webHooks.engine.connect() as conn:
+            session = conn.execute(
+                webHooks.webHookSessionsTable.select().where(
+                    webHooks.webHookSessionsTable.c.WebHookSessionID == sessionID
+                )
+            ).mappings().fetchone()
+        ws = cls(webHooks, webHook, session["Data"], sessionID)
+        ws.webHookSessionLogs = WebHookSessionLogs(**(session["Logs"] or {}))
+        return ws
         
     def Prepare(self):
+        self.webHookSessionLogs.addLog(-1, "Preparing webhook session")
         with self.engine.begin() as conn:
             conn.execute(
                 self.webHookSessionsTable.insert().values({
@@ -226,7 +477,6 @@ class WebHookSession:
                     "Logs": self.webHookSessionLogs.model_dump()
                 })
             )
-        self.UpdateSessionLog(-1, "Preparing webhook session")
             
     def UpdateSessionLog(self, status, message):
         self.webHookSessionLogs.addLog(status, message)
@@ -244,44 +494,39 @@ class WebHookSession:
             conn.execute(
                 self.webHookSessionsTable.update().values({
                     "Status": status,
-                    "EndDate": datetime.now()
+                    "EndDate": datetime.now(),
+                    "Logs": self.webHookSessionLogs.model_dump()
                 }).where(
                     self.webHookSessionsTable.c.WebHookSessionID == self.sessionID
                 )
             )
     
-    def Execute(self):
-        success = False
-        
-        for i in range(5):
-            headerDictionary = {
-                'Content-Type': self.webHook.ContentType
-            }
-            for header in self.webHook.Headers.values():
-                if header['key'] not in ['Content-Type']:
-                    headerDictionary[header['key']] = header['value']
-                
-            if self.webHook.ContentType == "application/json":
-                reqData = json.dumps(self.data)
-            else:
-                for (key, val) in self.data.items():
-                    if type(self.data[key]) not in [str, int]:
-                        self.data[key] = json.dumps(self.data[key])
-                reqData = urllib.parse.urlencode(self.data)
-            try:
-                req = requests.post(
-                    self.webHook.PayloadURL, headers=headerDictionary, timeout=10, data=reqData, verify=self.webHook.VerifySSL
-                )
-                req.raise_for_status()
-                success = True
-                self.UpdateSessionLog(0, "Webhook request finished")
-                self.UpdateSessionLog(0, json.dumps({"returned_data": req.text}))
-                self.UpdateStatus(0)
-                break
-            except requests.exceptions.RequestException as e:
-                self.UpdateSessionLog(1, f"Attempt #{i + 1}/5. Request errored. Reason: " + str(e))
-            time.sleep(10)
-        
-        if not success:
-            self.UpdateSessionLog(1, "Webhook request failed & terminated.")
-            self.UpdateStatus(1)
\ No newline at end of file
+    def Execute(self, httpSession: requests.Session, attempt: int, maxAttempts: int) -> bool:
+        """Make one delivery attempt; retries are scheduled by DashboardWebHooks"""
+        headerDictionary = {
+            'Content-Type': self.webHook.ContentType
+        }
+        for header in self.webHook.Headers.values():
+            if header['key'] not in ['Content-Type']:
+                headerDictionary[header['key']] = header['value']
+            
+        if self.webHook.ContentType == "application/json":
+            reqData = json.dumps(self.data)
+        else:
+            formData = {}
+            for (key, val) in self.data.items():
+                formData[key] = json.dumps(val) if type(val) not in [str, int] else val
+            reqData = urllib.parse.urlencode(formData)
+        try:
+            req = httpSession.post(
+                self.webHook.PayloadURL, headers=headerDictionary, timeout=DashboardWebHooks.REQUEST_TIMEOUT,
+                data=reqData, verify=self.webHook.VerifySSL
+            )
+            req.raise_for_status()
+            self.webHookSessionLogs.addLog(0, "Webhook request finished")
+            self.webHookSessionLogs.addLog(0, json.dumps({"returned_data": req.text}))
+            self.UpdateStatus(0)
+            return True
+        except requests.exceptions.RequestException as e:
+            self.UpdateSessionLog(1, f"Attempt #{attempt}/{maxAttempts}. Request errored. Reason: " + str(e))
+        return False
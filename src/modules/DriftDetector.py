@@ -2,9 +2,12 @@
 Drift Detection Module
 Identifies mismatches between panel database and node agent state
 """
+import hashlib
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
+import sqlalchemy as db
 
 try:
     from flask import current_app
@@ -37,17 +40,23 @@ def _log_error(msg, exc=None):
 class DriftDetector:
     """Detects configuration drift between panel and node agents"""
     
-    def __init__(self, DashboardConfig):
+    def __init__(self, DashboardConfig, WireguardConfigurations: Optional[dict] = None, max_workers: int = 16):
         self.DashboardConfig = DashboardConfig
         self.engine = DashboardConfig.engine
+        self.WireguardConfigurations = WireguardConfigurations if WireguardConfigurations is not None else {}
+        # Maximum number of nodes checked concurrently
+        self.max_workers = max_workers
         
-    def detectDrift(self, node_id: str, wg_dump_data: Dict[str, Any]) -> Dict[str, Any]:
+    def detectDrift(self, node_id: str, wg_dump_data: Dict[str, Any], iface: Optional[str] = None,
+                    db_peers: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
         """
         Detect drift between panel database and agent-reported WireGuard state
         
         Args:
             node_id: Node ID to check for drift
             wg_dump_data: WireGuard dump data from agent (result of /wg/{iface}/dump)
+            iface: Interface the dump was taken from, limits the panel peers compared
+            db_peers: Panel peers of the node if already loaded
             
         Returns:
             Dictionary with drift information:
@@ -74,7 +83,8 @@ class DriftDetector:
                         agent_peers[public_key] = peer
             
             # Get peers from database for this node
-            db_peers = self._getNodePeersFromDB(node_id)
+            if db_peers is None:
+                db_peers = self._getNodePeersFromDB(node_id, iface)
             
             # Detect unknown peers (on agent but not in panel)
             unknown_peers = []
@@ -149,69 +159,66 @@ class DriftDetector:
                 }
             }
     
-    def _getNodePeersFromDB(self, node_id: str) -> Dict[str, Dict[str, Any]]:
+    def _getNodePeersFromDB(self, node_id: str, iface: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
         """
-        Get all peers for a node from database
+        Get all peers for a node from the loaded configurations' peer tables
+        
+        Args:
+            node_id: Node ID
+            iface: Optional interface name; peers without an interface match any
         
         Returns:
             Dictionary mapping public_key to peer data
         """
         peers_by_public_key = {}
         
-        try:
-            # Query all peer tables for peers with this node_id
-            # Try to find WireGuardPeer table
-            from .WireguardConfiguration import WireguardConfiguration
-            
-            with self.engine.connect() as conn:
-                # Get all configuration names
-                conf_path = self.DashboardConfig.GetConfig("Server", "wg_conf_path")[1]
-                import os
-                if not os.path.exists(conf_path):
-                    return peers_by_public_key
+        for conf_name, wg_conf in list(self.WireguardConfigurations.items()):
+            try:
+                table = wg_conf.peersTable
+                if 'node_id' not in table.c:
+                    continue  # Configuration type without node-hosted peers
+                peer_query = db.select(
+                    table.c.id, table.c.name, table.c.allowed_ip, table.c.keepalive, table.c.preshared_key
+                ).where(table.c.node_id == node_id)
+                if iface:
+                    peer_query = peer_query.where(db.or_(table.c.iface == iface, table.c.iface.is_(None)))
                 
-                # Iterate through all configurations
-                for filename in os.listdir(conf_path):
-                    if filename.endswith('.conf'):
-                        conf_name = filename[:-5]
-                        
-                        # Create configuration object to access peer table
-                        try:
-                            wg_conf = WireguardConfiguration(name=conf_name)
-                            
-                            # Query peers for this node
-                            peer_query = wg_conf.peerTable.select().where(
-                                wg_conf.peerTable.c.node_id == node_id
-                            )
-                            
-                            result = conn.execute(peer_query).mappings().fetchall()
-                            
-                            for row in result:
-                                peer_data = dict(row)
-                                public_key = peer_data.get('public_key')
-                                if public_key:
-                                    # Parse allowed_ips if stored as string
-                                    allowed_ips = peer_data.get('allowed_ip', '')
-                                    if isinstance(allowed_ips, str):
-                                        allowed_ips = [ip.strip() for ip in allowed_ips.split(',') if ip.strip()]
-                                    
-                                    peers_by_public_key[public_key] = {
-                                        'id': peer_data.get('id'),
-                                        'name': peer_data.get('name', ''),
-                                        'public_key': public_key,
-                                        'allowed_ips': allowed_ips,
-                                        'persistent_keepalive': int(peer_data.get('keepalive', 0)),
-                                        'preshared_key': peer_data.get('preshared_key', '')
-                                    }
-                        except Exception as e:
-                            # Skip configurations that don't exist or have errors
-                            continue
-            
-        except Exception as e:
-            _log_error(f"Error getting peers from database for node {node_id}: {e}", exc=e)
+                with wg_conf.engine.connect() as conn:
+                    result = conn.execute(peer_query).mappings().fetchall()
+                
+                for row in result:
+                    # Parse allowed_ips stored as comma separated string
+                    allowed_ips = [ip.strip() for ip in (row['allowed_ip'] or '').split(',') if ip.strip()]
+                    peers_by_public_key[row['id']] = {
+                        'id': row['id'],
+                        'name': row['name'] or '',
+                        'public_key': row['id'],
+                        'allowed_ips': allowed_ips,
+                        'persistent_keepalive': int(row['keepalive'] or 0),
+                        'preshared_key': row['preshared_key'] or '',
+                        'config_name': conf_name
+                    }
+            except Exception as e:
+                _log_error(f"Error getting peers of {conf_name} for node {node_id}: {e}", exc=e)
         
         return peers_by_public_key
     
+    @staticmethod
+    def peerSetDigest(peers) -> str:
+        """
+        SHA-256 over a peer set, computed exactly like the agent's /v1/wg/{iface}/digest
+        
+        Args:
+            peers: Iterable of peer dicts with public_key, allowed_ips and persistent_keepalive
+        """
+        digest = hashlib.sha256()
+        for peer in sorted(peers, key=lambda p: p['public_key']):
+            digest.update(
+                f"{peer['public_key']}|{','.join(sorted(peer.get('allowed_ips', [])))}|"
+                f"{int(peer.get('persistent_keepalive') or 0)}\n".encode('utf-8')
+            )
+        return digest.hexdigest()
+    
     def _compareConfiguration(self, db_peer: Dict[str, Any], agent_peer: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         Compare peer configurations and return list of mismatches
@@ -248,52 +255,153 @@ class DriftDetector:
         
         return mismatches
     
-    def detectDriftForAllNodes(self, nodes_manager) -> Dict[str, Any]:
+    def detectNodeDrift(self, node, client, interfaces: List[str]) -> Dict[str, Any]:
+        """
+        Detect drift for one node across its interfaces
+        
+        The agent's peer set digest is compared first; the dump is only fetched and
+        diffed when the digests differ (or the agent does not provide one).
+        
+        Args:
+            node: Node to check
+            client: AgentClient for the node
+            interfaces: Interface names to check
+        
+        Returns:
+            Drift report merged over the interfaces
+        """
+        reports = []
+        for iface in interfaces:
+            db_peers = self._getNodePeersFromDB(node.id, iface)
+            
+            success, digest = client.get_wg_digest(iface)
+            if success and isinstance(digest, dict) \
+                    and digest.get('digest') == self.peerSetDigest(db_peers.values()):
+                report = self.detectDrift(node.id, {'peers': []}, iface, db_peers={})
+                report["digest_match"] = True
+                reports.append(report)
+                continue
+            
+            # Get WireGuard dump from agent
+            success, wg_data = client.get_wg_dump(iface)
+            if not success:
+                return {
+                    "error": f"Failed to get WireGuard dump for {iface}: {wg_data}",
+                    "has_drift": False
+                }
+            reports.append(self.detectDrift(node.id, wg_data, iface, db_peers=db_peers))
+        
+        if len(reports) == 1:
+            return reports[0]
+        
+        merged = self.detectDrift(node.id, {'peers': []}, db_peers={})
+        for report in reports:
+            for key in ("unknown_peers", "missing_peers", "mismatched_peers"):
+                merged[key].extend(report.get(key, []))
+        merged["has_drift"] = any(report.get("has_drift", False) for report in reports)
+        merged["summary"] = {
+            "unknown_count": len(merged["unknown_peers"]),
+            "missing_count": len(merged["missing_peers"]),
+            "mismatched_count": len(merged["mismatched_peers"]),
+            "total_issues": len(merged["unknown_peers"]) + len(merged["missing_peers"]) + len(merged["mismatched_peers"])
+        }
+        return merged
+    
+    def reconcileNode(self, node, client, interfaces: List[str], add_missing: bool = True,
+                      update_mismatched: bool = True, remove_unknown: bool = False) -> Dict[str, Any]:
         """
-        Detect drift for all enabled nodes
+        Reconcile a node by sending each interface's complete desired peer set in one request
+        
+        The agent diffs the set against its live configuration and applies it with a
+        single `wg syncconf`, so the cost does not grow with the number of drifted peers.
+        
+        Args:
+            node: Node to reconcile
+            client: AgentClient for the node
+            interfaces: Interface names to reconcile
+            add_missing: Add panel peers missing on the node
+            update_mismatched: Update peers whose allowed IPs or keepalive differ
+            remove_unknown: Remove peers the panel does not know
+        
+        Returns:
+            Dictionary with added, updated and removed public keys and per-interface errors
+        """
+        results = {
+            "added": [],
+            "updated": [],
+            "removed": [],
+            "errors": []
+        }
+        for iface in interfaces:
+            desired = []
+            for peer in self._getNodePeersFromDB(node.id, iface).values():
+                entry = {
+                    'public_key': peer['public_key'],
+                    'allowed_ips': peer['allowed_ips'],
+                    'persistent_keepalive': peer['persistent_keepalive']
+                }
+                if peer['preshared_key']:
+                    entry['preshared_key'] = peer['preshared_key']
+                desired.append(entry)
+            
+            success, summary = client.reconcile_peers(iface, desired, add_missing, update_mismatched, remove_unknown)
+            if not success or not isinstance(summary, dict):
+                results["errors"].append({"interface": iface, "action": "reconcile", "error": summary})
+                continue
+            for key in ("added", "updated", "removed"):
+                results[key].extend(summary.get(key, []))
+        
+        _log_info(f"Reconciled node {node.id}: {len(results['added'])} added, "
+                  f"{len(results['updated'])} updated, {len(results['removed'])} removed")
+        return results
+    
+    def detectDriftForAllNodes(self, nodes_manager, interfaces_manager=None) -> Dict[str, Any]:
+        """
+        Detect drift for all enabled nodes, checking up to max_workers nodes concurrently
         
         Args:
             nodes_manager: NodesManager instance
+            interfaces_manager: Optional NodeInterfacesManager; without it only the
+                                node's legacy wg_interface is checked
             
         Returns:
             Dictionary mapping node_id to drift report
         """
         results = {}
         
+        def check(node):
+            try:
+                # Get agent client
+                client = nodes_manager.getNodeAgentClient(node.id)
+                if not client:
+                    return {
+                        "error": "Failed to create agent client",
+                        "has_drift": False
+                    }
+                
+                interfaces = []
+                if interfaces_manager is not None:
+                    interfaces = [i.interface_name for i in interfaces_manager.getEnabledInterfacesByNodeId(node.id)]
+                if not interfaces and node.wg_interface:
+                    interfaces = [node.wg_interface]
+                
+                return self.detectNodeDrift(node, client, interfaces)
+            except Exception as e:
+                _log_error(f"Error detecting drift for node {node.id}: {e}", exc=e)
+                return {
+                    "error": str(e),
+                    "has_drift": False
+                }
+        
         try:
             enabled_nodes = nodes_manager.getEnabledNodes()
+            if not enabled_nodes:
+                return results
             
-            for node in enabled_nodes:
-                try:
-                    # Get agent client
-                    client = nodes_manager.getNodeAgentClient(node.id)
-                    if not client:
-                        results[node.id] = {
-                            "error": "Failed to create agent client",
-                            "has_drift": False
-                        }
-                        continue
-                    
-                    # Get WireGuard dump from agent
-                    success, wg_data = client.get_wg_dump(node.wg_interface)
-                    
-                    if not success:
-                        results[node.id] = {
-                            "error": f"Failed to get WireGuard dump: {wg_data}",
-                            "has_drift": False
-                        }
-                        continue
-                    
-                    # Detect drift
-                    drift_report = self.detectDrift(node.id, wg_data)
-                    results[node.id] = drift_report
-                    
-                except Exception as e:
-                    _log_error(f"Error detecting drift for node {node.id}: {e}", exc=e)
-                    results[node.id] = {
-                        "error": str(e),
-                        "has_drift": False
-                    }
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(enabled_nodes))) as executor:
+                futures = {executor.submit(check, node): node for node in enabled_nodes}
+                for future in as_completed(futures):
+                    results[futures[future].id] = future.result()
         
         except Exception as e:
             _log_error(f"Error detecting drift for all nodes: {e}", exc=e)
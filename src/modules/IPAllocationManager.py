@@ -17,7 +17,8 @@ class IPAllocationManager:
         self.ipAllocationsTable = DashboardConfig.ipAllocationsTable
         self.nodesTable = DashboardConfig.nodesTable
     
-    def allocateIP(self, node_id: str, peer_id: str, max_retries: int = 3) -> Tuple[bool, str]:
+    def allocateIP(self, node_id: str, peer_id: str, max_retries: int = 3,
+                   ip_pool_cidr: Optional[str] = None) -> Tuple[bool, str]:
         """
         Allocate a free IP address from node's pool for a peer
         
@@ -25,23 +26,25 @@ class IPAllocationManager:
             node_id: Node ID to allocate from
             peer_id: Peer ID (public key) to allocate for
             max_retries: Maximum number of retries on conflict
+            ip_pool_cidr: Pool of the peer's interface, the node's pool is used when not given
             
         Returns:
             Tuple of (success: bool, ip_address or error_message)
         """
         try:
             # Get node's IP pool CIDR
-            with self.engine.connect() as conn:
-                result = conn.execute(
-                    self.nodesTable.select().where(self.nodesTable.c.id == node_id)
-                ).mappings().fetchone()
+            if not ip_pool_cidr:
+                with self.engine.connect() as conn:
+                    result = conn.execute(
+                        self.nodesTable.select().where(self.nodesTable.c.id == node_id)
+                    ).mappings().fetchone()
                 
-                if not result:
-                    return False, "Node not found"
+                    if not result:
+                        return False, "Node not found"
                 
-                ip_pool_cidr = result.get('ip_pool_cidr')
-                if not ip_pool_cidr:
-                    return False, "Node does not have an IP pool configured"
+                    ip_pool_cidr = result.get('ip_pool_cidr')
+                    if not ip_pool_cidr:
+                        return False, "Node does not have an IP pool configured"
             
             # Parse CIDR
             try:
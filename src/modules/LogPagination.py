@@ -0,0 +1,81 @@
+"""
+Log Pagination
+Keyset pagination on (time, id) shared by the audit, job and webhook session logs
+"""
+import base64
+import json
+from datetime import datetime
+
+import sqlalchemy as db
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursorException(Exception):
+    pass
+
+
+def PageSize(limit: int | str | None) -> int:
+    """Requested page size clamped to 1 to MAX_PAGE_SIZE, DEFAULT_PAGE_SIZE when missing or invalid"""
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+def EncodeCursor(time: datetime, id) -> str:
+    return base64.urlsafe_b64encode(json.dumps([time.isoformat(), id]).encode()).decode().rstrip("=")
+
+
+def DecodeCursor(cursor: str) -> tuple[datetime, int | str]:
+    try:
+        time, id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(time), id
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorException(f"Invalid cursor: {cursor}") from e
+
+
+def KeysetPage(conn: db.Connection, query: db.Select, timeColumn: db.Column, idColumn: db.Column,
+               cursor: str = None, limit: int | str = None) -> tuple[list[db.RowMapping], str | None]:
+    """
+    One page of query, newest first, starting after cursor. The page is read
+    with a range seek on an index ending in (timeColumn, idColumn), so a deep
+    page costs the same as the first one.
+
+    Returns:
+        Rows of the page and the cursor of the next page, None on the last page
+    """
+    limit = PageSize(limit)
+    if cursor:
+        time, id = DecodeCursor(cursor)
+        # The first bound seeks the index, the second only breaks ties on time
+        query = query.where(timeColumn <= time, db.or_(timeColumn < time, idColumn < id))
+    rows = conn.execute(
+        query.order_by(timeColumn.desc(), idColumn.desc()).limit(limit + 1)
+    ).mappings().fetchall()
+    if len(rows) <= limit:
+        return list(rows), None
+    last = rows[limit - 1]
+    return list(rows[:limit]), EncodeCursor(last[timeColumn.name], last[idColumn.name])
+
+
+def ReadPages(read, count: int = None) -> list:
+    """
+    Rows of every page of read(cursor), or of the first count rows, for the
+    endpoints that still answer with one unpaged list
+    """
+    rows, cursor = [], None
+    while count is None or len(rows) < count:
+        page, cursor = read(cursor)
+        rows.extend(page)
+        if cursor is None:
+            break
+    return rows if count is None else rows[:count]
+
+
+def CreateIndexes(engine: db.Engine, table: db.Table):
+    """Create the indexes of a table that already existed before they were declared"""
+    for index in table.indexes:
+        index.create(engine, checkfirst=True)
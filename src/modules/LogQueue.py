@@ -0,0 +1,197 @@
+"""
+Log Queue
+Bounded write-behind queue shared by the dashboard, job and client loggers
+"""
+import logging
+import threading
+from collections import deque
+
+import sqlalchemy as db
+
+LogOverflowPolicies = ['drop_oldest', 'block']
+
+
+class LogQueue:
+    """
+    Log rows are appended to a bounded in-memory queue and written by one
+    background thread, so a request that logs only pays for an append. The writer
+    waits up to flushInterval for a batch to fill, then writes it in one
+    transaction per database with one executemany per table.
+
+    When the queue is full the overflow policy either drops the oldest row
+    (drop_oldest) or blocks the caller for up to blockTimeout seconds (block),
+    after which the new row is dropped. Shutdown writes every row still queued,
+    and rows logged after it are written synchronously.
+
+    Rows whose transaction failed go back to the front of the queue and are
+    written again after RETRY_INTERVAL seconds, up to MAX_ATTEMPTS writes, then
+    dropped and counted as failed. Failures are reported through the app logger.
+    """
+    MAX_SIZE = 10000
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 1.0
+    BLOCK_TIMEOUT = 5.0
+    MAX_ATTEMPTS = 3
+    RETRY_INTERVAL = 5.0
+
+    def __init__(self, DashboardConfig, maxSize: int = None, overflow: str = None, batchSize: int = None,
+                 flushInterval: float = None, blockTimeout: float = None):
+        self.maxSize = int(maxSize or self.__configNumber(DashboardConfig, "queue_size", self.MAX_SIZE))
+        self.batchSize = int(batchSize or self.__configNumber(DashboardConfig, "batch_size", self.BATCH_SIZE))
+        self.flushInterval = float(flushInterval if flushInterval is not None
+                                   else self.__configNumber(DashboardConfig, "flush_interval", self.FLUSH_INTERVAL))
+        self.blockTimeout = float(blockTimeout if blockTimeout is not None
+                                  else self.__configNumber(DashboardConfig, "block_timeout", self.BLOCK_TIMEOUT))
+        if overflow is None:
+            exist, overflow = DashboardConfig.GetConfig("Logging", "overflow")
+            if not exist or overflow not in LogOverflowPolicies:
+                overflow = LogOverflowPolicies[0]
+        if overflow not in LogOverflowPolicies:
+            raise ValueError(f"Overflow policy must be one of {', '.join(LogOverflowPolicies)}")
+        self.overflow = overflow
+        # The Flask app's logger, which the writer thread can use outside the app context
+        self.logger = logging.getLogger("WGDashboard")
+
+        self.__condition = threading.Condition()
+        # (engine, table, row, failed writes)
+        self.__rows: deque[tuple[db.Engine, db.Table, dict, int]] = deque()
+        self.__writing = 0
+        self.__flushing = 0
+        self.__enqueued = 0
+        self.__flushed = 0
+        self.__dropped = 0
+        self.__failed = 0
+        self.__retried = 0
+        self.__batches = 0
+        self.__running = True
+        self.__writer = threading.Thread(target=self.__write, daemon=True, name="LogQueueWriter")
+        self.__writer.start()
+
+    @staticmethod
+    def __configNumber(DashboardConfig, key: str, default: float) -> float:
+        exist, value = DashboardConfig.GetConfig("Logging", key)
+        try:
+            return float(value) if exist else default
+        except (TypeError, ValueError):
+            return default
+
+    def put(self, engine: db.Engine, table: db.Table, row: dict) -> bool:
+        """
+        Queue a row for table. Rows of the same table must have the same columns.
+
+        Returns:
+            False if the row was dropped because the queue stayed full
+        """
+        with self.__condition:
+            if self.__running:
+                if len(self.__rows) >= self.maxSize:
+                    if self.overflow == 'drop_oldest':
+                        self.__rows.popleft()
+                        self.__dropped += 1
+                    elif not self.__condition.wait_for(
+                            lambda: len(self.__rows) < self.maxSize or not self.__running, self.blockTimeout):
+                        self.__dropped += 1
+                        return False
+                if self.__running:
+                    self.__rows.append((engine, table, row, 0))
+                    self.__enqueued += 1
+                    if len(self.__rows) == 1 or len(self.__rows) >= self.batchSize:
+                        self.__condition.notify_all()
+                    return True
+        failed = self.__commit([(engine, table, row, 0)])
+        with self.__condition:
+            self.__flushed += 1 - len(failed)
+            self.__failed += len(failed)
+        return not failed
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until every queued row is written
+
+        Returns:
+            False if rows were still queued after timeout seconds
+        """
+        with self.__condition:
+            self.__flushing += 1
+            self.__condition.notify_all()
+            try:
+                return self.__condition.wait_for(lambda: not self.__rows and not self.__writing, timeout)
+            finally:
+                self.__flushing -= 1
+
+    def shutdown(self, timeout: float = 10):
+        """Write every queued row and stop the writer"""
+        with self.__condition:
+            if not self.__running:
+                return
+            self.__running = False
+            self.__condition.notify_all()
+        self.__writer.join(timeout=timeout)
+
+    def getStats(self) -> dict:
+        """Queue depth and the counters of queued, written, dropped and failed rows"""
+        with self.__condition:
+            return {
+                "QueueDepth": len(self.__rows),
+                "MaxSize": self.maxSize,
+                "Overflow": self.overflow,
+                "Enqueued": self.__enqueued,
+                "Flushed": self.__flushed,
+                "Dropped": self.__dropped,
+                "Failed": self.__failed,
+                "Retried": self.__retried,
+                "Batches": self.__batches
+            }
+
+    def __write(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__rows or not self.__running)
+                if self.__running and not self.__flushing and len(self.__rows) < self.batchSize:
+                    self.__condition.wait_for(
+                        lambda: len(self.__rows) >= self.batchSize or self.__flushing or not self.__running,
+                        self.flushInterval
+                    )
+                if not self.__rows:
+                    if not self.__running:
+                        return
+                    continue
+                batch = [self.__rows.popleft() for _ in range(min(self.batchSize, len(self.__rows)))]
+                self.__writing = len(batch)
+                self.__condition.notify_all()
+            failed = self.__commit(batch)
+            retry = [(engine, table, row, attempts + 1) for engine, table, row, attempts in failed
+                     if attempts + 1 < self.MAX_ATTEMPTS]
+            with self.__condition:
+                self.__writing = 0
+                self.__flushed += len(batch) - len(failed)
+                self.__failed += len(failed) - len(retry)
+                self.__retried += len(retry)
+                self.__batches += 1
+                # Failed rows are the oldest, they go back in front of the queue
+                self.__rows.extendleft(reversed(retry))
+                self.__condition.notify_all()
+                if retry and self.__running:
+                    self.__condition.wait_for(lambda: not self.__running, self.RETRY_INTERVAL)
+            if len(failed) > len(retry):
+                self.logger.error(f"Log Queue dropped {len(failed) - len(retry)} rows after {self.MAX_ATTEMPTS} "
+                                  f"failed writes")
+
+    def __commit(self, batch: list[tuple[db.Engine, db.Table, dict, int]]) -> list[tuple[db.Engine, db.Table, dict, int]]:
+        """Write the batch in one transaction per database, returning the rows of the transactions that failed"""
+        databases: dict[db.Engine, list[tuple[db.Engine, db.Table, dict, int]]] = {}
+        for entry in batch:
+            databases.setdefault(entry[0], []).append(entry)
+        failed = []
+        for engine, entries in databases.items():
+            tables: dict[db.Table, list[dict]] = {}
+            for _, table, row, _ in entries:
+                tables.setdefault(table, []).append(row)
+            try:
+                with engine.begin() as conn:
+                    for table, rows in tables.items():
+                        conn.execute(table.insert(), rows)
+            except Exception as e:
+                self.logger.error(f"Log Queue Error: {len(entries)} rows of {engine.url.database} failed to write: {e}")
+                failed.extend(entries)
+        return failed
@@ -7,12 +7,15 @@ import hmac
 import json
 import time
 import requests
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, List, Tuple
 
 
 class AgentClient:
     """Client for communicating with WireGuard node agents"""
 
+    # Upper bound on history pages read for one backfill
+    HISTORY_MAX_PAGES = 1000
+
     def __init__(self, agent_url: str, secret: str, timeout: int = 10):
         """
         Initialize agent client
@@ -47,7 +50,8 @@ class AgentClient:
         ).hexdigest()
         return signature
 
-    def _make_request(self, method: str, path: str, data: Optional[Dict] = None) -> Tuple[bool, Any]:
+    def _make_request(self, method: str, path: str, data: Optional[Dict] = None,
+                      params: Optional[Dict] = None) -> Tuple[bool, Any]:
         """
         Make authenticated request to agent
         
@@ -55,6 +59,7 @@ class AgentClient:
             method: HTTP method
             path: Request path (relative to agent_url)
             data: Optional request body data
+            params: Optional query string parameters (not part of the signed path)
             
         Returns:
             Tuple of (success: bool, response_data: dict or error_message: str)
@@ -73,7 +78,7 @@ class AgentClient:
         
         try:
             if method == 'GET':
-                response = requests.get(url, headers=headers, timeout=self.timeout)
+                response = requests.get(url, headers=headers, params=params, timeout=self.timeout)
             elif method == 'POST':
                 response = requests.post(url, headers=headers, json=data, timeout=self.timeout)
             elif method == 'PUT':
@@ -137,6 +142,64 @@ class AgentClient:
         """
         return self._make_request('GET', f'/v1/wg/{iface}/dump')
 
+    def get_wg_digest(self, iface: str) -> Tuple[bool, Any]:
+        """
+        Get a digest of the interface's peer set, used to skip full drift diffs
+        
+        Args:
+            iface: WireGuard interface name
+            
+        Returns:
+            Tuple of (success: bool, {'interface', 'peer_count', 'digest'} or error_message)
+        """
+        return self._make_request('GET', f'/v1/wg/{iface}/digest')
+
+    def get_wg_history(self, iface: str, since: int) -> Tuple[bool, Any]:
+        """
+        Get per-peer counter samples the agent recorded since a Unix timestamp
+        
+        Args:
+            iface: WireGuard interface name
+            since: Unix timestamp; only newer samples are returned
+            
+        Returns:
+            Tuple of (success: bool, history_data or error_message)
+        """
+        return self._make_request('GET', f'/v1/wg/{iface}/history', params={'since': int(since)})
+
+    def iter_wg_history(self, iface: str, since: int):
+        """
+        Page through the agent's history since a Unix timestamp until a page is
+        not truncated. A truncated page is continued from its last sample time,
+        and the samples of that second are left to the next page so a snapshot
+        split between two pages is read whole.
+        
+        Args:
+            iface: WireGuard interface name
+            since: Unix timestamp; only newer samples are returned
+            
+        Yields:
+            Tuple of (success: bool, samples or error_message)
+        """
+        for _ in range(self.HISTORY_MAX_PAGES):
+            success, history = self.get_wg_history(iface, since)
+            if not success or not isinstance(history, dict):
+                yield False, history
+                return
+            samples = history.get('samples', [])
+            if not history.get('truncated') or not samples:
+                yield True, samples
+                return
+            last = samples[-1][0]
+            complete = [s for s in samples if s[0] < last]
+            if complete:
+                yield True, complete
+                since = last - 1
+            else:
+                # A single second holds more samples than a page
+                yield True, samples
+                since = last
+
     def add_peer(self, iface: str, peer_data: Dict[str, Any]) -> Tuple[bool, Any]:
         """
         Add peer to WireGuard interface
@@ -190,6 +253,32 @@ class AgentClient:
         """
         return self._make_request('POST', f'/v1/wg/{iface}/syncconf', {'config': config_base64})
 
+    def reconcile_peers(self, iface: str, peers: List[Dict[str, Any]], add_missing: bool = True,
+                        update_mismatched: bool = True, remove_unknown: bool = False,
+                        remove: Optional[List[str]] = None) -> Tuple[bool, Any]:
+        """
+        Apply the complete desired peer set of an interface in a single kernel sync
+        
+        Args:
+            iface: WireGuard interface name
+            peers: Desired peers with public_key, allowed_ips, persistent_keepalive
+                   and optionally preshared_key
+            add_missing: Add peers that are not on the interface
+            update_mismatched: Update peers whose configuration differs
+            remove_unknown: Remove peers that are not in the desired set
+            remove: Public keys to remove even when remove_unknown is off
+            
+        Returns:
+            Tuple of (success: bool, summary with added/updated/removed or error_message)
+        """
+        return self._make_request('POST', f'/v1/wg/{iface}/peers/reconcile', {
+            'peers': peers,
+            'add_missing': add_missing,
+            'update_mismatched': update_mismatched,
+            'remove_unknown': remove_unknown,
+            'remove': remove or []
+        })
+
     def test_connection(self) -> Tuple[bool, str]:
         """
         Test connection to agent
@@ -0,0 +1,38 @@
+"""
+NodeMetric Model
+Represents one typed health/capacity sample for a node
+"""
+from datetime import datetime
+
+
+class NodeMetric:
+    def __init__(self, tableData):
+        self.node_id = tableData.get("node_id")
+        self.time = tableData.get("time")
+        self.resolution = tableData.get("resolution", 60)
+        self.status = tableData.get("status", "offline")
+        self.cpu_percent = tableData.get("cpu_percent")
+        self.memory_percent = tableData.get("memory_percent")
+        self.peer_count = tableData.get("peer_count")
+        self.active_peers = tableData.get("active_peers")
+        self.interface_count = tableData.get("interface_count")
+        self.latency_ms = tableData.get("latency_ms")
+        # Per-interface peer counts, only held in memory for the latest sample
+        self.interfaces = tableData.get("interfaces") or {}
+
+    def toJson(self):
+        return {
+            "node_id": self.node_id,
+            "time": self.time.strftime("%Y-%m-%d %H:%M:%S") if isinstance(self.time, datetime) else self.time,
+            "resolution": self.resolution,
+            "status": self.status,
+            "cpu_percent": self.cpu_percent,
+            "memory_percent": self.memory_percent,
+            "peer_count": self.peer_count,
+            "active_peers": self.active_peers,
+            "interface_count": self.interface_count,
+            "latency_ms": self.latency_ms,
+        }
+
+    def __repr__(self):
+        return str(self.toJson())
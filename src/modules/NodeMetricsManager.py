@@ -0,0 +1,254 @@
+"""
+NodeMetrics Manager
+Stores typed node health samples and keeps the latest state of every node in memory
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import sqlalchemy as db
+
+try:
+    from flask import current_app
+    _has_flask = True
+except ImportError:
+    _has_flask = False
+
+try:
+    from .NodeMetric import NodeMetric
+except ImportError:
+    from NodeMetric import NodeMetric
+
+
+def _log_info(msg):
+    """Helper to log info messages"""
+    if _has_flask:
+        try:
+            current_app.logger.info(msg)
+        except (RuntimeError, NameError):
+            pass
+
+
+def _log_error(msg, exc=None):
+    """Helper to log error messages"""
+    if _has_flask:
+        try:
+            if exc:
+                current_app.logger.error(msg, exc)
+            else:
+                current_app.logger.error(msg)
+        except (RuntimeError, NameError):
+            pass
+
+
+class NodeMetricsManager:
+    """Manager for the NodeMetrics time series and the in-memory node state map"""
+
+    RAW_RESOLUTION = 60
+    # (source resolution, target resolution, age after which source rows are rolled up)
+    ROLLUPS = (
+        (60, 3600, timedelta(days=2)),
+        (3600, 86400, timedelta(days=30)),
+    )
+    # Daily rows older than this are deleted
+    RETENTION = timedelta(days=365)
+
+    def __init__(self, DashboardConfig):
+        self.DashboardConfig = DashboardConfig
+        self.engine = DashboardConfig.engine
+        self.nodeMetricsTable = DashboardConfig.nodeMetricsTable
+        self.__lock = threading.Lock()
+        self.__latest: Dict[str, NodeMetric] = {}
+        self.__loadLatest()
+
+    def __loadLatest(self):
+        """Seed the state map with the newest raw sample of every node"""
+        try:
+            t = self.nodeMetricsTable
+            newest = db.select(t.c.node_id, db.func.max(t.c.time).label('time')) \
+                .where(t.c.resolution == self.RAW_RESOLUTION) \
+                .group_by(t.c.node_id).subquery()
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    t.select().join(newest, db.and_(t.c.node_id == newest.c.node_id, t.c.time == newest.c.time))
+                    .where(t.c.resolution == self.RAW_RESOLUTION)
+                ).mappings().fetchall()
+            with self.__lock:
+                for row in rows:
+                    self.__latest[row['node_id']] = NodeMetric(dict(row))
+        except Exception as e:
+            _log_error(f"Error loading latest node metrics: {e}")
+
+    @staticmethod
+    def extractMetrics(node_id: str, health_info: dict, latency_ms: Optional[float] = None) -> NodeMetric:
+        """
+        Build a typed sample from the poller's health info
+
+        Args:
+            node_id: ID of the node
+            health_info: Dict with status and optionally the agent's /v1/status payload
+                         under 'status_data' and a wg dump under 'wg_dump'
+            latency_ms: Round trip time of the health request
+
+        Returns:
+            NodeMetric
+        """
+        data = {
+            "node_id": node_id,
+            "time": datetime.now(),
+            "resolution": NodeMetricsManager.RAW_RESOLUTION,
+            "status": health_info.get('status', 'offline'),
+            "latency_ms": round(latency_ms, 2) if latency_ms is not None else None,
+        }
+        status = health_info.get('status_data')
+        if isinstance(status, dict):
+            system = status.get('system', {})
+            if 'cpu_percent' in system:
+                data['cpu_percent'] = float(system['cpu_percent'])
+            if isinstance(system.get('memory'), dict) and 'percent' in system['memory']:
+                data['memory_percent'] = float(system['memory']['percent'])
+            interfaces = status.get('wireguard', {}).get('interfaces', {})
+            if isinstance(interfaces, dict):
+                data['interface_count'] = len(interfaces)
+                data['peer_count'] = sum(int(i.get('peer_count', 0)) for i in interfaces.values())
+                data['active_peers'] = sum(int(i.get('active_peers', 0)) for i in interfaces.values())
+                data['interfaces'] = {
+                    name: {'peer_count': int(i.get('peer_count', 0)), 'active_peers': int(i.get('active_peers', 0))}
+                    for name, i in interfaces.items()
+                }
+        wg_dump = health_info.get('wg_dump')
+        if data.get('peer_count') is None and isinstance(wg_dump, dict) \
+                and isinstance(wg_dump.get('peers'), list):
+            data['peer_count'] = len(wg_dump['peers'])
+        return NodeMetric(data)
+
+    def record(self, node_id: str, health_info: dict, latency_ms: Optional[float] = None) -> Optional[NodeMetric]:
+        """
+        Record a sample for a node and make it the node's latest state
+
+        Returns:
+            The recorded NodeMetric, or None on failure
+        """
+        try:
+            metric = self.extractMetrics(node_id, health_info, latency_ms)
+            with self.__lock:
+                self.__latest[node_id] = metric
+            with self.engine.begin() as conn:
+                conn.execute(self.nodeMetricsTable.insert().values(
+                    node_id=metric.node_id,
+                    time=metric.time,
+                    resolution=metric.resolution,
+                    status=metric.status,
+                    cpu_percent=metric.cpu_percent,
+                    memory_percent=metric.memory_percent,
+                    peer_count=metric.peer_count,
+                    active_peers=metric.active_peers,
+                    interface_count=metric.interface_count,
+                    latency_ms=metric.latency_ms
+                ))
+            return metric
+        except Exception as e:
+            _log_error(f"Error recording metrics for node {node_id}: {e}")
+            return None
+
+    def getLatest(self, node_id: str) -> Optional[NodeMetric]:
+        """Get the latest in-memory state of a node"""
+        with self.__lock:
+            return self.__latest.get(node_id)
+
+    def getAllLatest(self) -> Dict[str, NodeMetric]:
+        """Get a snapshot of the latest in-memory state of every node"""
+        with self.__lock:
+            return dict(self.__latest)
+
+    def forgetNode(self, node_id: str):
+        """Drop a node's in-memory state and its stored samples"""
+        with self.__lock:
+            self.__latest.pop(node_id, None)
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(self.nodeMetricsTable.delete().where(self.nodeMetricsTable.c.node_id == node_id))
+        except Exception as e:
+            _log_error(f"Error deleting metrics for node {node_id}: {e}")
+
+    def getHistory(self, node_id: str, start: datetime, end: Optional[datetime] = None) -> List[NodeMetric]:
+        """
+        Get samples of a node between start and end, oldest first
+
+        Older ranges come back at the coarser resolution they were rolled up to
+        """
+        t = self.nodeMetricsTable
+        query = t.select().where(t.c.node_id == node_id, t.c.time >= start)
+        if end is not None:
+            query = query.where(t.c.time <= end)
+        with self.engine.connect() as conn:
+            rows = conn.execute(query.order_by(t.c.time)).mappings().fetchall()
+        return [NodeMetric(dict(row)) for row in rows]
+
+    @staticmethod
+    def _bucketStart(time: datetime, resolution: int) -> datetime:
+        if resolution >= 86400:
+            return time.replace(hour=0, minute=0, second=0, microsecond=0)
+        return time.replace(minute=0, second=0, microsecond=0)
+
+    def downsample(self, now: Optional[datetime] = None) -> int:
+        """
+        Roll old samples up into coarser resolutions and apply retention
+
+        Only complete target buckets are rolled up, so running this repeatedly is safe.
+
+        Returns:
+            Number of source rows that were rolled up or deleted
+        """
+        now = now or datetime.now()
+        t = self.nodeMetricsTable
+        processed = 0
+        try:
+            for source, target, age in self.ROLLUPS:
+                cutoff = self._bucketStart(now - age, target)
+                with self.engine.begin() as conn:
+                    rows = conn.execute(
+                        t.select().where(t.c.resolution == source, t.c.time < cutoff)
+                    ).mappings().fetchall()
+                    if not rows:
+                        continue
+                    buckets: Dict[tuple, List] = {}
+                    for row in rows:
+                        buckets.setdefault((row['node_id'], self._bucketStart(row['time'], target)), []).append(row)
+                    conn.execute(t.insert(), [
+                        self.__aggregate(node_id, bucket, target, samples)
+                        for (node_id, bucket), samples in buckets.items()
+                    ])
+                    conn.execute(t.delete().where(t.c.resolution == source, t.c.time < cutoff))
+                processed += len(rows)
+            with self.engine.begin() as conn:
+                result = conn.execute(t.delete().where(t.c.time < now - self.RETENTION))
+                processed += result.rowcount or 0
+            if processed:
+                _log_info(f"Downsampled {processed} node metric rows")
+        except Exception as e:
+            _log_error(f"Error downsampling node metrics: {e}")
+        return processed
+
+    @staticmethod
+    def __aggregate(node_id: str, bucket: datetime, resolution: int, samples: list) -> dict:
+        def average(key):
+            values = [s[key] for s in samples if s[key] is not None]
+            return sum(values) / len(values) if values else None
+
+        def maximum(key):
+            values = [s[key] for s in samples if s[key] is not None]
+            return max(values) if values else None
+
+        online = [s for s in samples if s['status'] == 'online']
+        return {
+            "node_id": node_id,
+            "time": bucket,
+            "resolution": resolution,
+            "status": 'online' if online else samples[-1]['status'],
+            "cpu_percent": average('cpu_percent'),
+            "memory_percent": average('memory_percent'),
+            "peer_count": maximum('peer_count'),
+            "active_peers": maximum('active_peers'),
+            "interface_count": maximum('interface_count'),
+            "latency_ms": average('latency_ms'),
+        }
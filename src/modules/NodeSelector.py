@@ -3,8 +3,14 @@ Node Selector
 Implements load balancing and node selection logic for peer distribution
 Phase 5: Added support for node groups and real-time metrics from /v1/status
 """
+import heapq
+import ipaddress
+import itertools
 import json
-from typing import Optional, List, Tuple
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, List, Tuple
 
 try:
     from flask import current_app
@@ -46,13 +52,143 @@ def _log_error(msg):
 class NodeSelector:
     """Handles node selection for peer placement"""
     
-    def __init__(self, NodesManager):
+    # Rebuild the scoring index on selection if the health poller has not refreshed it for this long
+    INDEX_MAX_AGE = 120
+    # Reservations not yet confirmed by a newer node state expire after this long
+    RESERVATION_TTL = 600
+    
+    def __init__(self, NodesManager, NodeMetricsManager=None):
         self.NodesManager = NodesManager
+        # In-memory node state map fed by the health poller; health_json is the fallback
+        self.NodeMetricsManager = NodeMetricsManager
+        self.__lock = threading.Lock()
+        # node_id -> {'node', 'load', 'metrics', 'version'}
+        self.__entries: Dict[str, dict] = {}
+        # group_id (None for all nodes) -> heap of (score, tiebreak, version, node_id)
+        self.__heaps: Dict[Optional[str], list] = {}
+        # node_id -> [reservation time]; (node_id, interface_name) -> [reservation time]
+        self.__reservations: Dict[str, List[float]] = {}
+        self.__interfaceReservations: Dict[Tuple[str, str], List[float]] = {}
+        self.__counter = itertools.count()
+        self.__indexedAt = None
+    
+    def refreshIndex(self):
+        """
+        Rebuild the scoring index from the enabled nodes and their latest state
+        
+        Called by the health poller after each cycle. Reservations already reflected in a
+        node's newer state are dropped; the rest keep counting against the node.
+        """
+        nodes = self.NodesManager.getEnabledNodes()
+        now = time.time()
+        with self.__lock:
+            self.__entries = {}
+            self.__heaps = {}
+            ids = {node.id for node in nodes}
+            self.__reservations = {k: v for k, v in self.__reservations.items() if k in ids}
+            self.__interfaceReservations = {k: v for k, v in self.__interfaceReservations.items() if k[0] in ids}
+            for node in nodes:
+                self.__expireReservations(node.id, now)
+                self.__entries[node.id] = {
+                    'node': node,
+                    'load': self._getNodeActivePeers(node),
+                    'metrics': self._getNodeSystemMetrics(node),
+                    'version': 0
+                }
+            self.__indexedAt = now
+        _log_debug(f"Refreshed node scoring index with {len(nodes)} nodes")
+    
+    def invalidateIndex(self):
+        """Force the next selection to rebuild the index (e.g. after node changes)"""
+        with self.__lock:
+            self.__indexedAt = None
+    
+    def __expireReservations(self, node_id: str, now: float):
+        state = self.NodeMetricsManager.getLatest(node_id) if self.NodeMetricsManager else None
+        stateTime = state.time.timestamp() if state is not None and isinstance(state.time, datetime) else now
+        keep = lambda t: t > stateTime and now - t < self.RESERVATION_TTL
+        if node_id in self.__reservations:
+            self.__reservations[node_id] = [t for t in self.__reservations[node_id] if keep(t)]
+        for key in [k for k in self.__interfaceReservations if k[0] == node_id]:
+            self.__interfaceReservations[key] = [t for t in self.__interfaceReservations[key] if keep(t)]
+    
+    def __ensureIndex(self):
+        with self.__lock:
+            fresh = self.__indexedAt is not None and time.time() - self.__indexedAt < self.INDEX_MAX_AGE
+        if not fresh:
+            self.refreshIndex()
+    
+    def __reservedCount(self, node_id: str) -> int:
+        return len(self.__reservations.get(node_id, []))
+    
+    def __score(self, entry: dict) -> float:
+        node = entry['node']
+        active_peers = entry['load'] + self.__reservedCount(node.id)
+        if node.max_peers > 0:
+            # Use utilization percentage divided by weight
+            utilization = active_peers / node.max_peers
+            base_score = utilization / node.weight if node.weight > 0 else utilization
+        else:
+            # Unlimited capacity - use raw peer count divided by weight
+            base_score = active_peers / node.weight if node.weight > 0 else active_peers
+        # Higher CPU/memory usage = higher penalty
+        return self._adjustScoreWithMetrics(base_score, entry['metrics'])
+    
+    def __hasCapacity(self, entry: dict) -> bool:
+        node = entry['node']
+        return node.max_peers <= 0 or entry['load'] + self.__reservedCount(node.id) < node.max_peers
+    
+    def __push(self, heap: list, entry: dict):
+        heapq.heappush(heap, (self.__score(entry), next(self.__counter), entry['version'], entry['node'].id))
+    
+    def __getHeap(self, group_id: Optional[str]) -> list:
+        if group_id not in self.__heaps:
+            heap = []
+            for entry in self.__entries.values():
+                if (group_id is None or entry['node'].group_id == group_id) and self.__hasCapacity(entry):
+                    self.__push(heap, entry)
+            self.__heaps[group_id] = heap
+        return self.__heaps[group_id]
+    
+    def __reserve(self, node_id: str):
+        """Count a provisional placement against a node and re-score it in every built heap"""
+        self.__reservations.setdefault(node_id, []).append(time.time())
+        entry = self.__entries.get(node_id)
+        if entry is None:
+            return
+        entry['version'] += 1
+        if self.__hasCapacity(entry):
+            for group_id, heap in self.__heaps.items():
+                if group_id is None or entry['node'].group_id == group_id:
+                    self.__push(heap, entry)
+    
+    def releaseNode(self, node_id: str, interface_name: Optional[str] = None):
+        """
+        Release a provisional reservation after a placement failed
+        
+        Args:
+            node_id: Node the peer was reserved on
+            interface_name: Interface the peer was reserved on, if any
+        """
+        with self.__lock:
+            if self.__reservations.get(node_id):
+                self.__reservations[node_id].pop()
+            if interface_name and self.__interfaceReservations.get((node_id, interface_name)):
+                self.__interfaceReservations[(node_id, interface_name)].pop()
+            entry = self.__entries.get(node_id)
+            if entry is not None:
+                entry['version'] += 1
+                for group_id, heap in self.__heaps.items():
+                    if group_id is None or entry['node'].group_id == group_id:
+                        self.__push(heap, entry)
     
     def selectNode(self, strategy: str = "auto", group_id: Optional[str] = None) -> Tuple[bool, Optional[Node], str]:
         """
         Select a node for peer placement
         
+        A successful selection provisionally reserves capacity on the node until its
+        next health refresh; call releaseNode if the placement fails.
+        
         Args:
             strategy: Selection strategy ("auto" or specific node_id)
             group_id: Optional group ID to limit selection to nodes in this group (Phase 5)
@@ -75,10 +211,12 @@ class NodeSelector:
                 return False, None, f"Node {node.name} is not in the requested group"
             
             # Check if node is at capacity
-            if node.max_peers > 0:
-                active_peers = self._getNodeActivePeers(node)
-                if active_peers >= node.max_peers:
-                    return False, None, f"Node {node.name} is at capacity ({active_peers}/{node.max_peers})"
+            with self.__lock:
+                if node.max_peers > 0:
+                    active_peers = self._getNodeActivePeers(node) + self.__reservedCount(node.id)
+                    if active_peers >= node.max_peers:
+                        return False, None, f"Node {node.name} is at capacity ({active_peers}/{node.max_peers})"
+                self.__reserve(node.id)
             
             return True, node, f"Selected node {node.name}"
     
@@ -88,12 +226,15 @@ class NodeSelector:
         
         Strategy:
         - Only consider enabled nodes (optionally filtered by group)
-        - Skip nodes at or over max_peers cap
+        - Skip nodes at or over max_peers cap, counting provisional reservations
         - Incorporate real-time metrics from /v1/status if available (CPU, memory)
         - Score = (active_peers / max_peers) / weight
         - Lower score is better
         - If max_peers is 0 (unlimited), use active_peers / weight
         
+        Scores live in a min-heap per group, so each selection is O(log n): the best
+        node is popped, reserved, re-scored and pushed back.
+        
         Args:
             group_id: Optional group ID to limit selection to nodes in this group
         
@@ -101,80 +242,91 @@ class NodeSelector:
             Tuple of (success: bool, node or None, message)
         """
         try:
-            # Get enabled nodes, optionally filtered by group
-            if group_id is not None:
-                enabled_nodes = self.NodesManager.getEnabledNodesByGroup(group_id)
-                _log_debug(f"Selecting from {len(enabled_nodes)} enabled nodes in group {group_id}")
-            else:
-                enabled_nodes = self.NodesManager.getEnabledNodes()
-                _log_debug(f"Selecting from {len(enabled_nodes)} enabled nodes (all groups)")
-            
-            if not enabled_nodes:
-                if group_id:
-                    return False, None, f"No enabled nodes in group {group_id}"
-                else:
+            self.__ensureIndex()
+            with self.__lock:
+                if group_id is not None:
+                    group_size = len([e for e in self.__entries.values() if e['node'].group_id == group_id])
+                    _log_debug(f"Selecting from {group_size} enabled nodes in group {group_id}")
+                    if group_size == 0:
+                        return False, None, f"No enabled nodes in group {group_id}"
+                elif not self.__entries:
                     # No nodes configured - fallback to legacy mode
                     return False, None, "No nodes configured - using legacy local mode"
-            
-            candidates = []
-            
-            for node in enabled_nodes:
-                # Get active peer count and system metrics
-                active_peers = self._getNodeActivePeers(node)
-                system_metrics = self._getNodeSystemMetrics(node)
-                
-                # Check max_peers soft cap
-                if node.max_peers > 0 and active_peers >= node.max_peers:
-                    _log_debug(f"Node {node.name} at capacity: {active_peers}/{node.max_peers}")
-                    continue
-                
-                # Calculate base score from peer utilization
-                if node.max_peers > 0:
-                    # Use utilization percentage divided by weight
-                    utilization = active_peers / node.max_peers
-                    base_score = utilization / node.weight if node.weight > 0 else utilization
-                else:
-                    # Unlimited capacity - use raw peer count divided by weight
-                    base_score = active_peers / node.weight if node.weight > 0 else active_peers
-                
-                # Adjust score based on real-time system metrics (Phase 5)
-                # Higher CPU/memory usage = higher penalty
-                score = self._adjustScoreWithMetrics(base_score, system_metrics)
                 
-                candidates.append((score, node, active_peers, system_metrics))
-                _log_debug(
-                    f"Node {node.name}: active={active_peers}, "
-                    f"max={node.max_peers}, weight={node.weight}, "
-                    f"cpu={system_metrics.get('cpu_percent', 'N/A')}%, "
-                    f"mem={system_metrics.get('memory_percent', 'N/A')}%, "
-                    f"score={score:.4f}"
-                )
-            
-            if not candidates:
-                if group_id:
-                    return False, None, f"No available nodes in group {group_id} (all at capacity)"
-                else:
-                    return False, None, "No available nodes (all at capacity)"
+                heap = self.__getHeap(group_id)
+                while heap:
+                    score, _, version, node_id = heapq.heappop(heap)
+                    entry = self.__entries.get(node_id)
+                    if entry is None or entry['version'] != version:
+                        continue  # Stale heap item, the node was re-scored since
+                    if not self.__hasCapacity(entry):
+                        continue
+                    self.__reserve(node_id)
+                    selected_node = entry['node']
+                    _log_info(f"Auto-selected node: {selected_node.name} (score: {score:.4f})")
+                    return True, selected_node, f"Auto-selected node {selected_node.name}"
             
-            # Sort by score (lower is better) and pick first
-            candidates.sort(key=lambda x: x[0])
-            selected_node = candidates[0][1]
-            
-            _log_info(f"Auto-selected node: {selected_node.name} (score: {candidates[0][0]:.4f})")
-            return True, selected_node, f"Auto-selected node {selected_node.name}"
+            if group_id:
+                return False, None, f"No available nodes in group {group_id} (all at capacity)"
+            else:
+                return False, None, "No available nodes (all at capacity)"
             
         except Exception as e:
             _log_error(f"Error in node selection: {e}")
             return False, None, str(e)
     
+    def selectInterface(self, node: Node, interfaces: list):
+        """
+        Select the interface of a node with the most remaining IP pool capacity
+        
+        Remaining capacity is the interface pool size minus the interface's current peers
+        (from the node state) and its provisional reservations. Interfaces without a pool
+        count as unlimited; ties go to the interface with fewer peers.
+        
+        Args:
+            node: Selected node
+            interfaces: Enabled NodeInterface objects of the node
+        
+        Returns:
+            The selected NodeInterface, or None if every pool is exhausted
+        """
+        state = self.NodeMetricsManager.getLatest(node.id) if self.NodeMetricsManager else None
+        interface_peers = state.interfaces if state is not None else {}
+        best = None
+        with self.__lock:
+            for iface in interfaces:
+                peers = interface_peers.get(iface.interface_name, {}).get('peer_count', 0) \
+                    + len(self.__interfaceReservations.get((node.id, iface.interface_name), []))
+                remaining = float('inf')
+                if iface.ip_pool_cidr:
+                    try:
+                        network = ipaddress.ip_network(iface.ip_pool_cidr, strict=False)
+                        # Exclude network, broadcast and gateway addresses
+                        remaining = max(0, network.num_addresses - 3) - peers
+                    except ValueError:
+                        _log_error(f"Invalid IP pool {iface.ip_pool_cidr} on interface {iface.interface_name}")
+                if remaining <= 0:
+                    continue
+                key = (-remaining, peers)
+                if best is None or key < best[0]:
+                    best = (key, iface)
+            if best is None:
+                return None
+            self.__interfaceReservations.setdefault((node.id, best[1].interface_name), []).append(time.time())
+            return best[1]
+    
     def _getNodeActivePeers(self, node: Node) -> int:
         """
-        Get count of active peers on a node from health data
+        Get count of active peers on a node from its latest state, or health data
         
         Returns:
             Number of active peers (0 if unknown)
         """
         try:
+            state = self.NodeMetricsManager.getLatest(node.id) if self.NodeMetricsManager else None
+            if state is not None and state.peer_count is not None:
+                return state.peer_count
+            
             if node.health_json:
                 health_data = json.loads(node.health_json) if isinstance(node.health_json, str) else node.health_json
                 
@@ -202,6 +354,16 @@ class NodeSelector:
             Dict with cpu_percent, memory_percent, and other metrics (empty if unavailable)
         """
         try:
+            state = self.NodeMetricsManager.getLatest(node.id) if self.NodeMetricsManager else None
+            if state is not None:
+                metrics = {}
+                if state.cpu_percent is not None:
+                    metrics['cpu_percent'] = state.cpu_percent
+                if state.memory_percent is not None:
+                    metrics['memory_percent'] = state.memory_percent
+                if metrics:
+                    return metrics
+            
             if node.health_json:
                 health_data = json.loads(node.health_json) if isinstance(node.health_json, str) else node.health_json
                 
@@ -3,6 +3,7 @@ Peer
 """
 import base64
 import datetime
+import functools
 import json
 import os, subprocess, uuid, random, re
 from datetime import timedelta
@@ -11,8 +12,26 @@ import jinja2
 import sqlalchemy as db
 from .PeerJob import PeerJob
 from .PeerShareLink import PeerShareLink
+from .PeerTrafficRollups import DownsampleTraffics
 from .Utilities import GenerateWireguardPublicKey, ValidateIPAddressesWithRange, ValidateDNSAddress
 
+PeerConfigurationTemplate = jinja2.Template(
+    "[Interface]\n"
+    "{% for key, val in interface %}{{ key }} = {{ val }}\n{% endfor %}"
+    "\n[Peer]"
+    "{% for key, val in peer %}\n{{ key }} = {{ val }}{% endfor %}"
+)
+
+@functools.lru_cache(maxsize=256)
+def _compileValueTemplate(source: str) -> jinja2.Template:
+    return jinja2.Template(source)
+
+def _renderValue(val, configuration):
+    # Override settings may reference the configuration, e.g. {{ configuration.ListenPort }}
+    if isinstance(val, str) and ("{{" in val or "{%" in val):
+        return _compileValueTemplate(val).render(configuration=configuration)
+    return val
+
 
 class Peer:
     def __init__(self, tableData, configuration):
@@ -41,11 +60,21 @@ class Peer:
         self.handshake_obs = tableData.get("handshake_obs")
         self.rx_obs = tableData.get("rx_obs")
         self.tx_obs = tableData.get("tx_obs")
+        if self.node_id and self.handshake_obs is not None:
+            # Node-hosted peers only store the raw handshake time, derive the display value
+            self.latest_handshake = self.__handshakeAge(self.handshake_obs)
         self.jobs: list[PeerJob] = []
         self.ShareLink: list[PeerShareLink] = []
         self.getJobs()
         self.getShareLink()
 
+    @staticmethod
+    def __handshakeAge(handshake: str) -> str:
+        if not str(handshake).isdigit() or int(handshake) == 0:
+            return "No Handshake"
+        age = datetime.datetime.now() - datetime.datetime.fromtimestamp(int(handshake))
+        return str(age).split(".", maxsplit=1)[0]
+
     def toJson(self):
         # self.getJobs()
         # self.getShareLink()
@@ -124,11 +153,17 @@ class Peer:
                         self.configuration.peersTable.c.id == self.id
                     )
                 )
+            self.configuration.invalidatePeerConfigCache(self.id)
             return True, None
         except subprocess.CalledProcessError as exc:
             return False, exc.output.decode("UTF-8").strip()
 
-    def downloadPeer(self) -> dict[str, str]:
+    def downloadPeer(self, cache: bool = True) -> dict[str, str]:
+        cacheKey = (self.name, self.private_key, self.allowed_ip, self.mtu, self.DNS,
+                    self.endpoint_allowed_ip, self.keepalive, self.preshared_key)
+        cached = self.configuration.getCachedPeerConfig(self.id, cacheKey)
+        if cached is not None:
+            return cached
         final = {
             "fileName": "",
             "file": ""
@@ -188,17 +223,13 @@ class Peer:
             ),
             "PresharedKey": self.preshared_key
         }
-        combine = [interfaceSection.items(), peerSection.items()]
-        for s in range(len(combine)):
-            if s == 0:
-                final["file"] += "[Interface]\n"
-            else:
-                final["file"] += "\n[Peer]\n"
-            for (key, val) in combine[s]:
+        combine = [[], []]
+        for s, section in enumerate([interfaceSection.items(), peerSection.items()]):
+            for (key, val) in section:
                 if val is not None and ((type(val) is str and len(val) > 0) or (type(val) is int and val > 0)):
-                    final["file"] += f"{key} = {val}\n"
-        
-        final["file"] = jinja2.Template(final["file"]).render(configuration=self.configuration)
+                    combine[s].append((key, _renderValue(val, self.configuration)))
+
+        final["file"] = PeerConfigurationTemplate.render(interface=combine[0], peer=combine[1])
 
 
         if self.configuration.Protocol == "awg":
@@ -219,6 +250,8 @@ class Peer:
                         if self.configuration.configurationInfo.OverridePeerSettings.PeerRemoteEndpoint 
                         else self.configuration.DashboardConfig.GetConfig("Peers", "remote_endpoint")[1])
             })
+        if cache:
+            self.configuration.cachePeerConfig(self.id, cacheKey, final)
         return final
 
     def getJobs(self):
@@ -279,20 +312,27 @@ class Peer:
         return True
     
     def getEndpoints(self):
-        result = []
+        """Distinct endpoints of the peer with when they were first and last seen, latest first"""
+        historyEndpoint = self.configuration.peersHistoryEndpointPartitions.source()
         with self.configuration.engine.connect() as conn:
             result = conn.execute(
                 db.select(
-                    self.configuration.peersHistoryEndpointTable.c.endpoint
-                ).group_by(
-                    self.configuration.peersHistoryEndpointTable.c.endpoint
+                    historyEndpoint.c.endpoint,
+                    db.func.min(historyEndpoint.c.first_seen).label("first_seen"),
+                    db.func.max(historyEndpoint.c.last_seen).label("last_seen"),
+                    db.func.sum(historyEndpoint.c.seen_count).label("seen_count")
                 ).where(
-                    self.configuration.peersHistoryEndpointTable.c.id == self.id
+                    historyEndpoint.c.id == self.id
+                ).group_by(
+                    historyEndpoint.c.endpoint
+                ).order_by(
+                    db.desc("last_seen")
                 )
             ).mappings().fetchall()
-        return list(result)
+        return [dict(row) for row in result]
     
-    def getTraffics(self, interval: int = 30, startDate: datetime.datetime = None, endDate: datetime.datetime = None):
+    def getTraffics(self, interval: int = 30, startDate: datetime.datetime = None, endDate: datetime.datetime = None,
+                    resolution: float = None, bucket: int = None, maxPoints: int = None):
         if startDate is None and endDate is None:
             endDate = datetime.datetime.now()
             startDate = endDate - timedelta(minutes=interval)
@@ -300,27 +340,14 @@ class Peer:
             endDate = endDate.replace(hour=23, minute=59, second=59, microsecond=999999)
             startDate = startDate.replace(hour=0, minute=0, second=0, microsecond=0)
 
-        with self.configuration.engine.connect() as conn:
-            result = conn.execute(
-                db.select(
-                    self.configuration.peersTransferTable.c.cumu_data,
-                    self.configuration.peersTransferTable.c.total_data,
-                    self.configuration.peersTransferTable.c.cumu_receive,
-                    self.configuration.peersTransferTable.c.total_receive,
-                    self.configuration.peersTransferTable.c.cumu_sent,
-                    self.configuration.peersTransferTable.c.total_sent,
-                    self.configuration.peersTransferTable.c.time
-                ).where(
-                    db.and_(
-                        self.configuration.peersTransferTable.c.id == self.id,
-                        self.configuration.peersTransferTable.c.time <= endDate,
-                        self.configuration.peersTransferTable.c.time >= startDate,
-                        )
-                ).order_by(
-                    self.configuration.peersTransferTable.c.time
-                )
-            ).mappings().fetchall()
-        return list(result)
+        rollups = self.configuration.peersTrafficRollups
+        if bucket is not None:
+            traffics = rollups.getBucketedTraffics(self.id, startDate, endDate, bucket)
+        else:
+            traffics = rollups.getTraffics(self.id, startDate, endDate, resolution)
+        if maxPoints is not None:
+            traffics = DownsampleTraffics(traffics, maxPoints, "delta_data" if bucket is not None else "total_data")
+        return traffics
             
     
     def getSessions(self, startDate: datetime.datetime = None, endDate: datetime.datetime = None):
@@ -333,24 +360,32 @@ class Peer:
         endDate = endDate.replace(hour=23, minute=59, second=59, microsecond=999999)
         startDate = startDate.replace(hour=0, minute=0, second=0, microsecond=0)
             
-
-        with self.configuration.engine.connect() as conn:
-            result = conn.execute(
-                db.select(
-                    self.configuration.peersTransferTable.c.time
-                ).where(
-                    db.and_(
-                        self.configuration.peersTransferTable.c.id == self.id,
-                        self.configuration.peersTransferTable.c.time <= endDate,
-                        self.configuration.peersTransferTable.c.time >= startDate,
-                    )
-                ).order_by(
-                    self.configuration.peersTransferTable.c.time
-                )
-            ).fetchall()
-        time = list(map(lambda x : x[0], result))
+        # Minute samples, from the 1m tier once the raw samples have expired
+        traffics = self.configuration.peersTrafficRollups.getTraffics(self.id, startDate, endDate, 60)
+        time = list(map(lambda x : x["time"], traffics))
         return time
     
+    def getSessionRecords(self, startDate: datetime.datetime = None, endDate: datetime.datetime = None):
+        """Sessions overlapping the days from startDate to endDate, oldest first, with the open session's traffic so far"""
+        if endDate is None:
+            endDate = datetime.datetime.now()
+        
+        if startDate is None:
+            startDate = endDate
+
+        endDate = endDate.replace(hour=23, minute=59, second=59, microsecond=999999)
+        startDate = startDate.replace(hour=0, minute=0, second=0, microsecond=0)
+            
+        sessions = self.configuration.peerSessions.getSessions(self.id, startDate, endDate)
+        for session in sessions:
+            # Traffic of the open session so far
+            if session["end_time"] is None and session["start_receive"] is not None:
+                session["total_receive"] = max((self.cumu_receive or 0) + (self.total_receive or 0) - session["start_receive"], 0)
+                session["total_sent"] = max((self.cumu_sent or 0) + (self.total_sent or 0) - session["start_sent"], 0)
+                session["total_data"] = session["total_receive"] + session["total_sent"]
+            del session["start_receive"], session["start_sent"]
+        return sessions
+    
     def __duration(self, t1: datetime.datetime, t2: datetime.datetime):
         delta = t1 - t2
         
@@ -0,0 +1,101 @@
+"""
+Peer Config Archive
+Streams the client configs of a configuration's peers as a ZIP or tar.gz archive
+"""
+import io
+import tarfile
+import time
+import zipfile
+from typing import Iterable, Iterator
+
+PeerConfigArchiveFormats = {
+    "zip": "application/zip",
+    "tar.gz": "application/gzip"
+}
+
+
+class _ArchiveBuffer(io.RawIOBase):
+    """
+    Write-only sink for the archive writers. It is not seekable, so zipfile writes
+    data descriptors instead of seeking back, and the generator hands out whatever
+    was written since the last chunk.
+    """
+    def __init__(self):
+        self.__chunks: list[bytes] = []
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.__chunks.append(bytes(b))
+        self.size += len(b)
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.__chunks)
+        self.__chunks.clear()
+        self.size = 0
+        return data
+
+
+class PeerConfigFileNames:
+    """
+    Unique config file names the way the download-all export always made them:
+    untitled peers are numbered, other duplicates get a suffix
+    """
+    def __init__(self):
+        self.__used: set[str] = set()
+        self.__untitledPeer = 0
+
+    def get(self, fileName: str) -> str:
+        if fileName == "UntitledPeer":
+            fileName = f"{self.__untitledPeer}_{fileName}"
+            self.__untitledPeer += 1
+        name, suffix = fileName, 1
+        while name in self.__used:
+            suffix += 1
+            name = f"{fileName}_{suffix}"
+        self.__used.add(name)
+        return name
+
+
+def StreamPeerConfigs(peers: Iterable, archiveFormat: str = "zip", chunkSize: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Render each peer's config and yield the archive in chunks of about chunkSize
+    bytes. Only one rendered config is held at a time and none are added to the
+    configuration's cache. Besides the file name set, only ZIP keeps per-entry
+    state, the small central directory index it writes at the end.
+    """
+    buffer = _ArchiveBuffer()
+    now = time.time()
+    if archiveFormat == "zip":
+        archive = zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED)
+
+        def add(name: str, data: bytes):
+            info = zipfile.ZipInfo(name, date_time=time.localtime(now)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o600 << 16
+            archive.writestr(info, data)
+    elif archiveFormat == "tar.gz":
+        archive = tarfile.open(fileobj=buffer, mode="w|gz")
+
+        def add(name: str, data: bytes):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(now)
+            info.mode = 0o600
+            archive.addfile(info, io.BytesIO(data))
+            # TarFile remembers every member for reading back; a stream never does
+            archive.members.clear()
+    else:
+        raise ValueError(f"Unsupported archive format {archiveFormat}")
+
+    fileNames = PeerConfigFileNames()
+    for peer in peers:
+        file = peer.downloadPeer(cache=False)
+        add(f"{fileNames.get(file['fileName'])}.conf", file["file"].encode("utf-8"))
+        if buffer.size >= chunkSize:
+            yield buffer.drain()
+    archive.close()
+    yield buffer.drain()
@@ -2,6 +2,7 @@
 Peer Job Logger
 """
 import uuid
+from datetime import datetime
 from typing import Sequence
 
 import sqlalchemy as db
@@ -10,9 +11,12 @@ from sqlalchemy import RowMapping
 
 from .ConnectionString import ConnectionString
 from .Log import Log
+from .LogPagination import CreateIndexes, InvalidCursorException, KeysetPage
+from .LogQueue import LogQueue
 
 class PeerJobLogger:
-    def __init__(self, AllPeerJobs, DashboardConfig):
+    def __init__(self, AllPeerJobs, DashboardConfig, logQueue: LogQueue = None):
+        self.logQueue = logQueue
         self.engine = db.create_engine(ConnectionString("wgdashboard_log"))                
         self.metadata = db.MetaData()
         self.jobLogTable = db.Table('JobLog', self.metadata,
@@ -21,46 +25,72 @@ class PeerJobLogger:
                                     db.Column('LogDate', (db.DATETIME if DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else db.TIMESTAMP), 
                                               server_default=db.func.now()),
                                     db.Column('Status', db.String(255), nullable=False),
-                                    db.Column('Message', db.Text)
+                                    db.Column('Message', db.Text),
+                                    db.Index('ix_JobLog_LogDate_LogID', 'LogDate', 'LogID'),
+                                    db.Index('ix_JobLog_JobID_LogDate_LogID', 'JobID', 'LogDate', 'LogID')
                                     )
         self.logs: list[Log] = []
         self.metadata.create_all(self.engine)
+        CreateIndexes(self.engine, self.jobLogTable)
         self.AllPeerJobs = AllPeerJobs
     def log(self, JobID: str, Status: bool = True, Message: str = "") -> bool:
+        row = {
+            "LogID": str(uuid.uuid4()),
+            "JobID": JobID,
+            "LogDate": datetime.now(),
+            "Status": Status,
+            "Message": Message
+        }
+        if self.logQueue is not None:
+            return self.logQueue.put(self.engine, self.jobLogTable, row)
         try:
             with self.engine.begin() as conn:
-                conn.execute(
-                    self.jobLogTable.insert().values(
-                        {
-                            "LogID": str(uuid.uuid4()), 
-                            "JobID": JobID, 
-                            "Status": Status, 
-                            "Message": Message
-                        }
-                    )
-                )
+                conn.execute(self.jobLogTable.insert().values(row))
         except Exception as e:
             current_app.logger.error(f"Peer Job Log Error", e)
             return False
         return True
 
-    def getLogs(self, configName = None) -> list[Log]:
+    def getLogs(self, configName = None, cursor: str = None, limit: int = None,
+                status: bool = None, JobID: str = None) -> tuple[list[Log], str | None]:
+        """
+        One page of the logs of the jobs of a configuration, newest first,
+        optionally of one job or status only
+
+        Returns:
+            Logs of the page and the cursor of the next page, None on the last page
+        """
         logs: list[Log] = []
+        if self.logQueue is not None:
+            self.logQueue.flush(timeout=5)
         try:
             allJobs = self.AllPeerJobs.getAllJobs(configName)
             allJobsID = [x.JobID for x in allJobs]
+            if JobID is not None:
+                allJobsID = [x for x in allJobsID if x == JobID]
             stmt = self.jobLogTable.select().where(self.jobLogTable.columns.JobID.in_(
                 allJobsID
             ))
             with self.engine.connect() as conn:
-                table = conn.execute(stmt).fetchall()
+                if status is not None:
+                    stmt = stmt.where(self.__statusIs(conn, status))
+                table, nextCursor = KeysetPage(conn, stmt, self.jobLogTable.c.LogDate, self.jobLogTable.c.LogID,
+                                               cursor, limit)
                 for l in table:
                     logs.append(
                         Log(l.LogID, l.JobID, l.LogDate.strftime("%Y-%m-%d %H:%M:%S"), l.Status, l.Message))
+        except InvalidCursorException:
+            raise
         except Exception as e:
             current_app.logger.error(f"Getting Peer Job Log Error", e)
-            return logs
-        return logs
+            return logs, None
+        return logs, nextCursor
+
+    def __statusIs(self, conn: db.Connection, status: bool):
+        # SQLite keeps the booleans logged by jobs as 1 and 0
+        if conn.dialect.name == 'sqlite':
+            return db.or_(self.jobLogTable.c.Status == str(status).lower(), self.jobLogTable.c.Status == int(status))
+        return self.jobLogTable.c.Status == str(status).lower()
     
     def getFailingJobs(self) -> Sequence[RowMapping]:
         with self.engine.connect() as conn:
@@ -68,10 +98,7 @@ class PeerJobLogger:
                 db.select(
                     self.jobLogTable.c.JobID
                 ).where(
-                    (db.or_(
-                        self.jobLogTable.c.Status == 'false',
-                        self.jobLogTable.c.Status == 0
-                    ) if conn.dialect.name == 'sqlite' else self.jobLogTable.c.Status == 'false')
+                    self.__statusIs(conn, False)
                 ).group_by(
                     self.jobLogTable.c.JobID
                 ).having(
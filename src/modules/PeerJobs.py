@@ -1,18 +1,45 @@
 """
 Peer Jobs
 """
+import heapq
+import itertools
+import threading
+import time
 import sqlalchemy
 
 from .ConnectionString import ConnectionString
 from .PeerJob import PeerJob
 from .PeerJobLogger import PeerJobLogger
+from .LogQueue import LogQueue
 import sqlalchemy as db
 from datetime import datetime
 from flask import current_app
 
 class PeerJobs:
-    def __init__(self, DashboardConfig, WireguardConfigurations, AllPeerShareLinks):
+    """
+    Date jobs wait on a min-heap keyed by their due time, so the scheduler thread
+    sleeps exactly until the next one. Threshold jobs (every field other than date)
+    are indexed by peer and evaluated by evaluatePeers() from the peer poll loop,
+    only for the peers whose values changed.
+
+    A job whose action failed is retried after DATE_RETRY_INTERVAL seconds,
+    doubling on every further failure up to DATE_RETRY_MAX_INTERVAL.
+    """
+    DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+    DATE_RECHECK_INTERVAL = 1
+    DATE_RETRY_INTERVAL = 180
+    DATE_RETRY_MAX_INTERVAL = 3600
+
+    def __init__(self, DashboardConfig, WireguardConfigurations, AllPeerShareLinks, logQueue: LogQueue = None):
         self.Jobs: list[PeerJob] = []
+        self.__jobsByPeer: dict[tuple[str, str], list[PeerJob]] = {}
+        self.__dateJobs: list[tuple[float, int, str]] = []
+        self.__sequence = itertools.count()
+        self.__pendingPeers: set[tuple[str, str]] = set()
+        # JobID -> (failed attempts, time of the next attempt)
+        self.__retries: dict[str, tuple[int, float]] = {}
+        self.__lock = threading.RLock()
+        self.__wakeup = threading.Event()
         self.engine = db.create_engine(ConnectionString('wgdashboard_job'))
         self.metadata = db.MetaData()
         self.peerJobTable = db.Table('PeerJobs', self.metadata,
@@ -28,21 +55,47 @@ class PeerJobs:
                                      )
         self.metadata.create_all(self.engine)
         self.__getJobs()
-        self.JobLogger: PeerJobLogger = PeerJobLogger(self, DashboardConfig)
+        self.JobLogger: PeerJobLogger = PeerJobLogger(self, DashboardConfig, logQueue)
         self.WireguardConfigurations = WireguardConfigurations
         self.AllPeerShareLinks = AllPeerShareLinks
         self.cleanJob(init=True)
 
     def __getJobs(self):
-        self.Jobs.clear()
         with self.engine.connect() as conn:
             jobs = conn.execute(self.peerJobTable.select().where(
                 self.peerJobTable.columns.ExpireDate.is_(None)
             )).mappings().fetchall()
-            for job in jobs:
-                self.Jobs.append(PeerJob(
-                    job['JobID'], job['Configuration'], job['Peer'], job['Field'], job['Operator'], job['Value'],
-                    job['CreationDate'], job['ExpireDate'], job['Action']))
+        loaded = [PeerJob(
+            job['JobID'], job['Configuration'], job['Peer'], job['Field'], job['Operator'], job['Value'],
+            job['CreationDate'], job['ExpireDate'], job['Action']) for job in jobs]
+        with self.__lock:
+            self.Jobs.clear()
+            self.Jobs.extend(loaded)
+            self.__buildIndex()
+        self.__wakeup.set()
+
+    def __buildIndex(self):
+        self.__jobsByPeer = {}
+        self.__dateJobs = []
+        self.__retries = {job.JobID: self.__retries[job.JobID] for job in self.Jobs if job.JobID in self.__retries}
+        for job in self.Jobs:
+            self.__jobsByPeer.setdefault((job.Configuration, job.Peer), []).append(job)
+            if job.Field == "date":
+                due = self.__dateJobDue(job)
+                if due is not None:
+                    if job.JobID in self.__retries:
+                        due = max(due, self.__retries[job.JobID][1])
+                    self.__dateJobs.append((due, next(self.__sequence), job.JobID))
+        heapq.heapify(self.__dateJobs)
+
+    def __dateJobDue(self, job: PeerJob) -> float | None:
+        # lgt and eq can only become true at the given time; lst and neq are true right away
+        if job.Operator in ("lst", "neq"):
+            return time.time()
+        try:
+            return datetime.strptime(job.Value, self.DATE_FORMAT).timestamp()
+        except (TypeError, ValueError):
+            return None
 
     def getAllJobs(self, configuration: str = None):
         if configuration is not None:
@@ -62,7 +115,7 @@ class PeerJobs:
         return [x.toJson() for x in self.Jobs]
 
     def searchJob(self, Configuration: str, Peer: str):
-        return list(filter(lambda x: x.Configuration == Configuration and x.Peer == Peer, self.Jobs))
+        return list(self.__jobsByPeer.get((Configuration, Peer), []))
 
     def searchJobById(self, JobID):
         return list(filter(lambda x: x.JobID == JobID, self.Jobs))
@@ -99,6 +152,10 @@ class PeerJobs:
                         }).where(self.peerJobTable.columns.JobID == Job.JobID)
                     )
                     self.JobLogger.log(Job.JobID, Message=f"Job is updated from if {currentJob[0].Field} {currentJob[0].Operator} {currentJob[0].Value} then {currentJob[0].Action}; to if {Job.Field} {Job.Operator} {Job.Value} then {Job.Action}")
+            if Job.Field != "date":
+                # The threshold may already be crossed while the peer is idle
+                with self.__lock:
+                    self.__pendingPeers.add((Job.Configuration, Job.Peer))
             self.__getJobs()
             self.WireguardConfigurations.get(Job.Configuration).searchPeer(Job.Peer)[1].getJobs()
             return True, list(
@@ -140,59 +197,136 @@ class PeerJobs:
         except Exception as e:
             return False, str(e)
     
-    def getPeerJobLogs(self, configurationName):
-        return self.JobLogger.getLogs(configurationName)
+    def getPeerJobLogs(self, configurationName, cursor: str = None, limit: int = None,
+                       status: bool = None, JobID: str = None):
+        return self.JobLogger.getLogs(configurationName, cursor, limit, status, JobID)
 
 
     def runJob(self):
+        """Evaluate every job once, regardless of its schedule"""
         self.cleanJob()
-        needToDelete = []
         self.__getJobs()
-        for job in self.Jobs:
-            c = self.WireguardConfigurations.get(job.Configuration)
-            if c is not None:
-                f, fp = c.searchPeer(job.Peer)
-                if f:
-                    if job.Field in ["total_receive", "total_sent", "total_data"]:
-                        s = job.Field.split("_")[1]
-                        x: float = getattr(fp, f"total_{s}") + getattr(fp, f"cumu_{s}")
-                        y: float = float(job.Value)
-                    else:
-                        x: datetime = datetime.now()
-                        y: datetime = datetime.strptime(job.Value, "%Y-%m-%d %H:%M:%S")
-                    runAction: bool = self.__runJob_Compare(x, y, job.Operator)
-                    if runAction:
-                        s = False
-                        if job.Action == "restrict":
-                            s, msg = c.restrictPeers([fp.id])
-                        elif job.Action == "delete":
-                            s, msg = c.deletePeers([fp.id], self, self.AllPeerShareLinks)
-                        elif job.Action == "reset_total_data_usage":
-                            s = fp.resetDataUsage("total")
-                            c.restrictPeers([fp.id])
-                            c.allowAccessPeers([fp.id])
-                        if s is True:
-                            self.JobLogger.log(job.JobID, s,
-                                          f"Peer {fp.id} from {c.Name} is successfully {job.Action}ed."
-                                          )
-                            needToDelete.append(job)
-                        else:
-                            self.JobLogger.log(job.JobID, s,
-                                          f"Peer {fp.id} from {c.Name} failed {job.Action}ed."
-                                          )
-                else:
-                    self.JobLogger.log(job.JobID, False,
-                                  f"Somehow can't find this peer {job.Peer} from {c.Name} failed {job.Action}ed."
-                                  )
-            else:
-                self.JobLogger.log(job.JobID, False,
-                              f"Somehow can't find this peer {job.Peer} from {job.Configuration} failed {job.Action}ed."
-                              )
-        for j in needToDelete:
+        with self.__lock:
+            jobs = list(self.Jobs)
+        self.__finishJobs([job for job in jobs if self.__evaluateJob(job)])
+
+    def runDueJobs(self) -> float | None:
+        """
+        Run the date jobs that are due and the threshold jobs of peers queued by saveJob
+
+        Returns:
+            Seconds until the next date job is due, or None if there is none
+        """
+        now = time.time()
+        due: list[PeerJob] = []
+        with self.__lock:
+            pendingPeers, self.__pendingPeers = self.__pendingPeers, set()
+            byId = {job.JobID: job for job in self.Jobs}
+            while self.__dateJobs and self.__dateJobs[0][0] <= now:
+                _, _, jobId = heapq.heappop(self.__dateJobs)
+                if jobId in byId:
+                    due.append(byId[jobId])
+
+        finished = []
+        for job in due:
+            if self.__evaluateJob(job):
+                finished.append(job)
+            elif job.Operator == "lgt":
+                # Clock skew is looked at again shortly, a failed action after its backoff
+                with self.__lock:
+                    retryAt = self.__retries.get(job.JobID, (0, 0))[1]
+                    heapq.heappush(self.__dateJobs,
+                                   (max(retryAt, now + self.DATE_RECHECK_INTERVAL), next(self.__sequence), job.JobID))
+        for configurationName, peerId in pendingPeers:
+            finished.extend(self.__evaluateThresholdJobs(configurationName, [peerId]))
+        self.__finishJobs(finished)
+
+        with self.__lock:
+            if not self.__dateJobs:
+                return None
+            return max(0.0, self.__dateJobs[0][0] - time.time())
+
+    def waitForJobs(self, timeout: float | None):
+        """Sleep until timeout or until the set of jobs changes"""
+        self.__wakeup.wait(timeout)
+        self.__wakeup.clear()
+
+    def evaluatePeers(self, configurationName: str, peerIds) -> int:
+        """
+        Evaluate the threshold jobs of peers whose transfer values just changed
+
+        Returns:
+            Number of jobs that ran their action and finished
+        """
+        finished = self.__evaluateThresholdJobs(configurationName, peerIds)
+        self.__finishJobs(finished)
+        return len(finished)
+
+    def __evaluateThresholdJobs(self, configurationName: str, peerIds) -> list[PeerJob]:
+        now = time.time()
+        with self.__lock:
+            # A job whose action failed waits for its backoff like a date job
+            jobs = [job for peerId in peerIds
+                    for job in self.__jobsByPeer.get((configurationName, peerId), [])
+                    if job.Field != "date" and self.__retries.get(job.JobID, (0, 0))[1] <= now]
+        if not jobs:
+            return []
+        c = self.WireguardConfigurations.get(configurationName)
+        return [job for job in jobs if self.__evaluateJob(job, c)]
+
+    def __finishJobs(self, jobs: list[PeerJob]):
+        for j in jobs:
             self.deleteJob(j)
-            
+
+    def __logFailure(self, job: PeerJob, message: str):
+        with self.__lock:
+            failures = self.__retries.get(job.JobID, (0, 0))[0] + 1
+            backoff = min(self.DATE_RETRY_INTERVAL * 2 ** (failures - 1), self.DATE_RETRY_MAX_INTERVAL)
+            self.__retries[job.JobID] = (failures, time.time() + backoff)
+        self.JobLogger.log(job.JobID, False, message)
+
+    def __evaluateJob(self, job: PeerJob, c=None, fp=None) -> bool:
+        """Compare one job against its peer and run the action; True if the job is finished"""
+        if c is None:
+            c = self.WireguardConfigurations.get(job.Configuration)
+        if c is None:
+            self.__logFailure(job, f"Somehow can't find this peer {job.Peer} from {job.Configuration} failed {job.Action}ed.")
+            return False
+        if fp is None:
+            f, fp = c.searchPeer(job.Peer)
+            if not f:
+                self.__logFailure(job, f"Somehow can't find this peer {job.Peer} from {c.Name} failed {job.Action}ed.")
+                return False
+        if job.Field in ["total_receive", "total_sent", "total_data"]:
+            s = job.Field.split("_")[1]
+            x: float = getattr(fp, f"total_{s}") + getattr(fp, f"cumu_{s}")
+            y: float = float(job.Value)
+        else:
+            x: datetime = datetime.now()
+            y: datetime = datetime.strptime(job.Value, self.DATE_FORMAT)
+        runAction: bool = self.__runJob_Compare(x, y, job.Operator)
+        if not runAction:
+            return False
+        s = False
+        if job.Action == "restrict":
+            s, msg = c.restrictPeers([fp.id])
+        elif job.Action == "delete":
+            s, msg = c.deletePeers([fp.id], self, self.AllPeerShareLinks)
+        elif job.Action == "reset_total_data_usage":
+            s = fp.resetDataUsage("total")
+            c.restrictPeers([fp.id])
+            c.allowAccessPeers([fp.id])
+        if s is True:
+            self.JobLogger.log(job.JobID, s,
+                          f"Peer {fp.id} from {c.Name} is successfully {job.Action}ed."
+                          )
+            return True
+        self.__logFailure(job, f"Peer {fp.id} from {c.Name} failed {job.Action}ed.")
+        return False
+
     def cleanJob(self, init = False):
         failingJobs = self.JobLogger.getFailingJobs()
+        expiredJobs = [j for job in failingJobs for j in self.searchJobById(job.get('JobID'))]
         with self.engine.begin() as conn:
             for job in failingJobs:
                 conn.execute(
@@ -204,6 +338,15 @@ class PeerJobs:
                 )
                 self.JobLogger.deleteLogs(JobID=job.get('JobID'))
                 self.JobLogger.log(job.get('JobID'), Message=f"Job is removed due to being stale.")
+        if failingJobs:
+            # Expired jobs must leave the schedule and the peer index too
+            self.__getJobs()
+            for job in expiredJobs:
+                c = self.WireguardConfigurations.get(job.Configuration)
+                if c is not None:
+                    f, fp = c.searchPeer(job.Peer)
+                    if f:
+                        fp.getJobs()
         
         with self.engine.connect() as conn:
             if init and conn.dialect.name == 'sqlite':
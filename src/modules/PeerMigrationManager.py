@@ -2,8 +2,11 @@
 Peer Migration Manager
 Handles automatic peer migration between nodes (Phase 8)
 """
+import heapq
 import json
-from typing import List, Optional, Tuple
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 import sqlalchemy as db
 
 try:
@@ -12,6 +15,11 @@ try:
 except ImportError:
     _has_flask = False
 
+try:
+    from .LogPagination import MAX_PAGE_SIZE
+except ImportError:
+    from LogPagination import MAX_PAGE_SIZE
+
 
 def _log_info(msg):
     """Helper to log info messages"""
@@ -41,11 +49,16 @@ class PeerMigrationManager:
     Features:
     - Migrate peers when node is removed from config
     - Migrate peers when node becomes unhealthy
-    - Least-loaded node selection
-    - Update peers via agent APIs
+    - Balanced assignment planned up front from node loads read once
+    - Batched execution per destination node, in parallel across nodes
+    - Progress and resume through the audit log
     """
     
-    def __init__(self, DashboardConfig, NodesManager, ConfigNodesManager):
+    AUDIT_ENTITY = "peer_migration"
+    
+    def __init__(self, DashboardConfig, NodesManager, ConfigNodesManager, AuditLogManager=None,
+                 WireguardConfigurations: Optional[dict] = None, max_workers: int = 8, batch_size: int = 250,
+                 NodeInterfacesManager=None, NodeSelector=None):
         """
         Initialize Peer Migration Manager
         
@@ -53,18 +66,30 @@ class PeerMigrationManager:
             DashboardConfig: Dashboard configuration instance
             NodesManager: Nodes manager instance
             ConfigNodesManager: Config nodes manager instance
+            AuditLogManager: Audit log manager used for progress and resume
+            WireguardConfigurations: Loaded configurations, used for their peer tables
+            max_workers: Maximum number of destination nodes migrated concurrently
+            batch_size: Maximum number of peers applied per agent request
+            NodeInterfacesManager: Node interfaces manager, used for the destination interfaces
+            NodeSelector: Node selector choosing the destination interface of each peer
         """
         self.DashboardConfig = DashboardConfig
         self.NodesManager = NodesManager
         self.ConfigNodesManager = ConfigNodesManager
+        self.AuditLogManager = AuditLogManager
+        self.WireguardConfigurations = WireguardConfigurations if WireguardConfigurations is not None else {}
         self.engine = DashboardConfig.engine
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.NodeInterfacesManager = NodeInterfacesManager
+        self.NodeSelector = NodeSelector
         
-        # Get peer table reference from a WireguardConfiguration
-        # We'll need to access the peer table directly
+        # Peer tables reflected for configurations that are not loaded, kept per config
         self.dbMetadata = db.MetaData()
+        self.__peerTables: Dict[str, db.Table] = {}
     
     def migrate_peers_from_node(self, config_name: str, source_node_id: str, 
-                               destination_node_id: str = None) -> Tuple[bool, str, int]:
+                               destination_node_id: str = None, user: str = None) -> Tuple[bool, str, int]:
         """
         Migrate all peers from source node to destination node(s)
         
@@ -72,67 +97,225 @@ class PeerMigrationManager:
             config_name: Name of the WireGuard configuration
             source_node_id: Node to migrate peers from
             destination_node_id: Specific destination node (optional, will auto-select if None)
+            user: User recorded in the audit log
             
         Returns:
             Tuple of (success, message, number of peers migrated)
         """
         try:
-            # Get peers assigned to the source node for this config
-            peers = self._get_peers_for_node(config_name, source_node_id)
+            success, plan = self.plan_migration(config_name, source_node_id, destination_node_id)
+            if not success:
+                return False, plan, 0
             
-            if not peers:
+            total = sum(len(peer_ids) for peer_ids in plan["assignments"].values()) + len(plan["unplaced"])
+            if total == 0:
                 _log_info(f"No peers to migrate from node {source_node_id}")
                 return True, "No peers to migrate", 0
             
-            _log_info(f"Found {len(peers)} peers to migrate from node {source_node_id}")
-            
-            # Get destination nodes
-            if destination_node_id:
-                dest_nodes = [self.NodesManager.getNodeById(destination_node_id)]
-                if not dest_nodes[0]:
-                    return False, "Destination node not found", 0
-            else:
-                # Get healthy nodes for this config (excluding source)
-                config_nodes = self.ConfigNodesManager.getHealthyNodesForConfig(config_name)
-                dest_node_ids = [cn.node_id for cn in config_nodes if cn.node_id != source_node_id]
-                
-                if not dest_node_ids:
-                    return False, "No healthy destination nodes available", 0
-                
-                dest_nodes = [self.NodesManager.getNodeById(nid) for nid in dest_node_ids]
-                dest_nodes = [n for n in dest_nodes if n and n.enabled]
-                
-                if not dest_nodes:
-                    return False, "No enabled destination nodes available", 0
+            _log_info(f"Found {total} peers to migrate from node {source_node_id}")
             
-            # Migrate each peer
-            migrated_count = 0
-            for peer in peers:
-                # Select destination node (least loaded)
-                dest_node = self._select_destination_node(dest_nodes, config_name)
-                
-                if not dest_node:
-                    _log_error(f"Could not select destination node for peer {peer['id']}")
-                    continue
-                
-                # Migrate the peer
-                success = self._migrate_single_peer(config_name, peer, source_node_id, dest_node.id)
-                
-                if success:
-                    migrated_count += 1
-                    _log_info(f"Migrated peer {peer['id']} from {source_node_id} to {dest_node.id}")
-                else:
-                    _log_error(f"Failed to migrate peer {peer['id']}")
+            migration_id = uuid.uuid4().hex
+            self._audit("peer_migration_planned", migration_id, plan, user)
+            migrated_count = self._execute_plan(migration_id, plan, user)
             
-            if migrated_count == len(peers):
+            if migrated_count == total:
                 return True, f"Successfully migrated {migrated_count} peers", migrated_count
             else:
-                return False, f"Migrated {migrated_count}/{len(peers)} peers", migrated_count
+                return False, f"Migrated {migrated_count}/{total} peers", migrated_count
         
         except Exception as e:
             _log_error(f"Error migrating peers: {e}")
             return False, str(e), 0
     
+    def plan_migration(self, config_name: str, source_node_id: str,
+                       destination_node_id: str = None) -> Tuple[bool, dict or str]:
+        """
+        Compute a balanced assignment of all peers of the source node
+        
+        Destination loads are read with one grouped query, then each peer goes to the
+        least-loaded destination that still has room under its max_peers.
+        
+        Returns:
+            Tuple of (success, plan dict or error message). The plan holds the
+            config, source node, destination -> peer IDs and the peers that did not fit.
+        """
+        peers = self._get_peers_for_node(config_name, source_node_id)
+        
+        # Get destination nodes
+        if destination_node_id:
+            dest_nodes = [self.NodesManager.getNodeById(destination_node_id)]
+            if not dest_nodes[0]:
+                return False, "Destination node not found"
+        else:
+            # Get healthy nodes for this config (excluding source)
+            config_nodes = self.ConfigNodesManager.getHealthyNodesForConfig(config_name)
+            dest_node_ids = [cn.node_id for cn in config_nodes if cn.node_id != source_node_id]
+            
+            if not dest_node_ids and peers:
+                return False, "No healthy destination nodes available"
+            
+            dest_nodes = [self.NodesManager.getNodeById(nid) for nid in dest_node_ids]
+            dest_nodes = [n for n in dest_nodes if n and n.enabled]
+            
+            if not dest_nodes and peers:
+                return False, "No enabled destination nodes available"
+        
+        node_loads = self._get_node_peer_counts(config_name, [n.id for n in dest_nodes])
+        heap = [(node_loads.get(n.id, 0), n.id, n.max_peers or 0) for n in dest_nodes]
+        heapq.heapify(heap)
+        
+        assignments = {n.id: [] for n in dest_nodes}
+        unplaced = []
+        for peer in peers:
+            dest_node_id = self._select_destination_node(heap)
+            if dest_node_id is None:
+                unplaced.append(peer["id"])
+                continue
+            assignments[dest_node_id].append(peer["id"])
+        
+        return True, {
+            "config_name": config_name,
+            "source_node_id": source_node_id,
+            "assignments": {node_id: peer_ids for node_id, peer_ids in assignments.items() if peer_ids},
+            "unplaced": unplaced
+        }
+    
+    def resume_migration(self, migration_id: str, user: str = None) -> Tuple[bool, str, int]:
+        """
+        Continue a migration from its audit log entries
+        
+        Peers of successful batches are skipped, as are peers no longer on the source node.
+        
+        Returns:
+            Tuple of (success, message, number of peers migrated by this call)
+        """
+        progress = self.get_migration_progress(migration_id)
+        if progress is None:
+            return False, "Migration not found", 0
+        if progress["completed"] and progress["failed"] == 0:
+            return True, "Migration already completed", 0
+        
+        plan = progress["plan"]
+        still_on_source = {p["id"] for p in self._get_peers_for_node(plan["config_name"], plan["source_node_id"])}
+        done = set(progress["migrated_peers"])
+        plan["assignments"] = {
+            node_id: [pid for pid in peer_ids if pid not in done and pid in still_on_source]
+            for node_id, peer_ids in plan["assignments"].items()
+        }
+        remaining = sum(len(peer_ids) for peer_ids in plan["assignments"].values())
+        
+        _log_info(f"Resuming migration {migration_id} with {remaining} peers left")
+        migrated_count = self._execute_plan(migration_id, plan, user)
+        if migrated_count == remaining:
+            return True, f"Successfully migrated {migrated_count} peers", migrated_count
+        return False, f"Migrated {migrated_count}/{remaining} peers", migrated_count
+    
+    def get_migration_progress(self, migration_id: str) -> Optional[dict]:
+        """
+        Summarize a migration from its audit log entries
+        
+        Returns:
+            Dict with the plan, total, migrated and failed counts, or None if unknown
+        """
+        if self.AuditLogManager is None:
+            return None
+        entries, cursor = [], None
+        while True:
+            page, cursor = self.AuditLogManager.get_logs(entity_type=self.AUDIT_ENTITY, entity_id=migration_id,
+                                                         limit=MAX_PAGE_SIZE, cursor=cursor)
+            entries.extend(page)
+            if cursor is None:
+                break
+        plan = None
+        migrated, failed = set(), set()
+        completed = False
+        # Entries come newest first
+        for entry in reversed(entries):
+            details = json.loads(entry.details or "{}")
+            if entry.action == "peer_migration_planned":
+                plan = details
+            elif entry.action == "peer_migration_batch":
+                if details.get("success"):
+                    migrated.update(details.get("peers", []))
+                    failed.difference_update(details.get("peers", []))
+                else:
+                    failed.update(details.get("peers", []))
+            elif entry.action == "peer_migration_completed":
+                completed = True
+        if plan is None:
+            return None
+        
+        total = sum(len(peer_ids) for peer_ids in plan["assignments"].values())
+        return {
+            "migration_id": migration_id,
+            "plan": plan,
+            "total": total,
+            "migrated": len(migrated),
+            "failed": len(failed - migrated),
+            "unplaced": len(plan.get("unplaced", [])),
+            "completed": completed,
+            "migrated_peers": sorted(migrated)
+        }
+    
+    def _execute_plan(self, migration_id: str, plan: dict, user: str = None) -> int:
+        """Run a plan batch by batch, destinations in parallel; returns the number of peers migrated"""
+        config_name = plan["config_name"]
+        source_node_id = plan["source_node_id"]
+        assignments = {node_id: peer_ids for node_id, peer_ids in plan["assignments"].items() if peer_ids}
+        
+        migrated_count = 0
+        if assignments:
+            peers = {p["id"]: p for p in self._get_peers_for_node(config_name, source_node_id)}
+            
+            def migrate_to(dest_node_id, peer_ids):
+                count = 0
+                for i in range(0, len(peer_ids), self.batch_size):
+                    batch = [peers[pid] for pid in peer_ids[i:i + self.batch_size] if pid in peers]
+                    if not batch:
+                        continue
+                    success, error = self._migrate_batch(config_name, batch, source_node_id, dest_node_id)
+                    self._audit("peer_migration_batch", migration_id, {
+                        "destination_node_id": dest_node_id,
+                        "peers": [p["id"] for p in batch],
+                        "success": success,
+                        "error": error
+                    }, user)
+                    if success:
+                        count += len(batch)
+                        _log_info(f"Migrated {len(batch)} peers from {source_node_id} to {dest_node_id}")
+                    else:
+                        _log_error(f"Failed to migrate {len(batch)} peers to {dest_node_id}: {error}")
+                return count
+            
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(assignments))) as executor:
+                futures = [executor.submit(migrate_to, node_id, peer_ids) for node_id, peer_ids in assignments.items()]
+                for future in as_completed(futures):
+                    migrated_count += future.result()
+        
+        self._audit("peer_migration_completed", migration_id, {
+            "config_name": config_name,
+            "source_node_id": source_node_id,
+            "migrated": migrated_count
+        }, user)
+        return migrated_count
+    
+    def _audit(self, action: str, migration_id: str, details: dict, user: str = None):
+        if self.AuditLogManager is not None:
+            self.AuditLogManager.log(action, self.AUDIT_ENTITY, migration_id, json.dumps(details), user)
+    
+    def _get_peer_table(self, config_name: str) -> Optional[db.Table]:
+        """Peer table of a configuration, reflected at most once when it is not loaded"""
+        configuration = self.WireguardConfigurations.get(config_name)
+        if configuration is not None:
+            return configuration.peersTable
+        table = self.__peerTables.get(config_name)
+        if table is None:
+            if not db.inspect(self.engine).has_table(config_name):
+                return None
+            table = db.Table(config_name, self.dbMetadata, autoload_with=self.engine)
+            self.__peerTables[config_name] = table
+        return table
+    
     def _get_peers_for_node(self, config_name: str, node_id: str) -> List[dict]:
         """
         Get all peers assigned to a specific node for a config
@@ -145,21 +328,14 @@ class PeerMigrationManager:
             List of peer dictionaries
         """
         try:
-            # Access the peer table
-            # The peer table name is based on the config name
-            peer_table_name = f"{config_name}"
+            peer_table = self._get_peer_table(config_name)
+            if peer_table is None:
+                return []
             
             with self.engine.connect() as conn:
-                # Check if table exists
-                if not db.inspect(self.engine).has_table(peer_table_name):
-                    return []
-                
-                # Reflect the peer table
-                peer_table = db.Table(peer_table_name, self.dbMetadata, autoload_with=self.engine)
-                
                 # Query peers for this node
                 result = conn.execute(
-                    peer_table.select().where(peer_table.c.node_id == node_id)
+                    peer_table.select().where(peer_table.c.node_id == node_id).order_by(peer_table.c.id)
                 ).mappings().fetchall()
                 
                 return [dict(row) for row in result]
@@ -168,93 +344,129 @@ class PeerMigrationManager:
             _log_error(f"Error getting peers for node: {e}")
             return []
     
-    def _select_destination_node(self, dest_nodes: List, config_name: str):
+    def _get_node_peer_counts(self, config_name: str, node_ids: List[str]) -> Dict[str, int]:
+        """Peer count of each node for a config, in one grouped query"""
+        peer_table = self._get_peer_table(config_name)
+        if peer_table is None or not node_ids:
+            return {}
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                db.select(peer_table.c.node_id, db.func.count().label('peer_count'))
+                .where(peer_table.c.node_id.in_(node_ids))
+                .group_by(peer_table.c.node_id)
+            ).fetchall()
+        return {row.node_id: row.peer_count for row in rows}
+    
+    @staticmethod
+    def _select_destination_node(node_loads: list) -> Optional[str]:
         """
-        Select the best destination node based on load
+        Take the least-loaded destination from a heap of (peer_count, node_id, max_peers)
+        and count the peer against it
         
-        Args:
-            dest_nodes: List of available destination nodes
-            config_name: Configuration name
-            
         Returns:
-            Selected node or None
+            Selected node ID, or None when every destination is at capacity
         """
-        if not dest_nodes:
-            return None
-        
-        # Simple selection: choose node with fewest peers for this config
-        node_loads = []
-        for node in dest_nodes:
-            peer_count = len(self._get_peers_for_node(config_name, node.id))
-            node_loads.append((node, peer_count))
-        
-        # Sort by peer count (ascending)
-        node_loads.sort(key=lambda x: x[1])
+        while node_loads:
+            peer_count, node_id, max_peers = node_loads[0]
+            if max_peers and peer_count >= max_peers:
+                # Full nodes stay full for the rest of the plan
+                heapq.heappop(node_loads)
+                continue
+            heapq.heapreplace(node_loads, (peer_count + 1, node_id, max_peers))
+            return node_id
+        return None
+    
+    @staticmethod
+    def _agent_peer_data(peer: dict) -> dict:
+        """Peer row as the agent's peer payload"""
+        peer_data = {
+            "public_key": peer["id"],
+            "allowed_ips": [ip.strip() for ip in (peer.get("allowed_ip") or "").split(",") if ip.strip()],
+            "persistent_keepalive": int(peer.get("keepalive") or 0)
+        }
+        if peer.get("preshared_key"):
+            peer_data["preshared_key"] = peer["preshared_key"]
+        return peer_data
+    
+    def _assign_destination_interfaces(self, dest_node, peers: List[dict]) -> Optional[Dict[str, List[dict]]]:
+        """
+        Choose the destination interface of each peer the way a new peer's is chosen:
+        the enabled interface with the most remaining IP pool capacity, falling back
+        to the node's legacy wg_interface when it has no interfaces
         
-        return node_loads[0][0]
+        Returns:
+            Peers grouped by destination interface, or None when every pool is exhausted
+        """
+        interfaces = []
+        if self.NodeInterfacesManager is not None and self.NodeSelector is not None:
+            interfaces = self.NodeInterfacesManager.getEnabledInterfacesByNodeId(dest_node.id)
+        if not interfaces:
+            return {dest_node.wg_interface: peers}
+        by_iface: Dict[str, List[dict]] = {}
+        for peer in peers:
+            interface = self.NodeSelector.selectInterface(dest_node, interfaces)
+            if interface is None:
+                return None
+            by_iface.setdefault(interface.interface_name, []).append(peer)
+        return by_iface
     
-    def _migrate_single_peer(self, config_name: str, peer: dict, 
-                            source_node_id: str, dest_node_id: str) -> bool:
+    def _migrate_batch(self, config_name: str, peers: List[dict],
+                       source_node_id: str, dest_node_id: str) -> Tuple[bool, Optional[str]]:
         """
-        Migrate a single peer from source to destination node
+        Move a batch of peers with one agent request per interface
+        
+        The destination receives the peers of each of its interfaces as one reconcile
+        request, the peer rows are repointed with one UPDATE per interface, then the
+        source drops the batch with one request per interface.
         
-        Args:
-            config_name: Configuration name
-            peer: Peer data dictionary
-            source_node_id: Source node ID
-            dest_node_id: Destination node ID
-            
         Returns:
-            True if successful, False otherwise
+            Tuple of (success, error message)
         """
         try:
-            # Get source and destination nodes
-            source_node = self.NodesManager.getNodeById(source_node_id)
             dest_node = self.NodesManager.getNodeById(dest_node_id)
+            if not dest_node:
+                return False, "Destination node not found"
+            dest_agent = self.NodesManager.getNodeAgentClient(dest_node_id)
+            by_dest_iface = self._assign_destination_interfaces(dest_node, peers)
+            if by_dest_iface is None:
+                return False, f"No interface on destination node {dest_node_id} has available IPs"
             
-            if not source_node or not dest_node:
-                return False
-            
-            # Add peer to destination node via agent API
-            from .NodeAgent import AgentClient
-            dest_agent = AgentClient(dest_node.agent_url, dest_node.secret_encrypted)
-            
-            # Prepare peer data for agent
-            peer_data = {
-                "public_key": peer.get("publicKey"),
-                "allowed_ips": peer.get("allowed_ip", "").split(",") if peer.get("allowed_ip") else [],
-                "preshared_key": peer.get("preshared_key"),
-                "persistent_keepalive": peer.get("keepalive", 0)
-            }
-            
-            # Add peer to destination
-            success_add, _ = dest_agent.add_peer(dest_node.wg_interface, peer_data)
-            
-            if not success_add:
-                _log_error(f"Failed to add peer to destination node {dest_node_id}")
-                return False
+            # Add peers to destination
+            for iface, iface_peers in by_dest_iface.items():
+                success_add, result = dest_agent.reconcile_peers(
+                    iface, [self._agent_peer_data(peer) for peer in iface_peers]
+                )
+                if not success_add:
+                    return False, f"Failed to add peers to destination node {dest_node_id}: {result}"
             
             # Update peer node_id in database
-            peer_table_name = f"{config_name}"
-            peer_table = db.Table(peer_table_name, self.dbMetadata, autoload_with=self.engine)
-            
+            peer_table = self._get_peer_table(config_name)
             with self.engine.begin() as conn:
-                conn.execute(
-                    peer_table.update().where(
-                        peer_table.c.id == peer["id"]
-                    ).values(node_id=dest_node_id)
-                )
+                for iface, iface_peers in by_dest_iface.items():
+                    values = {"node_id": dest_node_id}
+                    if "iface" in peer_table.c:
+                        values["iface"] = iface
+                    conn.execute(
+                        peer_table.update().where(
+                            peer_table.c.id.in_([peer["id"] for peer in iface_peers])
+                        ).values(**values)
+                    )
             
-            # Remove peer from source node via agent API
-            source_agent = AgentClient(source_node.agent_url, source_node.secret_encrypted)
-            success_del, _ = source_agent.delete_peer(source_node.wg_interface, peer.get("publicKey"))
-            
-            if not success_del:
-                _log_error(f"Failed to delete peer from source node {source_node_id}")
-                # Note: Peer is already on destination and DB is updated, so this is not critical
+            # Remove peers from source node, grouped by the interface they were on
+            source_node = self.NodesManager.getNodeById(source_node_id)
+            source_agent = self.NodesManager.getNodeAgentClient(source_node_id)
+            if source_node and source_agent:
+                by_iface: Dict[str, List[str]] = {}
+                for peer in peers:
+                    by_iface.setdefault(peer.get("iface") or source_node.wg_interface, []).append(peer["id"])
+                for iface, public_keys in by_iface.items():
+                    success_del, _ = source_agent.reconcile_peers(iface, [], remove=public_keys)
+                    if not success_del:
+                        # Peers are already on destination and DB is updated, so this is not critical
+                        _log_error(f"Failed to delete {len(public_keys)} peers from source node {source_node_id}")
             
-            return True
+            return True, None
         
         except Exception as e:
-            _log_error(f"Error migrating single peer: {e}")
-            return False
+            _log_error(f"Error migrating peer batch: {e}")
+            return False, str(e)
@@ -0,0 +1,134 @@
+"""
+Peer Sessions
+Online and offline transitions of the peers, stored as sessions in <config>_sessions
+"""
+import threading
+from datetime import datetime, timedelta
+
+import sqlalchemy as db
+
+
+class PeerSessions:
+    """
+    Keeps one row per connection of a peer. A peer is online while its latest
+    handshake is fresher than THRESHOLD, the rule that also sets its status. The
+    poller reports every peer's handshake each cycle, and a row is only written
+    when a peer crosses the threshold: it is opened with the handshake that brought
+    the peer online and the peer's counters at that moment, and closed with the
+    last handshake and the traffic since. Open sessions are kept in memory, so a
+    cycle without transitions costs no query.
+
+    A session still open when the dashboard stops is resumed on the next start if
+    the peer is online again by then.
+    """
+    THRESHOLD = timedelta(minutes=3)
+
+    def __init__(self, engine: db.Engine, metadata: db.MetaData, dbName: str, DashboardConfig):
+        self.engine = engine
+        timeType = db.DATETIME if DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else db.TIMESTAMP
+        self.table = db.Table(
+            f'{dbName}_sessions', metadata,
+            db.Column('session_id', db.Integer, primary_key=True, autoincrement=True),
+            db.Column('id', db.String(255), nullable=False),
+            db.Column('start_time', timeType, nullable=False),
+            db.Column('end_time', timeType),
+            db.Column('start_receive', db.Float),
+            db.Column('start_sent', db.Float),
+            db.Column('total_receive', db.Float),
+            db.Column('total_sent', db.Float),
+            db.Column('total_data', db.Float),
+            db.Index(f'ix_{dbName}_sessions_id_start_time', 'id', 'start_time'),
+            extend_existing=True
+        )
+        self.__open: dict[str, dict] | None = None
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def tableName(dbName: str) -> str:
+        return f'{dbName}_sessions'
+
+    def __load(self) -> dict[str, dict]:
+        if self.__open is None:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    db.select(
+                        self.table.c.session_id, self.table.c.id, self.table.c.start_time,
+                        self.table.c.start_receive, self.table.c.start_sent
+                    ).where(self.table.c.end_time.is_(None))
+                ).mappings().fetchall()
+            self.__open = {row["id"]: dict(row, handshake=None) for row in rows}
+        return self.__open
+
+    def track(self, peers: list[dict], now: datetime = None) -> dict[str, list[str]]:
+        """
+        Open or close sessions for the peers whose handshake crossed the threshold
+        since the previous call. Each peer is a dict with its id, handshake, the
+        time of its latest handshake or None, and receive and sent, its cumulative
+        counters in GB. Open sessions of peers that are no longer listed are closed.
+
+        Returns:
+            IDs of the peers that came online and of those that went offline
+        """
+        now = now or datetime.now()
+        transitions = {"online": [], "offline": []}
+        with self.__lock:
+            sessions = self.__load()
+            listed = set()
+            with self.engine.begin() as conn:
+                for peer in peers:
+                    listed.add(peer["id"])
+                    handshake = peer["handshake"]
+                    online = handshake is not None and now - handshake < self.THRESHOLD
+                    session = sessions.get(peer["id"])
+                    if session is None and online:
+                        session = {
+                            "id": peer["id"],
+                            "start_time": handshake,
+                            "start_receive": peer["receive"],
+                            "start_sent": peer["sent"]
+                        }
+                        session["session_id"] = conn.execute(
+                            self.table.insert().values(session)
+                        ).inserted_primary_key[0]
+                        sessions[peer["id"]] = session
+                        transitions["online"].append(peer["id"])
+                    elif session is not None and not online:
+                        self.__close(conn, sessions.pop(peer["id"]), handshake, peer["receive"], peer["sent"])
+                        transitions["offline"].append(peer["id"])
+                    if peer["id"] in sessions:
+                        sessions[peer["id"]]["handshake"] = handshake
+                for peerId in [p for p in sessions if p not in listed]:
+                    session = sessions.pop(peerId)
+                    self.__close(conn, session, session.get("handshake"), None, None)
+                    transitions["offline"].append(peerId)
+        return transitions
+
+    def __close(self, conn: db.Connection, session: dict, handshake: datetime | None,
+                receive: float | None, sent: float | None):
+        values = {"end_time": max(handshake or session["start_time"], session["start_time"])}
+        if receive is not None and sent is not None \
+                and session["start_receive"] is not None and session["start_sent"] is not None:
+            values["total_receive"] = max(receive - session["start_receive"], 0)
+            values["total_sent"] = max(sent - session["start_sent"], 0)
+            values["total_data"] = values["total_receive"] + values["total_sent"]
+        conn.execute(self.table.update().where(self.table.c.session_id == session["session_id"]).values(values))
+
+    def clear(self, conn: db.Connection):
+        with self.__lock:
+            conn.execute(self.table.delete())
+            self.__open = {}
+
+    def getSessions(self, peerId: str, startDate: datetime, endDate: datetime) -> list[dict]:
+        """Sessions of a peer overlapping startDate to endDate, oldest first. An open session has no end_time"""
+        with self.engine.connect() as conn:
+            result = conn.execute(
+                db.select(
+                    self.table.c.start_time, self.table.c.end_time, self.table.c.start_receive,
+                    self.table.c.start_sent, self.table.c.total_receive, self.table.c.total_sent,
+                    self.table.c.total_data
+                ).where(
+                    db.and_(self.table.c.id == peerId, self.table.c.start_time <= endDate,
+                            db.or_(self.table.c.end_time.is_(None), self.table.c.end_time >= startDate))
+                ).order_by(self.table.c.start_time)
+            ).mappings().fetchall()
+        return [dict(row) for row in result]
@@ -0,0 +1,476 @@
+"""
+Peer Traffic Rollups
+Aggregates the raw <config>_transfer samples into 1-minute, 1-hour and 1-day tiers
+"""
+import itertools
+import math
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator
+
+import sqlalchemy as db
+
+from .BulkWrites import BulkInsert, BulkUpsert
+from .TimePartitions import TimePartitionedTable
+
+TrafficFields = ("total_receive", "total_sent", "total_data", "cumu_receive", "cumu_sent", "cumu_data")
+
+
+def BucketStart(t: datetime, seconds: int) -> datetime:
+    if seconds >= 86400:
+        return t.replace(hour=0, minute=0, second=0, microsecond=0)
+    if seconds >= 3600:
+        return t.replace(minute=0, second=0, microsecond=0)
+    return t.replace(second=0, microsecond=0)
+
+
+def _max(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def _min(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+def AggregateTraffics(rows: Iterable, seconds: int) -> Iterator[dict]:
+    """
+    Fold time ordered samples into buckets of the given size, keeping per peer the
+    highest counters of the bucket and the number of raw samples behind them
+    """
+    bucket, current = None, {}
+    for row in rows:
+        start = BucketStart(row["time"], seconds)
+        if start != bucket:
+            yield from current.values()
+            bucket, current = start, {}
+        aggregate = current.get(row["id"])
+        if aggregate is None:
+            current[row["id"]] = {
+                "id": row["id"],
+                **{field: row[field] for field in TrafficFields},
+                "samples": row.get("samples", 1),
+                "time": start
+            }
+        else:
+            for field in TrafficFields:
+                aggregate[field] = _max(aggregate[field], row[field])
+            aggregate["samples"] += row.get("samples", 1)
+    yield from current.values()
+
+
+def TimeBucket(dialect: str, column: db.ColumnElement, seconds: int) -> db.ColumnElement:
+    """
+    SQL expression flooring a time column to buckets of the given size since the
+    epoch. Constants are inlined so the expression can be repeated in GROUP BY.
+    """
+    size = db.literal_column(str(int(seconds)), db.Integer)
+    if dialect == 'postgresql':
+        return db.func.timezone(db.literal_column("'UTC'"), db.func.to_timestamp(
+            db.func.floor(db.extract('epoch', column) / size) * size
+        ))
+    if dialect == 'mysql':
+        return db.func.from_unixtime(db.func.floor(db.func.unix_timestamp(column) / size) * size)
+    return db.func.datetime(
+        db.cast(db.func.strftime(db.literal_column("'%s'"), column), db.Integer) // size * size,
+        db.literal_column("'unixepoch'")
+    )
+
+
+def DownsampleTraffics(rows: list[dict], maxPoints: int, field: str = "delta_data") -> list[dict]:
+    """
+    Reduce time ordered rows to at most maxPoints with Largest-Triangle-Three-Buckets,
+    which keeps the first and last rows and from every bucket in between the row
+    forming the largest triangle with its neighbours, so peaks survive.
+    """
+    if len(rows) <= maxPoints:
+        return rows
+    if maxPoints < 3:
+        return [rows[0], rows[-1]][:maxPoints]
+    x = [row["time"].timestamp() for row in rows]
+    y = [row[field] or 0 for row in rows]
+    size = (len(rows) - 2) / (maxPoints - 2)
+    sampled = [rows[0]]
+    a = 0
+    for i in range(maxPoints - 2):
+        start, end = int(i * size) + 1, int((i + 1) * size) + 1
+        nextStart, nextEnd = end, min(int((i + 2) * size) + 1, len(rows))
+        avgX = sum(x[nextStart:nextEnd]) / (nextEnd - nextStart)
+        avgY = sum(y[nextStart:nextEnd]) / (nextEnd - nextStart)
+        a = max(range(start, end), key=lambda j: abs(
+            (x[a] - avgX) * (y[j] - y[a]) - (x[a] - x[j]) * (avgY - y[a])
+        ))
+        sampled.append(rows[a])
+    sampled.append(rows[-1])
+    return sampled
+
+
+class PeerTrafficRollups:
+    """
+    Keeps <config>_transfer_1m, _1h and _1d next to the raw transfer table. Each tier
+    is built from the next finer one and only closed buckets are stored, so a pass
+    resumes from the latest stored bucket and can be repeated safely. The bucket
+    that is still open is aggregated from the finer tiers when it is queried.
+
+    A pass reads at most PASS_SOURCE_BUCKETS finer buckets per tier, counting raw
+    samples as minutes, so a long backlog such as the raw history of an upgraded
+    install is caught up over several passes.
+
+    Samples inserted behind the stored buckets, e.g. a node's outage backfill, are
+    marked with markBackfilled. <config>_transfer_rollup_pending then holds per tier
+    the time from which its stored buckets must be aggregated again; the passes
+    re-aggregate them, finest tier first, and prune keeps their source rows.
+    """
+    TIERS = (("1m", 60), ("1h", 3600), ("1d", 86400))
+    RETENTION_DAYS = {"raw": 2, "1m": 14, "1h": 180, "1d": 0, "history_endpoint": 0}
+    RETENTION_KEYS = {"raw": "raw_retention_days", "1m": "minute_retention_days",
+                      "1h": "hour_retention_days", "1d": "day_retention_days",
+                      "history_endpoint": "history_endpoint_retention_days"}
+    TRAFFIC_POINTS = 720
+    BATCH_SIZE = 5000
+    PASS_SOURCE_BUCKETS = 360
+
+    def __init__(self, engine: db.Engine, metadata: db.MetaData, dbName: str,
+                 transferPartitions: TimePartitionedTable, DashboardConfig):
+        self.engine = engine
+        self.transferPartitions = transferPartitions
+        self.transferTable = transferPartitions.table
+        self.DashboardConfig = DashboardConfig
+        timeType = db.DATETIME if DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else db.TIMESTAMP
+        self.tables: dict[str, db.Table] = {}
+        for name, _ in self.TIERS:
+            self.tables[name] = db.Table(
+                f'{dbName}_transfer_{name}', metadata,
+                db.Column('id', db.String(255), nullable=False, primary_key=True),
+                db.Column('time', timeType, nullable=False, primary_key=True),
+                *[db.Column(field, db.Float) for field in TrafficFields],
+                db.Column('samples', db.Integer, nullable=False, default=0),
+                db.Index(f'ix_{dbName}_transfer_{name}_time', 'time'),
+                extend_existing=True
+            )
+        self.pendingTable = db.Table(
+            f'{dbName}_transfer_rollup_pending', metadata,
+            db.Column('tier', db.String(16), nullable=False, primary_key=True),
+            db.Column('time', timeType, nullable=False),
+            extend_existing=True
+        )
+
+    @staticmethod
+    def tableNames(dbName: str) -> list[str]:
+        return [*[f'{dbName}_transfer_{name}' for name, _ in PeerTrafficRollups.TIERS],
+                f'{dbName}_transfer_rollup_pending']
+
+    def retentionDays(self) -> dict[str, int]:
+        """Days each tier and the endpoint history are kept, 0 keeps them forever"""
+        retention = {}
+        for name, default in self.RETENTION_DAYS.items():
+            exist, value = self.DashboardConfig.GetConfig("TrafficRollups", self.RETENTION_KEYS[name])
+            try:
+                days = int(value) if exist else default
+            except (TypeError, ValueError):
+                days = default
+            retention[name] = days if days >= 0 else default
+        return retention
+
+    def markBackfilled(self, conn: db.Connection, since: datetime):
+        """Have the next passes aggregate every tier again from since, after raw samples were inserted there"""
+        self.__markPending(conn, self.TIERS[0][0], since)
+
+    def __markPending(self, conn: db.Connection, tier: str, since: datetime):
+        BulkUpsert(conn, self.pendingTable, [{"tier": tier, "time": since}], ["tier"], lambda table, proposed: {
+            "time": db.case((table.c.time < proposed.time, table.c.time), else_=proposed.time)
+        })
+
+    def __pending(self, conn: db.Connection) -> dict[str, datetime]:
+        return {row.tier: row.time for row in conn.execute(db.select(self.pendingTable))}
+
+    def __sourceRows(self, conn: db.Connection, source: db.Table | None, since: datetime | None, until: datetime):
+        """Rows of the finer tier, or raw samples when source is None, from since until until in time order"""
+        if source is None:
+            raw = self.transferPartitions.source(since, until)
+            query = db.select(
+                raw.c.id, raw.c.time, *[raw.c[field] for field in TrafficFields], db.literal(1).label("samples")
+            ).where(raw.c.time < until)
+        else:
+            query = db.select(source).where(source.c.time < until)
+        time = query.selected_columns.time
+        if since is not None:
+            query = query.where(time >= since)
+        return conn.execute(query.order_by(time).execution_options(stream_results=True))
+
+    def __store(self, conn: db.Connection, table: db.Table, aggregates: Iterable[dict], replace: bool = False) -> int:
+        stored, batch = 0, []
+        write = (lambda rows: BulkUpsert(conn, table, rows, ["id", "time"], lambda target, proposed: {
+            field: proposed[field] for field in (*TrafficFields, "samples")
+        })) if replace else (lambda rows: BulkInsert(conn, table, rows))
+        for aggregate in aggregates:
+            batch.append(aggregate)
+            if len(batch) >= self.BATCH_SIZE:
+                stored += write(batch)
+                batch = []
+        return stored + (write(batch) if batch else 0)
+
+    def rollup(self, now: datetime = None) -> dict[str, int]:
+        """
+        Store the closed buckets not rolled up yet, raw samples into 1m, 1m into 1h
+        and 1h into 1d, up to PASS_SOURCE_BUCKETS finer buckets per tier from the
+        first row not rolled up. A tier only closes buckets the finer tier covered
+        in this pass.
+
+        Before that, stored buckets marked as pending are aggregated again from the
+        finer tier and replaced, a window of the same size per pass. A tier waits
+        until the finer one has none pending, and each replaced window is marked
+        pending for the next tier.
+
+        Returns:
+            Number of rows stored per tier, replaced rows included
+        """
+        now = now or datetime.now()
+        source, sourceSeconds, covered = None, 60, now
+        stored = {}
+        with self.engine.begin() as conn:
+            pending = self.__pending(conn)
+            sourcePending = False
+            for i, (name, seconds) in enumerate(self.TIERS):
+                table = self.tables[name]
+                span = timedelta(seconds=max(seconds, self.PASS_SOURCE_BUCKETS * sourceSeconds))
+                latest = conn.execute(db.select(db.func.max(table.c.time))).scalar()
+                since = latest + timedelta(seconds=seconds) if latest is not None else None
+                stored[name] = 0
+
+                if name in pending and not sourcePending:
+                    marked = pending[name]
+                    start = BucketStart(marked, seconds)
+                    stop = min(since, start + span) if since is not None else start
+                    if start < stop:
+                        result = self.__sourceRows(conn, source, start, stop)
+                        replaced = self.__store(conn, table, AggregateTraffics(result.mappings(), seconds), True)
+                        result.close()
+                        stored[name] += replaced
+                        if replaced and i + 1 < len(self.TIERS):
+                            self.__markPending(conn, self.TIERS[i + 1][0], start)
+                    # Only move the mark that was read, a backfill may have moved it back since
+                    mark = self.pendingTable.c.tier == name
+                    if start < stop < since:
+                        conn.execute(self.pendingTable.update().where(mark, self.pendingTable.c.time == marked)
+                                     .values(time=stop))
+                    else:
+                        conn.execute(self.pendingTable.delete().where(mark, self.pendingTable.c.time == marked))
+                pending = self.__pending(conn)
+                sourcePending = name in pending
+
+                until = BucketStart(covered, seconds)
+                result = self.__sourceRows(conn, source, since, until)
+                rows = result.mappings()
+                first = next(rows, None)
+                if first is not None:
+                    # The window starts at the first row, so gaps in the history are skipped
+                    until = min(until, BucketStart(first["time"], seconds) + span)
+                    rows = itertools.takewhile(lambda row: row["time"] < until, itertools.chain([first], rows))
+                    stored[name] += self.__store(conn, table, AggregateTraffics(rows, seconds))
+                result.close()
+                source, sourceSeconds, covered = table, seconds, until
+        return stored
+
+    def prune(self, now: datetime = None) -> dict[str, int]:
+        """
+        Delete rows older than each tier's retention. Rows the next tier has not
+        rolled up yet, or has to aggregate again, are kept whatever their age.
+
+        Returns:
+            Number of rows deleted per tier
+        """
+        now = now or datetime.now()
+        retention = self.retentionDays()
+        levels = [("raw", self.transferTable, 0)] + [(name, self.tables[name], seconds) for name, seconds in self.TIERS]
+        deleted = {}
+        with self.engine.begin() as conn:
+            pending = self.__pending(conn)
+            for i, (name, table, _) in enumerate(levels):
+                if retention[name] == 0:
+                    continue
+                cutoff = now - timedelta(days=retention[name])
+                if i + 1 < len(levels):
+                    coarserName, coarser, coarserSeconds = levels[i + 1]
+                    latest = conn.execute(db.select(db.func.max(coarser.c.time))).scalar()
+                    if latest is None:
+                        continue
+                    cutoff = min(cutoff, latest + timedelta(seconds=coarserSeconds))
+                    if coarserName in pending:
+                        cutoff = min(cutoff, BucketStart(pending[coarserName], coarserSeconds))
+                if i == 0:
+                    # Raw samples expire a whole partition at a time when partitioned
+                    deleted[name] = self.transferPartitions.dropBefore(conn, cutoff)
+                else:
+                    deleted[name] = conn.execute(table.delete().where(table.c.time < cutoff)).rowcount
+        return deleted
+
+    def clear(self, conn: db.Connection):
+        for table in self.tables.values():
+            conn.execute(table.delete())
+        conn.execute(self.pendingTable.delete())
+
+    def selectTier(self, startDate: datetime, resolution: float, now: datetime = None) -> int:
+        """
+        Pick the coarsest level, 0 being the raw table, whose bucket is not wider than
+        the resolution and whose retention still covers startDate. If none is fine
+        enough, the finest level that covers the range is used.
+        """
+        now = now or datetime.now()
+        retention = self.retentionDays()
+        levels = [("raw", 0)] + list(self.TIERS)
+        covering = [i for i, (name, _) in enumerate(levels)
+                    if retention[name] == 0 or startDate >= now - timedelta(days=retention[name])]
+        if not covering:
+            return len(levels) - 1
+        fine = [i for i in covering if levels[i][1] <= resolution]
+        return fine[-1] if fine else covering[0]
+
+    def getTraffics(self, peerId: str, startDate: datetime, endDate: datetime,
+                    resolution: float = None, now: datetime = None) -> list[dict]:
+        """
+        Traffic samples of a peer between startDate and endDate, read from the tier
+        chosen by selectTier. Without a resolution, one is chosen so the range fits in
+        about TRAFFIC_POINTS samples.
+        """
+        if resolution is None:
+            resolution = (endDate - startDate).total_seconds() / self.TRAFFIC_POINTS
+        return self.__traffics(self.selectTier(startDate, resolution, now), peerId, startDate, endDate)
+
+    def getBucketedTraffics(self, peerId: str, startDate: datetime, endDate: datetime, bucket: int,
+                            now: datetime = None) -> list[dict]:
+        """
+        Traffic of a peer between startDate and endDate grouped in SQL into buckets
+        of the given seconds, read from the coarsest tier not wider than the bucket.
+        Each row holds the highest counters of its bucket like the rows of
+        getTraffics, and delta_receive, delta_sent and delta_data, the traffic of
+        the bucket as the sum of the deltas between its samples.
+        """
+        return self.getPeersBucketedTraffics([peerId], startDate, endDate, bucket, now).get(peerId, [])
+
+    def getPeersBucketedTraffics(self, peerIds: list[str] | None, startDate: datetime, endDate: datetime,
+                                 bucket: int = None, now: datetime = None) -> dict[str, list[dict]]:
+        """
+        Bucketed traffic like getBucketedTraffics for several peers, or every peer
+        of the configuration when peerIds is None, with one grouped query per tier
+        read. Without a bucket, one is chosen so the range fits in about
+        TRAFFIC_POINTS buckets.
+
+        Returns:
+            Rows of every peer with traffic in the range, by peer ID
+        """
+        if bucket is None:
+            bucket = max(60, math.ceil((endDate - startDate).total_seconds() / self.TRAFFIC_POINTS))
+        buckets = self.__buckets(self.selectTier(startDate, bucket, now), peerIds, startDate, endDate, bucket)
+        traffics: dict[str, list[dict]] = {}
+        previous: dict[tuple[str, str], float] = {}
+        for peerId, time in sorted(buckets):
+            row = buckets[(peerId, time)]
+            for direction in ("receive", "sent"):
+                lowest, highest = row.pop(f"lowest_{direction}") or 0, row.pop(f"highest_{direction}") or 0
+                # The first bucket only has the deltas between its own samples
+                row[f"delta_{direction}"] = max(highest - previous.get((peerId, direction), lowest), 0)
+                previous[(peerId, direction)] = highest
+            row["delta_data"] = row["delta_receive"] + row["delta_sent"]
+            traffics.setdefault(peerId, []).append(row)
+        return traffics
+
+    def __buckets(self, level: int, peerIds: list[str] | None, startDate: datetime, endDate: datetime,
+                  bucket: int) -> dict[tuple[str, datetime], dict]:
+        if level == 0:
+            table = self.transferPartitions.source(startDate, endDate)
+            samples = db.func.count()
+            lower, tailStart = startDate, None
+        else:
+            name, seconds = self.TIERS[level - 1]
+            table = self.tables[name]
+            samples = db.func.sum(table.c.samples)
+            lower = BucketStart(startDate, seconds)
+            # Rollups store the closed buckets of every peer at once, the tail starts after the latest
+            with self.engine.connect() as conn:
+                latest = conn.execute(
+                    db.select(db.func.max(table.c.time)).where(
+                        db.and_(table.c.time >= lower, table.c.time <= endDate)
+                    )
+                ).scalar()
+            tailStart = latest + timedelta(seconds=seconds) if latest is not None else lower
+        time = TimeBucket(self.engine.dialect.name, table.c.time, bucket)
+        receive = table.c.cumu_receive + table.c.total_receive
+        sent = table.c.cumu_sent + table.c.total_sent
+        query = db.select(
+            table.c.id,
+            db.type_coerce(time, self.transferTable.c.time.type).label("time"),
+            *[db.func.max(table.c[field]).label(field) for field in TrafficFields],
+            db.func.min(receive).label("lowest_receive"), db.func.max(receive).label("highest_receive"),
+            db.func.min(sent).label("lowest_sent"), db.func.max(sent).label("highest_sent"),
+            samples.label("samples")
+        ).where(
+            db.and_(table.c.time >= lower, table.c.time <= endDate)
+        )
+        if peerIds is not None:
+            query = query.where(table.c.id.in_(peerIds))
+        if tailStart is not None:
+            query = query.where(table.c.time < tailStart)
+        with self.engine.connect() as conn:
+            result = conn.execute(
+                query.group_by(table.c.id, time).order_by(table.c.id, time)
+            ).mappings().fetchall()
+        buckets = {}
+        for row in result:
+            row = dict(row)
+            buckets[(row.pop("id"), row["time"])] = row
+        # Buckets after the latest stored one are not closed yet, group them from the finer tiers
+        if tailStart is not None and tailStart <= endDate:
+            for key, row in self.__buckets(level - 1, peerIds, tailStart, endDate, bucket).items():
+                if key not in buckets:
+                    buckets[key] = row
+                    continue
+                merged = buckets[key]
+                for field in (*TrafficFields, "highest_receive", "highest_sent"):
+                    merged[field] = _max(merged[field], row[field])
+                for field in ("lowest_receive", "lowest_sent"):
+                    merged[field] = _min(merged[field], row[field])
+                merged["samples"] += row["samples"]
+        return buckets
+
+    def __traffics(self, level: int, peerId: str, startDate: datetime, endDate: datetime) -> list[dict]:
+        if level == 0:
+            table = self.transferPartitions.source(startDate, endDate)
+            with self.engine.connect() as conn:
+                result = conn.execute(
+                    db.select(
+                        table.c.cumu_data, table.c.total_data, table.c.cumu_receive,
+                        table.c.total_receive, table.c.cumu_sent, table.c.total_sent, table.c.time
+                    ).where(
+                        db.and_(table.c.id == peerId, table.c.time <= endDate, table.c.time >= startDate)
+                    ).order_by(table.c.time)
+                ).mappings().fetchall()
+            return [dict(row) for row in result]
+
+        name, seconds = self.TIERS[level - 1]
+        table = self.tables[name]
+        with self.engine.connect() as conn:
+            result = conn.execute(
+                db.select(
+                    table.c.cumu_data, table.c.total_data, table.c.cumu_receive, table.c.total_receive,
+                    table.c.cumu_sent, table.c.total_sent, table.c.samples, table.c.time
+                ).where(
+                    db.and_(table.c.id == peerId, table.c.time <= endDate,
+                            table.c.time >= BucketStart(startDate, seconds))
+                ).order_by(table.c.time)
+            ).mappings().fetchall()
+        rows = [dict(row) for row in result]
+        # Buckets after the latest stored one are not closed yet, fold them from the finer tiers
+        tailStart = rows[-1]["time"] + timedelta(seconds=seconds) if rows else BucketStart(startDate, seconds)
+        if tailStart <= endDate:
+            tail = [dict(row, id=peerId) for row in self.__traffics(level - 1, peerId, tailStart, endDate)]
+            for row in AggregateTraffics(tail, seconds):
+                del row["id"]
+                rows.append(row)
+        return rows
@@ -0,0 +1,239 @@
+"""
+Time Partitions
+Monthly partitions for the per-configuration time series tables
+"""
+import re
+import threading
+from datetime import datetime
+from typing import Callable
+
+import sqlalchemy as db
+
+from .BulkWrites import BulkInsert, BulkUpsert
+
+
+def MonthStart(t: datetime) -> datetime:
+    return t.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def NextMonth(t: datetime) -> datetime:
+    month = MonthStart(t)
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def PartitionNames(engine: db.Engine, tableName: str) -> list[str]:
+    """Names of the existing monthly partitions of a table, <table>_pYYYYMM"""
+    pattern = re.compile(rf"^{re.escape(tableName)}_p\d{{6}}$")
+    return sorted(n for n in db.inspect(engine).get_table_names() if pattern.match(n))
+
+
+def _isNativePartitioned(engine: db.Engine, tableName: str) -> bool:
+    with engine.connect() as conn:
+        return conn.execute(
+            db.text("SELECT relkind FROM pg_class WHERE relname = :name"), {"name": tableName}
+        ).scalar() == 'p'
+
+
+def PartitionedTableOptions(engine: db.Engine, tableName: str, enabled: bool) -> dict:
+    """
+    Table keyword arguments for a time series table. With partitioning enabled on
+    PostgreSQL, a table that does not exist yet is created with native range
+    partitioning on time. An existing plain table is left as it is and gets manual
+    partitions like on SQLite and MySQL.
+    """
+    if not enabled or engine.dialect.name != 'postgresql':
+        return {}
+    if db.inspect(engine).has_table(tableName) and not _isNativePartitioned(engine, tableName):
+        return {}
+    return {"postgresql_partition_by": "RANGE (time)"}
+
+
+class TimePartitionedTable:
+    """
+    Routes a time series table to monthly partitions named <table>_pYYYYMM.
+
+    On PostgreSQL with native partitioning the partitions are attached to the base
+    table, which is read and written directly. Otherwise every partition is a plain
+    table with the base table's columns and indexes. Writes go to the partition of
+    the row's month, and reads union the partitions overlapping the range with the
+    base table, which keeps the rows from before partitioning was enabled.
+    Partitions stay readable when partitioning is switched off again.
+
+    Retention drops whole months, so expiring one never rewrites the table. Rows in
+    the base table expire on expireColumn, which defaults to time.
+    """
+    UPSERT_BATCH = 500
+
+    def __init__(self, engine: db.Engine, metadata: db.MetaData, table: db.Table, enabled: bool = False,
+                 expireColumn: str = "time"):
+        self.engine = engine
+        self.metadata = metadata
+        self.table = table
+        self.enabled = enabled
+        self.expireColumn = expireColumn
+        self.native = False
+        self.__partitions: dict[datetime, db.Table] | None = None
+        self.__lock = threading.RLock()
+
+    def __load(self) -> dict[datetime, db.Table]:
+        with self.__lock:
+            if self.__partitions is None:
+                self.native = self.engine.dialect.name == 'postgresql' \
+                    and _isNativePartitioned(self.engine, self.table.name)
+                self.__partitions = {}
+                for name in PartitionNames(self.engine, self.table.name):
+                    month = datetime.strptime(name[-6:], "%Y%m")
+                    self.__partitions[month] = self.__define(name)
+            return self.__partitions
+
+    def __define(self, name: str) -> db.Table:
+        partition = db.Table(
+            name, self.metadata,
+            *[db.Column(c.name, c.type, nullable=c.nullable, primary_key=c.primary_key) for c in self.table.columns],
+            extend_existing=True
+        )
+        for index in self.table.indexes:
+            # Native partitions inherit the base table's indexes, except the unique ones
+            # that PostgreSQL only accepts on a parent when they include time
+            if not self.native or index.unique:
+                db.Index(index.name.replace(self.table.name, name, 1), *[partition.c[c.name] for c in index.columns],
+                         unique=index.unique)
+        return partition
+
+    def partitions(self) -> dict[datetime, db.Table]:
+        """Existing partitions by the first day of their month"""
+        return dict(self.__load())
+
+    def tables(self) -> list[db.Table]:
+        """Tables that hold rows: the base table, and the partitions unless they are native"""
+        partitions = self.__load()
+        return [self.table] + ([] if self.native else [partitions[m] for m in sorted(partitions)])
+
+    def tableFor(self, conn: db.Connection, t: datetime) -> db.Table:
+        """Partition of the month of t, created on first use"""
+        month = MonthStart(t)
+        partitions = self.__load()
+        with self.__lock:
+            if month not in partitions:
+                name = f'{self.table.name}_p{month.strftime("%Y%m")}'
+                partition = self.__define(name)
+                if self.native:
+                    conn.execute(db.text(
+                        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{self.table.name}" '
+                        f"FOR VALUES FROM ('{month}') TO ('{NextMonth(month)}')"
+                    ))
+                    for index in partition.indexes:
+                        index.create(conn, checkfirst=True)
+                else:
+                    partition.create(conn, checkfirst=True)
+                partitions[month] = partition
+            return partitions[month]
+
+    def __route(self, conn: db.Connection, rows: list[dict], throughBase: bool) -> list[tuple[db.Table, list[dict]]]:
+        """Group rows by the table they are written to, native partitions are written through the base table if asked"""
+        self.__load()
+        if not self.enabled and not self.native:
+            return [(self.table, rows)]
+        byMonth: dict[datetime, list[dict]] = {}
+        for row in rows:
+            byMonth.setdefault(MonthStart(row["time"]), []).append(row)
+        routed = []
+        for month, monthRows in byMonth.items():
+            partition = self.tableFor(conn, month)
+            routed.append((self.table if self.native and throughBase else partition, monthRows))
+        return routed
+
+    def insert(self, conn: db.Connection, rows: list[dict]):
+        """Insert rows, each with a time, into the partitions of their months"""
+        if not rows:
+            return
+        for table, tableRows in self.__route(conn, rows, True):
+            BulkInsert(conn, table, tableRows)
+
+    def upsert(self, conn: db.Connection, rows: list[dict], keys: list[str],
+               update: Callable[[db.Table, db.ColumnCollection], dict]) -> int:
+        """
+        Insert rows into the partitions of their months in one statement per batch,
+        updating the row that already holds the same keys instead. keys must be
+        covered by a unique index on every table written to, which is why native
+        partitions are written directly rather than through the base table.
+        update receives the target table and the columns of the row proposed for
+        insertion, and returns the values to set on conflict.
+
+        Returns:
+            Number of rows sent
+        """
+        if not rows:
+            return 0
+        for table, tableRows in self.__route(conn, rows, False):
+            BulkUpsert(conn, table, tableRows, keys, update, self.UPSERT_BATCH)
+        return len(rows)
+
+    def source(self, startDate: datetime = None, endDate: datetime = None) -> db.FromClause:
+        """
+        Selectable with the base table's columns covering startDate to endDate. Only
+        the partitions overlapping the range are read.
+        """
+        partitions = self.__load()
+        if self.native:
+            return self.table
+        tables = [self.table] + [
+            partitions[month] for month in sorted(partitions)
+            if (endDate is None or month <= endDate) and (startDate is None or NextMonth(month) > startDate)
+        ]
+        if len(tables) == 1:
+            return self.table
+        return db.union_all(*[db.select(*t.c) for t in tables]).subquery(self.table.name)
+
+    def count(self, conn: db.Connection) -> int:
+        return sum(conn.execute(db.select(db.func.count()).select_from(t)).scalar() for t in self.tables())
+
+    def dropBefore(self, conn: db.Connection, cutoff: datetime) -> int:
+        """
+        Drop the partitions that end before cutoff and delete the rows of the base
+        table whose expireColumn is older.
+
+        Returns:
+            Number of rows deleted from the base table, dropped partitions are not counted
+        """
+        deleted = 0
+        if not self.native:
+            deleted = conn.execute(
+                self.table.delete().where(self.table.c[self.expireColumn] < cutoff)
+            ).rowcount
+        with self.__lock:
+            partitions = self.__load()
+            for month in sorted(partitions):
+                if NextMonth(month) <= cutoff:
+                    self.__drop(conn, partitions.pop(month))
+        return deleted
+
+    def truncate(self, conn: db.Connection):
+        """Delete every row, dropping the partitions instead of deleting from them"""
+        if not self.native:
+            conn.execute(self.table.delete())
+        with self.__lock:
+            partitions = self.__load()
+            for month in list(partitions):
+                self.__drop(conn, partitions.pop(month))
+
+    def __drop(self, conn: db.Connection, partition: db.Table):
+        conn.execute(db.text(f'DROP TABLE IF EXISTS "{partition.name}"'))
+        self.metadata.remove(partition)
+
+    def copyFrom(self, conn: db.Connection, other: "TimePartitionedTable"):
+        """Copy every row of another partitioned table, e.g. when a configuration is renamed"""
+        self.__load()
+        if not other.native:
+            if self.native:
+                first, last = conn.execute(db.select(db.func.min(other.table.c.time), db.func.max(other.table.c.time))).one()
+                month = first
+                while month is not None and month <= last:
+                    self.tableFor(conn, month)
+                    month = NextMonth(month)
+            conn.execute(db.text(f'INSERT INTO "{self.table.name}" SELECT * FROM "{other.table.name}"'))
+        for month, partition in sorted(other.partitions().items()):
+            target = self.tableFor(conn, month)
+            conn.execute(db.text(
+                f'INSERT INTO "{(self.table if self.native else target).name}" SELECT * FROM "{partition.name}"'
+            ))
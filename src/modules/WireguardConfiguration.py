@@ -10,11 +10,16 @@ from datetime import datetime, timedelta
 from itertools import islice
 from flask import current_app
 
+from .BulkWrites import BulkUpdate
+from .ConfigurationSchema import ConfigurationSchema
 from .ConnectionString import ConnectionString
 from .DashboardConfig import DashboardConfig
 from .Peer import Peer
 from .PeerJobs import PeerJobs
+from .PeerSessions import PeerSessions
 from .PeerShareLinks import PeerShareLinks
+from .PeerTrafficRollups import PeerTrafficRollups, DownsampleTraffics
+from .TimePartitions import TimePartitionedTable, PartitionedTableOptions, PartitionNames
 from .Utilities import StringToBoolean, GenerateWireguardPublicKey, RegexMatch, ValidateDNSAddress, \
     ValidateEndpointAllowedIPs
 from .WireguardConfigurationInfo import WireguardConfigurationInfo, PeerGroupsClass
@@ -40,6 +45,12 @@ class WireguardConfiguration:
                  wg: bool = True
                  ):
         self.Peers = []
+        # Position of each peer id in Peers, checked on every lookup and rebuilt when stale
+        self.__peerPositions: dict[str, int] = {}
+        # Rendered client configs by peer id, with the peer fields they were rendered from
+        self.__peerConfigCache: dict[str, tuple[tuple, dict]] = {}
+        # Last raw dump observation of node-hosted peers, used for change detection
+        self.__nodeObservations: dict[str, tuple] = {}
         self.__parser: configparser.ConfigParser = configparser.RawConfigParser(strict=False)
         self.__parser.optionxform = str
         self.__configFileModifiedTime = None
@@ -152,6 +163,22 @@ class WireguardConfiguration:
         self.getPeers()
         self.getRestrictedPeersList()
 
+    def getCachedPeerConfig(self, peerId: str, cacheKey: tuple) -> dict | None:
+        cached = self.__peerConfigCache.get(peerId)
+        if cached is not None and cached[0] == cacheKey:
+            return dict(cached[1])
+        return None
+
+    def cachePeerConfig(self, peerId: str, cacheKey: tuple, rendered: dict):
+        self.__peerConfigCache[peerId] = (cacheKey, dict(rendered))
+
+    def invalidatePeerConfigCache(self, peerId: str = None):
+        """Drop one peer's rendered config, or all of them after an interface change"""
+        if peerId is None:
+            self.__peerConfigCache.clear()
+        else:
+            self.__peerConfigCache.pop(peerId, None)
+
     def getRawConfigurationFile(self):
         return open(self.configPath, 'r').read()
 
@@ -215,9 +242,13 @@ class WireguardConfiguration:
             if self.PrivateKey:
                 self.PublicKey = self.__getPublicKey()
             self.Status = self.getStatus()
+            self.invalidatePeerConfigCache()
 
     def __dropDatabase(self):
-        existingTables = [self.Name, f'{self.Name}_restrict_access', f'{self.Name}_transfer', f'{self.Name}_deleted']
+        existingTables = [self.Name, f'{self.Name}_restrict_access', f'{self.Name}_transfer', f'{self.Name}_deleted',
+                          *PeerTrafficRollups.tableNames(self.Name), PeerSessions.tableName(self.Name),
+                          *PartitionNames(self.engine, f'{self.Name}_transfer'),
+                          *PartitionNames(self.engine, f'{self.Name}_history_endpoint')]
         try:
             with self.engine.begin() as conn:
                 for t in existingTables:
@@ -226,6 +257,7 @@ class WireguardConfiguration:
                             f'DROP TABLE "{t}"'
                         )
                     )
+            self.configurationSchema.deleteVersion(self.Name)
         except Exception as e:
             current_app.logger.error("Dropping table failed")
             return False
@@ -234,6 +266,7 @@ class WireguardConfiguration:
     def createDatabase(self, dbName = None):
         if dbName is None:
             dbName = self.Name
+        partitioning = self.DashboardConfig.GetConfig("Database", "time_partitioning")[1] is True
         self.peersTable = sqlalchemy.Table(
             dbName, self.metadata,
             sqlalchemy.Column('id', sqlalchemy.String(255), nullable=False, primary_key=True),
@@ -301,8 +334,16 @@ class WireguardConfiguration:
             sqlalchemy.Column('cumu_data', sqlalchemy.Float),
             sqlalchemy.Column('time', (sqlalchemy.DATETIME if self.DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else sqlalchemy.TIMESTAMP),
                               server_default=sqlalchemy.func.now()),
-            extend_existing=True
+            extend_existing=True,
+            **PartitionedTableOptions(self.engine, f'{dbName}_transfer', partitioning)
+        )
+        self.peersTransferPartitions = TimePartitionedTable(
+            self.engine, self.metadata, self.peersTransferTable, partitioning
+        )
+        self.peersTrafficRollups = PeerTrafficRollups(
+            self.engine, self.metadata, dbName, self.peersTransferPartitions, self.DashboardConfig
         )
+        self.peerSessions = PeerSessions(self.engine, self.metadata, dbName, self.DashboardConfig)
         
         self.peersHistoryEndpointTable = sqlalchemy.Table(
             f'{dbName}_history_endpoint', self.metadata,
@@ -310,7 +351,16 @@ class WireguardConfiguration:
             sqlalchemy.Column('endpoint', sqlalchemy.String(255), nullable=False),
             sqlalchemy.Column('time', 
                               (sqlalchemy.DATETIME if self.DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else sqlalchemy.TIMESTAMP)),
-            extend_existing=True
+            sqlalchemy.Column('first_seen',
+                              (sqlalchemy.DATETIME if self.DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else sqlalchemy.TIMESTAMP)),
+            sqlalchemy.Column('last_seen',
+                              (sqlalchemy.DATETIME if self.DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else sqlalchemy.TIMESTAMP)),
+            sqlalchemy.Column('seen_count', sqlalchemy.Integer),
+            extend_existing=True,
+            **PartitionedTableOptions(self.engine, f'{dbName}_history_endpoint', partitioning)
+        )
+        self.peersHistoryEndpointPartitions = TimePartitionedTable(
+            self.engine, self.metadata, self.peersHistoryEndpointTable, partitioning, "last_seen"
         )
         
         self.peersDeletedTable = sqlalchemy.Table(
@@ -346,14 +396,21 @@ class WireguardConfiguration:
         )
 
         self.metadata.create_all(self.engine)
+        self.configurationSchema = ConfigurationSchema(self, dbName)
+        self.configurationSchema.migrate()
 
     def __dumpDatabase(self):
         with self.engine.connect() as conn:
-            tables = [self.peersTable, self.peersRestrictedTable, self.peersTransferTable, self.peersDeletedTable]
-            for i in tables:
+            # Partitions are dumped into their base table
+            tables = [(self.peersTable, self.peersTable), (self.peersRestrictedTable, self.peersRestrictedTable),
+                      *[(t, self.peersTransferTable) for t in self.peersTransferPartitions.tables()],
+                      (self.peersDeletedTable, self.peersDeletedTable),
+                      *[(t, t) for t in self.peersTrafficRollups.tables.values()],
+                      (self.peerSessions.table, self.peerSessions.table)]
+            for i, target in tables:
                 rows = conn.execute(i.select()).mappings().fetchall()
                 for row in rows:
-                    insert_stmt = i.insert().values(dict(row))
+                    insert_stmt = target.insert().values(dict(row))
                     yield str(insert_stmt.compile(compile_kwargs={"literal_binds": True}))
 
     def __importDatabase(self, sqlFilePath, restore = False) -> bool:
@@ -492,46 +549,185 @@ class WireguardConfiguration:
                     tmpList.append(Peer(i, self))
         self.Peers = tmpList
     
-    def logPeersTraffic(self):
+    def logPeersTraffic(self) -> int:
+        """
+        Log a transfer snapshot of every running peer, written with one bulk insert
+
+        Returns:
+            Number of rows logged
+        """
+        now = datetime.now()
+        rows = [{
+            "id": tempPeer.id,
+            "total_receive": tempPeer.total_receive,
+            "total_sent": tempPeer.total_sent,
+            "total_data": tempPeer.total_data,
+            "cumu_sent": tempPeer.cumu_sent,
+            "cumu_receive": tempPeer.cumu_receive,
+            "cumu_data": tempPeer.cumu_data,
+            "time": now
+        } for tempPeer in self.Peers if tempPeer.status == "running"]
         with self.engine.begin() as conn:
-            for tempPeer in self.Peers:
-                if tempPeer.status == "running":
-                    conn.execute(
-                        self.peersTransferTable.insert().values({
-                            "id": tempPeer.id,
-                            "total_receive": tempPeer.total_receive,
-                            "total_sent": tempPeer.total_sent,
-                            "total_data": tempPeer.total_data,
-                            "cumu_sent": tempPeer.cumu_sent,
-                            "cumu_receive": tempPeer.cumu_receive,
-                            "cumu_data": tempPeer.cumu_data,
-                            "time": datetime.now()
-                        })
-                    )
+            self.peersTransferPartitions.insert(conn, rows)
+        return len(rows)
+
+    def getPeersTraffics(self, peerIds: list[str] | None, startDate: datetime, endDate: datetime,
+                         bucket: int = None, maxPoints: int = None) -> dict[str, list[dict]]:
+        """
+        Bucketed traffic of several peers, or of every peer when peerIds is None,
+        read with one grouped query
+
+        Returns:
+            Rows of every peer with traffic in the range, by peer ID
+        """
+        traffics = self.peersTrafficRollups.getPeersBucketedTraffics(peerIds, startDate, endDate, bucket)
+        if maxPoints is not None:
+            traffics = {peerId: DownsampleTraffics(rows, maxPoints) for peerId, rows in traffics.items()}
+        return traffics
+
+    def rollupPeersTraffic(self) -> dict[str, int]:
+        """Roll logged traffic up into the 1m, 1h and 1d tiers"""
+        return self.peersTrafficRollups.rollup()
+
+    def expirePeersTracking(self) -> dict[str, int]:
+        """Apply the retention of the traffic tiers and of the endpoint history"""
+        deleted = self.peersTrafficRollups.prune()
+        days = self.peersTrafficRollups.retentionDays()["history_endpoint"]
+        if days > 0:
+            with self.engine.begin() as conn:
+                deleted["history_endpoint"] = self.peersHistoryEndpointPartitions.dropBefore(
+                    conn, datetime.now() - timedelta(days=days)
+                )
+        return deleted
     
-    def logPeersHistoryEndpoint(self):
+    def backfillPeersTraffic(self, node_id: str, samples: list) -> int:
+        """
+        Insert transfer rows for this configuration's peers hosted on a node from
+        the agent's history samples of (time, public_key, transfer_rx, transfer_tx,
+        latest_handshake). Like logPeersTraffic, only samples taken while the peer
+        was online are logged. The rollup tiers are marked to aggregate again from
+        the earliest sample, as it may be behind buckets they already stored.
+        """
+        nodePeers = {p.id: p for p in self.Peers if p.node_id == node_id}
+        rows = []
+        for sampleTime, publicKey, transferRx, transferTx, latestHandshake in samples:
+            tempPeer = nodePeers.get(publicKey)
+            if tempPeer is None or latestHandshake <= 0 or sampleTime - latestHandshake >= 180:
+                continue
+            totalReceive = transferRx / (1024 ** 3)
+            totalSent = transferTx / (1024 ** 3)
+            rows.append({
+                "id": tempPeer.id,
+                "total_receive": totalReceive,
+                "total_sent": totalSent,
+                "total_data": totalReceive + totalSent,
+                "cumu_sent": tempPeer.cumu_sent,
+                "cumu_receive": tempPeer.cumu_receive,
+                "cumu_data": tempPeer.cumu_data,
+                "time": datetime.fromtimestamp(sampleTime)
+            })
+        if rows:
+            with self.engine.begin() as conn:
+                self.peersTransferPartitions.insert(conn, rows)
+                self.peersTrafficRollups.markBackfilled(conn, min(row["time"] for row in rows))
+        return len(rows)
+    
+    def ingestNodeDump(self, node_id: str, iface: str, dumpPeers: list) -> list[str]:
+        """
+        Apply a node agent's interface dump to this configuration's peers hosted on
+        that node and interface. Raw counters and the handshake time go to rx_obs,
+        tx_obs and handshake_obs; totals, status and endpoint are derived like the
+        local wg polling. Only peers whose observation or online status changed are
+        written, in one bulk update, so logPeersTraffic picks up the running ones.
+
+        Returns:
+            IDs of the peers that were updated
+        """
+        nodePeers = {p.id: p for p in self.Peers if p.node_id == node_id and p.iface == iface}
+        if not nodePeers:
+            return []
+        observations = self.__nodeObservations
+        now = datetime.now().timestamp()
+        rows = []
+        for d in dumpPeers:
+            tempPeer = nodePeers.get(d.get('public_key'))
+            if tempPeer is None:
+                continue
+            handshake = int(d.get('latest_handshake') or 0)
+            status = "running" if handshake > 0 and now - handshake < 180 else "stopped"
+            observation = (int(d.get('transfer_rx', 0)), int(d.get('transfer_tx', 0)), handshake,
+                           d.get('endpoint') or "N/A", status)
+            previous = observations.get(tempPeer.id)
+            if previous == observation:
+                continue
+            observations[tempPeer.id] = observation
+            totalReceive = observation[0] / (1024 ** 3)
+            totalSent = observation[1] / (1024 ** 3)
+            cumuReceive = tempPeer.cumu_receive or 0
+            cumuSent = tempPeer.cumu_sent or 0
+            lastReceive = previous[0] / (1024 ** 3) if previous else tempPeer.rx_obs
+            lastSent = previous[1] / (1024 ** 3) if previous else tempPeer.tx_obs
+            if lastReceive is not None and lastSent is not None \
+                    and (totalReceive < lastReceive or totalSent < lastSent):
+                # Counters were reset on the node, bank what was transferred so far
+                cumuReceive += tempPeer.total_receive or 0
+                cumuSent += tempPeer.total_sent or 0
+            rows.append({
+                "peer_id": tempPeer.id,
+                "rx_obs": totalReceive,
+                "tx_obs": totalSent,
+                "handshake_obs": str(handshake),
+                "total_receive": totalReceive,
+                "total_sent": totalSent,
+                "total_data": totalReceive + totalSent,
+                "cumu_receive": cumuReceive,
+                "cumu_sent": cumuSent,
+                "cumu_data": cumuReceive + cumuSent,
+                "endpoint": observation[3],
+                "status": status
+            })
+        if rows:
+            with self.engine.begin() as conn:
+                BulkUpdate(conn, self.peersTable, "id", [{"id": row["peer_id"], **row} for row in rows])
+            for row in rows:
+                tempPeer = nodePeers[row["peer_id"]]
+                for key, value in row.items():
+                    if key != "peer_id":
+                        setattr(tempPeer, key, value)
+        return [row["peer_id"] for row in rows]
+    
+    def logPeersHistoryEndpoint(self) -> int:
+        """
+        Record the endpoint of every running peer with one bulk upsert. A row is kept
+        per peer and endpoint (per month when partitioned), and seeing it again moves
+        last_seen and counts the sighting instead of adding a row.
+
+        Returns:
+            Number of endpoints recorded
+        """
+        now = datetime.now()
+        rows = {}
+        for tempPeer in self.Peers:
+            if tempPeer.status == "running":
+                endpoint = tempPeer.endpoint.rsplit(":", 1)
+                if len(endpoint) == 2 and len(endpoint[0]) > 0:
+                    rows[(tempPeer.id, endpoint[0])] = {
+                        "id": tempPeer.id,
+                        "endpoint": endpoint[0],
+                        "time": now,
+                        "first_seen": now,
+                        "last_seen": now,
+                        "seen_count": 1
+                    }
         with self.engine.begin() as conn:
-            for tempPeer in self.Peers:
-                if tempPeer.status == "running":
-                    endpoint = tempPeer.endpoint.rsplit(":", 1)    
-                    if len(endpoint) == 2 and len(endpoint[0]) > 0:
-                        exist = conn.execute(
-                            self.peersHistoryEndpointTable.select().where(
-                                sqlalchemy.and_(
-                                    self.peersHistoryEndpointTable.c.id == tempPeer.id,
-                                    self.peersHistoryEndpointTable.c.endpoint == endpoint[0]
-                                )
-                            )
-                        ).mappings().fetchone()
-                        if not exist:
-                            conn.execute(
-                                self.peersHistoryEndpointTable.insert().values({
-                                    "id": tempPeer.id,
-                                    "endpoint": endpoint[0],
-                                    "time": datetime.now()
-                                })
-                            )
-                          
+            return self.peersHistoryEndpointPartitions.upsert(
+                conn, list(rows.values()), ["id", "endpoint"],
+                lambda table, excluded: {
+                    "last_seen": excluded.last_seen,
+                    "seen_count": table.c.seen_count + excluded.seen_count
+                }
+            )
+
     def addPeers(self, peers: list) -> tuple[bool, list, str]:
         result = {
             "message": None,
@@ -593,10 +789,15 @@ class WireguardConfiguration:
         return True, result['peers'], ""
 
     def searchPeer(self, publicKey):
-        for i in self.Peers:
-            if i.id == publicKey:
-                return True, i
-        return False, None
+        position = self.__peerPositions.get(publicKey)
+        if position is None or position >= len(self.Peers) or self.Peers[position].id != publicKey:
+            self.__peerPositions = {}
+            for i, p in enumerate(self.Peers):
+                self.__peerPositions.setdefault(p.id, i)
+            position = self.__peerPositions.get(publicKey)
+            if position is None:
+                return False, None
+        return True, self.Peers[position]
 
     def allowAccessPeers(self, listOfPublicKeys) -> tuple[bool, str]:
         if not self.getStatus():
@@ -708,6 +909,7 @@ class WireguardConfiguration:
                             )
                         )
                         deleted.append(pf.id)
+                        self.invalidatePeerConfigCache(pf.id)
                         numOfDeletedPeers += 1
                     except Exception as e:
                         numOfFailedToDeletePeers += 1
@@ -736,7 +938,13 @@ class WireguardConfiguration:
         except subprocess.CalledProcessError as e:
             return False, str(e)
 
-    def getPeersLatestHandshake(self):
+    def getPeersLatestHandshake(self) -> dict[str, datetime | None] | str:
+        """
+        Update the peers' latest handshake and status from wg
+
+        Returns:
+            Time of each peer's latest handshake, None if it never had one
+        """
         if not self.getStatus():
             self.toggleConfiguration()
         try:
@@ -747,10 +955,13 @@ class WireguardConfiguration:
         latestHandshake = latestHandshake.decode("UTF-8").split()
         count = 0
         now = datetime.now()
-        time_delta = timedelta(minutes=3)
+        time_delta = PeerSessions.THRESHOLD
+        handshakes = {}
 
         with self.engine.begin() as conn:
             for _ in range(int(len(latestHandshake) / 2)):
+                handshakes[latestHandshake[count]] = datetime.fromtimestamp(int(latestHandshake[count + 1])) \
+                    if int(latestHandshake[count + 1]) > 0 else None
                 minus = now - datetime.fromtimestamp(int(latestHandshake[count + 1]))
                 if minus < time_delta:
                     status = "running"
@@ -775,29 +986,65 @@ class WireguardConfiguration:
                         )
                     )
                 count += 2
+        return handshakes
+
+    def logPeersSessions(self, handshakes: dict[str, datetime | None]) -> dict[str, list[str]]:
+        """
+        Open and close the peers' sessions whose handshake crossed the freshness
+        threshold, with the handshakes returned by getPeersLatestHandshake and the
+        latest handshakes of the node hosted peers from ingestNodeDump
+
+        Returns:
+            IDs of the peers that came online and of those that went offline
+        """
+        handshakes = dict(handshakes)
+        for peerId, observation in list(self.__nodeObservations.items()):
+            # A node that stops reporting leaves its handshakes to go stale
+            handshakes.setdefault(peerId, datetime.fromtimestamp(observation[2]) if observation[2] > 0 else None)
+        peers = {p.id: p for p in self.Peers}
+        observations = []
+        for peerId, handshake in handshakes.items():
+            p = peers.get(peerId)
+            observations.append({
+                "id": peerId,
+                "handshake": handshake,
+                "receive": (p.cumu_receive or 0) + (p.total_receive or 0) if p else None,
+                "sent": (p.cumu_sent or 0) + (p.total_sent or 0) if p else None
+            })
+        return self.peerSessions.track(observations)
 
-    def getPeersTransfer(self):
+    def getPeersTransfer(self) -> list[str]:
+        """
+        Update the peers' transfer totals from wg
+
+        Returns:
+            IDs of the peers whose totals changed
+        """
         if not self.getStatus():
             self.toggleConfiguration()
+        changed = []
         # try:
         data_usage = subprocess.check_output(f"{self.Protocol} show {self.Name} transfer",
                                              shell=True, stderr=subprocess.STDOUT)
         data_usage = data_usage.decode("UTF-8").split("\n")
         
         data_usage = [p.split("\t") for p in data_usage]
-        cur_i = None
+        peers = {p.id: p for p in self.Peers}
+        resets, totals = [], []
         with self.engine.begin() as conn:
+            stored = {
+                row["id"]: row for row in conn.execute(
+                    sqlalchemy.select(
+                        self.peersTable.c.id, self.peersTable.c.total_receive, self.peersTable.c.total_sent,
+                        self.peersTable.c.cumu_receive, self.peersTable.c.cumu_sent
+                    )
+                ).mappings()
+            }
             for i in range(len(data_usage)):
                 if len(data_usage[i]) == 3:
-                    cur_i = conn.execute(
-                        self.peersTable.select().where(
-                            self.peersTable.c.id == data_usage[i][0]
-                        )
-                    ).mappings().fetchone()
+                    cur_i = stored.get(data_usage[i][0])
                     if cur_i is not None:
-                        # print(cur_i is None)
                         total_sent = cur_i['total_sent']
-                        # print(cur_i is None)
                         total_receive = cur_i['total_receive']
                         cur_total_sent = float(data_usage[i][2]) / (1024 ** 3)
                         cur_total_receive = float(data_usage[i][1]) / (1024 ** 3)
@@ -807,32 +1054,28 @@ class WireguardConfiguration:
                             total_sent = cur_total_sent
                             total_receive = cur_total_receive
                         else:
-                            conn.execute(
-                                self.peersTable.update().values({
-                                    "cumu_receive": cumulative_receive,
-                                    "cumu_sent": cumulative_sent,
-                                    "cumu_data": cumulative_sent + cumulative_receive
-                                }).where(
-                                    self.peersTable.c.id == data_usage[i][0]
-                                )
-                            )
-
+                            resets.append({
+                                "id": data_usage[i][0],
+                                "cumu_receive": cumulative_receive,
+                                "cumu_sent": cumulative_sent,
+                                "cumu_data": cumulative_sent + cumulative_receive
+                            })
                             total_sent = 0
                             total_receive = 0
-                        status, p = self.searchPeer(data_usage[i][0])
-                        if status:
+                        p = peers.get(data_usage[i][0])
+                        if p is not None:
                             if p.total_receive != total_receive or p.total_sent != total_sent:
-                                conn.execute(
-                                    self.peersTable.update().values({
-                                        "total_receive": total_receive,
-                                        "total_sent": total_sent,
-                                        "total_data": total_receive + total_sent
-                                    }).where(
-                                        self.peersTable.c.id == data_usage[i][0]
-                                    )
-                                )
+                                totals.append({
+                                    "id": data_usage[i][0],
+                                    "total_receive": total_receive,
+                                    "total_sent": total_sent,
+                                    "total_data": total_receive + total_sent
+                                })
+                                changed.append(data_usage[i][0])
+            BulkUpdate(conn, self.peersTable, "id", resets)
+            BulkUpdate(conn, self.peersTable, "id", totals)
+        return changed
 
-            
 
     def getPeersEndpoint(self):
         if not self.getStatus():
@@ -1034,6 +1277,7 @@ class WireguardConfiguration:
             return False, msg
         for i in allowEdit:
             setattr(self, i, str(newData[i]))
+        self.invalidatePeerConfigCache()
                 
         return True, ""
 
@@ -1048,6 +1292,8 @@ class WireguardConfiguration:
         try:
             if self.getStatus():
                 self.toggleConfiguration()
+            transferPartitions = self.peersTransferPartitions
+            historyEndpointPartitions = self.peersHistoryEndpointPartitions
             self.createDatabase(newConfigurationName)
             with self.engine.begin() as conn:
                 conn.execute(
@@ -1065,11 +1311,17 @@ class WireguardConfiguration:
                         f'INSERT INTO "{newConfigurationName}_deleted" SELECT * FROM "{self.Name}_deleted"'
                     )
                 )
-                conn.execute(
-                    sqlalchemy.text(
-                        f'INSERT INTO "{newConfigurationName}_transfer" SELECT * FROM "{self.Name}_transfer"'
+                self.peersTransferPartitions.copyFrom(conn, transferPartitions)
+                self.peersHistoryEndpointPartitions.copyFrom(conn, historyEndpointPartitions)
+                for oldTable, newTable in zip([*PeerTrafficRollups.tableNames(self.Name),
+                                               PeerSessions.tableName(self.Name)],
+                                              [*PeerTrafficRollups.tableNames(newConfigurationName),
+                                               PeerSessions.tableName(newConfigurationName)]):
+                    conn.execute(
+                        sqlalchemy.text(
+                            f'INSERT INTO "{newTable}" SELECT * FROM "{oldTable}"'
+                        )
                     )
-                )
             self.AllPeerJobs.updateJobConfigurationName(self.Name, newConfigurationName)
             shutil.copy(
                 self.configPath,
@@ -1221,6 +1473,7 @@ class WireguardConfiguration:
                     return False, str(e), None
             self.configurationInfo.OverridePeerSettings = (
                 self.configurationInfo.OverridePeerSettings.model_validate(value))
+            self.invalidatePeerConfigCache()
         elif key == "PeerGroups":
             peerGroups = {}
             for name, data in value.items():
@@ -1251,40 +1504,37 @@ class WireguardConfiguration:
         
     def getTransferTableSize(self):
         with self.engine.connect() as db:
-            row_count = db.execute(
-                sqlalchemy.select(sqlalchemy.func.count()).select_from(self.peersTransferTable)
-            ).scalar()
+            row_count = self.peersTransferPartitions.count(db)
             return int(row_count)
 
     def getHistoricalEndpointTableSize(self):
         with self.engine.connect() as db:
-            row_count = db.execute(
-                sqlalchemy.select(sqlalchemy.func.count()).select_from(self.peersHistoryEndpointTable)
-            ).scalar()
+            row_count = self.peersHistoryEndpointPartitions.count(db)
             return int(row_count)
         
     def downloadTransferTable(self):
         with self.engine.connect() as db:
             data = db.execute(
-                self.peersTransferTable.select()
+                sqlalchemy.select(self.peersTransferPartitions.source())
             ).mappings().fetchall()
             return data
 
     def downloadHistoricalEndpointTable(self):
         with self.engine.connect() as db:
             data = db.execute(
-                self.peersHistoryEndpointTable.select()
+                sqlalchemy.select(self.peersHistoryEndpointPartitions.source())
             ).mappings().fetchall()
             return data
     
     def deleteTransferTable(self):
         try:
             with self.engine.begin() as db:
-                db.execute(
-                    self.peersTransferTable.delete()
-            )
+                self.peersTransferPartitions.truncate(db)
+                self.peersTrafficRollups.clear(db)
+                self.peerSessions.clear(db)
+            # Dropped partitions need no VACUUM, which would lock the whole database
             with self.engine.connect() as conn:
-                if conn.dialect.name == 'sqlite':
+                if conn.dialect.name == 'sqlite' and not self.peersTransferPartitions.enabled:
                     print("[WGDashboard] SQLite Vacuuming Database")
                     conn.execute(sqlalchemy.text('VACUUM;'))
         except Exception as e:
@@ -1294,11 +1544,9 @@ class WireguardConfiguration:
     def deleteHistoryEndpointTable(self):
         try:
             with self.engine.begin() as db:
-                db.execute(
-                    self.peersHistoryEndpointTable.delete()
-                )
+                self.peersHistoryEndpointPartitions.truncate(db)
             with self.engine.connect() as conn:
-                if conn.dialect.name == 'sqlite':
+                if conn.dialect.name == 'sqlite' and not self.peersHistoryEndpointPartitions.enabled:
                     print("[WGDashboard] SQLite Vacuuming Database")
                     conn.execute(sqlalchemy.text('VACUUM;'))
         except Exception as e:
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Test script for the agent's store-and-forward stats history
+Tests the bounded ring store, the /v1/wg/{iface}/history endpoint and the
+panel-side client used for backfilling after an outage
+"""
+
+import sys
+import os
+import json
+import tempfile
+from unittest.mock import patch, MagicMock
+
+# Add wgdashboard-agent and src/modules to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'wgdashboard-agent'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'modules'))
+
+
+def _dumps(peer_count, sample_time):
+    return {'wg0': [(f'peer{i:04d}', sample_time - 10, i * 100, i * 10) for i in range(peer_count)]}
+
+
+def test_history_record_and_query():
+    """Test samples are recorded and returned per interface since a timestamp"""
+    print("\nTesting history record and query...")
+    import app as agent_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = agent_app.HistoryStore(os.path.join(tmp, 'history.db'), 64 * 1024 * 1024, 60)
+        store.record(_dumps(3, 1000), 1000)
+        store.record(_dumps(3, 1060), 1060)
+        store.record({'wg1': [('other', 1100, 1, 1)]}, 1120)
+
+        assert len(store.query('wg0', 0, 1000)) == 6
+        newer = store.query('wg0', 1000, 1000)
+        assert len(newer) == 3 and all(row[0] == 1060 for row in newer)
+        assert store.query('wg0', 0, 2) == store.query('wg0', 0, 1000)[:2]
+        assert len(store.query('wg1', 0, 1000)) == 1
+
+    print("✓ History samples are queryable per interface and since timestamp")
+    return True
+
+
+def test_history_bounded_by_disk_budget():
+    """Test the store drops the oldest samples to stay within its disk budget"""
+    print("\nTesting history disk budget...")
+    import app as agent_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'history.db')
+        budget = 256 * 1024
+        store = agent_app.HistoryStore(path, budget, 60)
+        for i in range(200):
+            store.record(_dumps(50, 1000 + i * 60), 1000 + i * 60)
+
+        conn = store._connect()
+        assert store.used_bytes(conn) <= budget, "Live data exceeds the budget"
+        rows = store.query('wg0', 0, 10 ** 6)
+        assert 0 < len(rows) < 200 * 50, "Oldest samples were not evicted"
+        # The newest sample is always kept
+        assert rows[-1][0] == 1000 + 199 * 60
+
+        # File size stops growing once freed pages are reused
+        size = os.path.getsize(path)
+        for i in range(200, 300):
+            store.record(_dumps(50, 1000 + i * 60), 1000 + i * 60)
+        assert os.path.getsize(path) <= size * 1.25, "History file keeps growing"
+
+    print("✓ History retention is bounded by the disk budget")
+    return True
+
+
+def test_history_endpoint_gzip():
+    """Test /v1/wg/{iface}/history returns compact, gzip-encoded samples"""
+    print("\nTesting /v1/wg/{iface}/history endpoint...")
+    import app as agent_app
+    from fastapi.testclient import TestClient
+    from test_agent_operation_queue import _signed_headers
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = agent_app.HistoryStore(os.path.join(tmp, 'history.db'), 64 * 1024 * 1024, 60)
+        store.record(_dumps(5, 1000), 1000)
+        store.record(_dumps(5, 1060), 1060)
+
+        with patch.object(agent_app, 'history_store', store):
+            client = TestClient(agent_app.app)
+            path = '/v1/wg/wg0/history'
+            headers = _signed_headers(agent_app.SHARED_SECRET, 'GET', path, '')
+            headers['Accept-Encoding'] = 'gzip'
+            response = client.get(path, params={'since': 1000}, headers=headers)
+
+        assert response.status_code == 200, response.text
+        assert response.headers['content-encoding'] == 'gzip'
+        data = response.json()
+        assert data['columns'][0] == 'time'
+        assert len(data['samples']) == 5
+        assert all(sample[0] == 1060 for sample in data['samples'])
+
+    print("✓ History endpoint returns compressed samples newer than since")
+    return True
+
+
+def test_agent_client_history_request():
+    """Test AgentClient signs the path only and sends since as a query parameter"""
+    print("\nTesting AgentClient.get_wg_history...")
+    from NodeAgent import AgentClient
+
+    client = AgentClient('http://test-node:8080', 'test-secret')
+    response = MagicMock(status_code=200)
+    response.json.return_value = {'samples': []}
+
+    with patch('NodeAgent.requests.get', return_value=response) as get, \
+            patch.object(client, '_generate_hmac', wraps=client._generate_hmac) as sign:
+        success, data = client.get_wg_history('wg0', 1234)
+
+    assert success is True
+    assert get.call_args.kwargs['params'] == {'since': 1234}
+    assert get.call_args.args[0] == 'http://test-node:8080/v1/wg/wg0/history'
+    assert sign.call_args.args[1] == '/v1/wg/wg0/history'
+
+    print("✓ AgentClient requests history with a signed path and since parameter")
+    return True
+
+
+def test_agent_client_history_pages():
+    """Test a truncated history is paged from its last sample time without losing a split snapshot"""
+    print("\nTesting AgentClient.iter_wg_history...")
+    from NodeAgent import AgentClient
+
+    # Three peers sampled every 60 s, pages of 4 samples like an agent with limit=4
+    stored = [(t, f'peer-{p}', t, t, t) for t in range(1000, 1600, 60) for p in range(3)]
+    def history(iface, since):
+        samples = [s for s in stored if s[0] > since][:4]
+        return True, {'samples': samples, 'truncated': len(samples) >= 4}
+
+    client = AgentClient('http://test-node:8080', 'test-secret')
+    with patch.object(client, 'get_wg_history', side_effect=history) as get:
+        pages = list(client.iter_wg_history('wg0', 999))
+    assert all(success for success, _ in pages)
+    assert [s for _, samples in pages for s in samples] == stored
+    assert get.call_args_list[1].args == ('wg0', 1059), "The split snapshot of 1060 is read again"
+
+    with patch.object(client, 'get_wg_history', return_value=(False, 'timeout')):
+        assert list(client.iter_wg_history('wg0', 999)) == [(False, 'timeout')]
+
+    print(f"✓ {len(stored)} samples read in {len(pages)} pages")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Agent History Store Tests")
+    print("=" * 60)
+
+    tests = [
+        test_history_record_and_query,
+        test_history_bounded_by_disk_budget,
+        test_history_endpoint_gzip,
+        test_agent_client_history_request,
+        test_agent_client_history_pages,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
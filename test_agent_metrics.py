@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test script for the agent's cached Prometheus metrics
+Tests per-peer cardinality modes, interface aggregates and cached/gzip serving
+"""
+
+import sys
+import os
+import gzip
+import time
+from unittest.mock import patch
+
+# Add wgdashboard-agent to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'wgdashboard-agent'))
+
+
+def _fake_dumps(peer_count, now):
+    """Build a fake interface dump with varying traffic and handshake ages"""
+    peers = []
+    for i in range(peer_count):
+        handshake = now - (i * 37) if i % 5 else 0
+        peers.append((f'peer{i:05d}' + 'x' * 40, handshake, i * 1000, i * 10))
+    return {'wg0': peers}
+
+
+def test_peer_series_modes():
+    """Test per-peer series are emitted for on, omitted for off and capped for top"""
+    print("\nTesting per-peer metric modes...")
+    import app as agent_app
+
+    now = int(time.time())
+    dumps = _fake_dumps(500, now)
+
+    on = agent_app.MetricsCache(15, 'on', 10).render(dumps, now)
+    off = agent_app.MetricsCache(15, 'off', 10).render(dumps, now)
+    top = agent_app.MetricsCache(15, 'top', 10).render(dumps, now)
+
+    def count(text, name):
+        return sum(1 for line in text.splitlines() if line.startswith(name + '{'))
+
+    assert count(on, 'wireguard_peer_receive_bytes_total') == 500
+    assert count(off, 'wireguard_peer_receive_bytes_total') == 0
+    assert count(top, 'wireguard_peer_receive_bytes_total') == 10
+    # Highest-traffic peer must be among the top-N series
+    assert 'public_key="peer00499' + 'x' * 40 + '"' in top
+
+    for text in (on, off, top):
+        assert 'wireguard_peers_total{interface="wg0"} 500' in text
+        assert 'wireguard_peers_active{interface="wg0"}' in text
+        assert 'wireguard_interface_receive_bytes_total{interface="wg0"}' in text
+        assert 'wireguard_peer_handshake_age_seconds_bucket{interface="wg0",le="+Inf"} 400' in text
+        assert 'wireguard_peer_handshake_age_seconds_count{interface="wg0"} 400' in text
+        # Each family is declared exactly once
+        assert text.count('# TYPE wireguard_peers_total gauge') == 1
+
+    print("✓ Per-peer series honour on/off/top-N with aggregates always present")
+    return True
+
+
+def test_metrics_served_from_cache():
+    """Test scrapes are served from the cache with gzip and exposition content type"""
+    print("\nTesting cached, gzip-encoded /v1/metrics...")
+    import app as agent_app
+    from fastapi.testclient import TestClient
+
+    now = int(time.time())
+    cache = agent_app.MetricsCache(3600, 'off', 10)
+
+    with patch.object(agent_app, '_read_interface_dumps', return_value=_fake_dumps(2000, now)) as reader, \
+            patch.object(agent_app, 'metrics_cache', cache):
+        client = TestClient(agent_app.app)
+        for _ in range(5):
+            response = client.get('/v1/metrics', headers={'Accept-Encoding': 'gzip'})
+            assert response.status_code == 200
+            assert response.headers['content-type'] == agent_app.PROMETHEUS_CONTENT_TYPE
+            assert response.headers['content-encoding'] == 'gzip'
+
+        plain = client.get('/v1/metrics', headers={'Accept-Encoding': 'identity'})
+        assert 'content-encoding' not in plain.headers
+        assert gzip.decompress(cache.body_gzip) == plain.content
+
+        # wg is read once to fill the cache, not once per scrape
+        assert reader.call_count == 1, f"wg was read {reader.call_count} times"
+
+    print("✓ Scrapes are served from the cache with constant cost")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Agent Metrics Cache Tests")
+    print("=" * 60)
+
+    tests = [
+        test_peer_series_modes,
+        test_metrics_served_from_cache,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Test script for the agent's per-interface operation queue
+Fires concurrent peer operations at the agent app against fake `wg` and
+`wg-quick` binaries and checks that mutations are serialized and saves coalesced
+"""
+
+import sys
+import os
+import json
+import time
+import hmac
+import hashlib
+import asyncio
+import tempfile
+
+# Add wgdashboard-agent to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'wgdashboard-agent'))
+
+FAKE_WG = """#!/bin/sh
+echo "wg $*" >> "$FAKE_WG_LOG"
+"""
+
+FAKE_WG_QUICK = """#!/bin/sh
+echo "wg-quick $*" >> "$FAKE_WG_LOG"
+"""
+
+
+def _install_fake_binaries(directory):
+    """Write fake wg/wg-quick scripts to directory and put it first on PATH"""
+    for name, body in (('wg', FAKE_WG), ('wg-quick', FAKE_WG_QUICK)):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as f:
+            f.write(body)
+        os.chmod(path, 0o755)
+    log_path = os.path.join(directory, 'calls.log')
+    open(log_path, 'w').close()
+    os.environ['FAKE_WG_LOG'] = log_path
+    os.environ['PATH'] = directory + os.pathsep + os.environ.get('PATH', '')
+    return log_path
+
+
+def _signed_headers(secret, method, path, body):
+    """Build the HMAC headers the agent expects"""
+    timestamp = str(int(time.time()))
+    message = f"{method}|{path}|{body}|{timestamp}"
+    signature = hmac.new(secret.encode('utf-8'), message.encode('utf-8'), hashlib.sha256).hexdigest()
+    return {
+        'Content-Type': 'application/json',
+        'X-Signature': signature,
+        'X-Timestamp': timestamp
+    }
+
+
+async def _fire_peer_adds(app_module, count, interface):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://agent') as client:
+        async def add(i):
+            path = f'/v1/wg/{interface}/peers'
+            body = json.dumps({
+                'public_key': f'peer-{i:05d}',
+                'allowed_ips': [f'10.{i // 65536}.{(i // 256) % 256}.{i % 256}/32'],
+                'persistent_keepalive': 0
+            })
+            headers = _signed_headers(app_module.SHARED_SECRET, 'POST', path, body)
+            return await client.post(path, content=body, headers=headers)
+
+        return await asyncio.gather(*(add(i) for i in range(count)))
+
+
+def test_concurrent_peer_adds_coalesce_saves():
+    """Test 1,000 concurrent peer adds are serialized with coalesced saves"""
+    print("\nTesting 1,000 concurrent peer adds against fake wg binary...")
+    original_path = os.environ.get('PATH', '')
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = _install_fake_binaries(tmp)
+        import app as agent_app
+
+        count = 1000
+        started = time.monotonic()
+        try:
+            responses = asyncio.run(_fire_peer_adds(agent_app, count, 'wgqueue0'))
+        finally:
+            os.environ['PATH'] = original_path
+        elapsed = time.monotonic() - started
+
+        assert all(r.status_code == 200 for r in responses), \
+            f"Failed requests: {[r.text for r in responses if r.status_code != 200][:3]}"
+
+        with open(log_path) as f:
+            calls = [line.strip() for line in f if line.strip()]
+        sets = [c for c in calls if c.startswith('wg set wgqueue0 peer')]
+        saves = [c for c in calls if c == 'wg-quick save wgqueue0']
+
+        assert len(sets) == count, f"Expected {count} wg set calls, got {len(sets)}"
+        assert 1 <= len(saves) <= count // 10, f"Saves were not coalesced: {len(saves)}"
+        # The final save must come after the final mutation so every add is durable
+        assert calls[-1] == 'wg-quick save wgqueue0', "Last mutation was never saved"
+
+        stats = agent_app.get_operation_queue('wgqueue0').stats()
+        assert stats['mutations'] == count
+        assert stats['queued'] == 0 and stats['unsaved'] == 0
+
+        print(f"✓ {count} adds in {elapsed:.2f}s ({count / elapsed:.0f} ops/s), "
+              f"{len(saves)} coalesced saves")
+        return True
+
+
+def test_failed_save_is_reported():
+    """Test that a request is not acknowledged when its save fails"""
+    print("\nTesting failed save propagates to the request...")
+    import app as agent_app
+    from unittest.mock import patch
+    import subprocess
+
+    queue = agent_app.InterfaceOperationQueue('wgfail0')
+
+    def fake_run(cmd, **kwargs):
+        if cmd[0] == 'wg-quick':
+            raise subprocess.CalledProcessError(1, cmd, stderr=b'save failed')
+        return subprocess.CompletedProcess(cmd, 0)
+
+    async def run():
+        return await queue.submit(fake_run, ['wg', 'set', 'wgfail0', 'peer', 'x'])
+
+    with patch.object(agent_app.subprocess, 'run', side_effect=fake_run):
+        try:
+            asyncio.run(run())
+            raise AssertionError("Save failure was swallowed")
+        except subprocess.CalledProcessError:
+            pass
+
+    assert queue.stats()['unsaved'] == 1, "Unsaved mutation must be reported"
+    print("✓ Save failures are surfaced and the mutation is reported as unsaved")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Agent Operation Queue Tests")
+    print("=" * 60)
+
+    tests = [
+        test_concurrent_peer_adds_coalesce_saves,
+        test_failed_save_is_reported,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Test script for the backend specific bulk writes of the poll cycle
+Tests that transfer snapshots and total updates are sent as one statement per
+cycle on SQLite, that MySQL gets multi-row INSERTs and PostgreSQL a COPY into a
+staging table merged with one statement, and that wg transfer readings including
+a counter reset are applied like before
+"""
+
+import sys
+import os
+import tempfile
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import sqlalchemy
+from sqlalchemy.dialects import mysql, postgresql
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+
+
+def _configuration(peer_count):
+    from modules.WireguardConfiguration import WireguardConfiguration
+
+    c = WireguardConfiguration.__new__(WireguardConfiguration)
+    c.Name = 'wg0'
+    c.Protocol = 'wg'
+    c.engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'wgdashboard.db')}")
+    c.metadata = sqlalchemy.MetaData()
+    c.DashboardConfig = MagicMock()
+    c.DashboardConfig.GetConfig.side_effect = lambda section, key: \
+        (True, False) if key == 'time_partitioning' else (True, 'sqlite')
+    c.createDatabase()
+    c.Peers = [SimpleNamespace(id=f'peer-{i}', status='running', total_receive=1.0, total_sent=1.0, total_data=2.0,
+                               cumu_receive=2.0, cumu_sent=0.0, cumu_data=2.0) for i in range(peer_count)]
+    with c.engine.begin() as conn:
+        conn.execute(c.peersTable.insert(), [
+            {'id': p.id, 'total_receive': p.total_receive, 'total_sent': p.total_sent, 'total_data': p.total_data,
+             'cumu_receive': p.cumu_receive, 'cumu_sent': p.cumu_sent, 'cumu_data': p.cumu_data} for p in c.Peers])
+    return c
+
+
+class _RecordingConnection:
+    """Connection stand-in recording what a bulk write sends to a backend"""
+    def __init__(self, dialect):
+        self.dialect = dialect
+        self.statements = []
+        self.copied = []
+        self.connection = SimpleNamespace(cursor=self.cursor)
+
+    def execute(self, statement, parameters=None):
+        self.statements.append(str(statement.compile(dialect=self.dialect)))
+
+    def exec_driver_sql(self, statement):
+        self.statements.append(statement)
+
+    @contextmanager
+    def cursor(self):
+        @contextmanager
+        def copy(statement):
+            self.statements.append(statement)
+            yield SimpleNamespace(write_row=self.copied.append)
+        yield SimpleNamespace(copy=copy)
+
+
+def _statements(engine, action):
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, context, executemany: \
+        statements.append((statement, executemany))
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        action()
+    finally:
+        sqlalchemy.event.remove(engine, 'before_cursor_execute', listener)
+    return statements
+
+
+def test_snapshot_is_one_statement():
+    """Test logPeersTraffic writes every running peer with one executemany on SQLite"""
+    print("\nTesting transfer snapshot logging...")
+    c = _configuration(500)
+    for i, peer in enumerate(c.Peers):
+        peer.status = 'running' if i % 5 else 'stopped'
+        peer.total_receive, peer.total_sent, peer.total_data = float(i), 0.5, float(i) + 0.5
+        peer.cumu_receive = peer.cumu_sent = peer.cumu_data = 0.0
+
+    logged = []
+    statements = _statements(c.engine, lambda: logged.append(c.logPeersTraffic()))
+    inserts = [s for s, _ in statements if s.startswith('INSERT')]
+    assert logged == [400] and c.getTransferTableSize() == 400
+    assert len(inserts) == 1 and all(many for s, many in statements if s.startswith('INSERT'))
+    with c.engine.connect() as conn:
+        times = conn.execute(sqlalchemy.select(sqlalchemy.func.count(sqlalchemy.distinct(c.peersTransferTable.c.time)))).scalar()
+    assert times == 1, "A snapshot shares one timestamp"
+
+    print(f"✓ 400 rows logged with {len(inserts)} INSERT")
+    return True
+
+
+def test_transfer_readings_are_batched():
+    """Test wg transfer readings, including a counter reset, are applied with one select and bulk updates"""
+    print("\nTesting transfer updates...")
+    c = _configuration(300)
+    gb = 1024 ** 3
+    lines = [f'{peer.id}\t{2 * gb}\t{gb}' for peer in c.Peers[:-1]]
+    lines.append(f'{c.Peers[-1].id}\t{gb // 2}\t{gb}')
+    lines.append(f'unknown-peer\t{gb}\t{gb}')
+    output = '\n'.join(lines).encode()
+
+    c.getStatus = lambda: True
+    changed = []
+    with patch('modules.WireguardConfiguration.subprocess.check_output', return_value=output):
+        statements = _statements(c.engine, lambda: changed.extend(c.getPeersTransfer()))
+    assert len(statements) == 3, [s for s, _ in statements]
+    assert len(changed) == 300
+
+    with c.engine.connect() as conn:
+        rows = {r['id']: r for r in conn.execute(c.peersTable.select()).mappings()}
+    first, reset = rows[c.Peers[0].id], rows[c.Peers[-1].id]
+    assert (first['total_receive'], first['total_sent'], first['total_data'], first['cumu_receive']) == (2.0, 1.0, 3.0, 2.0)
+    assert (reset['total_receive'], reset['total_sent'], reset['cumu_receive'], reset['cumu_sent'], reset['cumu_data']) == \
+           (0, 0, 3.0, 1.0, 4.0)
+
+    print(f"✓ 300 readings applied with {len(statements)} statements")
+    return True
+
+
+def test_backend_fast_paths():
+    """Test MySQL gets multi-row INSERTs and PostgreSQL a COPY merged from a staging table"""
+    print("\nTesting backend fast paths...")
+    from modules.BulkWrites import BulkInsert, BulkUpdate, BATCH_SIZE
+    c = _configuration(1)
+    rows = [{'id': f'peer-{i}', 'total_receive': float(i), 'total_sent': 0.0, 'total_data': float(i),
+             'cumu_receive': 0.0, 'cumu_sent': 0.0, 'cumu_data': 0.0, 'time': None} for i in range(2500)]
+
+    conn = _RecordingConnection(mysql.dialect())
+    assert BulkInsert(conn, c.peersTransferTable, rows) == 2500
+    assert len(conn.statements) == 3 and conn.statements[0].count('(%s, %s, %s, %s, %s, %s, %s, %s)') == BATCH_SIZE
+
+    conn = _RecordingConnection(postgresql.dialect())
+    assert BulkInsert(conn, c.peersTransferTable, rows) == 2500
+    assert conn.statements[0].startswith('CREATE TEMPORARY TABLE IF NOT EXISTS "wg0_transfer_staging"')
+    assert conn.statements[2].startswith('COPY "wg0_transfer_staging" ("id", "total_receive"')
+    assert conn.statements[3].startswith('INSERT INTO "wg0_transfer" ("id"') and 'FROM "wg0_transfer_staging"' in conn.statements[3]
+    assert len(conn.copied) == 2500 and conn.copied[7][:2] == ['peer-7', 7.0]
+
+    conn = _RecordingConnection(postgresql.dialect())
+    BulkUpdate(conn, c.peersTable, 'id', [{'id': 'peer-1', 'total_receive': 1.0, 'total_sent': 2.0}])
+    assert conn.statements[-1] == 'UPDATE "wg0" AS t SET "total_receive" = s."total_receive", "total_sent" = s."total_sent" ' \
+                                  'FROM "wg0_staging" AS s WHERE t."id" = s."id"'
+    assert conn.copied == [['peer-1', 1.0, 2.0]]
+
+    print("✓ 2,500 rows sent as 3 multi-row INSERTs on MySQL and one COPY on PostgreSQL")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Bulk Write Tests")
+    print("=" * 60)
+
+    tests = [
+        test_snapshot_is_one_statement,
+        test_transfer_readings_are_batched,
+        test_backend_fast_paths,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
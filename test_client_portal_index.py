@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Test script for the client portal assignment index and peer config rendering
+Tests the by-client and by-peer assignment indexes, that the precompiled peer
+config template renders the same file as before, and the rendered-config cache
+"""
+
+import sys
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import jinja2
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+
+def _configuration(name, peer_count):
+    """WireguardConfiguration with real Peer objects and no backing interface"""
+    from modules.WireguardConfiguration import WireguardConfiguration
+    from modules.WireguardConfigurationInfo import WireguardConfigurationInfo
+    from modules.Peer import Peer
+
+    c = WireguardConfiguration.__new__(WireguardConfiguration)
+    c._WireguardConfiguration__peerConfigCache = {}
+    c._WireguardConfiguration__peerPositions = {}
+    c.Name = name
+    c.Protocol = 'wg'
+    c.PublicKey = 'c2VydmVyLXB1YmxpYy1rZXktZm9yLXRlc3Rpbmctb25seQ='
+    c.ListenPort = '51820'
+    c.configurationInfo = WireguardConfigurationInfo()
+    c.DashboardConfig = MagicMock()
+    c.DashboardConfig.GetConfig.return_value = (True, 'vpn.example.com')
+    c.AllPeerJobs = MagicMock()
+    c.AllPeerJobs.searchJob.return_value = []
+    c.AllPeerShareLinks = MagicMock()
+    c.AllPeerShareLinks.getLink.return_value = []
+    c.Peers = [Peer({
+        'id': f'{name}-peer-{i}', 'private_key': f'private-{i}', 'DNS': '1.1.1.1',
+        'endpoint_allowed_ip': '0.0.0.0/0', 'name': f'Peer {i}', 'total_receive': 1.0, 'total_sent': 2.0,
+        'total_data': 3.0, 'endpoint': 'N/A', 'status': 'stopped', 'latest_handshake': 'No Handshake',
+        'allowed_ip': f'10.0.{i // 256}.{i % 256}/32', 'cumu_receive': 0.0, 'cumu_sent': 0.0, 'cumu_data': 0.0,
+        'mtu': 1420, 'keepalive': 21, 'remote_endpoint': 'vpn.example.com', 'preshared_key': ''
+    }, c) for i in range(peer_count)]
+    return c
+
+
+def _assignments(configurations):
+    import modules.DashboardClientsPeerAssignment as AssignmentModule
+    import modules.DashboardLogger as DashboardLoggerModule
+    from modules.DashboardClientsPeerAssignment import DashboardClientsPeerAssignment
+
+    directory = tempfile.mkdtemp()
+    connection = lambda database: f"sqlite:///{os.path.join(directory, database + '.db')}"
+    AssignmentModule.ConnectionString = connection
+    DashboardLoggerModule.ConnectionString = connection
+    return DashboardClientsPeerAssignment(configurations)
+
+
+def _legacy_render(peer):
+    """The file downloadPeer produced before the template was precompiled"""
+    c = peer.configuration
+    override = c.configurationInfo.OverridePeerSettings
+    sections = [
+        {'PrivateKey': peer.private_key, 'Address': peer.allowed_ip, 'MTU': override.MTU or peer.mtu,
+         'DNS': override.DNS or peer.DNS},
+        {'PublicKey': c.PublicKey, 'AllowedIPs': override.EndpointAllowedIPs or peer.endpoint_allowed_ip,
+         'Endpoint': f'{override.PeerRemoteEndpoint or "vpn.example.com"}:{override.ListenPort or c.ListenPort}',
+         'PersistentKeepalive': override.PersistentKeepalive or peer.keepalive, 'PresharedKey': peer.preshared_key}
+    ]
+    file = ""
+    for s, section in enumerate(sections):
+        file += "[Interface]\n" if s == 0 else "\n[Peer]\n"
+        for key, val in section.items():
+            if val is not None and ((type(val) is str and len(val) > 0) or (type(val) is int and val > 0)):
+                file += f"{key} = {val}\n"
+    return jinja2.Template(file).render(configuration=c)
+
+
+def test_assignment_index():
+    """Test assignments are indexed by client and by peer and kept in step on changes"""
+    print("\nTesting assignment index...")
+    configurations = {'wg0': _configuration('wg0', 2000), 'wg1': _configuration('wg1', 10)}
+    index = _assignments(configurations)
+
+    for i in range(0, 2000, 20):
+        assert index.AssignClient('client-a', 'wg0', f'wg0-peer-{i}')[0]
+    assert index.AssignClient('client-a', 'wg1', 'wg1-peer-3')[0]
+    assert index.AssignClient('client-b', 'wg0', 'wg0-peer-0')[0]
+    assert index.AssignClient('client-a', 'wg0', 'wg0-peer-0') == (False, None), "Duplicate assignment"
+    assert index.AssignClient('client-a', 'wg0', 'missing') == (False, None)
+
+    peers = index.GetAssignedPeers('client-a')
+    assert len(peers) == 101 and {p['configuration_name'] for p in peers} == {'wg0', 'wg1'}
+    assert peers[0]['peer_configuration_data']['file'].startswith('[Interface]\nPrivateKey = private-0')
+    assert sorted(a.ClientID for a in index.GetAssignedClients('wg0', 'wg0-peer-0')) == ['client-a', 'client-b']
+
+    first = index.GetAssignedClients('wg0', 'wg0-peer-0')[0]
+    assert index.UnassignClients(first.AssignmentID)
+    assert len(index.GetAssignedClients('wg0', 'wg0-peer-0')) == 1
+    assert index.UnassignPeers('client-a')
+    assert index.GetAssignedPeers('client-a') == []
+    assert [a.ClientID for a in index.GetAssignedClients('wg0', 'wg0-peer-0')] == ['client-b']
+
+    # A new instance rebuilds the same index from the table
+    from modules.DashboardClientsPeerAssignment import DashboardClientsPeerAssignment
+    reloaded = DashboardClientsPeerAssignment(configurations)
+    assert [a.ClientID for a in reloaded.GetAssignedClients('wg0', 'wg0-peer-0')] == ['client-b']
+    assert reloaded.GetAssignedPeers('client-a') == []
+
+    print("✓ Assign and unassign keep both indexes in step with the table")
+    return True
+
+
+def test_search_peer_positions():
+    """Test searchPeer returns the current peer object after Peers is rebuilt in place or replaced"""
+    print("\nTesting peer lookup positions...")
+    c = _configuration('wg0', 1000)
+    assert c.searchPeer('wg0-peer-700') == (True, c.Peers[700])
+    assert c.searchPeer('missing') == (False, None)
+
+    # AmneziaWG rebuilds the list in place, in a different order
+    rebuilt = _configuration('wg0', 1000).Peers[::-1]
+    c.Peers.clear()
+    c.Peers.extend(rebuilt)
+    assert c.searchPeer('wg0-peer-700')[1] is rebuilt[299]
+    c.Peers = c.Peers[:500]
+    assert c.searchPeer('wg0-peer-700')[1] is rebuilt[299]
+    assert c.searchPeer('wg0-peer-100') == (False, None)
+
+    print("✓ Lookups follow in-place rebuilds and replacements of Peers")
+    return True
+
+
+def test_precompiled_template_matches_legacy_render():
+    """Test the precompiled template renders the same file, including templated overrides"""
+    print("\nTesting precompiled peer config template...")
+    c = _configuration('wg0', 3)
+    peer = c.Peers[1]
+    assert peer.downloadPeer()['file'] == _legacy_render(peer)
+    assert peer.downloadPeer()['fileName'] == 'Peer1'
+
+    c.invalidatePeerConfigCache()
+    c.configurationInfo.OverridePeerSettings.PeerRemoteEndpoint = 'edge.example.com'
+    c.configurationInfo.OverridePeerSettings.ListenPort = '{{ configuration.ListenPort }}'
+    c.configurationInfo.OverridePeerSettings.PersistentKeepalive = '25'
+    rendered = peer.downloadPeer()['file']
+    assert rendered == _legacy_render(peer) and 'Endpoint = edge.example.com:51820' in rendered
+
+    print("✓ Rendered files are identical to the per-call template")
+    return True
+
+
+def test_rendered_config_cache():
+    """Test the rendered config is reused until the peer or interface changes"""
+    print("\nTesting rendered config cache...")
+    import modules.Peer as PeerModule
+    c = _configuration('wg0', 3)
+    peer = c.Peers[2]
+    renders = []
+    original = PeerModule.PeerConfigurationTemplate
+    PeerModule.PeerConfigurationTemplate = SimpleNamespace(
+        render=lambda **kwargs: renders.append(kwargs) or original.render(**kwargs))
+    try:
+        first = peer.downloadPeer()
+        first['file'] = 'mutated by caller'
+        assert peer.downloadPeer()['file'] != 'mutated by caller'
+        assert len(renders) == 1
+
+        peer.DNS = '9.9.9.9'
+        assert 'DNS = 9.9.9.9' in peer.downloadPeer()['file'] and len(renders) == 2
+
+        c.ListenPort = '51999'
+        assert ':51999' not in peer.downloadPeer()['file'], "Interface changes go through invalidation"
+        c.invalidatePeerConfigCache()
+        assert ':51999' in peer.downloadPeer()['file'] and len(renders) == 3
+    finally:
+        PeerModule.PeerConfigurationTemplate = original
+
+    print("✓ Configs render once and again only after a peer change or invalidation")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Client Portal Index Tests")
+    print("=" * 60)
+
+    tests = [
+        test_assignment_index,
+        test_search_peer_positions,
+        test_precompiled_template_matches_legacy_render,
+        test_rendered_config_cache,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Test script for cached, concurrent Cloudflare DNS synchronisation
+Runs CloudflareDNSManager against a local fake Cloudflare HTTP server and checks
+the record cache, ETag revalidation, minimal diffs, concurrency and retry backoff
+"""
+
+import sys
+import os
+import json
+import time
+import uuid
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Add src/modules to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'modules'))
+
+
+class FakeCloudflare:
+    """In-memory dns_records API with ETags, request counting and failure injection"""
+
+    def __init__(self, latency=0.0):
+        self.records = {}
+        self.requests = []
+        self.failures = {}  # content -> number of POSTs to reject
+        self.latency = latency
+        self.version = 0
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, result=None, headers=None):
+                body = json.dumps({'success': status < 300, 'errors': [] if status < 300 else [{'message': 'fail'}],
+                                   'result': result}).encode()
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                name = parse_qs(url.query).get('name', [None])[0]
+                with fake.lock:
+                    fake.requests.append(('GET', url.path))
+                    etag = f'"v{fake.version}"'
+                    records = [r for r in fake.records.values() if name is None or r['name'] == name]
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self._reply(200, records, {'ETag': etag})
+
+            def do_POST(self):
+                data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                time.sleep(fake.latency)
+                with fake.lock:
+                    fake.requests.append(('POST', data['content']))
+                    if fake.failures.get(data['content'], 0) > 0:
+                        fake.failures[data['content']] -= 1
+                        failed = True
+                    else:
+                        failed = False
+                        record = dict(data, id=uuid.uuid4().hex)
+                        fake.records[record['id']] = record
+                        fake.version += 1
+                if failed:
+                    self._reply(500)
+                else:
+                    self._reply(200, record)
+
+            def do_DELETE(self):
+                record_id = self.path.rsplit('/', 1)[1]
+                time.sleep(fake.latency)
+                with fake.lock:
+                    fake.requests.append(('DELETE', record_id))
+                    fake.records.pop(record_id, None)
+                    fake.version += 1
+                self._reply(200, {'id': record_id})
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def contents(self):
+        with self.lock:
+            return sorted(r['content'] for r in self.records.values())
+
+    def take_requests(self):
+        with self.lock:
+            requests, self.requests = self.requests, []
+            return requests
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _manager(fake):
+    from CloudflareDNSManager import CloudflareDNSManager
+    return CloudflareDNSManager('token', base_url=fake.url)
+
+
+def test_unchanged_set_costs_no_requests():
+    """Test a repeated sync uses the cache and a stale view is revalidated by ETag"""
+    print("\nTesting cached record view...")
+    fake = FakeCloudflare()
+    try:
+        manager = _manager(fake)
+        ips = ['203.0.113.1', '203.0.113.2', '2001:db8::1']
+
+        assert manager.sync_node_ips_to_dns('zone', 'vpn.example.com', ips)[0]
+        assert fake.contents() == sorted(ips)
+        requests = fake.take_requests()
+        assert [r[0] for r in requests].count('GET') == 1 and len(requests) == 4
+
+        assert manager.sync_node_ips_to_dns('zone', 'vpn.example.com', list(reversed(ips)))[0]
+        assert fake.take_requests() == [], "Unchanged set must not contact the API"
+
+        # A stale view is revalidated; nothing changed so the server answers 304
+        success, records = manager.get_cached_records('zone', 'vpn.example.com', max_age=0)
+        assert success and sorted(content for _, content in records) == sorted(ips)
+        assert fake.take_requests() == [('GET', '/zones/zone/dns_records')]
+    finally:
+        fake.close()
+
+    print("✓ Unchanged sets cost no requests and stale views revalidate with ETag")
+    return True
+
+
+def test_minimal_concurrent_diff():
+    """Test only changed records are mutated and mutations run concurrently"""
+    print("\nTesting minimal concurrent diff...")
+    fake = FakeCloudflare(latency=0.05)
+    try:
+        manager = _manager(fake)
+        first = [f'198.51.100.{i}' for i in range(1, 21)]
+        started = time.monotonic()
+        assert manager.sync_node_ips_to_dns('zone', 'vpn.example.com', first)[0]
+        elapsed = time.monotonic() - started
+        assert elapsed < 20 * 0.05 / 2, f"20 creates took {elapsed:.2f}s"
+        fake.take_requests()
+
+        second = first[2:] + ['198.51.100.99']
+        assert manager.sync_node_ips_to_dns('zone', 'vpn.example.com', second)[0]
+        requests = fake.take_requests()
+        assert sorted(r[0] for r in requests) == ['DELETE', 'DELETE', 'POST'], requests
+        assert fake.contents() == sorted(second)
+    finally:
+        fake.close()
+
+    print(f"✓ 20 creates in {elapsed:.2f}s; a changed set sends only its diff")
+    return True
+
+
+def test_retry_backoff_per_item():
+    """Test failed creates are retried on their own backoff timers"""
+    print("\nTesting retry backoff...")
+    fake = FakeCloudflare()
+    try:
+        manager = _manager(fake)
+        manager.RETRY_BASE_DELAY = 0.05
+        fake.failures['192.0.2.1'] = 2
+
+        success, message = manager.sync_node_ips_to_dns('zone', 'vpn.example.com', ['192.0.2.1', '192.0.2.2'])
+        assert success and 'queued for retry' in message
+        assert fake.contents() == ['192.0.2.2']
+
+        deadline = time.monotonic() + 2
+        while fake.contents() != ['192.0.2.1', '192.0.2.2'] and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert fake.contents() == ['192.0.2.1', '192.0.2.2'], "Retry did not succeed within backoff"
+        assert not manager.retry_queue
+
+        # The cache learned about the retried record, so a repeat sync is free
+        fake.take_requests()
+        assert manager.sync_node_ips_to_dns('zone', 'vpn.example.com', ['192.0.2.1', '192.0.2.2'])[0]
+        assert fake.take_requests() == []
+        manager.stop_retry_thread()
+    finally:
+        fake.close()
+
+    print("✓ Failed operations are retried with per-item backoff")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Cloudflare DNS Sync Tests")
+    print("=" * 60)
+
+    tests = [
+        test_unchanged_set_costs_no_requests,
+        test_minimal_concurrent_diff,
+        test_retry_backoff_per_item,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Test script for the versioned configuration schema migrations
+Tests that tables created by an older version are upgraded once, that the version
+is recorded per configuration, and that the traffic, session and endpoint queries
+are answered through the new indexes according to SQLite's query plans
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import sqlalchemy
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from configuration_fixtures import make_configuration, make_engine
+
+
+def _legacy_tables(engine):
+    """Tables as an older version created them: no node columns and no indexes"""
+    peer_columns = ('id VARCHAR(255) NOT NULL PRIMARY KEY, private_key VARCHAR(255), "DNS" TEXT, '
+                    'endpoint_allowed_ip TEXT, name TEXT, total_receive FLOAT, total_sent FLOAT, total_data FLOAT, '
+                    'endpoint VARCHAR(255), status VARCHAR(255), latest_handshake VARCHAR(255), '
+                    'allowed_ip VARCHAR(255), cumu_receive FLOAT, cumu_sent FLOAT, cumu_data FLOAT, mtu INTEGER, '
+                    'keepalive INTEGER, remote_endpoint VARCHAR(255), preshared_key VARCHAR(255)')
+    with engine.begin() as conn:
+        for table in ('wg0', 'wg0_restrict_access', 'wg0_deleted'):
+            conn.exec_driver_sql(f'CREATE TABLE "{table}" ({peer_columns})')
+        conn.exec_driver_sql('CREATE TABLE "wg0_transfer" (id VARCHAR(255) NOT NULL, total_receive FLOAT, '
+                             'total_sent FLOAT, total_data FLOAT, cumu_receive FLOAT, cumu_sent FLOAT, '
+                             'cumu_data FLOAT, time DATETIME DEFAULT CURRENT_TIMESTAMP)')
+        conn.exec_driver_sql('CREATE TABLE "wg0_history_endpoint" (id VARCHAR(255) NOT NULL, '
+                             'endpoint VARCHAR(255) NOT NULL, time DATETIME)')
+        conn.exec_driver_sql("INSERT INTO wg0 (id, name) VALUES ('peer-a', 'Laptop')")
+        conn.exec_driver_sql("INSERT INTO wg0_transfer (id, total_receive, time) VALUES ('peer-a', 1.5, '2026-10-01 10:00:00')")
+
+
+def _plans(engine, action):
+    """Query plans of the SELECT statements run by action on the transfer, endpoint and session tables"""
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, context, executemany: \
+        statements.append((statement, parameters))
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        action()
+    finally:
+        sqlalchemy.event.remove(engine, 'before_cursor_execute', listener)
+    plans = []
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            if statement.lstrip().upper().startswith('SELECT') and \
+                    any(t in statement for t in ('_transfer', '_history_endpoint', '_sessions')):
+                rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+                plans.append(' | '.join(row[-1] for row in rows))
+    return plans
+
+
+def test_older_tables_are_upgraded_once():
+    """Test an older database gets the missing columns and indexes and its version recorded"""
+    print("\nTesting schema upgrade...")
+    engine = make_engine()
+    _legacy_tables(engine)
+
+    c = make_configuration(engine)
+    inspector = sqlalchemy.inspect(engine)
+    assert {'node_id', 'iface', 'handshake_obs', 'rx_obs', 'tx_obs'} <= {col['name'] for col in inspector.get_columns('wg0')}
+    assert {'node_id', 'iface'} <= {col['name'] for col in inspector.get_columns('wg0_deleted')}
+    assert {i['name'] for i in inspector.get_indexes('wg0_transfer')} == {'ix_wg0_transfer_id_time', 'ix_wg0_transfer_time'}
+    assert {i['name'] for i in inspector.get_indexes('wg0_history_endpoint')} == \
+           {'ux_wg0_history_endpoint_id_endpoint', 'ix_wg0_history_endpoint_time'}
+    assert 'ix_wg0_node_id_iface' in {i['name'] for i in inspector.get_indexes('wg0')}
+    assert c.configurationSchema.getVersion() == c.configurationSchema.latestVersion
+
+    with engine.connect() as conn:
+        assert conn.execute(sqlalchemy.select(c.peersTable.c.name, c.peersTable.c.node_id)).one() == ('Laptop', None)
+        assert c.getTransferTableSize() == 1
+
+    again = make_configuration(engine)
+    assert again.configurationSchema.migrate() == []
+    other = make_configuration(engine, 'wg1')
+    assert other.configurationSchema.getVersion() == other.configurationSchema.latestVersion
+
+    print(f"✓ Upgraded to version {c.configurationSchema.latestVersion}, later starts apply nothing")
+    return True
+
+
+def test_query_plans_use_indexes():
+    """Test traffic, session and endpoint queries search the indexes instead of scanning"""
+    print("\nTesting query plans...")
+    engine = make_engine()
+    c = make_configuration(engine)
+    now = datetime.now()
+    with engine.begin() as conn:
+        c.peersTransferPartitions.insert(conn, [
+            {'id': f'peer-{i % 50}', 'total_receive': float(i), 'total_sent': 0.0, 'total_data': float(i),
+             'cumu_receive': 0.0, 'cumu_sent': 0.0, 'cumu_data': 0.0, 'time': now - timedelta(minutes=i)}
+            for i in range(5000)])
+        conn.execute(sqlalchemy.text('ANALYZE'))
+
+    from modules.Peer import Peer
+    peer = Peer.__new__(Peer)
+    peer.id, peer.configuration = 'peer-7', c
+    c.Peers = [SimpleNamespace(id='peer-7', status='running', endpoint='203.0.113.7:51820')]
+
+    plans = _plans(engine, lambda: peer.getTraffics(30))
+    plans += _plans(engine, lambda: peer.getSessionRecords(now - timedelta(days=1), now))
+    plans += _plans(engine, lambda: peer.getEndpoints())
+    plans += _plans(engine, c.logPeersHistoryEndpoint)
+    assert any('ix_wg0_transfer_id_time' in p for p in plans), plans
+    assert any('ux_wg0_history_endpoint_id_endpoint' in p for p in plans), plans
+    assert any('ix_wg0_sessions_id_start_time' in p for p in plans), plans
+    for plan in plans:
+        assert 'USING' in plan and 'SCAN wg0_transfer ' not in f'{plan} ' \
+               and 'SCAN wg0_history_endpoint ' not in f'{plan} ', plan
+
+    print(f"✓ {len(plans)} queries searched an index")
+    return True
+
+
+def test_partitions_get_the_indexes():
+    """Test monthly partitions created after the upgrade carry the same indexes"""
+    print("\nTesting partition indexes...")
+    engine = make_engine()
+    c = make_configuration(engine, partitioning=True)
+    with engine.begin() as conn:
+        c.peersTransferPartitions.insert(conn, [
+            {'id': 'peer-a', 'total_receive': 1.0, 'total_sent': 0.0, 'total_data': 1.0, 'cumu_receive': 0.0,
+             'cumu_sent': 0.0, 'cumu_data': 0.0, 'time': datetime(2026, 10, 5)}])
+    assert {i['name'] for i in sqlalchemy.inspect(engine).get_indexes('wg0_transfer_p202610')} == \
+           {'ix_wg0_transfer_p202610_id_time', 'ix_wg0_transfer_p202610_time'}
+
+    table = c.peersTransferPartitions.partitions()[datetime(2026, 10, 1)]
+    with engine.connect() as conn:
+        plan = conn.execute(sqlalchemy.text(
+            f"EXPLAIN QUERY PLAN SELECT * FROM {table.name} WHERE id = 'peer-a' AND time >= '2026-10-01'"
+        )).fetchall()
+    assert 'ix_wg0_transfer_p202610_id_time' in plan[0][-1]
+
+    print("✓ New partitions are created with the composite index")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Configuration Schema Tests")
+    print("=" * 60)
+
+    tests = [
+        test_older_tables_are_upgraded_once,
+        test_query_plans_use_indexes,
+        test_partitions_get_the_indexes,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
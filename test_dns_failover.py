@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test script for event-driven DNS failover
+Tests the K/M hysteresis of the node health state machine, damping of flapping
+nodes and coalescing of transitions into one DNS update per configuration
+"""
+
+import sys
+import os
+import time
+from types import SimpleNamespace
+
+# Add src/modules to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'modules'))
+
+
+class FakeConfigNodes:
+    """In-memory stand-in for ConfigNodesManager"""
+
+    def __init__(self, assignments):
+        self.assignments = {key: True for key in assignments}
+        self.updates = []
+
+    def getConfigsForNode(self, node_id):
+        return [SimpleNamespace(config_name=config, node_id=node, is_healthy=healthy)
+                for (config, node), healthy in self.assignments.items() if node == node_id]
+
+    def updateNodeHealth(self, config_name, node_id, is_healthy):
+        self.assignments[(config_name, node_id)] = is_healthy
+        self.updates.append((config_name, node_id, is_healthy))
+        return True, "Health status updated"
+
+
+def _manager(assignments, window=60):
+    from DNSFailoverManager import DNSFailoverManager
+    config_nodes = FakeConfigNodes(assignments)
+    dns_updates = []
+    manager = DNSFailoverManager(config_nodes, dns_updates.append,
+                                 unhealthy_threshold=3, healthy_threshold=2, coalesce_window=window)
+    return manager, config_nodes, dns_updates
+
+
+def test_hysteresis_thresholds():
+    """Test removal after K failures, re-add after M successes and damping of flaps"""
+    print("\nTesting health hysteresis...")
+    manager, config_nodes, dns_updates = _manager([('wg0', 'a')])
+
+    # Alternating results never reach either threshold
+    for healthy in [False, False, True, False, True, False, False, True] * 3:
+        assert manager.observe('a', healthy) is None
+    assert manager.isHealthy('a') is True
+
+    assert [manager.observe('a', False) for _ in range(3)] == [None, None, False]
+    assert manager.flush() == {'wg0'} and dns_updates == ['wg0']
+    assert config_nodes.assignments[('wg0', 'a')] is False
+
+    assert manager.observe('a', True) is None
+    assert manager.observe('a', True) is True
+    manager.flush()
+    assert dns_updates == ['wg0', 'wg0'] and config_nodes.assignments[('wg0', 'a')] is True
+
+    print("✓ Nodes change state only after K failed or M healthy checks in a row")
+    return True
+
+
+def test_transitions_coalesce_into_one_update():
+    """Test several nodes failing within the window cause one DNS update per configuration"""
+    print("\nTesting coalesced DNS updates...")
+    manager, config_nodes, dns_updates = _manager(
+        [('wg0', 'a'), ('wg0', 'b'), ('wg0', 'c'), ('wg1', 'c')], window=0.1
+    )
+
+    for _ in range(3):
+        for node_id in ('a', 'b', 'c'):
+            manager.observe(node_id, False)
+    assert dns_updates == [], "Updates must wait for the coalescing window"
+
+    deadline = time.monotonic() + 2
+    while len(dns_updates) < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert sorted(dns_updates) == ['wg0', 'wg1']
+    assert len(config_nodes.updates) == 4 and not any(update[2] for update in config_nodes.updates)
+
+    print("✓ Three node failures produced one DNS update per configuration")
+    return True
+
+
+def test_restart_state_and_reverted_transition():
+    """Test the stored health is the starting state and reverted transitions are dropped"""
+    print("\nTesting stored state and reverted transitions...")
+    manager, config_nodes, dns_updates = _manager([('wg0', 'a')])
+    config_nodes.assignments[('wg0', 'a')] = False
+
+    # Stored as unhealthy: failures are not a transition, two good checks re-add it
+    assert manager.observe('a', False) is None and manager.isHealthy('a') is False
+    manager.observe('a', True)
+    assert manager.observe('a', True) is True
+
+    # Goes down again before the window closes: nothing left to apply
+    for _ in range(3):
+        manager.observe('a', False)
+    assert manager.flush() == set() and dns_updates == []
+
+    print("✓ Stored health seeds the state machine and reverted transitions are dropped")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("DNS Failover Tests")
+    print("=" * 60)
+
+    tests = [
+        test_hysteresis_thresholds,
+        test_transitions_coalesce_into_one_update,
+        test_restart_state_and_reverted_transition,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
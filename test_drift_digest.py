@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Test script for indexed, parallel drift detection
+Tests the node peer query against configuration tables, digest agreement between
+panel and agent, and that a no-drift sweep costs one agent round trip per node
+"""
+
+import sys
+import os
+import time
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+# Add src/modules, src and wgdashboard-agent to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'modules'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'wgdashboard-agent'))
+
+import sqlalchemy
+
+
+def _make_configuration(name, peers):
+    """Build a WireguardConfiguration with the given (id, node_id, iface, allowed_ip, keepalive) peers"""
+    from modules.WireguardConfiguration import WireguardConfiguration
+
+    c = WireguardConfiguration.__new__(WireguardConfiguration)
+    c.Name = name
+    c.engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'wgdashboard.db')}")
+    c.metadata = sqlalchemy.MetaData()
+    c.DashboardConfig = MagicMock()
+    c.DashboardConfig.GetConfig.return_value = (True, 'sqlite')
+    c.createDatabase()
+    with c.engine.begin() as conn:
+        conn.execute(c.peersTable.insert(), [{
+            'id': peer_id, 'name': peer_id, 'node_id': node_id, 'iface': iface,
+            'allowed_ip': allowed_ip, 'keepalive': keepalive, 'preshared_key': ''
+        } for peer_id, node_id, iface, allowed_ip, keepalive in peers])
+    return c
+
+
+def _make_detector(configurations):
+    from DriftDetector import DriftDetector
+    return DriftDetector(MagicMock(), configurations)
+
+
+def test_node_peers_query():
+    """Test panel peers are read by node_id and interface across configurations"""
+    print("\nTesting indexed node peer query...")
+    detector = _make_detector({
+        'wg0': _make_configuration('wg0', [
+            ('a', 'node-1', 'wg0', '10.0.0.2/32, 10.0.1.0/24', 25),
+            ('b', 'node-1', 'wg1', '10.0.0.3/32', None),
+            ('c', 'node-2', 'wg0', '10.0.0.4/32', 0),
+        ]),
+        'wg1': _make_configuration('wg1', [('d', 'node-1', None, '10.1.0.2/32', 0)]),
+    })
+
+    peers = detector._getNodePeersFromDB('node-1')
+    assert sorted(peers) == ['a', 'b', 'd']
+    assert peers['a']['allowed_ips'] == ['10.0.0.2/32', '10.0.1.0/24']
+    assert peers['a']['persistent_keepalive'] == 25 and peers['b']['persistent_keepalive'] == 0
+    assert peers['d']['config_name'] == 'wg1'
+    # Peers without an interface belong to any interface of the node
+    assert sorted(detector._getNodePeersFromDB('node-1', 'wg0')) == ['a', 'd']
+
+    print("✓ Node peers are queried by node_id and interface")
+    return True
+
+
+def test_digest_matches_agent():
+    """Test the panel computes the same peer set digest as the agent"""
+    print("\nTesting digest agreement with the agent...")
+    import app as agent_app
+    from DriftDetector import DriftDetector
+
+    agent = agent_app.peer_set_digest([
+        ('key-b', ['10.0.0.3/32'], 0),
+        ('key-a', ['10.0.1.0/24', '10.0.0.2/32'], 25),
+    ])
+    panel = DriftDetector.peerSetDigest([
+        {'public_key': 'key-a', 'allowed_ips': ['10.0.0.2/32', '10.0.1.0/24'], 'persistent_keepalive': 25},
+        {'public_key': 'key-b', 'allowed_ips': ['10.0.0.3/32'], 'persistent_keepalive': 0},
+    ])
+    assert agent == panel
+    assert panel != DriftDetector.peerSetDigest([
+        {'public_key': 'key-a', 'allowed_ips': ['10.0.0.2/32'], 'persistent_keepalive': 25},
+        {'public_key': 'key-b', 'allowed_ips': ['10.0.0.3/32'], 'persistent_keepalive': 0},
+    ])
+
+    print("✓ Panel and agent digests agree")
+    return True
+
+
+def test_no_drift_sweep_is_one_round_trip_per_node():
+    """Test a sweep over 100 nodes without drift only fetches digests, concurrently"""
+    print("\nTesting 100-node drift sweep...")
+    from DriftDetector import DriftDetector
+
+    node_count = 100
+    latency = 0.05
+    peers = [(f'peer-{n}', f'node-{n}', 'wg0', f'10.0.{n}.2/32', 0) for n in range(node_count)]
+    detector = _make_detector({'wg0': _make_configuration('wg0', peers)})
+
+    drifted = 'node-7'
+    clients = {}
+    for n in range(node_count):
+        node_id = f'node-{n}'
+        agent_peers = [{'public_key': f'peer-{n}', 'allowed_ips': [f'10.0.{n}.2/32'], 'persistent_keepalive': 0}]
+        if node_id == drifted:
+            agent_peers.append({'public_key': 'stranger', 'allowed_ips': ['10.9.9.9/32'], 'persistent_keepalive': 0})
+
+        def get_digest(iface, agent_peers=agent_peers):
+            time.sleep(latency)
+            return True, {'digest': DriftDetector.peerSetDigest(agent_peers)}
+
+        def get_dump(iface, agent_peers=agent_peers):
+            time.sleep(latency)
+            return True, {'peers': agent_peers}
+
+        clients[node_id] = MagicMock(get_wg_digest=MagicMock(side_effect=get_digest),
+                                     get_wg_dump=MagicMock(side_effect=get_dump))
+
+    nodes_manager = MagicMock()
+    nodes_manager.getEnabledNodes.return_value = [
+        SimpleNamespace(id=f'node-{n}', wg_interface='wg0') for n in range(node_count)
+    ]
+    nodes_manager.getNodeAgentClient.side_effect = clients.get
+
+    started = time.monotonic()
+    results = detector.detectDriftForAllNodes(nodes_manager)
+    elapsed = time.monotonic() - started
+
+    assert len(results) == node_count
+    assert [node_id for node_id, r in results.items() if r['has_drift']] == [drifted]
+    assert results[drifted]['unknown_peers'][0]['public_key'] == 'stranger'
+    dumps = [node_id for node_id, client in clients.items() if client.get_wg_dump.called]
+    assert dumps == [drifted], "Full dumps must only be fetched on digest mismatch"
+    assert elapsed < node_count * latency / 4, f"Sweep is not concurrent: {elapsed:.2f}s"
+
+    print(f"✓ 100-node sweep in {elapsed:.2f}s with one full dump")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Drift Digest Tests")
+    print("=" * 60)
+
+    tests = [
+        test_node_peers_query,
+        test_digest_matches_agent,
+        test_no_drift_sweep_is_one_round_trip_per_node,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Test script for batch drift reconciliation
+Tests the agent's peer set merge, that 2,000 drifted peers are applied with one
+request and one `wg syncconf`, and that the panel sends one request per interface
+"""
+
+import sys
+import os
+import json
+import asyncio
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+# Add src/modules, src and wgdashboard-agent to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'modules'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'wgdashboard-agent'))
+
+from test_agent_operation_queue import _signed_headers
+from test_drift_digest import _make_configuration
+
+# showconf prints the live config; syncconf replaces it with the given file
+FAKE_WG = """#!/bin/sh
+echo "wg $*" >> "$FAKE_WG_LOG"
+if [ "$1" = "showconf" ]; then cat "$FAKE_WG_CONF"; fi
+if [ "$1" = "syncconf" ]; then cp "$3" "$FAKE_WG_CONF"; fi
+"""
+
+FAKE_WG_QUICK = """#!/bin/sh
+echo "wg-quick $*" >> "$FAKE_WG_LOG"
+"""
+
+INTERFACE = """[Interface]
+ListenPort = 51820
+PrivateKey = aW50ZXJmYWNlLXByaXZhdGUta2V5LW5vdC1yZWFsLTAwMA=
+
+"""
+
+
+def _peer_section(public_key, allowed_ip, keepalive=0):
+    section = f"[Peer]\nPublicKey = {public_key}\nAllowedIPs = {allowed_ip}\nEndpoint = 198.51.100.1:51820\n"
+    if keepalive:
+        section += f"PersistentKeepalive = {keepalive}\n"
+    return section + "\n"
+
+
+def _install_fake_binaries(directory, live_config):
+    for name, body in (('wg', FAKE_WG), ('wg-quick', FAKE_WG_QUICK)):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as f:
+            f.write(body)
+        os.chmod(path, 0o755)
+    log_path = os.path.join(directory, 'calls.log')
+    open(log_path, 'w').close()
+    conf_path = os.path.join(directory, 'wg0.conf')
+    with open(conf_path, 'w') as f:
+        f.write(live_config)
+    os.environ['FAKE_WG_LOG'] = log_path
+    os.environ['FAKE_WG_CONF'] = conf_path
+    os.environ['PATH'] = directory + os.pathsep + os.environ.get('PATH', '')
+    return log_path, conf_path
+
+
+def test_plan_merges_desired_set():
+    """Test the agent-side merge classifies and keeps peers correctly"""
+    print("\nTesting peer set merge...")
+    import app as agent_app
+
+    interface_lines, current = agent_app.parse_wg_showconf(
+        INTERFACE + _peer_section('same', '10.0.0.2/32') + _peer_section('changed', '10.0.0.3/32', 25)
+        + _peer_section('stranger', '10.0.0.9/32')
+    )
+    assert interface_lines[1].startswith('PrivateKey') and sorted(current) == ['changed', 'same', 'stranger']
+
+    desired = [
+        {'public_key': 'same', 'allowed_ips': ['10.0.0.2/32'], 'persistent_keepalive': 0},
+        {'public_key': 'changed', 'allowed_ips': ['10.0.0.3/32'], 'persistent_keepalive': 0},
+        {'public_key': 'new', 'allowed_ips': ['10.0.0.4/32'], 'persistent_keepalive': 25},
+    ]
+    merged, summary = agent_app.plan_peer_reconcile(current, desired)
+    assert summary == {'added': ['new'], 'updated': ['changed'], 'removed': [], 'unchanged': 1}
+    assert 'stranger' in merged, "Unknown peers are kept unless remove_unknown is set"
+    assert 'PersistentKeepalive' not in merged['changed'] and merged['changed']['Endpoint']
+
+    merged, summary = agent_app.plan_peer_reconcile(current, desired, update_mismatched=False, remove_unknown=True)
+    assert summary['removed'] == ['stranger'] and summary['updated'] == []
+    assert merged['changed']['PersistentKeepalive'] == '25'
+
+    print("✓ Desired peers are added, updated and unknown peers kept or removed")
+    return True
+
+
+def test_two_thousand_peers_one_sync():
+    """Test reconciling 2,000 drifted peers costs one request, one syncconf and one save"""
+    print("\nTesting 2,000-peer batch reconcile against fake wg binary...")
+    import httpx
+    import app as agent_app
+
+    peer_count = 2000
+    live = INTERFACE + ''.join(
+        _peer_section(f'peer-{i:05d}', f'10.0.{i // 256}.{i % 256}/32') for i in range(0, peer_count, 2)
+    ) + _peer_section('stranger', '10.9.9.9/32')
+    desired = [{
+        'public_key': f'peer-{i:05d}', 'allowed_ips': [f'10.0.{i // 256}.{i % 256}/32'], 'persistent_keepalive': 25
+    } for i in range(peer_count)]
+
+    original_path = os.environ.get('PATH', '')
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path, conf_path = _install_fake_binaries(tmp, live)
+        try:
+            async def reconcile():
+                transport = httpx.ASGITransport(app=agent_app.app)
+                async with httpx.AsyncClient(transport=transport, base_url='http://agent') as client:
+                    path = '/v1/wg/wg0/peers/reconcile'
+                    body = json.dumps({'peers': desired, 'remove_unknown': True})
+                    headers = _signed_headers(agent_app.SHARED_SECRET, 'POST', path, body)
+                    return await client.post(path, content=body, headers=headers)
+
+            response = asyncio.run(reconcile())
+            assert response.status_code == 200, response.text
+            summary = response.json()
+            assert len(summary['added']) == 1000 and len(summary['updated']) == 1000
+            assert summary['removed'] == ['stranger']
+
+            with open(log_path) as f:
+                calls = f.read().splitlines()
+            assert [c.split()[1] for c in calls if c.startswith('wg ')] == ['showconf', 'syncconf']
+            assert calls.count('wg-quick save wg0') == 1
+
+            with open(conf_path) as f:
+                applied = f.read()
+            assert 'PrivateKey = ' in applied, "Interface settings must be kept"
+            _, peers = agent_app.parse_wg_showconf(applied)
+            assert len(peers) == peer_count and all(p['PersistentKeepalive'] == '25' for p in peers.values())
+        finally:
+            os.environ['PATH'] = original_path
+
+    print("✓ 2,000 drifted peers applied with one request and one syncconf")
+    return True
+
+
+def test_panel_sends_one_request_per_interface():
+    """Test DriftDetector.reconcileNode sends each interface's full desired set once"""
+    print("\nTesting panel batch reconcile...")
+    from DriftDetector import DriftDetector
+
+    detector = DriftDetector(MagicMock(), {'wg0': _make_configuration('wg0', [
+        (f'peer-{i}', 'node-1', 'wg0' if i % 2 else 'wg1', f'10.0.0.{i}/32', 0) for i in range(1, 9)
+    ])})
+    client = MagicMock()
+    client.reconcile_peers.side_effect = lambda iface, peers, *flags: (True, {
+        'added': [p['public_key'] for p in peers], 'updated': [], 'removed': [], 'unchanged': 0
+    }) if iface == 'wg0' else (False, 'HTTP 500: boom')
+
+    results = detector.reconcileNode(SimpleNamespace(id='node-1'), client, ['wg0', 'wg1'], remove_unknown=True)
+    assert client.reconcile_peers.call_count == 2
+    iface, peers, add_missing, update_mismatched, remove_unknown = client.reconcile_peers.call_args_list[0].args
+    assert iface == 'wg0' and len(peers) == 4 and remove_unknown is True
+    assert sorted(results['added']) == ['peer-1', 'peer-3', 'peer-5', 'peer-7']
+    assert results['errors'] == [{'interface': 'wg1', 'action': 'reconcile', 'error': 'HTTP 500: boom'}]
+
+    print("✓ One reconcile request per interface with errors reported per interface")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Batch Drift Reconcile Tests")
+    print("=" * 60)
+
+    tests = [
+        test_plan_merges_desired_set,
+        test_two_thousand_peers_one_sync,
+        test_panel_sends_one_request_per_interface,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
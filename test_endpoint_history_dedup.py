@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test script for the deduplicated endpoint history
+Tests that every poll cycle records the endpoints with one upsert, that a roaming
+peer keeps one row per endpoint with its first and last sighting, that older
+histories are merged by the schema migration, and that retention follows last_seen
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import sqlalchemy
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from configuration_fixtures import make_configuration, make_engine
+
+
+def _peer(c, peer_id):
+    from modules.Peer import Peer
+
+    peer = Peer.__new__(Peer)
+    peer.id, peer.configuration = peer_id, c
+    return peer
+
+
+def test_roaming_peer_keeps_one_row_per_endpoint():
+    """Test a peer flipping between two networks is recorded with one upsert per cycle"""
+    print("\nTesting endpoint upserts...")
+    engine = make_engine()
+    c = make_configuration(engine)
+    c.Peers = [SimpleNamespace(id='peer-a', status='running', endpoint='203.0.113.7:51820'),
+               SimpleNamespace(id='peer-b', status='running', endpoint='(none)'),
+               SimpleNamespace(id='peer-c', status='stopped', endpoint='192.0.2.1:51820')]
+
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, context, executemany: statements.append(statement)
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        for cycle in range(10):
+            c.Peers[0].endpoint = '203.0.113.7:51820' if cycle % 2 == 0 else f'198.51.100.9:{40000 + cycle}'
+            assert c.logPeersHistoryEndpoint() == 1
+    finally:
+        sqlalchemy.event.remove(engine, 'before_cursor_execute', listener)
+
+    assert len(statements) == 10 and all('ON CONFLICT' in s for s in statements)
+    assert c.getHistoricalEndpointTableSize() == 2
+    endpoints = _peer(c, 'peer-a').getEndpoints()
+    assert [(e['endpoint'], e['seen_count']) for e in endpoints] == [('198.51.100.9', 5), ('203.0.113.7', 5)]
+    assert endpoints[0]['first_seen'] < endpoints[0]['last_seen']
+    assert _peer(c, 'peer-c').getEndpoints() == []
+
+    print("✓ Ten cycles of a roaming peer left two rows")
+    return True
+
+
+def test_older_history_is_merged():
+    """Test the migration fills in the sightings and merges duplicate rows"""
+    print("\nTesting endpoint history migration...")
+    engine = make_engine()
+    with engine.begin() as conn:
+        conn.exec_driver_sql('CREATE TABLE "wg0_history_endpoint" (id VARCHAR(255) NOT NULL, '
+                             'endpoint VARCHAR(255) NOT NULL, time DATETIME)')
+        conn.exec_driver_sql('CREATE INDEX ix_wg0_history_endpoint_id_endpoint ON wg0_history_endpoint (id, endpoint)')
+        conn.exec_driver_sql("INSERT INTO wg0_history_endpoint VALUES "
+                             "('peer-a', '203.0.113.7', '2026-09-01 10:00:00.000000'), "
+                             "('peer-a', '203.0.113.7', '2026-09-03 10:00:00.000000'), "
+                             "('peer-a', '198.51.100.9', '2026-09-02 10:00:00.000000')")
+
+    c = make_configuration(engine)
+    assert {i['name']: i['unique'] for i in sqlalchemy.inspect(engine).get_indexes('wg0_history_endpoint')} == \
+           {'ux_wg0_history_endpoint_id_endpoint': 1, 'ix_wg0_history_endpoint_time': 0}
+    assert c.getHistoricalEndpointTableSize() == 2
+    merged = {e['endpoint']: e for e in _peer(c, 'peer-a').getEndpoints()}
+    assert (merged['203.0.113.7']['first_seen'], merged['203.0.113.7']['last_seen'], merged['203.0.113.7']['seen_count']) \
+           == (datetime(2026, 9, 1, 10), datetime(2026, 9, 3, 10), 2)
+    assert merged['198.51.100.9']['seen_count'] == 1
+
+    c.Peers = [SimpleNamespace(id='peer-a', status='running', endpoint='203.0.113.7:51820')]
+    c.logPeersHistoryEndpoint()
+    assert _peer(c, 'peer-a').getEndpoints()[0]['seen_count'] == 3
+
+    print("✓ Three legacy rows were merged into two")
+    return True
+
+
+def test_retention_follows_last_seen():
+    """Test expiring the history keeps an endpoint first seen long ago but still in use"""
+    print("\nTesting endpoint retention...")
+    engine = make_engine()
+    c = make_configuration(engine)
+    now = datetime.now()
+    with engine.begin() as conn:
+        c.peersHistoryEndpointPartitions.insert(conn, [
+            {'id': 'peer-a', 'endpoint': '203.0.113.7', 'time': now - timedelta(days=90),
+             'first_seen': now - timedelta(days=90), 'last_seen': now - timedelta(days=90), 'seen_count': 1},
+            {'id': 'peer-a', 'endpoint': '198.51.100.9', 'time': now - timedelta(days=90),
+             'first_seen': now - timedelta(days=90), 'last_seen': now - timedelta(days=90), 'seen_count': 1}])
+    c.Peers = [SimpleNamespace(id='peer-a', status='running', endpoint='203.0.113.7:51820')]
+    c.logPeersHistoryEndpoint()
+
+    with engine.begin() as conn:
+        assert c.peersHistoryEndpointPartitions.dropBefore(conn, now - timedelta(days=30)) == 1
+    assert [e['endpoint'] for e in _peer(c, 'peer-a').getEndpoints()] == ['203.0.113.7']
+
+    print("✓ Only the endpoint not seen for 90 days was expired")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Endpoint History Tests")
+    print("=" * 60)
+
+    tests = [
+        test_roaming_peer_keeps_one_row_per_endpoint,
+        test_older_history_is_merged,
+        test_retention_follows_last_seen,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Test script for the keyset pagination of the audit, job and webhook session logs
+Tests that paging on (time, id) returns every row exactly once in order even when
+rows share a timestamp, that the filters are applied in the query, that page sizes
+are capped, that older tables get the indexes and that deep pages are read with a
+range seek on them according to SQLite's query plans
+"""
+
+import sys
+import os
+import uuid
+import tempfile
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import sqlalchemy
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+
+def _dashboard_config(engine):
+    from modules.DashboardConfig import DashboardConfig
+
+    config = DashboardConfig.__new__(DashboardConfig)
+    config.engine = engine
+    config.dbMetadata = sqlalchemy.MetaData()
+    config.GetConfig = lambda section, key: (True, 'sqlite')
+    config._DashboardConfig__createAuditLogTable()
+    return config
+
+
+def _pages(read, **filters):
+    rows, cursor, pages = [], None, 0
+    while True:
+        page, cursor = read(cursor=cursor, **filters)
+        rows.extend(page)
+        pages += 1
+        if cursor is None:
+            return rows, pages
+
+
+def test_audit_log_pages():
+    """Test audit logs are paged newest first without gaps or repeats and filtered by action and user"""
+    print("\nTesting audit log pages...")
+    from modules.AuditLogManager import AuditLogManager
+    from modules.LogPagination import InvalidCursorException, MAX_PAGE_SIZE
+
+    engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'wgdashboard.db')}")
+    with engine.begin() as conn:
+        # An older version created the table without indexes
+        conn.exec_driver_sql('CREATE TABLE "AuditLog" (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp DATETIME, '
+                             'action VARCHAR(100) NOT NULL, entity_type VARCHAR(50) NOT NULL, '
+                             'entity_id VARCHAR(255), details TEXT, user VARCHAR(255))')
+    config = _dashboard_config(engine)
+    assert {'ix_AuditLog_timestamp_id', 'ix_AuditLog_action_timestamp_id', 'ix_AuditLog_user_timestamp_id',
+            'ix_AuditLog_entity_timestamp_id'} <= {i['name'] for i in sqlalchemy.inspect(engine).get_indexes('AuditLog')}
+
+    start = datetime(2026, 10, 1)
+    with engine.begin() as conn:
+        conn.execute(config.auditLogTable.insert(), [
+            {'timestamp': start + timedelta(minutes=i // 4), 'action': 'dns_updated' if i % 3 else 'node_added',
+             'entity_type': 'dns_record', 'entity_id': f'wg{i % 5}', 'user': 'admin' if i % 2 else 'system'}
+            for i in range(1050)])
+        conn.exec_driver_sql('ANALYZE')
+    manager = AuditLogManager(config)
+
+    rows, pages = _pages(lambda **kw: manager.get_logs(limit=100, **kw))
+    assert pages == 11 and [r.id for r in rows] == list(range(1050, 0, -1))
+    rows, _ = _pages(lambda **kw: manager.get_logs(limit=40, **kw), action='node_added', user='admin')
+    assert rows and [r.id for r in rows] == [i + 1 for i in range(1049, -1, -1) if i % 3 == 0 and i % 2]
+
+    page, cursor = manager.get_logs(limit=100000)
+    assert len(page) == MAX_PAGE_SIZE and cursor is not None
+    try:
+        manager.get_logs(cursor='not-a-cursor')
+        assert False, "An invalid cursor is rejected"
+    except InvalidCursorException:
+        pass
+
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, context, executemany: \
+        statements.append((statement, parameters))
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', listener)
+    manager.get_logs(limit=50, cursor=cursor)
+    manager.get_logs(limit=50, cursor=cursor, action='dns_updated')
+    sqlalchemy.event.remove(engine, 'before_cursor_execute', listener)
+    with engine.connect() as conn:
+        plans = [' | '.join(row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {s}', p).fetchall())
+                 for s, p in statements]
+    assert 'SEARCH AuditLog USING INDEX ix_AuditLog_timestamp_id (timestamp<?)' in plans[0], plans
+    assert 'SEARCH AuditLog USING INDEX ix_AuditLog_action_timestamp_id (action=? AND timestamp<?)' in plans[1], plans
+    assert all('TEMP B-TREE' not in p for p in plans), plans
+
+    print(f"✓ 1,050 entries read in {pages} pages with range seeks")
+    return True
+
+
+def test_job_log_pages():
+    """Test job logs are paged per configuration and filtered by status and job"""
+    print("\nTesting job log pages...")
+    import modules.PeerJobLogger as PeerJobLoggerModule
+    from modules.PeerJobLogger import PeerJobLogger
+
+    directory = tempfile.mkdtemp()
+    PeerJobLoggerModule.ConnectionString = lambda database: f"sqlite:///{os.path.join(directory, database + '.db')}"
+    jobs = MagicMock()
+    jobs.getAllJobs.side_effect = lambda configName: \
+        [MagicMock(JobID=j) for j in (['job-a', 'job-b'] if configName == 'wg0' else ['job-c'])]
+    config = MagicMock()
+    config.GetConfig.return_value = (True, 'sqlite')
+    logger = PeerJobLogger(jobs, config)
+
+    with logger.engine.begin() as conn:
+        conn.execute(logger.jobLogTable.insert(), [
+            {'LogID': str(uuid.uuid4()), 'JobID': ('job-a', 'job-b', 'job-c')[i % 3],
+             'LogDate': datetime(2026, 10, 1) + timedelta(seconds=i // 2), 'Status': i % 4 != 0, 'Message': f'run {i}'}
+            for i in range(600)])
+
+    rows, pages = _pages(lambda **kw: logger.getLogs('wg0', limit=50, **kw))
+    assert len(rows) == 400 and pages == 8 and len({r.LogID for r in rows}) == 400
+    assert [r.LogDate for r in rows] == sorted((r.LogDate for r in rows), reverse=True)
+    failed, _ = _pages(lambda **kw: logger.getLogs('wg0', limit=50, **kw), status=False)
+    assert len(failed) == 100 and {r.Message for r in failed} == {f'run {i}' for i in range(0, 600, 4) if i % 3 != 2}
+    only, _ = _pages(lambda **kw: logger.getLogs('wg0', limit=500, **kw), JobID='job-b', status=True)
+    assert len(only) == 150 and {r.JobID for r in only} == {'job-b'}
+    assert logger.getLogs('wg0', JobID='job-c') == ([], None)
+    assert {r['JobID'] for r in logger.getFailingJobs()} == {'job-a', 'job-b', 'job-c'}
+
+    print(f"✓ 400 job logs read in {pages} pages, 100 failed runs filtered in the query")
+    return True
+
+
+def test_webhook_session_pages():
+    """Test webhook sessions are paged per webhook and filtered by status"""
+    print("\nTesting webhook session pages...")
+    import modules.DashboardWebHooks as DashboardWebHooksModule
+    from modules.DashboardWebHooks import DashboardWebHooks, WebHook
+
+    path = os.path.join(tempfile.mkdtemp(), 'wgdashboard.db')
+    DashboardWebHooksModule.ConnectionString = lambda database: f"sqlite:///{path}"
+    config = MagicMock()
+    config.GetConfig.return_value = (False, None)
+    webhooks = DashboardWebHooks(config, workers=1)
+    try:
+        with webhooks.engine.begin() as conn:
+            conn.execute(webhooks.webHookSessionsTable.insert(), [
+                {'WebHookSessionID': str(uuid.uuid4()), 'WebHookID': 'hook-a' if i % 4 else 'hook-b',
+                 'StartDate': datetime(2026, 10, 1) + timedelta(seconds=i // 3), 'Status': i % 2, 'Logs': {'Logs': []}}
+                for i in range(800)])
+
+        sessions, pages = _pages(lambda **kw: webhooks.GetWebHookSessions(WebHook(WebHookID='hook-a'), limit=100, **kw))
+        assert len(sessions) == 600 and pages == 6 and len({s['WebHookSessionID'] for s in sessions}) == 600
+        failed, _ = _pages(lambda **kw: webhooks.GetWebHookSessions(WebHook(WebHookID='hook-a'), **kw), status=1)
+        assert len(failed) == 400 and {s['Status'] for s in failed} == {1}
+        assert {i['name'] for i in sqlalchemy.inspect(webhooks.engine).get_indexes('DashboardWebHookSessions')} == \
+               {'ix_DashboardWebHookSessions_WebHookID_StartDate_ID'}
+    finally:
+        webhooks.Shutdown()
+
+    print(f"✓ 600 sessions read in {pages} pages")
+    return True
+
+
+def test_unpaged_reads():
+    """Test the unpaged list responses read every page, or only the rows up to offset plus limit"""
+    print("\nTesting unpaged reads...")
+    from modules.AuditLogManager import AuditLogManager
+    from modules.LogPagination import ReadPages, MAX_PAGE_SIZE
+
+    engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'wgdashboard.db')}")
+    config = _dashboard_config(engine)
+    with engine.begin() as conn:
+        conn.execute(config.auditLogTable.insert(), [
+            {'timestamp': datetime(2026, 10, 1) + timedelta(seconds=i), 'action': 'dns_updated',
+             'entity_type': 'dns_record', 'entity_id': f'wg{i}'} for i in range(1200)])
+    manager = AuditLogManager(config)
+
+    reads = []
+    def read(cursor):
+        reads.append(cursor)
+        return manager.get_logs(limit=MAX_PAGE_SIZE, cursor=cursor)
+    rows = ReadPages(read)
+    assert [r.id for r in rows] == list(range(1200, 0, -1)) and len(reads) == 3
+    reads.clear()
+    rows = ReadPages(read, 120)
+    assert [r.id for r in rows] == list(range(1200, 1080, -1)) and len(reads) == 1
+    assert ReadPages(lambda cursor: ([], None)) == []
+
+    print("✓ 1,200 entries read in 3 pages, 120 entries in one")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Log Pagination Tests")
+    print("=" * 60)
+
+    tests = [
+        test_audit_log_pages,
+        test_job_log_pages,
+        test_webhook_session_pages,
+        test_unpaged_reads,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared write-behind log queue
+Tests that dashboard and job log rows are written by the background writer in
+batched transactions while logging stays as cheap as an append, that audit rows
+bypass the queue, that the overflow policies drop or block as configured with
+their counters, that failed writes are retried a bounded number of times, and
+that shutdown writes every queued row
+"""
+
+import sys
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock
+
+import sqlalchemy
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+
+def _dashboard_config():
+    config = MagicMock()
+    config.GetConfig.side_effect = lambda section, key: (True, 'sqlite') if key == 'type' else (False, None)
+    return config
+
+
+def _table():
+    engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'log.db')}")
+    table = sqlalchemy.Table('TestLog', sqlalchemy.MetaData(),
+                             sqlalchemy.Column('LogID', sqlalchemy.Integer, primary_key=True),
+                             sqlalchemy.Column('Message', sqlalchemy.Text))
+    table.metadata.create_all(engine)
+    return engine, table
+
+
+def _count(engine, table):
+    with engine.connect() as conn:
+        return conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(table)).scalar()
+
+
+def test_loggers_write_in_batches():
+    """Test the loggers share the queue, a slow database does not slow down logging and audit rows are not queued"""
+    print("\nTesting batched log writes...")
+    import modules.DashboardLogger as DashboardLoggerModule
+    import modules.PeerJobLogger as PeerJobLoggerModule
+    from modules.DashboardLogger import DashboardLogger
+    from modules.PeerJobLogger import PeerJobLogger
+    from modules.AuditLogManager import AuditLogManager
+    from modules.LogQueue import LogQueue
+
+    directory = tempfile.mkdtemp()
+    connection = lambda database: f"sqlite:///{os.path.join(directory, database + '.db')}"
+    DashboardLoggerModule.ConnectionString = connection
+    PeerJobLoggerModule.ConnectionString = connection
+    config = _dashboard_config()
+    config.engine = sqlalchemy.create_engine(connection('wgdashboard'))
+    config.auditLogTable = sqlalchemy.Table(
+        'AuditLog', sqlalchemy.MetaData(),
+        sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True, autoincrement=True),
+        sqlalchemy.Column('timestamp', sqlalchemy.DATETIME),
+        *[sqlalchemy.Column(c, sqlalchemy.String(255)) for c in ('action', 'entity_type', 'entity_id', 'details', 'user')])
+    config.auditLogTable.metadata.create_all(config.engine)
+
+    queue = LogQueue(config, batchSize=500, flushInterval=0.05)
+    dashboardLogger = DashboardLogger(queue)
+    jobLogger = PeerJobLogger(MagicMock(), config, queue)
+    auditLog = AuditLogManager(config)
+
+    statements = []
+    def slow(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, executemany))
+        time.sleep(0.2)
+    sqlalchemy.event.listen(dashboardLogger.engine, 'before_cursor_execute', slow)
+    start = time.perf_counter()
+    for i in range(1200):
+        assert dashboardLogger.log('/api/test', '127.0.0.1', Message=f'request {i}')
+        jobLogger.log('job-1', Message=f'job {i}')
+    elapsed = time.perf_counter() - start
+    assert elapsed < 2.0, f"Logging took {elapsed:.2f}s"
+
+    # Audit rows journal migrations, they are written before log returns and never dropped
+    for i in range(20):
+        assert auditLog.log('node_added', 'config_node', f'node-{i}') == (True, "Audit log created")
+    assert _count(config.engine, config.auditLogTable) == 20
+    assert auditLog.get_logs(limit=1)[0][0].entity_id == 'node-19'
+
+    assert queue.flush(timeout=30)
+    sqlalchemy.event.remove(dashboardLogger.engine, 'before_cursor_execute', slow)
+    assert _count(dashboardLogger.engine, dashboardLogger.dashboardLoggerTable) == 1201
+    assert _count(jobLogger.engine, jobLogger.jobLogTable) == 1200
+    inserts = [s for s in statements if s[0].startswith('INSERT')]
+    assert all(many for _, many in inserts) and len(inserts) <= 20, len(inserts)
+    stats = queue.getStats()
+    assert (stats['Flushed'], stats['Dropped'], stats['Failed'], stats['QueueDepth']) == (2401, 0, 0, 0)
+
+    print(f"✓ 2,400 rows logged in {elapsed * 1000:.0f}ms, written in {stats['Batches']} batches")
+    return True
+
+
+def test_overflow_policies():
+    """Test a full queue drops its oldest rows or blocks up to the timeout, and counts what it dropped"""
+    print("\nTesting overflow policies...")
+    from modules.LogQueue import LogQueue
+
+    engine, table = _table()
+    release = threading.Event()
+    hold = lambda conn, cursor, statement, parameters, context, executemany: release.wait(10)
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', hold)
+
+    queue = LogQueue(_dashboard_config(), maxSize=10, batchSize=5, flushInterval=0)
+    queue.put(engine, table, {'Message': 'first'})
+    while queue.getStats()['QueueDepth']:
+        time.sleep(0.01)
+    assert all(queue.put(engine, table, {'Message': f'row {i}'}) for i in range(30))
+    assert queue.getStats()['Dropped'] == 20
+    release.set()
+    assert queue.flush(timeout=10)
+    with engine.connect() as conn:
+        messages = [r[0] for r in conn.execute(sqlalchemy.select(table.c.Message).order_by(table.c.LogID))]
+    assert messages == ['first'] + [f'row {i}' for i in range(20, 30)]
+
+    release.clear()
+    blocking = LogQueue(_dashboard_config(), maxSize=3, overflow='block', batchSize=1, flushInterval=0, blockTimeout=0.2)
+    blocking.put(engine, table, {'Message': 'first'})
+    while blocking.getStats()['QueueDepth']:
+        time.sleep(0.01)
+    assert all(blocking.put(engine, table, {'Message': 'queued'}) for _ in range(3))
+    start = time.perf_counter()
+    assert not blocking.put(engine, table, {'Message': 'late'})
+    assert time.perf_counter() - start >= 0.2
+    threading.Timer(0.1, release.set).start()
+    assert blocking.put(engine, table, {'Message': 'waited'})
+    assert blocking.flush(timeout=10)
+    sqlalchemy.event.remove(engine, 'before_cursor_execute', hold)
+    stats = blocking.getStats()
+    assert (stats['Flushed'], stats['Dropped']) == (5, 1)
+
+    try:
+        LogQueue(_dashboard_config(), overflow='drop_newest')
+        assert False, "An unknown policy is rejected"
+    except ValueError:
+        pass
+
+    print("✓ drop_oldest kept the newest 10 rows, block dropped one row after its timeout")
+    return True
+
+
+def test_failed_writes_are_retried():
+    """Test rows of a failed transaction are written again, and dropped and reported after the last attempt"""
+    print("\nTesting failed writes...")
+    from modules.LogQueue import LogQueue
+
+    engine, table = _table()
+    broken, brokenTable = _table()
+    failures = []
+    def fail(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT') and len(failures) < 2:
+            failures.append(statement)
+            raise RuntimeError("database is locked")
+    def full(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT'):
+            raise RuntimeError("disk full")
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', fail)
+    sqlalchemy.event.listen(broken, 'before_cursor_execute', full)
+
+    queue = LogQueue(_dashboard_config(), batchSize=100, flushInterval=0.05)
+    queue.RETRY_INTERVAL = 0.01
+    queue.logger = MagicMock()
+    for i in range(50):
+        assert queue.put(engine, table, {'Message': f'row {i}'})
+        assert queue.put(broken, brokenTable, {'Message': f'lost {i}'})
+    assert queue.flush(timeout=10)
+
+    assert len(failures) == 2 and _count(engine, table) == 50
+    with engine.connect() as conn:
+        messages = [r[0] for r in conn.execute(sqlalchemy.select(table.c.Message).order_by(table.c.LogID))]
+    assert messages == [f'row {i}' for i in range(50)], "Retried rows keep their order"
+    stats = queue.getStats()
+    assert (stats['Flushed'], stats['Failed'], stats['QueueDepth']) == (50, 50, 0), stats
+    assert any('dropped 50 rows' in call.args[0] for call in queue.logger.error.call_args_list)
+    queue.shutdown()
+
+    print("✓ 50 rows written on their third attempt, 50 rows of a broken database dropped and reported")
+    return True
+
+
+def test_shutdown_writes_queued_rows():
+    """Test shutdown writes the rows waiting for the next batch and later rows are written directly"""
+    print("\nTesting shutdown flush...")
+    from modules.LogQueue import LogQueue
+
+    engine, table = _table()
+    queue = LogQueue(_dashboard_config(), batchSize=1000, flushInterval=60)
+    for i in range(250):
+        queue.put(engine, table, {'Message': f'row {i}'})
+    time.sleep(0.1)
+    assert _count(engine, table) == 0, "Rows wait for the batch to fill"
+
+    queue.shutdown()
+    assert _count(engine, table) == 250
+    assert queue.put(engine, table, {'Message': 'after shutdown'})
+    assert _count(engine, table) == 251
+    assert queue.getStats()['Flushed'] == 251
+
+    print("✓ 250 queued rows were written on shutdown")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Log Queue Tests")
+    print("=" * 60)
+
+    tests = [
+        test_loggers_write_in_batches,
+        test_overflow_policies,
+        test_failed_writes_are_retried,
+        test_shutdown_writes_queued_rows,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Test script for ingesting node agent dumps into node-hosted peer rows
+Tests observation columns, change detection, counter resets and that
+ingested peers are picked up by <config>_transfer logging
+"""
+
+import sys
+import os
+import time
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+import sqlalchemy
+
+
+def _make_configuration(peer_count):
+    """Build a WireguardConfiguration backed by in-memory sqlite with node-hosted peers"""
+    from modules.WireguardConfiguration import WireguardConfiguration
+    from modules.Peer import Peer
+
+    c = WireguardConfiguration.__new__(WireguardConfiguration)
+    c.Name = 'wg-test'
+    c.engine = sqlalchemy.create_engine('sqlite://')
+    c.metadata = sqlalchemy.MetaData()
+    c.DashboardConfig = MagicMock()
+    c.DashboardConfig.GetConfig.return_value = (True, 'sqlite')
+    c.AllPeerJobs = MagicMock()
+    c.AllPeerShareLinks = MagicMock()
+    c._WireguardConfiguration__nodeObservations = {}
+    c.createDatabase()
+
+    rows = [{
+        'id': f'peer{i:05d}', 'private_key': '', 'DNS': '', 'endpoint_allowed_ip': '', 'name': '',
+        'total_receive': 0, 'total_sent': 0, 'total_data': 0, 'endpoint': 'N/A', 'status': 'stopped',
+        'latest_handshake': 'N/A', 'allowed_ip': '', 'cumu_receive': 0, 'cumu_sent': 0, 'cumu_data': 0,
+        'mtu': 1420, 'keepalive': 0, 'remote_endpoint': '', 'preshared_key': '',
+        'node_id': 'node-1', 'iface': 'wg0'
+    } for i in range(peer_count)]
+    with c.engine.begin() as conn:
+        conn.execute(c.peersTable.insert(), rows)
+
+    def reload():
+        with c.engine.connect() as conn:
+            c.Peers = [Peer(row, c) for row in conn.execute(c.peersTable.select()).mappings().fetchall()]
+    reload()
+    return c, reload
+
+
+def _dump(peer_count, now, rx=1024 ** 3):
+    return [{
+        'public_key': f'peer{i:05d}', 'endpoint': f'198.51.100.{i % 250}:51820',
+        'latest_handshake': now - 30 if i % 2 == 0 else 0,
+        'transfer_rx': rx, 'transfer_tx': rx // 2
+    } for i in range(peer_count)]
+
+
+def test_dump_updates_observations_and_status():
+    """Test a dump is mapped onto node-hosted peers with derived totals and status"""
+    print("\nTesting node dump ingestion...")
+    c, reload = _make_configuration(10)
+    now = int(time.time())
+
+    changed = c.ingestNodeDump('node-1', 'wg0', _dump(10, now))
+    assert len(changed) == 10
+    assert c.ingestNodeDump('node-2', 'wg0', _dump(10, now)) == [], "Peers of other nodes must not match"
+
+    reload()
+    peer = next(p for p in c.Peers if p.id == 'peer00000')
+    assert peer.status == 'running' and peer.rx_obs == 1.0 and peer.tx_obs == 0.5
+    assert peer.total_receive == 1.0 and peer.endpoint == '198.51.100.0:51820'
+    assert peer.handshake_obs == str(now - 30) and peer.latest_handshake.startswith('0:00:')
+    idle = next(p for p in c.Peers if p.id == 'peer00001')
+    assert idle.status == 'stopped' and idle.latest_handshake == 'No Handshake'
+
+    print("✓ Dump observations, totals and status are applied per peer")
+    return True
+
+
+def test_change_detection_and_counter_reset():
+    """Test unchanged peers are skipped and counter resets are banked into cumulative totals"""
+    print("\nTesting change detection...")
+    c, reload = _make_configuration(1000)
+    now = int(time.time())
+    dump = _dump(1000, now)
+
+    assert len(c.ingestNodeDump('node-1', 'wg0', dump)) == 1000
+    assert c.ingestNodeDump('node-1', 'wg0', dump) == [], "Unchanged peers were rewritten"
+
+    dump[3]['transfer_rx'] += 1024 ** 3
+    dump[7]['latest_handshake'] = now - 10
+    assert sorted(c.ingestNodeDump('node-1', 'wg0', dump)) == ['peer00003', 'peer00007']
+
+    # Counters restart on the node after an interface re-create
+    dump[3]['transfer_rx'] = 0
+    dump[3]['transfer_tx'] = 0
+    assert c.ingestNodeDump('node-1', 'wg0', dump) == ['peer00003']
+    reload()
+    peer = next(p for p in c.Peers if p.id == 'peer00003')
+    assert peer.total_receive == 0 and peer.cumu_receive == 2.0 and peer.cumu_sent == 0.5
+
+    print("✓ Only changed peers are written and resets keep cumulative usage")
+    return True
+
+
+def test_ingested_peers_feed_transfer_logging():
+    """Test running node-hosted peers are logged by logPeersTraffic"""
+    print("\nTesting transfer logging of node-hosted peers...")
+    c, reload = _make_configuration(6)
+    c.ingestNodeDump('node-1', 'wg0', _dump(6, int(time.time())))
+    reload()
+    c.logPeersTraffic()
+
+    with c.engine.connect() as conn:
+        logged = conn.execute(sqlalchemy.select(c.peersTransferTable.c.id)).scalars().all()
+    assert sorted(logged) == ['peer00000', 'peer00002', 'peer00004']
+
+    print("✓ Running node-hosted peers are logged to the transfer table")
+    return True
+
+
+def test_node_peers_get_sessions():
+    """Test node-hosted peers open and close sessions from their dump handshakes"""
+    print("\nTesting node peer sessions...")
+    c, reload = _make_configuration(10)
+    now = int(time.time())
+
+    c.ingestNodeDump('node-1', 'wg0', _dump(10, now))
+    reload()
+    transitions = c.logPeersSessions({})
+    assert sorted(transitions['online']) == [f'peer{i:05d}' for i in range(0, 10, 2)] and transitions['offline'] == []
+    assert c.logPeersSessions({}) == {'online': [], 'offline': []}
+
+    stale = [dict(d, latest_handshake=now - 600) if d['latest_handshake'] else d for d in _dump(10, now, 2 * 1024 ** 3)]
+    c.ingestNodeDump('node-1', 'wg0', stale)
+    reload()
+    transitions = c.logPeersSessions({})
+    assert sorted(transitions['offline']) == [f'peer{i:05d}' for i in range(0, 10, 2)]
+
+    print("✓ Sessions of node-hosted peers follow their dump handshakes")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Node Dump Ingestion Tests")
+    print("=" * 60)
+
+    tests = [
+        test_dump_updates_observations_and_status,
+        test_change_detection_and_counter_reset,
+        test_ingested_peers_feed_transfer_logging,
+        test_node_peers_get_sessions,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Test script for typed node metrics
+Tests sample extraction, the in-memory node state map, downsampled retention
+and that the node selector reads the state map instead of health_json
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+# Add src/modules to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'modules'))
+
+import sqlalchemy as db
+
+
+def _make_dashboard_config():
+    """Build a minimal DashboardConfig stand-in with the NodeMetrics table on in-memory sqlite"""
+    engine = db.create_engine('sqlite://')
+    metadata = db.MetaData()
+    config = MagicMock()
+    config.engine = engine
+    config.nodeMetricsTable = db.Table('NodeMetrics', metadata,
+                                       db.Column('id', db.Integer, primary_key=True, autoincrement=True),
+                                       db.Column('node_id', db.String(255), nullable=False),
+                                       db.Column('time', db.DATETIME, nullable=False),
+                                       db.Column('resolution', db.Integer, nullable=False, server_default='60'),
+                                       db.Column('status', db.String(20), nullable=False),
+                                       db.Column('cpu_percent', db.Float, nullable=True),
+                                       db.Column('memory_percent', db.Float, nullable=True),
+                                       db.Column('peer_count', db.Integer, nullable=True),
+                                       db.Column('active_peers', db.Integer, nullable=True),
+                                       db.Column('interface_count', db.Integer, nullable=True),
+                                       db.Column('latency_ms', db.Float, nullable=True),
+                                       db.Index('ix_NodeMetrics_node_id_time', 'node_id', 'time'))
+    metadata.create_all(engine)
+    return config
+
+
+STATUS_DATA = {
+    'system': {'cpu_percent': 42.5, 'memory': {'percent': 61.0}},
+    'wireguard': {
+        'interfaces': {
+            'wg0': {'status': 'up', 'peer_count': 30, 'active_peers': 12},
+            'wg1': {'status': 'up', 'peer_count': 5, 'active_peers': 1},
+        },
+        'interface_count': 2
+    }
+}
+
+
+def test_record_updates_state_map():
+    """Test a recorded sample is typed, stored and becomes the node's latest state"""
+    print("\nTesting metric recording and state map...")
+    from NodeMetricsManager import NodeMetricsManager
+
+    config = _make_dashboard_config()
+    manager = NodeMetricsManager(config)
+    metric = manager.record('node-1', {'status': 'online', 'status_data': STATUS_DATA}, 12.345)
+
+    assert metric.cpu_percent == 42.5 and metric.memory_percent == 61.0
+    assert metric.peer_count == 35 and metric.active_peers == 13
+    assert metric.interface_count == 2 and metric.latency_ms == 12.35
+    assert manager.getLatest('node-1') is metric
+    assert len(manager.getHistory('node-1', datetime.now() - timedelta(hours=1))) == 1
+
+    # A fresh manager seeds its state map from the table
+    reloaded = NodeMetricsManager(config)
+    assert reloaded.getLatest('node-1').peer_count == 35
+
+    print("✓ Samples are typed, stored and held as the latest node state")
+    return True
+
+
+def test_downsample_rolls_up_old_samples():
+    """Test raw samples older than the raw window are rolled up into hourly rows"""
+    print("\nTesting downsampled retention...")
+    from NodeMetricsManager import NodeMetricsManager
+
+    config = _make_dashboard_config()
+    manager = NodeMetricsManager(config)
+    table = config.nodeMetricsTable
+    now = datetime(2024, 6, 10, 12, 30)
+    old_hour = datetime(2024, 6, 7, 9, 0)
+    with config.engine.begin() as conn:
+        conn.execute(table.insert(), [
+            {'node_id': 'node-1', 'time': old_hour + timedelta(minutes=i), 'resolution': 60,
+             'status': 'online', 'cpu_percent': float(i), 'peer_count': i}
+            for i in range(60)
+        ] + [
+            {'node_id': 'node-1', 'time': now - timedelta(minutes=5), 'resolution': 60,
+             'status': 'online', 'cpu_percent': 1.0, 'peer_count': 1}
+        ])
+
+    assert manager.downsample(now) == 60
+    with config.engine.connect() as conn:
+        rows = conn.execute(table.select().order_by(table.c.time)).mappings().fetchall()
+    assert len(rows) == 2
+    assert rows[0]['resolution'] == 3600 and rows[0]['time'] == old_hour
+    assert rows[0]['cpu_percent'] == sum(range(60)) / 60 and rows[0]['peer_count'] == 59
+    assert rows[1]['resolution'] == 60
+
+    # Running again is a no-op
+    assert manager.downsample(now) == 0
+
+    print("✓ Old raw samples are rolled up and recent ones kept")
+    return True
+
+
+def test_selector_reads_state_map():
+    """Test the selector prefers the in-memory state over health_json"""
+    print("\nTesting NodeSelector with the node state map...")
+    from NodeMetricsManager import NodeMetricsManager
+    from NodeSelector import NodeSelector
+    from Node import Node
+
+    manager = NodeMetricsManager(_make_dashboard_config())
+    busy = Node({'id': 'busy', 'name': 'busy', 'enabled': True, 'weight': 100, 'max_peers': 100,
+                 'health_json': '{}'})
+    idle = Node({'id': 'idle', 'name': 'idle', 'enabled': True, 'weight': 100, 'max_peers': 100,
+                 'health_json': '{}'})
+    manager.record('busy', {'status': 'online', 'status_data': STATUS_DATA})
+    manager.record('idle', {'status': 'online', 'status_data': {
+        'system': {'cpu_percent': 5.0, 'memory': {'percent': 10.0}},
+        'wireguard': {'interfaces': {'wg0': {'peer_count': 3, 'active_peers': 3}}}
+    }})
+
+    nodes_manager = MagicMock()
+    nodes_manager.getEnabledNodes.return_value = [busy, idle]
+    selector = NodeSelector(nodes_manager, manager)
+
+    assert selector._getNodeActivePeers(busy) == 35
+    assert selector._getNodeSystemMetrics(busy) == {'cpu_percent': 42.5, 'memory_percent': 61.0}
+    success, node, _ = selector.selectNode('auto')
+    assert success and node.id == 'idle'
+
+    print("✓ Selector scores nodes from the in-memory state map")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Node Metrics Tests")
+    print("=" * 60)
+
+    tests = [
+        test_record_updates_state_map,
+        test_downsample_rolls_up_old_samples,
+        test_selector_reads_state_map,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Test script for the NodeSelector scoring index
+Tests provisional reservations during bulk placement, capacity limits,
+reservation release and capacity-aware interface selection
+"""
+
+import sys
+import os
+import time
+from collections import Counter
+from unittest.mock import MagicMock
+
+# Add src/modules to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'modules'))
+
+
+def _node(node_id, peers, max_peers=0, weight=100, group_id=None):
+    from Node import Node
+    return Node({
+        'id': node_id, 'name': node_id, 'enabled': True, 'weight': weight,
+        'max_peers': max_peers, 'group_id': group_id,
+        'health_json': '{"peer_count": %d}' % peers
+    })
+
+
+def _selector(nodes):
+    from NodeSelector import NodeSelector
+    manager = MagicMock()
+    manager.getEnabledNodes.return_value = nodes
+    return NodeSelector(manager), manager
+
+
+def test_bulk_placement_is_balanced():
+    """Test consecutive selections spread over nodes instead of piling on one"""
+    print("\nTesting bulk placement with reservations...")
+    selector, manager = _selector([_node('a', 10), _node('b', 10), _node('c', 40)])
+
+    placements = Counter(selector.selectNode('auto')[1].id for _ in range(60))
+    # a and b start at 10, c at 40; 60 peers level everything out at 40
+    assert placements == {'a': 30, 'b': 30}, placements
+    # Index was built once, not per selection
+    assert manager.getEnabledNodes.call_count == 1
+
+    print("✓ Reservations keep bulk placement balanced")
+    return True
+
+
+def test_reservations_respect_capacity_and_release():
+    """Test reservations count against max_peers and can be released"""
+    print("\nTesting capacity with reservations...")
+    nodes = [_node('a', 8, max_peers=10), _node('b', 0, max_peers=2, group_id='g')]
+    selector, manager = _selector(nodes)
+    manager.getNodeById.side_effect = {n.id: n for n in nodes}.get
+
+    ids = [selector.selectNode('auto')[1].id for _ in range(4)]
+    assert Counter(ids) == {'a': 2, 'b': 2}
+    success, node, message = selector.selectNode('auto')
+    assert success is False and node is None and 'capacity' in message
+
+    selector.releaseNode('b')
+    success, node, _ = selector.selectNode('auto', group_id='g')
+    assert success and node.id == 'b'
+    assert selector.selectNode('b')[0] is False, "Specific selection must count reservations"
+
+    # A refresh without a newer node state drops reservations that were absorbed
+    selector.refreshIndex()
+    assert selector.selectNode('auto', group_id='g')[1].id == 'b'
+
+    print("✓ Reservations count against capacity and are released on failure")
+    return True
+
+
+def test_selection_scales():
+    """Test placement over many nodes stays cheap per peer"""
+    print("\nTesting selection cost with 2,000 nodes...")
+    selector, _ = _selector([_node(f'n{i}', i % 50) for i in range(2000)])
+    selector.refreshIndex()
+
+    started = time.monotonic()
+    placements = Counter(selector.selectNode('auto')[1].id for _ in range(10000))
+    elapsed = time.monotonic() - started
+
+    # Peers fill the least-loaded nodes up to a common level (about 22)
+    loads = [i % 50 + placements[f'n{i}'] for i in range(2000) if placements[f'n{i}']]
+    assert len(placements) > 800 and max(loads) - min(loads) <= 1, "Placements are not level"
+    assert elapsed < 2.0, f"10,000 selections took {elapsed:.2f}s"
+
+    print(f"✓ 10,000 selections over 2,000 nodes in {elapsed:.3f}s")
+    return True
+
+
+def test_interface_selection_by_capacity():
+    """Test interfaces are chosen by remaining pool capacity, then peer count"""
+    print("\nTesting capacity-aware interface selection...")
+    from NodeSelector import NodeSelector
+    from NodeMetric import NodeMetric
+    from NodeInterface import NodeInterface
+
+    metrics = MagicMock()
+    metrics.getLatest.return_value = NodeMetric({
+        'node_id': 'a',
+        'interfaces': {'wg0': {'peer_count': 250}, 'wg1': {'peer_count': 3}, 'wg2': {'peer_count': 0}}
+    })
+    selector = NodeSelector(MagicMock(), metrics)
+    node = _node('a', 0)
+    wg0 = NodeInterface({'interface_name': 'wg0', 'ip_pool_cidr': '10.0.0.0/24'})
+    wg1 = NodeInterface({'interface_name': 'wg1', 'ip_pool_cidr': '10.1.0.0/28'})
+
+    # wg0 has 3 addresses left, wg1 has 10
+    assert selector.selectInterface(node, [wg0, wg1]).interface_name == 'wg1'
+    picks = [selector.selectInterface(node, [wg0, wg1]).interface_name for _ in range(11)]
+    assert picks.count('wg1') == 9 and picks.count('wg0') == 2, picks
+    assert selector.selectInterface(node, [wg0, wg1]).interface_name == 'wg0'
+    assert selector.selectInterface(node, [wg0, wg1]) is None, "Exhausted pools must not be selected"
+
+    # Interfaces without a pool are unlimited
+    wg2 = NodeInterface({'interface_name': 'wg2', 'ip_pool_cidr': None})
+    assert selector.selectInterface(node, [wg0, wg2]).interface_name == 'wg2'
+
+    print("✓ Interfaces are selected by remaining IP pool capacity")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Node Selector Index Tests")
+    print("=" * 60)
+
+    tests = [
+        test_bulk_placement_is_balanced,
+        test_reservations_respect_capacity_and_release,
+        test_selection_scales,
+        test_interface_selection_by_capacity,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
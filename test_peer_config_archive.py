@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test script for the streaming download-all-peers archive
+Tests that ZIP and tar.gz archives are produced in bounded chunks, contain every
+rendered config under the established file names, and that memory does not grow
+with the number of peers
+"""
+
+import sys
+import os
+import io
+import tarfile
+import zipfile
+import tracemalloc
+from types import SimpleNamespace
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from test_client_portal_index import _configuration
+
+
+def _named_configuration(peer_count):
+    c = _configuration('wg0', peer_count)
+    for i, peer in enumerate(c.Peers):
+        peer.name = '' if i % 10 == 0 else ('Laptop' if i % 10 == 1 else f'Peer {i}')
+    return c
+
+
+def test_zip_stream_contents():
+    """Test the ZIP holds every config with unique names and is sent in bounded chunks"""
+    print("\nTesting streamed ZIP archive...")
+    from modules.PeerConfigArchive import StreamPeerConfigs
+    c = _named_configuration(3000)
+
+    chunks = list(StreamPeerConfigs(c.Peers, 'zip', chunkSize=16 * 1024))
+    assert len(chunks) > 10 and max(len(chunk) for chunk in chunks[:-1]) < 32 * 1024
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+        names = archive.namelist()
+        assert len(names) == 3000 == len(set(names))
+        assert names[:3] == ['0_UntitledPeer.conf', 'Laptop.conf', 'Peer2.conf']
+        assert 'Laptop_2.conf' in names and '1_UntitledPeer.conf' in names
+        assert archive.read('Peer2.conf').decode() == c.Peers[2].downloadPeer()['file']
+        assert archive.getinfo('Peer2.conf').external_attr >> 16 == 0o600
+    assert c._WireguardConfiguration__peerConfigCache.keys() == {c.Peers[2].id}, "Export must not fill the cache"
+
+    print(f"✓ 3,000 configs streamed in {len(chunks)} chunks")
+    return True
+
+
+def test_tar_gz_stream_contents():
+    """Test the tar.gz export round-trips"""
+    print("\nTesting streamed tar.gz archive...")
+    from modules.PeerConfigArchive import StreamPeerConfigs
+    c = _named_configuration(200)
+
+    data = b''.join(StreamPeerConfigs(c.Peers, 'tar.gz'))
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as archive:
+        members = archive.getmembers()
+        assert len(members) == 200 and members[2].name == 'Peer2.conf' and members[2].mode == 0o600
+        assert archive.extractfile(members[2]).read().decode() == c.Peers[2].downloadPeer()['file']
+
+    print("✓ tar.gz archive contains every config")
+    return True
+
+
+def test_memory_does_not_grow_with_peer_count():
+    """Test the streaming peak stays flat from 1,000 to 10,000 peers"""
+    print("\nTesting constant memory...")
+    from modules.PeerConfigArchive import StreamPeerConfigs
+
+    def peak(peer_count):
+        c = _named_configuration(peer_count)
+        # MagicMock records every call, which would hide the archive's own footprint
+        c.DashboardConfig = SimpleNamespace(GetConfig=lambda section, key: (True, 'vpn.example.com'))
+        for peer in c.Peers:
+            peer.name = f'Peer {peer.id}'
+        tracemalloc.start()
+        size = sum(len(chunk) for chunk in StreamPeerConfigs(c.Peers, 'tar.gz'))
+        _, top = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return top, size
+
+    small, small_size = peak(1000)
+    large, large_size = peak(10000)
+    assert large_size > 5 * small_size
+    # The name set grows by one short string per peer; everything else is constant
+    assert large < small + 10000 * 150, f"{small} -> {large} bytes"
+
+    print(f"✓ Peak {small // 1024} KiB at 1,000 peers, {large // 1024} KiB at 10,000 peers")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Peer Config Archive Tests")
+    print("=" * 60)
+
+    tests = [
+        test_zip_stream_contents,
+        test_tar_gz_stream_contents,
+        test_memory_does_not_grow_with_peer_count,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
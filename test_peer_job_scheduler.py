@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Test script for the event-driven peer job scheduler
+Tests that date jobs wake up exactly when due from the heap, threshold jobs are
+evaluated only for peers whose transfer changed, and saved jobs wake the scheduler
+"""
+
+import sys
+import os
+import time
+import uuid
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+
+class FakeConfiguration:
+    """Configuration holding in-memory peers and recording job actions"""
+
+    def __init__(self, name, peer_count):
+        self.Name = name
+        self.Peers = [SimpleNamespace(id=f'peer-{i}', total_receive=0.0, total_sent=0.0, total_data=0.0,
+                                      cumu_receive=0.0, cumu_sent=0.0, cumu_data=0.0, getJobs=lambda: None)
+                      for i in range(peer_count)]
+        self.restricted = []
+        self.searches = 0
+
+    def searchPeer(self, publicKey):
+        self.searches += 1
+        for p in self.Peers:
+            if p.id == publicKey:
+                return True, p
+        return False, None
+
+    def restrictPeers(self, ids):
+        self.restricted.extend(ids)
+        return True, None
+
+
+def _make_jobs(peer_count=1000):
+    import modules.PeerJobs as PeerJobsModule
+    import modules.PeerJobLogger as PeerJobLoggerModule
+    from modules.PeerJobs import PeerJobs
+
+    directory = tempfile.mkdtemp()
+    connection = lambda database: f"sqlite:///{os.path.join(directory, database + '.db')}"
+    PeerJobsModule.ConnectionString = connection
+    PeerJobLoggerModule.ConnectionString = connection
+    dashboard_config = MagicMock()
+    dashboard_config.GetConfig.return_value = (True, 'sqlite')
+    c = FakeConfiguration('wg0', peer_count)
+    return PeerJobs(dashboard_config, {'wg0': c}, MagicMock()), c
+
+
+def _job(peer, field, value, operator='lgt'):
+    from modules.PeerJob import PeerJob
+    return PeerJob(str(uuid.uuid4()), 'wg0', peer, field, operator, value, datetime.now(), None, 'restrict')
+
+
+def test_threshold_jobs_only_for_changed_peers():
+    """Test threshold jobs are evaluated only for the changed peers they are attached to"""
+    print("\nTesting inline threshold evaluation...")
+    jobs, c = _make_jobs()
+    for i in range(3):
+        assert jobs.saveJob(_job(f'peer-{i}', 'total_data', '1'))[0]
+    jobs.runDueJobs()
+    assert c.restricted == []
+
+    c.searches = 0
+    assert jobs.evaluatePeers('wg0', [f'peer-{i}' for i in range(100, 1000)]) == 0
+    assert c.searches == 0, "Peers without jobs must not be looked at"
+
+    c.Peers[1].total_data = 0.75
+    c.Peers[1].cumu_data = 0.5
+    assert jobs.evaluatePeers('wg0', ['peer-1', 'peer-500']) == 1
+    assert c.restricted == ['peer-1']
+    assert jobs.searchJob('wg0', 'peer-1') == [] and len(jobs.searchJob('wg0', 'peer-2')) == 1
+
+    print("✓ Only jobs of changed peers were evaluated")
+    return True
+
+
+def test_date_jobs_wake_up_when_due():
+    """Test the heap reports the next due time and runs date jobs once it is reached"""
+    print("\nTesting date job heap...")
+    jobs, c = _make_jobs(10)
+    soon = (datetime.now() + timedelta(seconds=1)).strftime('%Y-%m-%d %H:%M:%S')
+    later = (datetime.now() + timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S')
+    jobs.saveJob(_job('peer-1', 'date', later))
+    jobs.saveJob(_job('peer-2', 'date', soon))
+
+    wait = jobs.runDueJobs()
+    assert wait is not None and wait <= 1.0 and c.restricted == []
+    time.sleep(wait + 0.05)
+    while not c.restricted:
+        time.sleep(0.05)
+        wait = jobs.runDueJobs()
+    assert c.restricted == ['peer-2']
+    assert 3500 < jobs.runDueJobs() <= 3600
+
+    print("✓ Date jobs run when due and the next wakeup is an hour away")
+    return True
+
+
+def test_saved_job_wakes_scheduler():
+    """Test saving a job wakes a waiting scheduler and checks an already crossed threshold"""
+    print("\nTesting scheduler wakeup on save...")
+    jobs, c = _make_jobs(10)
+    c.Peers[3].total_sent = 5.0
+    jobs.waitForJobs(0)
+
+    woke = []
+    waiter = threading.Thread(target=lambda: woke.append(jobs.waitForJobs(30) or time.monotonic()))
+    waiter.start()
+    started = time.monotonic()
+    jobs.saveJob(_job('peer-3', 'total_sent', '2'))
+    waiter.join(5)
+    assert woke and woke[0] - started < 2, "Scheduler was not woken"
+
+    assert jobs.runDueJobs() is None
+    assert c.restricted == ['peer-3'], "Idle peer over its threshold must be handled"
+
+    print("✓ Saving a job wakes the scheduler, which evaluates it")
+    return True
+
+
+def test_failed_actions_back_off_and_stale_jobs_expire():
+    """Test failing date and threshold jobs are retried after their backoff, and jobs expired as stale stop running"""
+    print("\nTesting failed job actions...")
+    from modules.PeerJobs import PeerJobs
+    jobs, c = _make_jobs(10)
+    attempts = []
+    c.restrictPeers = lambda ids: attempts.append(ids) or (False, "wg set failed")
+    past = (datetime.now() - timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M:%S')
+    dateJob = _job('peer-1', 'date', past)
+    thresholdJob = _job('peer-2', 'total_data', '1')
+    jobs.saveJob(dateJob)
+    jobs.saveJob(thresholdJob)
+
+    wait = jobs.runDueJobs()
+    assert len(attempts) == 1 and PeerJobs.DATE_RETRY_INTERVAL - 5 < wait <= PeerJobs.DATE_RETRY_INTERVAL
+    for _ in range(5):
+        jobs.runDueJobs()
+    jobs.saveJob(_job('peer-3', 'date', past, operator='eq'))
+    jobs.runDueJobs()
+    assert len(attempts) == 1, "A failed action must wait for its backoff, also after the index is rebuilt"
+
+    c.Peers[2].total_data = 2.0
+    for _ in range(5):
+        assert jobs.evaluatePeers('wg0', ['peer-2']) == 0
+    assert len(attempts) == 2, "A failed threshold action must wait for its backoff too"
+    import modules.PeerJobs as PeerJobsModule
+    clock = time.time()
+    for _ in range(10):
+        clock += PeerJobs.DATE_RETRY_MAX_INTERVAL + 1
+        with patch.object(PeerJobsModule, 'time', SimpleNamespace(time=lambda: clock)):
+            assert jobs.evaluatePeers('wg0', ['peer-2']) == 0
+    assert len(attempts) == 12
+    jobs.cleanJob()
+    assert jobs.searchJob('wg0', 'peer-2') == [] and jobs.searchJobById(thresholdJob.JobID) == []
+    assert jobs.evaluatePeers('wg0', ['peer-2']) == 0 and len(attempts) == 12, \
+        "An expired job must not be evaluated"
+    assert len(jobs.searchJob('wg0', 'peer-1')) == 1
+
+    print("✓ Failed actions back off and stale jobs leave the index")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Peer Job Scheduler Tests")
+    print("=" * 60)
+
+    tests = [
+        test_threshold_jobs_only_for_changed_peers,
+        test_date_jobs_wake_up_when_due,
+        test_saved_job_wakes_scheduler,
+        test_failed_actions_back_off_and_stale_jobs_expire,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
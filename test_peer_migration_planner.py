@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Test script for planned, parallel bulk peer migration
+Tests the balanced up-front assignment, batched parallel execution against
+node agents and resuming a partially failed migration from the audit log
+"""
+
+import sys
+import os
+import time
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+# Add src/modules and src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src', 'modules'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+import sqlalchemy as db
+
+
+def _make_environment(loads, source_peers=3000, interfaces=None):
+    """
+    Build a PeerMigrationManager over a temp-file sqlite database
+
+    loads maps destination node id to (existing peer count, max_peers), interfaces
+    maps a node id to the (interface name, IP pool) of its enabled interfaces
+    """
+    from modules.WireguardConfiguration import WireguardConfiguration
+    from modules.PeerMigrationManager import PeerMigrationManager
+    from modules.AuditLogManager import AuditLogManager
+    from modules.NodeSelector import NodeSelector
+
+    engine = db.create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'wgdashboard.db')}")
+    metadata = db.MetaData()
+    dashboard_config = MagicMock()
+    dashboard_config.engine = engine
+    dashboard_config.auditLogTable = db.Table('AuditLog', metadata,
+                                              db.Column('id', db.Integer, primary_key=True, autoincrement=True),
+                                              db.Column('timestamp', db.DATETIME, server_default=db.func.now()),
+                                              db.Column('action', db.String(100), nullable=False),
+                                              db.Column('entity_type', db.String(50), nullable=False),
+                                              db.Column('entity_id', db.String(255), nullable=True),
+                                              db.Column('details', db.Text, nullable=True),
+                                              db.Column('user', db.String(255), nullable=True))
+    metadata.create_all(engine)
+
+    c = WireguardConfiguration.__new__(WireguardConfiguration)
+    c.Name = 'wg0'
+    c.engine = engine
+    c.metadata = db.MetaData()
+    c.DashboardConfig = MagicMock()
+    c.DashboardConfig.GetConfig.return_value = (True, 'sqlite')
+    c.createDatabase()
+    rows = [{'id': f'src-{i:05d}', 'node_id': 'source', 'iface': 'wg9',
+             'allowed_ip': f'10.0.{i // 256}.{i % 256}/32', 'keepalive': 25} for i in range(source_peers)]
+    for node_id, (count, _) in loads.items():
+        rows += [{'id': f'{node_id}-{i:05d}', 'node_id': node_id, 'iface': 'wg0',
+                  'allowed_ip': '', 'keepalive': 0} for i in range(count)]
+    with engine.begin() as conn:
+        conn.execute(c.peersTable.insert(), rows)
+
+    nodes = {node_id: SimpleNamespace(id=node_id, enabled=True, max_peers=max_peers, wg_interface='wg0')
+             for node_id, (_, max_peers) in loads.items()}
+    nodes['source'] = SimpleNamespace(id='source', enabled=True, max_peers=0, wg_interface='wg0')
+    clients = {node_id: MagicMock() for node_id in nodes}
+    for client in clients.values():
+        client.reconcile_peers.return_value = (True, {'added': [], 'updated': [], 'removed': []})
+
+    nodes_manager = MagicMock()
+    nodes_manager.getNodeById.side_effect = nodes.get
+    nodes_manager.getNodeAgentClient.side_effect = clients.get
+    config_nodes_manager = MagicMock()
+    config_nodes_manager.getHealthyNodesForConfig.return_value = [
+        SimpleNamespace(node_id=node_id) for node_id in list(loads) + ['source']
+    ]
+
+    node_interfaces_manager = MagicMock()
+    node_interfaces_manager.getEnabledInterfacesByNodeId.side_effect = lambda node_id: [
+        SimpleNamespace(interface_name=name, ip_pool_cidr=pool) for name, pool in (interfaces or {}).get(node_id, [])
+    ]
+
+    manager = PeerMigrationManager(dashboard_config, nodes_manager, config_nodes_manager,
+                                   AuditLogManager(dashboard_config), {'wg0': c}, batch_size=250,
+                                   NodeInterfacesManager=node_interfaces_manager,
+                                   NodeSelector=NodeSelector(nodes_manager))
+
+    def node_counts(by_iface=False):
+        columns = [c.peersTable.c.node_id] + ([c.peersTable.c.iface] if by_iface else [])
+        with engine.connect() as conn:
+            rows = conn.execute(db.select(*columns, db.func.count()).group_by(*columns)).fetchall()
+        return {tuple(row[:-1]) if by_iface else row[0]: row[-1] for row in rows}
+
+    return manager, clients, node_counts
+
+
+def test_plan_is_balanced_and_respects_capacity():
+    """Test the plan levels destination loads and stops at max_peers"""
+    print("\nTesting balanced migration plan...")
+    manager, clients, _ = _make_environment({'a': (100, 0), 'b': (0, 0), 'c': (0, 500)})
+
+    success, plan = manager.plan_migration('wg0', 'source')
+    assert success
+    final = {'a': 100 + len(plan['assignments']['a']), 'b': len(plan['assignments']['b']),
+             'c': len(plan['assignments']['c'])}
+    assert final == {'a': 1300, 'b': 1300, 'c': 500}, final
+    assert plan['unplaced'] == [] and 'source' not in plan['assignments']
+
+    success, plan = manager.plan_migration('wg0', 'source', 'c')
+    assert len(plan['assignments']['c']) == 500 and len(plan['unplaced']) == 2500
+
+    print("✓ Peers are assigned to the least-loaded destinations within capacity")
+    return True
+
+
+def test_batched_parallel_execution():
+    """Test 3,000 peers move in batches of 250, destinations in parallel"""
+    print("\nTesting batched parallel migration of 3,000 peers...")
+    manager, clients, node_counts = _make_environment({'a': (0, 0), 'b': (0, 0), 'c': (0, 0)})
+    latency = 0.05
+    in_flight = []
+    lock = threading.Lock()
+    active = [0]
+
+    def slow_reconcile(iface, peers, *args, **kwargs):
+        with lock:
+            active[0] += 1
+            in_flight.append(active[0])
+        time.sleep(latency)
+        with lock:
+            active[0] -= 1
+        return True, {'added': [p['public_key'] for p in peers], 'updated': [], 'removed': kwargs.get('remove', [])}
+
+    for client in clients.values():
+        client.reconcile_peers.side_effect = slow_reconcile
+
+    started = time.monotonic()
+    success, message, count = manager.migrate_peers_from_node('wg0', 'source')
+    elapsed = time.monotonic() - started
+
+    assert success and count == 3000, message
+    assert node_counts() == {'a': 1000, 'b': 1000, 'c': 1000}
+    for node_id in ('a', 'b', 'c'):
+        calls = clients[node_id].reconcile_peers.call_args_list
+        assert len(calls) == 4 and all(len(call.args[1]) == 250 and call.args[0] == 'wg0' for call in calls)
+        assert calls[0].args[1][0]['persistent_keepalive'] == 25
+    removals = clients['source'].reconcile_peers.call_args_list
+    assert len(removals) == 12 and all(call.args[0] == 'wg9' for call in removals)
+    assert max(in_flight) > 1, "Destinations were not migrated in parallel"
+    assert elapsed < 24 * latency, f"Migration took {elapsed:.2f}s"
+
+    print(f"✓ 3,000 peers migrated in {elapsed:.2f}s with 12 batches")
+    return True
+
+
+def test_resume_from_audit_log():
+    """Test a partially failed migration reports progress and resumes the remaining batches"""
+    print("\nTesting migration resume from the audit log...")
+    manager, clients, node_counts = _make_environment({'a': (0, 0), 'b': (0, 0)}, source_peers=1000)
+    calls = [0]
+
+    def flaky(iface, peers, *args, **kwargs):
+        calls[0] += 1
+        if calls[0] == 2:
+            return False, "HTTP 503: busy"
+        return True, {'added': [], 'updated': [], 'removed': []}
+
+    clients['b'].reconcile_peers.side_effect = flaky
+    success, message, count = manager.migrate_peers_from_node('wg0', 'source')
+    assert not success and count == 750, message
+
+    migration_id = manager.AuditLogManager.get_logs(action='peer_migration_planned')[0][0].entity_id
+    progress = manager.get_migration_progress(migration_id)
+    assert progress['total'] == 1000 and progress['migrated'] == 750 and progress['failed'] == 250
+    assert progress['completed']
+
+    success, message, count = manager.resume_migration(migration_id)
+    assert success and count == 250, message
+    assert node_counts() == {'a': 500, 'b': 500}
+    progress = manager.get_migration_progress(migration_id)
+    assert progress['migrated'] == 1000 and progress['failed'] == 0
+    assert manager.resume_migration(migration_id) == (True, "Migration already completed", 0)
+
+    print("✓ Progress is tracked in the audit log and failed batches are resumed")
+    return True
+
+
+def test_destination_interface_by_pool_capacity():
+    """Test peers land on the destination interfaces with IP pool capacity, not the legacy wg_interface"""
+    print("\nTesting destination interface selection...")
+    manager, clients, node_counts = _make_environment(
+        {'a': (0, 0)}, source_peers=300,
+        interfaces={'a': [('wg1', '10.1.0.0/25'), ('wg2', '10.2.0.0/24')]})
+
+    success, message, count = manager.migrate_peers_from_node('wg0', 'source')
+    assert success and count == 300, message
+    counts = node_counts(by_iface=True)
+    # /25 has room for 125 peers and /24 for 253, so the /24 takes 128 before they level
+    assert counts == {('a', 'wg1'): 86, ('a', 'wg2'): 128 + 86}, counts
+    added = {}
+    for call in clients['a'].reconcile_peers.call_args_list:
+        added[call.args[0]] = added.get(call.args[0], 0) + len(call.args[1])
+    assert added == {'wg1': 86, 'wg2': 214}
+
+    manager, clients, _ = _make_environment({'a': (0, 0)}, source_peers=10,
+                                            interfaces={'a': [('wg1', '10.1.0.0/29')]})
+    success, message, count = manager.migrate_peers_from_node('wg0', 'source')
+    assert not success and count == 0 and not clients['a'].reconcile_peers.called, message
+
+    print("✓ Each peer moved to the destination interface with the most remaining pool capacity")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Peer Migration Planner Tests")
+    print("=" * 60)
+
+    tests = [
+        test_plan_is_balanced_and_respects_capacity,
+        test_batched_parallel_execution,
+        test_resume_from_audit_log,
+        test_destination_interface_by_pool_capacity,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test script for the peer session transitions
+Tests that a session is opened when a peer's handshake becomes fresh and closed
+with its traffic when the handshake goes stale, that cycles without transitions
+write nothing, and that sessions are read back by overlapping range
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import sqlalchemy
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from configuration_fixtures import make_configuration, make_engine
+
+
+def _observation(peer_id, handshake, receive=0.0, sent=0.0):
+    return {'id': peer_id, 'handshake': handshake, 'receive': receive, 'sent': sent}
+
+
+def test_transitions_open_and_close_sessions():
+    """Test crossing the handshake threshold opens and closes a session with its traffic"""
+    print("\nTesting session transitions...")
+    engine = make_engine()
+    c = make_configuration(engine, node_observations={})
+    start = datetime(2026, 10, 1, 8, 0, 0)
+
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, context, executemany: statements.append(statement)
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        assert c.peerSessions.track([_observation('peer-a', start + timedelta(seconds=5), 1.0, 0.5),
+                                     _observation('peer-b', None)], now=start + timedelta(seconds=10)) == \
+               {'online': ['peer-a'], 'offline': []}
+        writes = len(statements)
+        # A handshake every two minutes keeps the session open without writing
+        for minute in range(2, 60, 2):
+            handshake = start + timedelta(minutes=minute)
+            assert c.peerSessions.track([_observation('peer-a', handshake, 1.0 + minute, 0.5),
+                                         _observation('peer-b', None)], now=handshake + timedelta(seconds=10)) == \
+                   {'online': [], 'offline': []}
+        assert len(statements) == writes
+        last = start + timedelta(minutes=58)
+        assert c.peerSessions.track([_observation('peer-a', last, 60.0, 1.5), _observation('peer-b', None)],
+                                    now=last + timedelta(minutes=3)) == {'online': [], 'offline': ['peer-a']}
+    finally:
+        sqlalchemy.event.remove(engine, 'before_cursor_execute', listener)
+
+    sessions = c.peerSessions.getSessions('peer-a', datetime(2026, 10, 1), datetime(2026, 10, 1, 23, 59))
+    assert len(sessions) == 1
+    assert (sessions[0]['start_time'], sessions[0]['end_time']) == (start + timedelta(seconds=5), last)
+    assert (sessions[0]['total_receive'], sessions[0]['total_sent'], sessions[0]['total_data']) == (59.0, 1.0, 60.0)
+    assert c.peerSessions.getSessions('peer-b', datetime(2026, 10, 1), datetime(2026, 10, 1, 23, 59)) == []
+
+    print(f"✓ One hour online was stored as one session in {writes + 1} statements")
+    return True
+
+
+def test_short_and_reloaded_sessions():
+    """Test a session under a minute is kept and an open session survives a restart"""
+    print("\nTesting short and reloaded sessions...")
+    engine = make_engine()
+    c = make_configuration(engine, node_observations={})
+    t = datetime(2026, 10, 2, 12, 0, 0)
+    c.peerSessions.track([_observation('peer-a', t)], now=t + timedelta(seconds=1))
+    c.peerSessions.track([_observation('peer-a', t)], now=t + timedelta(minutes=3, seconds=1))
+    c.peerSessions.track([_observation('peer-a', t + timedelta(hours=1))], now=t + timedelta(hours=1, seconds=1))
+
+    restarted = make_configuration(engine, node_observations={})
+    # Peers removed from the interface have their session closed
+    assert restarted.peerSessions.track([], now=t + timedelta(hours=1, minutes=1)) == {'online': [], 'offline': ['peer-a']}
+
+    sessions = restarted.peerSessions.getSessions('peer-a', datetime(2026, 10, 2), datetime(2026, 10, 2, 23, 59))
+    assert [(s['start_time'], s['end_time']) for s in sessions] == \
+           [(t, t), (t + timedelta(hours=1), t + timedelta(hours=1))]
+
+    print("✓ Both sessions were recorded and closed across a restart")
+    return True
+
+
+def test_peer_sessions_overlap_the_range():
+    """Test Peer.getSessionRecords returns the sessions overlapping the days with the open session's traffic"""
+    print("\nTesting Peer.getSessionRecords...")
+    engine = make_engine()
+    c = make_configuration(engine, node_observations={})
+    c.Peers = [SimpleNamespace(id='peer-a', cumu_receive=1.0, total_receive=1.0, cumu_sent=0.0, total_sent=0.5)]
+    now = datetime.now()
+    assert c.logPeersSessions({'peer-a': now - timedelta(seconds=30), 'peer-b': None}) == \
+           {'online': ['peer-a'], 'offline': []}
+
+    from modules.Peer import Peer
+    peer = Peer.__new__(Peer)
+    peer.id, peer.configuration = 'peer-a', c
+    peer.cumu_receive, peer.total_receive, peer.cumu_sent, peer.total_sent = 1.0, 3.0, 0.0, 1.5
+    sessions = peer.getSessionRecords(now - timedelta(days=1), now)
+    assert len(sessions) == 1 and sessions[0]['end_time'] is None
+    assert (sessions[0]['total_receive'], sessions[0]['total_sent'], sessions[0]['total_data']) == (2.0, 1.0, 3.0)
+    assert peer.getSessionRecords(now - timedelta(days=3), now - timedelta(days=2)) == []
+
+    # Existing callers still get the times of the minute samples
+    samples = [now.replace(second=0, microsecond=0) - timedelta(minutes=m) for m in (2, 1)]
+    with engine.begin() as conn:
+        conn.execute(c.peersTransferTable.insert(), [
+            {'id': 'peer-a', 'total_receive': 1.0, 'total_sent': 0.5, 'total_data': 1.5, 'cumu_receive': 0.0,
+             'cumu_sent': 0.0, 'cumu_data': 0.0, 'time': t} for t in samples])
+    assert peer.getSessions(now, now) == samples
+
+    print("✓ The open session was listed with its traffic so far")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Peer Session Tests")
+    print("=" * 60)
+
+    tests = [
+        test_transitions_open_and_close_sessions,
+        test_short_and_reloaded_sessions,
+        test_peer_sessions_overlap_the_range,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
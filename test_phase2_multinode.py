@@ -208,6 +208,45 @@ def test_ip_allocation_exhaustion():
         traceback.print_exc()
         return False
 
+def test_ip_allocation_interface_pool():
+    """Test IP allocation uses the selected interface's pool instead of the node's"""
+    print("\nTesting IP Allocation from an interface pool...")
+    try:
+        import sqlalchemy
+        from IPAllocationManager import IPAllocationManager
+        
+        mock_config = MagicMock()
+        mock_config.engine = sqlalchemy.create_engine("sqlite://")
+        metadata = sqlalchemy.MetaData()
+        mock_config.nodesTable = sqlalchemy.Table(
+            'Nodes', metadata,
+            sqlalchemy.Column('id', sqlalchemy.String(255), primary_key=True),
+            sqlalchemy.Column('ip_pool_cidr', sqlalchemy.String(50)))
+        mock_config.ipAllocationsTable = sqlalchemy.Table(
+            'IPAllocations', metadata,
+            sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True, autoincrement=True),
+            sqlalchemy.Column('node_id', sqlalchemy.String(255), nullable=False),
+            sqlalchemy.Column('peer_id', sqlalchemy.String(255), nullable=False),
+            sqlalchemy.Column('ip_address', sqlalchemy.String(50), nullable=False),
+            sqlalchemy.UniqueConstraint('node_id', 'ip_address'))
+        metadata.create_all(mock_config.engine)
+        with mock_config.engine.begin() as conn:
+            conn.execute(mock_config.nodesTable.insert().values(id='node-1', ip_pool_cidr='10.0.1.0/24'))
+        manager = IPAllocationManager(mock_config)
+        
+        assert manager.allocateIP('node-1', 'peer-a') == (True, '10.0.1.2/24')
+        assert manager.allocateIP('node-1', 'peer-b', ip_pool_cidr='10.0.2.0/24') == (True, '10.0.2.2/24')
+        assert manager.allocateIP('node-1', 'peer-c', ip_pool_cidr='10.0.2.0/24') == (True, '10.0.2.3/24')
+        assert manager.allocateIP('node-1', 'peer-d') == (True, '10.0.1.3/24')
+        
+        print("✓ IP allocated from the interface pool")
+        return True
+    except Exception as e:
+        print(f"✗ IP allocation interface pool test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
 def test_peer_creation_integration():
     """Test peer creation flow with mock agent"""
     print("\nTesting peer creation integration with mock agent...")
@@ -245,6 +284,7 @@ def main():
     results.append(("Node Selector Fallback", test_node_selector_fallback()))
     results.append(("IP Allocation Boundaries", test_ip_allocation_boundaries()))
     results.append(("IP Allocation Exhaustion", test_ip_allocation_exhaustion()))
+    results.append(("IP Allocation Interface Pool", test_ip_allocation_interface_pool()))
     results.append(("Peer Creation Integration", test_peer_creation_integration()))
     
     print("\n" + "=" * 60)
@@ -144,7 +144,7 @@ def test_manager_classes_exist():
         assert "class PeerMigrationManager" in content
         assert "def migrate_peers_from_node" in content
         assert "def _select_destination_node" in content  # Least-loaded selection
-        assert "def _migrate_single_peer" in content
+        assert "def _migrate_batch" in content
         
         # AuditLogManager
         with open('src/modules/AuditLogManager.py', 'r') as f:
@@ -210,11 +210,11 @@ def test_peer_migration_logic():
         assert "migrate_peers_from_node" in content
         assert "_get_peers_for_node" in content
         assert "_select_destination_node" in content
-        assert "_migrate_single_peer" in content
+        assert "_migrate_batch" in content
         
         # Check that it uses agent APIs
-        assert "add_peer" in content or "AgentClient" in content
-        assert "delete_peer" in content
+        assert "reconcile_peers" in content
+        assert "remove=" in content
         
         # Check least-loaded selection
         assert "peer_count" in content or "node_loads" in content
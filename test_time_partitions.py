@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Test script for the monthly partitions of the transfer and endpoint history tables
+Tests that rows are written to the partition of their month, that reads only touch
+the partitions overlapping the range, that retention drops whole months, and that
+rows from before partitioning was enabled stay readable
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import sqlalchemy
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from configuration_fixtures import make_configuration, make_engine
+
+
+def _samples(peer_id, start, days):
+    return [{'id': peer_id, 'total_receive': float(i), 'total_sent': 0.0, 'total_data': float(i),
+             'cumu_receive': 0.0, 'cumu_sent': 0.0, 'cumu_data': 0.0, 'time': start + timedelta(hours=i)}
+            for i in range(days * 24)]
+
+
+def _tables(engine):
+    return sorted(sqlalchemy.inspect(engine).get_table_names())
+
+
+def test_rows_are_routed_to_monthly_partitions():
+    """Test inserts land in the partition of their month and reads only touch overlapping ones"""
+    print("\nTesting partition routing...")
+    engine = make_engine()
+    c = make_configuration(engine, partitioning=True)
+    with engine.begin() as conn:
+        c.peersTransferPartitions.insert(conn, _samples('peer-a', datetime(2026, 7, 20), 60))
+
+    assert [t for t in _tables(engine) if t.startswith('wg0_transfer_p')] == \
+           ['wg0_transfer_p202607', 'wg0_transfer_p202608', 'wg0_transfer_p202609']
+    with engine.connect() as conn:
+        assert conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(c.peersTransferTable)).scalar() == 0
+    assert c.getTransferTableSize() == 60 * 24
+    assert 'ix_wg0_transfer_p202608_time' in {i['name'] for i in sqlalchemy.inspect(engine).get_indexes('wg0_transfer_p202608')}
+
+    source = str(sqlalchemy.select(c.peersTransferPartitions.source(datetime(2026, 8, 3), datetime(2026, 8, 9))))
+    assert 'wg0_transfer_p202608' in source and 'p202607' not in source and 'p202609' not in source
+
+    rows = c.peersTrafficRollups.getTraffics('peer-a', datetime(2026, 7, 31, 12), datetime(2026, 8, 1, 11, 59), 0,
+                                             now=datetime(2026, 8, 2))
+    assert len(rows) == 24 and rows[0]['time'] == datetime(2026, 7, 31, 12) and rows[-1]['time'] == datetime(2026, 8, 1, 11)
+
+    print("✓ Two months of samples were split into three monthly partitions")
+    return True
+
+
+def test_retention_drops_whole_partitions():
+    """Test expiring history drops complete months and clearing drops every partition"""
+    print("\nTesting partition retention...")
+    engine = make_engine()
+    c = make_configuration(engine, partitioning=True)
+    with engine.begin() as conn:
+        c.peersTransferPartitions.insert(conn, _samples('peer-a', datetime(2026, 7, 20), 60))
+        deleted = c.peersTransferPartitions.dropBefore(conn, datetime(2026, 9, 5))
+    assert deleted == 0
+    assert [t for t in _tables(engine) if t.startswith('wg0_transfer_p')] == ['wg0_transfer_p202609']
+    assert min(r['time'] for r in c.downloadTransferTable()) == datetime(2026, 9, 1)
+
+    assert c.deleteTransferTable()
+    assert [t for t in _tables(engine) if t.startswith('wg0_transfer_p')] == []
+    assert c.getTransferTableSize() == 0
+
+    print("✓ July and August were dropped as whole tables")
+    return True
+
+
+def test_rows_from_before_partitioning_stay_readable():
+    """Test the base table keeps serving older rows once partitioning is switched on"""
+    print("\nTesting existing rows...")
+    engine = make_engine()
+    legacy = make_configuration(engine, partitioning=False)
+    with engine.begin() as conn:
+        legacy.peersTransferPartitions.insert(conn, _samples('peer-a', datetime(2026, 8, 30), 2))
+
+    c = make_configuration(engine, partitioning=True)
+    with engine.begin() as conn:
+        c.peersTransferPartitions.insert(conn, _samples('peer-a', datetime(2026, 9, 1), 2))
+    rows = c.peersTrafficRollups.getTraffics('peer-a', datetime(2026, 8, 30), datetime(2026, 9, 2, 23, 59), 0,
+                                             now=datetime(2026, 9, 1))
+    assert len(rows) == 4 * 24
+
+    with engine.begin() as conn:
+        assert c.peersTransferPartitions.dropBefore(conn, datetime(2026, 8, 31)) == 24
+    assert c.getTransferTableSize() == 3 * 24
+
+    print("✓ Rows from before partitioning are read and expired from the base table")
+    return True
+
+
+def test_endpoint_history_partitions():
+    """Test endpoint history is written to partitions and read back across them"""
+    print("\nTesting partitioned endpoint history...")
+    engine = make_engine()
+    c = make_configuration(engine, partitioning=True)
+    with engine.begin() as conn:
+        c.peersHistoryEndpointPartitions.insert(conn, [
+            {'id': 'peer-a', 'endpoint': '198.51.100.1', 'time': datetime(2026, 8, 1),
+             'first_seen': datetime(2026, 8, 1), 'last_seen': datetime(2026, 8, 1), 'seen_count': 1}])
+    c.Peers = [SimpleNamespace(id='peer-a', status='running', endpoint='203.0.113.7:51820'),
+               SimpleNamespace(id='peer-b', status='running', endpoint='198.51.100.1:4500')]
+    c.logPeersHistoryEndpoint()
+    c.Peers[1].endpoint = '198.51.100.1:4600'
+    c.logPeersHistoryEndpoint()
+
+    month = datetime.now().strftime('%Y%m')
+    assert f'wg0_history_endpoint_p{month}' in _tables(engine)
+    assert c.getHistoricalEndpointTableSize() == 3
+
+    from modules.Peer import Peer
+    peer = Peer.__new__(Peer)
+    peer.id, peer.configuration = 'peer-a', c
+    assert sorted(r['endpoint'] for r in peer.getEndpoints()) == ['198.51.100.1', '203.0.113.7']
+
+    print("✓ Endpoints from two monthly partitions are listed together")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Time Partition Tests")
+    print("=" * 60)
+
+    tests = [
+        test_rows_are_routed_to_monthly_partitions,
+        test_retention_drops_whole_partitions,
+        test_rows_from_before_partitioning_stay_readable,
+        test_endpoint_history_partitions,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
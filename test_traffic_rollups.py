@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Test script for the multi-resolution traffic rollups
+Tests that raw transfer samples are rolled up into closed 1m, 1h and 1d buckets,
+that range queries are answered from the coarsest adequate tier including the open
+bucket, that retention only expires rows already rolled up, that backfilled samples
+are aggregated into the stored buckets again, and that charts can be
+grouped into time buckets in SQL and downsampled
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import sqlalchemy
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from test_drift_digest import _make_configuration
+
+
+def _configuration_with_samples(days=3):
+    """Two peers logging one raw sample a minute for the given number of days"""
+    c = _make_configuration('wg0', [('peer-a', None, None, '10.0.0.2/32', 25),
+                                    ('peer-b', None, None, '10.0.0.3/32', 25)])
+    now = datetime.now()
+    first = (now - timedelta(days=days)).replace(second=5, microsecond=0)
+    rows = []
+    for minute in range(int((now - first).total_seconds() // 60) + 1):
+        for peer_id, rate in (('peer-a', 1.0), ('peer-b', 2.0)):
+            rows.append({'id': peer_id, 'total_receive': minute * rate, 'total_sent': minute * rate / 2,
+                         'total_data': minute * rate * 1.5, 'cumu_receive': 0.0, 'cumu_sent': 0.0,
+                         'cumu_data': 0.0, 'time': first + timedelta(minutes=minute)})
+    with c.engine.begin() as conn:
+        conn.execute(c.peersTransferTable.insert(), rows)
+    return c, now, rows
+
+
+def _rollup_all(rollups, now):
+    """Repeat bounded rollup passes until one stores nothing, returning the rows stored per tier"""
+    total, passes = {}, 0
+    while True:
+        stored = rollups.rollup(now)
+        passes += 1
+        assert passes < 100, "Rollup passes make no progress"
+        if not any(stored.values()):
+            return total
+        for name, count in stored.items():
+            total[name] = total.get(name, 0) + count
+
+
+def test_rollup_stores_closed_buckets():
+    """Test each tier stores every closed bucket once and a second pass adds nothing"""
+    print("\nTesting rollup passes...")
+    c, now, rows = _configuration_with_samples()
+    rollups = c.peersTrafficRollups
+
+    stored = _rollup_all(rollups, now)
+    closed_minutes = {r['time'].replace(second=0) for r in rows if r['time'] < now.replace(second=0, microsecond=0)}
+    closed_hours = {t.replace(minute=0) for t in closed_minutes if t < now.replace(minute=0, second=0, microsecond=0)}
+    assert stored['1m'] == 2 * len(closed_minutes), stored
+    assert stored['1h'] == 2 * len(closed_hours), stored
+    assert stored['1d'] == 2 * 3, stored
+    assert rollups.rollup(now) == {'1m': 0, '1h': 0, '1d': 0}
+
+    hour = sorted(closed_hours)[1]
+    with c.engine.connect() as conn:
+        row = conn.execute(rollups.tables['1h'].select().where(
+            rollups.tables['1h'].c.id == 'peer-b', rollups.tables['1h'].c.time == hour)).mappings().one()
+    last = max((r for r in rows if r['id'] == 'peer-b' and r['time'].replace(minute=0, second=0) == hour),
+               key=lambda r: r['time'])
+    assert row['samples'] == 60 and row['total_receive'] == last['total_receive']
+
+    print(f"✓ {stored['1m']} minute, {stored['1h']} hour and {stored['1d']} day rows, second pass is a no-op")
+    return True
+
+
+def test_rollup_passes_are_bounded():
+    """Test a pass over a long raw backlog stops after its window and the next one resumes from it"""
+    print("\nTesting bounded rollup passes...")
+    c, now, rows = _configuration_with_samples()
+    rollups = c.peersTrafficRollups
+    first = min(r['time'] for r in rows).replace(second=0)
+    # A day without samples must not stall the passes
+    gap = (first + timedelta(hours=20), first + timedelta(hours=44))
+    with c.engine.begin() as conn:
+        conn.execute(c.peersTransferTable.delete().where(
+            c.peersTransferTable.c.time >= gap[0], c.peersTransferTable.c.time < gap[1]))
+    rows = [r for r in rows if not gap[0] <= r['time'] < gap[1]]
+
+    window = rollups.PASS_SOURCE_BUCKETS
+    assert rollups.rollup(now) == {'1m': 2 * window, '1h': 2 * window // 60, '1d': 0}
+    minutes = rollups.tables['1m']
+    with c.engine.connect() as conn:
+        latest = conn.execute(sqlalchemy.select(sqlalchemy.func.max(minutes.c.time))).scalar()
+    assert latest == first + timedelta(minutes=window - 1)
+    stored = rollups.rollup(now)
+    assert stored['1m'] == 2 * window and stored['1h'] == 2 * window // 60, stored
+
+    passes = 2
+    while any(rollups.rollup(now).values()):
+        passes += 1
+    closed = {r['time'].replace(second=0) for r in rows if r['time'] < now.replace(second=0, microsecond=0)}
+    with c.engine.connect() as conn:
+        assert conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(minutes)).scalar() == 2 * len(closed)
+    assert passes <= 3 * 24 * 60 // window, passes
+
+    print(f"✓ Three days of raw samples rolled up over {passes} passes of {window} minutes")
+    return True
+
+
+def test_queries_use_coarsest_adequate_tier():
+    """Test range queries read the coarsest tier and fold the open bucket from finer tiers"""
+    print("\nTesting tier selection...")
+    c, now, rows = _configuration_with_samples()
+    rollups = c.peersTrafficRollups
+    _rollup_all(rollups, now)
+    latest = max((r for r in rows if r['id'] == 'peer-a'), key=lambda r: r['time'])
+
+    assert rollups.selectTier(now - timedelta(minutes=30), 2.5, now) == 0, "Recent short ranges read raw samples"
+    assert rollups.selectTier(now - timedelta(days=3), 360, now) == 1, "Raw samples no longer cover the range"
+    assert rollups.selectTier(now - timedelta(days=30), 3600, now) == 2
+    assert rollups.selectTier(now - timedelta(days=400), 60, now) == 3, "Only the day tier covers a year ago"
+
+    daily = rollups.getTraffics('peer-a', now - timedelta(days=3), now, 86400, now)
+    assert len(daily) == 4 and all(r['samples'] > 0 for r in daily)
+    assert daily[-1]['total_receive'] == latest['total_receive'], "The open day must include the latest sample"
+    assert sum(r['samples'] for r in daily) == sum(1 for r in rows if r['id'] == 'peer-a')
+
+    month = rollups.getTraffics('peer-a', now - timedelta(days=30), now, None, now)
+    assert 72 <= len(month) <= 74 and month[-1]['total_receive'] == latest['total_receive']
+
+    print(f"✓ A month reads {len(month)} hourly rows, three days at 1d read {len(daily)} rows")
+    return True
+
+
+def test_retention_keeps_unrolled_rows():
+    """Test raw samples expire only after they are rolled up and queries still cover them"""
+    print("\nTesting retention...")
+    c, now, rows = _configuration_with_samples()
+    rollups = c.peersTrafficRollups
+    assert rollups.prune(now) == {}, "Nothing is rolled up yet"
+    assert c.getTransferTableSize() == len(rows)
+
+    _rollup_all(rollups, now)
+    before = rollups.getTraffics('peer-a', now - timedelta(days=3), now - timedelta(days=2, hours=12), 60, now)
+    deleted = rollups.prune(now)
+    assert deleted['raw'] > 0 and deleted.get('1m', 0) == 0
+    with c.engine.connect() as conn:
+        oldest = conn.execute(sqlalchemy.select(sqlalchemy.func.min(c.peersTransferTable.c.time))).scalar()
+    assert oldest >= now - timedelta(days=2, minutes=1)
+    after = rollups.getTraffics('peer-a', now - timedelta(days=3), now - timedelta(days=2, hours=12), 60, now)
+    assert after == before and len(after) > 700
+
+    print(f"✓ {deleted['raw']} raw rows expired, old ranges are served from the minute tier")
+    return True
+
+
+def test_backfill_is_rolled_up_again():
+    """Test a node backfill behind the stored buckets reaches every tier and its raw rows are kept until then"""
+    print("\nTesting backfill rollups...")
+    c, now, rows = _configuration_with_samples()
+    rollups = c.peersTrafficRollups
+    _rollup_all(rollups, now)
+
+    c.Peers = [SimpleNamespace(id='peer-n', node_id='node-1', cumu_receive=0.0, cumu_sent=0.0, cumu_data=0.0)]
+    start = (now - timedelta(days=2, hours=12)).replace(minute=0, second=30, microsecond=0)
+    samples = [(int(t.timestamp()), 'peer-n', minute * 1024 ** 3, 0, int(t.timestamp()) - 5)
+               for minute, t in ((m, start + timedelta(minutes=m)) for m in range(600))]
+    assert c.backfillPeersTraffic('node-1', samples) == 600
+
+    def count(table, *where):
+        with c.engine.connect() as conn:
+            return conn.execute(sqlalchemy.select(sqlalchemy.func.count(), sqlalchemy.func.sum(
+                table.c.samples if 'samples' in table.c else 1)).where(table.c.id == 'peer-n', *where)).one()
+
+    # The backfill is older than the raw retention but not rolled up yet
+    rollups.prune(now)
+    assert count(c.peersTransferTable)[0] == 600
+
+    _rollup_all(rollups, now)
+    assert tuple(count(rollups.tables['1m'])) == (600, 600)
+    assert tuple(count(rollups.tables['1h'])) == (10, 600)
+    assert count(rollups.tables['1d'])[1] == 600
+    with c.engine.connect() as conn:
+        assert conn.execute(rollups.pendingTable.select()).fetchall() == []
+        hour = conn.execute(rollups.tables['1h'].select().where(
+            rollups.tables['1h'].c.id == 'peer-n').order_by(rollups.tables['1h'].c.time)).mappings().first()
+    assert hour['time'] == start.replace(second=0) and hour['total_receive'] == 59.0
+    assert rollups.rollup(now) == {'1m': 0, '1h': 0, '1d': 0}
+
+    rollups.prune(now)
+    assert count(c.peersTransferTable)[0] == 0, "Rolled up backfill expires with the raw retention"
+
+    print("✓ 600 backfilled samples re-aggregated into the minute, hour and day tiers")
+    return True
+
+
+def test_bucketed_traffics_sum_deltas():
+    """Test SQL buckets keep the highest counters and the traffic of each bucket, open bucket included"""
+    print("\nTesting time buckets...")
+    c, now, rows = _configuration_with_samples()
+    rollups = c.peersTrafficRollups
+    _rollup_all(rollups, now)
+    latest = max((r for r in rows if r['id'] == 'peer-a'), key=lambda r: r['time'])
+    start = (now - timedelta(hours=30)).replace(minute=0, second=0, microsecond=0)
+
+    hourly = rollups.getBucketedTraffics('peer-a', start, now, 3600, now)
+    assert len(hourly) == 31 and all(r['time'].minute == 0 and r['time'].second == 0 for r in hourly)
+    assert hourly[-1]['total_receive'] == latest['total_receive'], "The open bucket must include the latest sample"
+    assert all(r['delta_receive'] == 60 and r['delta_sent'] == 30 and r['delta_data'] == 90 for r in hourly[1:-1])
+    assert sum(r['delta_receive'] for r in hourly[1:]) == hourly[-1]['total_receive'] - hourly[0]['total_receive']
+
+    fine = rollups.getBucketedTraffics('peer-a', start, now, 600, now)
+    assert len(fine) == 6 * 30 + now.minute // 10 + 1
+    assert sum(r['delta_receive'] for r in fine[1:]) == fine[-1]['total_receive'] - fine[0]['total_receive']
+    assert sum(r['samples'] for r in fine) == sum(1 for r in rows if r['id'] == 'peer-a' and r['time'] >= start)
+
+    print(f"✓ 30 hours grouped into {len(hourly)} hourly and {len(fine)} ten minute buckets")
+    return True
+
+
+def test_downsampling_keeps_peaks():
+    """Test Largest-Triangle-Three-Buckets bounds the points and keeps the ends and a spike"""
+    print("\nTesting downsampling...")
+    from modules.PeerTrafficRollups import DownsampleTraffics
+
+    start = datetime(2026, 10, 1)
+    series = [{'time': start + timedelta(minutes=i), 'delta_data': 5.0 if i == 637 else 0.1} for i in range(1440)]
+    sampled = DownsampleTraffics(series, 100)
+    assert len(sampled) == 100 and sampled[0] is series[0] and sampled[-1] is series[-1]
+    assert series[637] in sampled
+    assert [r['time'] for r in sampled] == sorted(r['time'] for r in sampled)
+    assert DownsampleTraffics(series[:50], 100) == series[:50]
+
+    c, now, rows = _configuration_with_samples(1)
+    from modules.Peer import Peer
+    peer = Peer.__new__(Peer)
+    peer.id, peer.configuration = 'peer-a', c
+    traffics = peer.getTraffics(600, bucket=60, maxPoints=120)
+    assert len(traffics) == 120 and 'delta_data' in traffics[0]
+
+    print(f"✓ {len(series)} points reduced to {len(sampled)} with the spike kept")
+    return True
+
+
+def test_batch_traffics_match_single_peer():
+    """Test several peers are bucketed with one grouped query per tier and match the single peer series"""
+    print("\nTesting batch traffic query...")
+    c, now, rows = _configuration_with_samples()
+    rollups = c.peersTrafficRollups
+    _rollup_all(rollups, now)
+    start = now - timedelta(hours=30)
+
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, context, executemany: statements.append(statement)
+    sqlalchemy.event.listen(c.engine, 'before_cursor_execute', listener)
+    try:
+        batch = c.getPeersTraffics(None, start, now, 3600)
+    finally:
+        sqlalchemy.event.remove(c.engine, 'before_cursor_execute', listener)
+    grouped = [s for s in statements if 'GROUP BY' in s]
+    assert len(grouped) == 3, "The hour tier, its open hour from the minute tier and the open minute from raw"
+    assert sorted(batch) == ['peer-a', 'peer-b']
+    for peer_id in batch:
+        assert batch[peer_id] == rollups.getBucketedTraffics(peer_id, start, now, 3600, now)
+    assert batch['peer-b'][5]['delta_receive'] == 2 * batch['peer-a'][5]['delta_receive'] == 120
+
+    selected = c.getPeersTraffics(['peer-b', 'peer-x'], start, now, maxPoints=50)
+    assert list(selected) == ['peer-b'] and len(selected['peer-b']) == 50
+
+    print(f"✓ Two peers bucketed with {len(grouped)} grouped queries")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Traffic Rollup Tests")
+    print("=" * 60)
+
+    tests = [
+        test_rollup_stores_closed_buckets,
+        test_rollup_passes_are_bounded,
+        test_queries_use_coarsest_adequate_tier,
+        test_retention_keeps_unrolled_rows,
+        test_backfill_is_rolled_up_again,
+        test_bucketed_traffics_sum_deltas,
+        test_downsampling_keeps_peaks,
+        test_batch_traffics_match_single_peer,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Test script for the webhook outbox and delivery worker pool
+Delivers events to a local HTTP receiver and checks the bounded worker pool,
+timer-driven retries, batching within a window, restart durability and the
+queue statistics
+"""
+
+import sys
+import os
+import json
+import time
+import uuid
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+
+class Receiver:
+    """Local webhook receiver counting concurrency, with failure injection"""
+
+    def __init__(self, latency=0.0):
+        self.payloads = []
+        self.failures = 0
+        self.latency = latency
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with receiver.lock:
+                    receiver.active += 1
+                    receiver.peak = max(receiver.peak, receiver.active)
+                time.sleep(receiver.latency)
+                with receiver.lock:
+                    receiver.active -= 1
+                    failed = receiver.failures > 0
+                    if failed:
+                        receiver.failures -= 1
+                    else:
+                        receiver.payloads.append(body)
+                self.send_response(500 if failed else 200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/hook'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def wait_for(self, count, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if len(self.payloads) >= count:
+                    return True
+            time.sleep(0.02)
+        return False
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _database():
+    import modules.DashboardWebHooks as DashboardWebHooksModule
+    path = os.path.join(tempfile.mkdtemp(), 'wgdashboard.db')
+    DashboardWebHooksModule.ConnectionString = lambda database: f"sqlite:///{path}"
+
+
+def _webhooks(receiver=None, **kwargs):
+    from modules.DashboardWebHooks import DashboardWebHooks
+    dashboard_config = MagicMock()
+    dashboard_config.GetConfig.return_value = (True, 'sqlite')
+    webhooks = DashboardWebHooks(dashboard_config, **kwargs)
+    if receiver is not None:
+        status, msg = webhooks.UpdateWebHook({
+            'WebHookID': str(uuid.uuid4()), 'PayloadURL': receiver.url,
+            'SubscribedActions': ['peer_created', 'peer_deleted']
+        })
+        assert status, msg
+    return webhooks
+
+
+def test_bounded_pool_delivers_bulk_events():
+    """Test 1,000 events are delivered by a fixed pool without spawning a thread each"""
+    print("\nTesting bulk delivery through the worker pool...")
+    _database()
+    receiver = Receiver(latency=0.002)
+    webhooks = _webhooks(receiver, workers=4)
+    try:
+        for i in range(1000):
+            assert webhooks.RunWebHook('peer_created', {'configuration': 'wg0', 'peers': [f'peer-{i}']})
+            workers = [t for t in threading.enumerate() if t.name.startswith('WebHookWorker')]
+            assert len(workers) <= 4, f"{len(workers)} delivery threads"
+        assert receiver.wait_for(1000, timeout=30), f"Only {len(receiver.payloads)} deliveries"
+        assert receiver.peak <= 4, f"{receiver.peak} concurrent deliveries"
+        assert sorted(p['peers'][0] for p in receiver.payloads) == sorted(f'peer-{i}' for i in range(1000))
+
+        deadline = time.monotonic() + 5
+        while webhooks.GetQueueStats()['Delivered'] < 1000 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        stats = webhooks.GetQueueStats()
+        assert stats['QueueDepth'] == 0 and stats['Delivered'] == 1000 and stats['Failed'] == 0, stats
+        assert stats['Latency']['Samples'] == 500 and stats['Latency']['P95'] >= stats['Latency']['Average'] > 0
+    finally:
+        webhooks.Shutdown()
+        receiver.close()
+
+    print(f"✓ 1,000 events delivered by 4 workers, p95 latency {stats['Latency']['P95']}s")
+    return True
+
+
+def test_retry_uses_backoff_timer():
+    """Test failed deliveries are retried from the outbox and logged on one session"""
+    print("\nTesting retry backoff...")
+    _database()
+    receiver = Receiver()
+    receiver.failures = 2
+    webhooks = _webhooks(receiver, workers=2)
+    webhooks.RETRY_BASE_DELAY = 0.05
+    try:
+        webhooks.RunWebHook('peer_deleted', {'configuration': 'wg0', 'peers': ['peer-1']})
+        assert receiver.wait_for(1, timeout=5)
+        time.sleep(0.1)
+        sessions, _ = webhooks.GetWebHookSessions(webhooks.WebHooks[0])
+        assert len(sessions) == 1 and sessions[0]['Status'] == 0
+        messages = [log['Message'] for log in sessions[0]['Logs']['Logs']]
+        assert sum('Request errored' in m for m in messages) == 2, messages
+        assert webhooks.GetQueueStats()['QueueDepth'] == 0
+    finally:
+        webhooks.Shutdown()
+        receiver.close()
+
+    print("✓ Two failed attempts were retried on their timers within one session")
+    return True
+
+
+def test_batch_window_folds_events():
+    """Test events for one webhook within the batch window become one delivery"""
+    print("\nTesting batched delivery...")
+    _database()
+    receiver = Receiver()
+    webhooks = _webhooks(receiver, workers=2, batchWindow=0.3)
+    try:
+        for i in range(5):
+            webhooks.RunWebHook('peer_created', {'configuration': 'wg0', 'peers': [f'peer-{i}']})
+        assert webhooks.GetQueueStats()['QueueDepth'] == 5
+        assert receiver.wait_for(1)
+        time.sleep(0.2)
+        assert len(receiver.payloads) == 1
+        payload = receiver.payloads[0]
+        assert payload['action'] == 'batch' and len(payload['events']) == 5
+        assert [e['peers'][0] for e in payload['events']] == [f'peer-{i}' for i in range(5)]
+    finally:
+        webhooks.Shutdown()
+        receiver.close()
+
+    print("✓ Five events inside the window were delivered as one batch")
+    return True
+
+
+def test_outbox_survives_restart():
+    """Test undelivered events are picked up again by a new instance"""
+    print("\nTesting outbox durability...")
+    _database()
+    receiver = Receiver()
+    webhooks = _webhooks(receiver, workers=2)
+    webhooks.Shutdown()
+    webhooks.RunWebHook('peer_created', {'configuration': 'wg0', 'peers': ['peer-restart']})
+    assert receiver.payloads == []
+
+    restarted = _webhooks(workers=2)
+    try:
+        assert receiver.wait_for(1)
+        assert receiver.payloads[0]['peers'] == ['peer-restart']
+    finally:
+        restarted.Shutdown()
+        receiver.close()
+
+    print("✓ A queued event was delivered after a restart")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("WebHook Outbox Tests")
+    print("=" * 60)
+
+    tests = [
+        test_bounded_pool_delivers_bulk_events,
+        test_retry_uses_backoff_timer,
+        test_batch_window_folds_events,
+        test_outbox_survives_restart,
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            results.append(test())
+        except Exception as e:
+            print(f"✗ {test.__name__} failed: {e}")
+            results.append(False)
+
+    print("\n" + "=" * 60)
+    print(f"Results: {sum(results)}/{len(results)} tests passed")
+    print("=" * 60)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
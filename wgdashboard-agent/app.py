@@ -5,29 +5,57 @@ Handles WireGuard operations with HMAC authentication
 
 import os
 import time
+import asyncio
 import hmac
 import hashlib
+import json
 import subprocess
 import tempfile
 import base64
+import gzip
+import heapq
 import logging
+import threading
+import sqlite3
 import psutil
+from contextlib import asynccontextmanager
 from typing import Optional, List
 from fastapi import FastAPI, Request, HTTPException, Path, Body
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
 logger = logging.getLogger(__name__)
 
 # Configuration
 SHARED_SECRET = os.getenv('WG_AGENT_SECRET', 'change-me-in-production')
 MAX_TIMESTAMP_AGE = int(os.getenv('MAX_TIMESTAMP_AGE', '300'))
+QUEUE_MAX_BATCH = int(os.getenv('WG_AGENT_QUEUE_MAX_BATCH', '256'))
+METRICS_REFRESH_INTERVAL = int(os.getenv('WG_AGENT_METRICS_INTERVAL', '15'))
+METRICS_PEER_MODE = os.getenv('WG_AGENT_METRICS_PEERS', 'top').lower()
+METRICS_PEER_TOP_N = int(os.getenv('WG_AGENT_METRICS_TOP_N', '20'))
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+HISTORY_PATH = os.getenv('WG_AGENT_HISTORY_PATH', '/var/lib/wgdashboard-agent/history.db')
+HISTORY_INTERVAL = int(os.getenv('WG_AGENT_HISTORY_INTERVAL', '60'))
+HISTORY_MAX_BYTES = int(os.getenv('WG_AGENT_HISTORY_MAX_BYTES', str(64 * 1024 * 1024)))
+HISTORY_MAX_SAMPLES = int(os.getenv('WG_AGENT_HISTORY_MAX_SAMPLES', '500000'))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background workers for the lifetime of the agent"""
+    metrics_cache.start()
+    if HISTORY_INTERVAL > 0:
+        history_store.start()
+    yield
+
 
 # FastAPI app
 app = FastAPI(
     title="WGDashboard Agent",
     description="Production-grade WireGuard node agent for WGDashboard multi-node architecture",
-    version="2.2.0"
+    version="2.2.0",
+    lifespan=lifespan
 )
 
 
@@ -48,6 +76,14 @@ class SyncconfRequest(BaseModel):
     config: str = Field(..., description="Base64-encoded WireGuard configuration")
 
 
+class PeerReconcileRequest(BaseModel):
+    peers: List[PeerAddRequest] = Field(default=[], description="Complete desired peer set of the interface")
+    add_missing: bool = Field(default=True, description="Add desired peers that are not on the interface")
+    update_mismatched: bool = Field(default=True, description="Update peers whose configuration differs")
+    remove_unknown: bool = Field(default=False, description="Remove peers that are not in the desired set")
+    remove: List[str] = Field(default=[], description="Public keys to remove regardless of remove_unknown")
+
+
 class InterfaceConfigRequest(BaseModel):
     """Request model for updating full interface configuration (Phase 6)"""
     private_key: str = Field(..., description="WireGuard private key for the interface")
@@ -60,6 +96,93 @@ class InterfaceConfigRequest(BaseModel):
     table: Optional[str] = Field(None, description="Routing table to use")
 
 
+# Per-interface operation queue
+class InterfaceOperationQueue:
+    """
+    Serializes kernel mutations on a single interface and coalesces the
+    `wg-quick save` that follows them.
+
+    Submitted operations are appended to a pending list drained by a single
+    worker task per interface. The worker applies every queued mutation in
+    order, then runs one save for the whole batch and only then resolves the
+    callers, so a request is answered once its change is durable while N
+    queued mutations cost a single save.
+    """
+
+    def __init__(self, interface: str):
+        self.interface = interface
+        self._pending = []
+        self._worker = None
+        self.mutations = 0
+        self.saves = 0
+        self.unsaved = 0
+
+    async def submit(self, operation, *args, **kwargs):
+        """Apply a blocking mutation and return its result once it has been saved"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((operation, args, kwargs, future))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._drain())
+        return await future
+
+    async def _drain(self):
+        while self._pending:
+            batch = self._pending[:QUEUE_MAX_BATCH]
+            del self._pending[:QUEUE_MAX_BATCH]
+            
+            applied = []
+            for operation, args, kwargs, future in batch:
+                try:
+                    result = await run_in_threadpool(operation, *args, **kwargs)
+                    applied.append((future, result))
+                    self.mutations += 1
+                    self.unsaved += 1
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+            
+            if not applied:
+                continue
+            
+            try:
+                await run_in_threadpool(
+                    subprocess.run, ['wg-quick', 'save', self.interface],
+                    check=True, capture_output=True
+                )
+                self.saves += 1
+                self.unsaved = 0
+            except Exception as e:
+                logger.error(f"Failed to save {self.interface} after {len(applied)} operations: {e}")
+                for future, _ in applied:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for future, result in applied:
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            'interface': self.interface,
+            'mutations': self.mutations,
+            'saves': self.saves,
+            'queued': len(self._pending),
+            'unsaved': self.unsaved
+        }
+
+
+_operation_queues: dict = {}
+
+
+def get_operation_queue(interface: str) -> InterfaceOperationQueue:
+    """Get (or lazily create) the operation queue for an interface"""
+    queue = _operation_queues.get(interface)
+    if queue is None:
+        queue = _operation_queues.setdefault(interface, InterfaceOperationQueue(interface))
+    return queue
+
+
 # Middleware for HMAC authentication
 @app.middleware("http")
 async def verify_hmac_signature(request: Request, call_next):
@@ -241,6 +364,9 @@ async def get_status():
             'wireguard': {
                 'interfaces': interfaces_status,
                 'interface_count': len(interfaces_status)
+            },
+            'operation_queues': {
+                name: queue.stats() for name, queue in _operation_queues.items()
             }
         }
         
@@ -249,113 +375,376 @@ async def get_status():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/v1/metrics")
-async def get_metrics():
+def _read_interface_dumps() -> dict:
     """
-    Expose WireGuard and system-level metrics in Prometheus-compatible format.
-    Used for observability systems like Prometheus/Grafana.
+    Read `wg show <iface> dump` for every WireGuard interface
+    
+    Returns:
+        Dict mapping interface name to a list of (public_key, latest_handshake,
+        transfer_rx, transfer_tx) tuples
     """
+    dumps = {}
     try:
+        wg_output = subprocess.check_output(['wg', 'show', 'interfaces'], stderr=subprocess.STDOUT).decode('utf-8')
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return dumps
+    
+    for iface in wg_output.strip().split():
+        try:
+            dump_output = subprocess.check_output(
+                ['wg', 'show', iface, 'dump'],
+                stderr=subprocess.STDOUT
+            ).decode('utf-8')
+        except subprocess.CalledProcessError:
+            continue
+        
+        peers = []
+        for line in dump_output.strip().split('\n')[1:]:  # Skip header
+            parts = line.split('\t')
+            if len(parts) >= 8:
+                peers.append((
+                    parts[0],
+                    int(parts[4]) if parts[4] != '0' else 0,
+                    int(parts[5]),
+                    int(parts[6])
+                ))
+        dumps[iface] = peers
+    return dumps
+
+
+class MetricsCache:
+    """
+    Prometheus exposition rendered off the request path.
+    
+    A background thread re-reads `wg` every METRICS_REFRESH_INTERVAL seconds and
+    renders the exposition text (plain and gzip) once; scrapes only return the
+    prerendered bytes, so scrape cost no longer depends on the peer count.
+    Per-peer series are controlled by METRICS_PEER_MODE (`on`, `off` or `top`,
+    the latter keeping the METRICS_PEER_TOP_N peers with the most traffic).
+    """
+
+    HANDSHAKE_AGE_BUCKETS = (60, 180, 300, 900, 3600, 86400)
+
+    def __init__(self, interval: int, peer_mode: str, top_n: int):
+        self.interval = interval
+        self.peer_mode = peer_mode if peer_mode in ('on', 'off', 'top') else 'top'
+        self.top_n = top_n
+        self.body = b''
+        self.body_gzip = b''
+        self.refreshed_at = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='metrics-cache', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing metrics cache: {e}", exc_info=True)
+            time.sleep(self.interval)
+
+    def get(self, gzipped: bool = False) -> bytes:
+        """Return the cached exposition, rendering it once if nothing is cached yet"""
+        if not self.refreshed_at:
+            self.refresh()
+        return self.body_gzip if gzipped else self.body
+
+    def refresh(self):
+        started = time.time()
+        text = self.render(_read_interface_dumps(), int(started))
+        text += '# HELP wgdashboard_agent_metrics_refresh_timestamp_seconds Time the metrics cache was last refreshed\n'
+        text += '# TYPE wgdashboard_agent_metrics_refresh_timestamp_seconds gauge\n'
+        text += f'wgdashboard_agent_metrics_refresh_timestamp_seconds {int(started)}\n'
+        text += '# HELP wgdashboard_agent_metrics_refresh_duration_seconds Time taken to refresh the metrics cache\n'
+        text += '# TYPE wgdashboard_agent_metrics_refresh_duration_seconds gauge\n'
+        text += f'wgdashboard_agent_metrics_refresh_duration_seconds {round(time.time() - started, 6)}\n'
+        
+        body = text.encode('utf-8')
+        body_gzip = gzip.compress(body)
+        with self._lock:
+            self.body, self.body_gzip, self.refreshed_at = body, body_gzip, started
+
+    def render(self, dumps: dict, current_time: int) -> str:
+        """Render system, interface-level and (optionally) per-peer metrics"""
         metrics = []
         
         # System metrics
-        cpu_percent = psutil.cpu_percent(interval=0.1)
+        cpu_percent = psutil.cpu_percent(interval=None)
         memory = psutil.virtual_memory()
         disk = psutil.disk_usage('/')
         
-        metrics.append(f'# HELP wgdashboard_agent_cpu_percent CPU usage percentage')
-        metrics.append(f'# TYPE wgdashboard_agent_cpu_percent gauge')
+        metrics.append('# HELP wgdashboard_agent_cpu_percent CPU usage percentage')
+        metrics.append('# TYPE wgdashboard_agent_cpu_percent gauge')
         metrics.append(f'wgdashboard_agent_cpu_percent {cpu_percent}')
         
-        metrics.append(f'# HELP wgdashboard_agent_memory_used_bytes Memory used in bytes')
-        metrics.append(f'# TYPE wgdashboard_agent_memory_used_bytes gauge')
+        metrics.append('# HELP wgdashboard_agent_memory_used_bytes Memory used in bytes')
+        metrics.append('# TYPE wgdashboard_agent_memory_used_bytes gauge')
         metrics.append(f'wgdashboard_agent_memory_used_bytes {memory.used}')
         
-        metrics.append(f'# HELP wgdashboard_agent_memory_percent Memory usage percentage')
-        metrics.append(f'# TYPE wgdashboard_agent_memory_percent gauge')
+        metrics.append('# HELP wgdashboard_agent_memory_percent Memory usage percentage')
+        metrics.append('# TYPE wgdashboard_agent_memory_percent gauge')
         metrics.append(f'wgdashboard_agent_memory_percent {memory.percent}')
         
-        metrics.append(f'# HELP wgdashboard_agent_disk_used_bytes Disk used in bytes')
-        metrics.append(f'# TYPE wgdashboard_agent_disk_used_bytes gauge')
+        metrics.append('# HELP wgdashboard_agent_disk_used_bytes Disk used in bytes')
+        metrics.append('# TYPE wgdashboard_agent_disk_used_bytes gauge')
         metrics.append(f'wgdashboard_agent_disk_used_bytes {disk.used}')
         
-        # Get WireGuard interfaces and metrics
-        try:
-            wg_output = subprocess.check_output(['wg', 'show', 'interfaces'], stderr=subprocess.STDOUT).decode('utf-8')
-            interfaces = wg_output.strip().split()
+        metrics.append('# HELP wireguard_interface_count Number of WireGuard interfaces')
+        metrics.append('# TYPE wireguard_interface_count gauge')
+        metrics.append(f'wireguard_interface_count {len(dumps)}')
+        
+        # Interface-level aggregates, one sample per interface per family
+        families = {
+            'wireguard_peers_total': ('gauge', 'Total number of peers on interface', []),
+            'wireguard_peers_active': ('gauge', 'Active peers (handshake within 3 minutes)', []),
+            'wireguard_interface_receive_bytes_total': ('counter', 'Total bytes received on interface', []),
+            'wireguard_interface_transmit_bytes_total': ('counter', 'Total bytes transmitted on interface', []),
+            'wireguard_peer_handshake_age_seconds': ('histogram', 'Age of the latest handshake of peers that have one', []),
+        }
+        peer_samples = []
+        
+        for iface, peers in dumps.items():
+            label = f'interface="{iface}"'
+            active_peers = 0
+            total_rx = 0
+            total_tx = 0
+            bucket_counts = [0] * len(self.HANDSHAKE_AGE_BUCKETS)
+            age_sum = 0
+            age_count = 0
             
-            metrics.append(f'# HELP wireguard_interface_count Number of WireGuard interfaces')
-            metrics.append(f'# TYPE wireguard_interface_count gauge')
-            metrics.append(f'wireguard_interface_count {len(interfaces)}')
+            for public_key, latest_handshake, transfer_rx, transfer_tx in peers:
+                total_rx += transfer_rx
+                total_tx += transfer_tx
+                if latest_handshake > 0:
+                    age = max(current_time - latest_handshake, 0)
+                    if age < 180:
+                        active_peers += 1
+                    age_sum += age
+                    age_count += 1
+                    for i, bound in enumerate(self.HANDSHAKE_AGE_BUCKETS):
+                        if age <= bound:
+                            bucket_counts[i] += 1
             
-            for iface in interfaces:
-                try:
-                    dump_output = subprocess.check_output(
-                        ['wg', 'show', iface, 'dump'],
-                        stderr=subprocess.STDOUT
-                    ).decode('utf-8')
-                    
-                    lines = dump_output.strip().split('\n')
-                    peer_count = len(lines) - 1
-                    
-                    metrics.append(f'# HELP wireguard_peers_total Total number of peers on interface')
-                    metrics.append(f'# TYPE wireguard_peers_total gauge')
-                    metrics.append(f'wireguard_peers_total{{interface="{iface}"}} {peer_count}')
-                    
-                    # Parse peer data
-                    active_peers = 0
-                    total_rx = 0
-                    total_tx = 0
-                    current_time = int(time.time())
-                    
-                    for line in lines[1:]:
-                        parts = line.split('\t')
-                        if len(parts) >= 8:
-                            public_key = parts[0][:16]  # Truncate for label
-                            latest_handshake = int(parts[4]) if parts[4] != '0' else 0
-                            transfer_rx = int(parts[5])
-                            transfer_tx = int(parts[6])
-                            
-                            # Count active peers
-                            if latest_handshake > 0 and (current_time - latest_handshake) < 180:
-                                active_peers += 1
-                            
-                            total_rx += transfer_rx
-                            total_tx += transfer_tx
-                            
-                            # Per-peer metrics (optional, can be commented out for large deployments)
-                            metrics.append(f'wireguard_peer_receive_bytes_total{{interface="{iface}",public_key="{public_key}"}} {transfer_rx}')
-                            metrics.append(f'wireguard_peer_transmit_bytes_total{{interface="{iface}",public_key="{public_key}"}} {transfer_tx}')
-                            
-                            if latest_handshake > 0:
-                                seconds_since = current_time - latest_handshake
-                                metrics.append(f'wireguard_peer_last_handshake_seconds{{interface="{iface}",public_key="{public_key}"}} {seconds_since}')
-                    
-                    metrics.append(f'# HELP wireguard_peers_active Active peers (handshake within 3 minutes)')
-                    metrics.append(f'# TYPE wireguard_peers_active gauge')
-                    metrics.append(f'wireguard_peers_active{{interface="{iface}"}} {active_peers}')
-                    
-                    metrics.append(f'# HELP wireguard_interface_receive_bytes_total Total bytes received on interface')
-                    metrics.append(f'# TYPE wireguard_interface_receive_bytes_total counter')
-                    metrics.append(f'wireguard_interface_receive_bytes_total{{interface="{iface}"}} {total_rx}')
-                    
-                    metrics.append(f'# HELP wireguard_interface_transmit_bytes_total Total bytes transmitted on interface')
-                    metrics.append(f'# TYPE wireguard_interface_transmit_bytes_total counter')
-                    metrics.append(f'wireguard_interface_transmit_bytes_total{{interface="{iface}"}} {total_tx}')
-                    
-                except subprocess.CalledProcessError:
-                    pass
-        except subprocess.CalledProcessError:
-            pass
-        
-        # Return in Prometheus text format
-        return PlainTextResponse('\n'.join(metrics) + '\n', media_type='text/plain; version=0.0.4')
+            families['wireguard_peers_total'][2].append(f'wireguard_peers_total{{{label}}} {len(peers)}')
+            families['wireguard_peers_active'][2].append(f'wireguard_peers_active{{{label}}} {active_peers}')
+            families['wireguard_interface_receive_bytes_total'][2].append(
+                f'wireguard_interface_receive_bytes_total{{{label}}} {total_rx}')
+            families['wireguard_interface_transmit_bytes_total'][2].append(
+                f'wireguard_interface_transmit_bytes_total{{{label}}} {total_tx}')
+            
+            histogram = families['wireguard_peer_handshake_age_seconds'][2]
+            # bucket_counts are already cumulative: each age counts towards every bound above it
+            for bound, count in zip(self.HANDSHAKE_AGE_BUCKETS, bucket_counts):
+                histogram.append(f'wireguard_peer_handshake_age_seconds_bucket{{{label},le="{bound}"}} {count}')
+            histogram.append(f'wireguard_peer_handshake_age_seconds_bucket{{{label},le="+Inf"}} {age_count}')
+            histogram.append(f'wireguard_peer_handshake_age_seconds_sum{{{label}}} {age_sum}')
+            histogram.append(f'wireguard_peer_handshake_age_seconds_count{{{label}}} {age_count}')
+            
+            if self.peer_mode == 'on':
+                peer_samples.extend((iface, peer) for peer in peers)
+            elif self.peer_mode == 'top':
+                top = heapq.nlargest(self.top_n, peers, key=lambda p: p[2] + p[3])
+                peer_samples.extend((iface, peer) for peer in top)
+        
+        for name, (metric_type, help_text, samples) in families.items():
+            metrics.append(f'# HELP {name} {help_text}')
+            metrics.append(f'# TYPE {name} {metric_type}')
+            metrics.extend(samples)
+        
+        if peer_samples:
+            receive, transmit, handshake = [], [], []
+            for iface, (public_key, latest_handshake, transfer_rx, transfer_tx) in peer_samples:
+                label = f'interface="{iface}",public_key="{public_key}"'
+                receive.append(f'wireguard_peer_receive_bytes_total{{{label}}} {transfer_rx}')
+                transmit.append(f'wireguard_peer_transmit_bytes_total{{{label}}} {transfer_tx}')
+                if latest_handshake > 0:
+                    handshake.append(f'wireguard_peer_last_handshake_seconds{{{label}}} {current_time - latest_handshake}')
+            
+            metrics.append('# HELP wireguard_peer_receive_bytes_total Bytes received from peer')
+            metrics.append('# TYPE wireguard_peer_receive_bytes_total counter')
+            metrics.extend(receive)
+            metrics.append('# HELP wireguard_peer_transmit_bytes_total Bytes transmitted to peer')
+            metrics.append('# TYPE wireguard_peer_transmit_bytes_total counter')
+            metrics.extend(transmit)
+            metrics.append('# HELP wireguard_peer_last_handshake_seconds Seconds since the latest handshake with peer')
+            metrics.append('# TYPE wireguard_peer_last_handshake_seconds gauge')
+            metrics.extend(handshake)
+        
+        return '\n'.join(metrics) + '\n'
+
+
+metrics_cache = MetricsCache(
+    interval=METRICS_REFRESH_INTERVAL,
+    peer_mode=METRICS_PEER_MODE,
+    top_n=METRICS_PEER_TOP_N
+)
+
+
+@app.get("/v1/metrics")
+async def get_metrics(request: Request):
+    """
+    Expose WireGuard and system-level metrics in Prometheus-compatible format.
+    Used for observability systems like Prometheus/Grafana.
+    Served from a periodically refreshed cache; gzip-encoded when the scraper accepts it.
+    """
+    try:
+        gzipped = 'gzip' in request.headers.get('accept-encoding', '')
+        body = await run_in_threadpool(metrics_cache.get, gzipped)
+        headers = {'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'} if gzipped else {'Vary': 'Accept-Encoding'}
+        return Response(content=body, media_type=PROMETHEUS_CONTENT_TYPE, headers=headers)
         
     except Exception as e:
         logger.error(f"Error getting metrics: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class HistoryStore:
+    """
+    Bounded local ring store of per-peer counter samples (store-and-forward).
+    
+    Every HISTORY_INTERVAL seconds the counters of all peers are appended to a
+    SQLite table. Retention is sized by disk budget rather than time: once the
+    live pages exceed HISTORY_MAX_BYTES the oldest samples are deleted, and the
+    freed pages are reused by later inserts, so the file stops growing. The panel
+    reads the samples back through /v1/wg/{interface}/history after an outage.
+    """
+
+    def __init__(self, path: str, max_bytes: int, interval: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS samples ('
+                'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'interface TEXT NOT NULL, '
+                'time INTEGER NOT NULL, '
+                'public_key TEXT NOT NULL, '
+                'transfer_rx INTEGER NOT NULL, '
+                'transfer_tx INTEGER NOT NULL, '
+                'latest_handshake INTEGER NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS samples_interface_time ON samples (interface, time)')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='history-sampler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.record(_read_interface_dumps(), int(time.time()))
+            except Exception as e:
+                logger.error(f"Error recording peer history: {e}", exc_info=True)
+            time.sleep(self.interval)
+
+    def record(self, dumps: dict, sample_time: int) -> int:
+        """Append one sample per peer and enforce the disk budget"""
+        rows = [
+            (iface, sample_time, public_key, transfer_rx, transfer_tx, latest_handshake)
+            for iface, peers in dumps.items()
+            for public_key, latest_handshake, transfer_rx, transfer_tx in peers
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    'INSERT INTO samples (interface, time, public_key, transfer_rx, transfer_tx, latest_handshake) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', rows
+                )
+            self._enforce_budget(conn)
+        return len(rows)
+
+    def used_bytes(self, conn: sqlite3.Connection) -> int:
+        """Bytes held by live pages (free pages are reused and not counted)"""
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return (page_count - freelist) * page_size
+
+    def _enforce_budget(self, conn: sqlite3.Connection):
+        used = self.used_bytes(conn)
+        if used <= self.max_bytes:
+            return
+        first, last = conn.execute('SELECT MIN(seq), MAX(seq) FROM samples').fetchone()
+        if first is None:
+            return
+        # Drop the oldest share of samples needed to get back to 90% of the budget
+        excess = (used - self.max_bytes * 0.9) / used
+        cutoff = first + max(int((last - first + 1) * excess), 1)
+        with conn:
+            conn.execute('DELETE FROM samples WHERE seq < ?', (cutoff,))
+        logger.info(f"History store over budget ({used} bytes), dropped samples before seq {cutoff}")
+
+    def query(self, interface: str, since: int, limit: int) -> list:
+        """Samples for an interface newer than `since`, oldest first"""
+        with self._lock:
+            conn = self._connect()
+            return conn.execute(
+                'SELECT time, public_key, transfer_rx, transfer_tx, latest_handshake FROM samples '
+                'WHERE interface = ? AND time > ? ORDER BY time, seq LIMIT ?',
+                (interface, since, limit)
+            ).fetchall()
+
+
+history_store = HistoryStore(HISTORY_PATH, HISTORY_MAX_BYTES, HISTORY_INTERVAL)
+
+
+@app.get("/v1/wg/{interface}/history")
+async def get_wg_history(
+    request: Request,
+    interface: str = Path(..., description="WireGuard interface name"),
+    since: int = 0,
+    limit: int = HISTORY_MAX_SAMPLES
+):
+    """
+    Get per-peer counter samples recorded since a Unix timestamp
+    Used by the panel to backfill transfer history after the node was unreachable.
+    Samples are returned column-wise compact and gzip-encoded when accepted.
+    """
+    try:
+        limit = max(1, min(limit, HISTORY_MAX_SAMPLES))
+        samples = await run_in_threadpool(history_store.query, interface, since, limit)
+        
+        body = json.dumps({
+            'interface': interface,
+            'since': since,
+            'columns': ['time', 'public_key', 'transfer_rx', 'transfer_tx', 'latest_handshake'],
+            'samples': samples,
+            'truncated': len(samples) >= limit
+        }, separators=(',', ':')).encode('utf-8')
+        
+        if 'gzip' in request.headers.get('accept-encoding', ''):
+            return Response(content=gzip.compress(body), media_type='application/json',
+                            headers={'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'})
+        return Response(content=body, media_type='application/json', headers={'Vary': 'Accept-Encoding'})
+        
+    except Exception as e:
+        logger.error(f"Error getting history for {interface}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # WireGuard Operations
 @app.get("/v1/wg/{interface}/dump")
 async def get_wg_dump(interface: str = Path(..., description="WireGuard interface name")):
@@ -397,6 +786,50 @@ async def get_wg_dump(interface: str = Path(..., description="WireGuard interfac
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def peer_set_digest(peers) -> str:
+    """
+    SHA-256 over a peer set of (public_key, allowed_ips, persistent_keepalive).
+    Peers are sorted by public key and allowed IPs sorted per peer, so the panel
+    can compute the same digest from its database and compare without a full dump.
+    """
+    digest = hashlib.sha256()
+    for public_key, allowed_ips, keepalive in sorted(peers, key=lambda p: p[0]):
+        digest.update(f"{public_key}|{','.join(sorted(allowed_ips))}|{int(keepalive or 0)}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+@app.get("/v1/wg/{interface}/digest")
+async def get_wg_digest(interface: str = Path(..., description="WireGuard interface name")):
+    """Get a digest of the interface's peer set for cheap drift checks"""
+    try:
+        output = (await run_in_threadpool(
+            subprocess.check_output, ['wg', 'show', interface, 'dump'], stderr=subprocess.STDOUT
+        )).decode('utf-8')
+        
+        peers = []
+        for line in output.strip().split('\n')[1:]:  # Skip header
+            parts = line.split('\t')
+            if len(parts) >= 8:
+                peers.append((
+                    parts[0],
+                    [ip for ip in parts[3].split(',') if ip and ip != '(none)'],
+                    int(parts[7]) if parts[7] != 'off' else 0
+                ))
+        
+        return {
+            'interface': interface,
+            'peer_count': len(peers),
+            'digest': peer_set_digest(peers)
+        }
+        
+    except subprocess.CalledProcessError as e:
+        logger.error(f"WireGuard command failed for {interface}: {e.output.decode()}")
+        raise HTTPException(status_code=500, detail=f"WireGuard command failed: {e.output.decode()}")
+    except Exception as e:
+        logger.error(f"Error getting WireGuard digest for {interface}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/v1/wg/{interface}/peers")
 async def add_peer(
     interface: str = Path(..., description="WireGuard interface name"),
@@ -420,7 +853,7 @@ async def add_peer(
                 psk_file_path = psk_file.name
             cmd.extend(['preshared-key', psk_file_path])
         
-        try:
+        def apply():
             subprocess.run(cmd, check=True, capture_output=True)
             
             # Set keepalive if specified
@@ -429,9 +862,10 @@ async def add_peer(
                     'wg', 'set', interface, 'peer', peer_data.public_key,
                     'persistent-keepalive', str(peer_data.persistent_keepalive)
                 ], check=True, capture_output=True)
-            
-            # Save configuration
-            subprocess.run(['wg-quick', 'save', interface], check=True, capture_output=True)
+        
+        try:
+            # Apply and wait for the (coalesced) save of the configuration
+            await get_operation_queue(interface).submit(apply)
             
             logger.info(f"Successfully added peer {peer_data.public_key[:16]}... to {interface}")
             return {
@@ -474,8 +908,9 @@ async def update_peer(
         if peer_data.persistent_keepalive is not None:
             cmd.extend(['persistent-keepalive', str(peer_data.persistent_keepalive)])
         
-        subprocess.run(cmd, check=True, capture_output=True)
-        subprocess.run(['wg-quick', 'save', interface], check=True, capture_output=True)
+        await get_operation_queue(interface).submit(
+            subprocess.run, cmd, check=True, capture_output=True
+        )
         
         logger.info(f"Successfully updated peer {public_key[:16]}... on {interface}")
         return {
@@ -500,11 +935,10 @@ async def delete_peer(
     try:
         logger.info(f"Deleting peer {public_key[:16]}... from {interface}")
         
-        subprocess.run([
-            'wg', 'set', interface, 'peer', public_key, 'remove'
-        ], check=True, capture_output=True)
-        
-        subprocess.run(['wg-quick', 'save', interface], check=True, capture_output=True)
+        await get_operation_queue(interface).submit(
+            subprocess.run, ['wg', 'set', interface, 'peer', public_key, 'remove'],
+            check=True, capture_output=True
+        )
         
         logger.info(f"Successfully deleted peer {public_key[:16]}... from {interface}")
         return {
@@ -545,13 +979,11 @@ async def syncconf(
             config_file_path = config_file.name
         
         try:
-            # Apply configuration using wg syncconf
-            subprocess.run([
-                'wg', 'syncconf', interface, config_file_path
-            ], check=True, capture_output=True)
-            
-            # Save the configuration
-            subprocess.run(['wg-quick', 'save', interface], check=True, capture_output=True)
+            # Apply configuration using wg syncconf and wait for the save
+            await get_operation_queue(interface).submit(
+                subprocess.run, ['wg', 'syncconf', interface, config_file_path],
+                check=True, capture_output=True
+            )
             
             logger.info(f"Successfully applied syncconf to {interface}")
             return {
@@ -572,6 +1004,154 @@ async def syncconf(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def parse_wg_showconf(text: str):
+    """
+    Split `wg showconf` output into the [Interface] lines and the peers keyed by public key
+    Peer values are kept as the raw `Key = Value` pairs of their section.
+    """
+    interface_lines = []
+    peers = {}
+    section = None
+    current = None
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('['):
+            section = line.lower()
+            current = {} if section == '[peer]' else None
+            continue
+        if section == '[interface]':
+            interface_lines.append(line)
+        elif section == '[peer]' and '=' in line:
+            key, value = line.split('=', 1)
+            current[key.strip()] = value.strip()
+            if key.strip() == 'PublicKey':
+                peers[value.strip()] = current
+    return interface_lines, peers
+
+
+def plan_peer_reconcile(current: dict, desired: list, add_missing: bool = True,
+                        update_mismatched: bool = True, remove_unknown: bool = False, remove=()):
+    """
+    Merge a desired peer set into the interface's current peers
+
+    Args:
+        current: Peers from parse_wg_showconf
+        desired: PeerAddRequest-like dicts
+        remove: Public keys to drop even when remove_unknown is off
+    
+    Returns:
+        Tuple of (merged peers keyed by public key, summary dict)
+    """
+    merged = {}
+    summary = {'added': [], 'updated': [], 'removed': [], 'unchanged': 0}
+    
+    for peer in desired:
+        public_key = peer['public_key']
+        allowed_ips = sorted(ip.strip() for ip in peer.get('allowed_ips', []) if ip.strip())
+        keepalive = int(peer.get('persistent_keepalive') or 0)
+        existing = current.get(public_key)
+        
+        if existing is None:
+            if not add_missing:
+                continue
+            entry = {'PublicKey': public_key}
+            summary['added'].append(public_key)
+        else:
+            entry = dict(existing)
+            actual_ips = sorted(ip.strip() for ip in existing.get('AllowedIPs', '').split(',') if ip.strip())
+            changed = actual_ips != allowed_ips \
+                or int(existing.get('PersistentKeepalive', 0) or 0) != keepalive \
+                or (peer.get('preshared_key') and existing.get('PresharedKey') != peer['preshared_key'])
+            if not changed or not update_mismatched:
+                merged[public_key] = existing
+                summary['unchanged'] += 1
+                continue
+            summary['updated'].append(public_key)
+        
+        entry['AllowedIPs'] = ', '.join(allowed_ips)
+        if keepalive:
+            entry['PersistentKeepalive'] = str(keepalive)
+        else:
+            entry.pop('PersistentKeepalive', None)
+        if peer.get('preshared_key'):
+            entry['PresharedKey'] = peer['preshared_key']
+        merged[public_key] = entry
+    
+    remove = set(remove)
+    for public_key, existing in current.items():
+        if public_key in merged:
+            continue
+        if remove_unknown or public_key in remove:
+            summary['removed'].append(public_key)
+        else:
+            merged[public_key] = existing
+    
+    return merged, summary
+
+
+def render_wg_config(interface_lines: list, peers: dict) -> str:
+    """Render a configuration accepted by `wg syncconf`"""
+    sections = ['[Interface]\n' + ''.join(f'{line}\n' for line in interface_lines)]
+    for peer in peers.values():
+        sections.append('[Peer]\n' + ''.join(f'{key} = {value}\n' for key, value in peer.items()))
+    return '\n'.join(sections)
+
+
+def reconcile_interface_peers(interface: str, desired: list, add_missing: bool,
+                              update_mismatched: bool, remove_unknown: bool, remove=()) -> dict:
+    """Read the live configuration, merge the desired peers and apply them with one `wg syncconf`"""
+    output = subprocess.run(['wg', 'showconf', interface], check=True, capture_output=True).stdout.decode('utf-8')
+    interface_lines, current = parse_wg_showconf(output)
+    merged, summary = plan_peer_reconcile(current, desired, add_missing, update_mismatched, remove_unknown, remove)
+    
+    if summary['added'] or summary['updated'] or summary['removed']:
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.conf', delete=False) as config_file:
+            config_file.write(render_wg_config(interface_lines, merged))
+            config_file_path = config_file.name
+        try:
+            subprocess.run(['wg', 'syncconf', interface, config_file_path], check=True, capture_output=True)
+        finally:
+            os.unlink(config_file_path)
+    return summary
+
+
+@app.post("/v1/wg/{interface}/peers/reconcile")
+async def reconcile_peers(
+    interface: str = Path(..., description="WireGuard interface name"),
+    reconcile_data: PeerReconcileRequest = Body(...)
+):
+    """
+    Apply a complete desired peer set in a single kernel sync
+    Only the [Peer] sections are replaced; the interface keys and settings are kept from
+    `wg showconf`. Returns the public keys that were added, updated and removed.
+    """
+    try:
+        logger.info(f"Reconciling {len(reconcile_data.peers)} peers on {interface}")
+        
+        summary = await get_operation_queue(interface).submit(
+            reconcile_interface_peers, interface, [dict(p) for p in reconcile_data.peers],
+            reconcile_data.add_missing, reconcile_data.update_mismatched, reconcile_data.remove_unknown,
+            reconcile_data.remove
+        )
+        
+        logger.info(f"Reconciled {interface}: {len(summary['added'])} added, "
+                    f"{len(summary['updated'])} updated, {len(summary['removed'])} removed")
+        return {
+            'status': 'success',
+            'interface': interface,
+            **summary
+        }
+        
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to reconcile peers on {interface}: {e.stderr.decode() if e.stderr else str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to reconcile peers: {e.stderr.decode() if e.stderr else str(e)}")
+    except Exception as e:
+        logger.error(f"Error reconciling peers on {interface}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # Interface-Level Configuration Management (Phase 6)
 @app.get("/v1/wg/{interface}/config")
 async def get_interface_config(interface: str = Path(..., description="WireGuard interface name")):